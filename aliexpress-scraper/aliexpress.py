@@ -5,24 +5,28 @@ https://scrapfly.io/blog/how-to-scrape-aliexpress/
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import uuid
+import asyncio
 import json
 import math
-import os
 import re
 from typing import Dict, List, TypedDict
 from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 
-import jmespath
 from loguru import logger as log
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient, ScrapflyScrapeError
+from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyScrapeError
+from scraper_runtime import SessionPool, get_client, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("aliexpress")
+BASE_CONFIG = site_config("aliexpress", {
     # Aliexpress.com requires Anti Scraping Protection bypass feature.
     # for more: https://scrapfly.io/docs/scrape-api/anti-scraping-protection
     "asp": True
-}
+})
+# product pages only load in a session that went through the homepage first,
+# warm sessions are shared by all product scrapes instead of warming one per product
+SESSIONS = SessionPool(SCRAPFLY, warmup=lambda session: ScrapeConfig(
+    "https://www.aliexpress.com/", **BASE_CONFIG, render_js=True, session=session
+))
 
 
 def add_or_replace_url_parameters(url: str, **params):
@@ -48,7 +52,7 @@ def parse_search(result: ScrapeApiResponse):
     data = extract_search(result)
     parsed = []
     for result in data["mods"]["itemList"]["content"]:
-        item = jmespath.search("""{
+        item = query("""{
             id: productId,
             type: productType,
             thumbnail: image.imgUrl,
@@ -171,28 +175,17 @@ def parse_product(result: ScrapeApiResponse) -> Product:
     }
 
 
-async def obtain_session() -> str:
-    """create a session to bypass aliexpress blocking"""
-    session_id = str(uuid.uuid4())
-    url = "https://www.aliexpress.com/"
-    await SCRAPFLY.async_scrape(ScrapeConfig(
-        url, **BASE_CONFIG, render_js=True, session=session_id
-    ))
-    return session_id
-
-
 async def scrape_product(url: str) -> List[Product]:
     """scrape aliexpress products by id"""
-    log.info("retrieving a session ID")
-    session_id = await obtain_session()
     log.info("scraping product: {}", url)
-    result = await SCRAPFLY.async_scrape(ScrapeConfig(
-        url, **BASE_CONFIG, render_js=True, auto_scroll=True, session=session_id,
-        rendering_wait=10000, retry=False, timeout=150000, js_scenario=[
-            {"wait_for_selector": {"selector": "//div[@id='nav-specification']//button", "timeout": 5000}},
-            {"click": {"selector": "//div[@id='nav-specification']//button", "ignore_if_not_visible": True}}
-        ]
-    ))
+    async with SESSIONS.lease() as session:
+        result = await session.scrape(ScrapeConfig(
+            url, **BASE_CONFIG, render_js=True, auto_scroll=True,
+            rendering_wait=10000, retry=False, timeout=150000, js_scenario=[
+                {"wait_for_selector": {"selector": "//div[@id='nav-specification']//button", "timeout": 5000}},
+                {"click": {"selector": "//div[@id='nav-specification']//button", "ignore_if_not_visible": True}}
+            ]
+        ))
     data = parse_product(result)
     reviews = await scrape_product_reviews(data["info"]["productId"], max_scrape_pages=3)
     data["reviewData"] = reviews
@@ -200,6 +193,20 @@ async def scrape_product(url: str) -> List[Product]:
     return data
 
 
+async def scrape_products(urls: List[str]) -> List[Product]:
+    """scrape many aliexpress products concurrently, sharing the warm sessions of the session pool"""
+    await SESSIONS.warm()
+    results = await asyncio.gather(*[scrape_product(url) for url in urls], return_exceptions=True)
+    products = []
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            log.error(f"failed to scrape product {url}: {result}")
+            continue
+        products.append(result)
+    log.success(f"scraped {len(products)} of {len(urls)} products with {SESSIONS.metrics()['warmed']} warm sessions")
+    return products
+
+
 def parse_review_page(result: ScrapeApiResponse):
     data = json.loads(result.content)["data"]
     return {
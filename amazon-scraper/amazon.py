@@ -7,17 +7,18 @@ $ export $SCRAPFLY_KEY="your key from https://SCRAPFLY.io/dashboard"
 """
 import json
 import math
-import os
 import re
+from contextlib import aclosing
 from pathlib import Path
 from typing import Dict, List, TypedDict, Optional
 from urllib.parse import urljoin, urlparse, parse_qsl, urlencode, urlunparse
 
 from loguru import logger as log
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+from scraper_runtime import JsonlSink, Shard, crawl_shards, get_client, parse_response, parse_responses, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("amazon")
+BASE_CONFIG = site_config("amazon", {
     # Amazon.com requires Anti Scraping Protection bypass feature.
     # for more: https://SCRAPFLY.io/docs/scrape-api/anti-scraping-protection
     "asp": True,
@@ -25,7 +26,7 @@ BASE_CONFIG = {
     "country": "US",
     # "proxy_pool": "public_residential_pool"
 
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -109,6 +110,7 @@ async def scrape_search(url: str, max_pages: Optional[int] = None) -> List[Produ
 
 
 class Review(TypedDict):
+    id: str
     title: str
     text: str
     location_and_date: str
@@ -118,57 +120,99 @@ class Review(TypedDict):
 
 def parse_reviews(result: ScrapeApiResponse) -> List[Review]:
     """parse review from single review page"""
-    # shop = result.selector.xpath('//*[@id="cr-arp-byline"]/a')
-    # shop = shop.get().split('>')[-2].split('<')[0].strip() 
-
     review_boxes = result.selector.xpath('//div[@data-hook="review"]')
     parsed = []
     for box in review_boxes:
+        rating = box.css("*[data-hook*=review-star-rating] ::text").re_first(r"(\d+\.*\d*) out")
         parsed.append(
-            {  
-                #  "Brand": shop,
-                # "text": "".join(box.css("span[data-hook=review-body] ::text").getall()).strip(),
-                "title": box.css('//i[@data-hook="review-title"]/span[@class="a-letter-space"]/following-sibling::span/text()').get(),
-                # "location_and_date": box.css("span[data-hook=review-date] ::text").get(),
-                # "verified": bool(box.css("span[data-hook=avp-badge] ::text").get()),
-                "rating": box.xpath('//span[@class="a-icon-alt"]/text()')
+            {
+                "id": box.xpath("./@id").get(),
+                "text": "".join(box.css("span[data-hook=review-body] ::text").getall()).strip(),
+                "title": box.xpath('.//*[@data-hook="review-title"]/span[not(@class)]/text()').get(),
+                "location_and_date": box.css("span[data-hook=review-date] ::text").get(),
+                "verified": bool(box.css("span[data-hook=avp-badge] ::text").get()),
+                "rating": float(rating) if rating else None,
             }
         )
     return parsed
 
 
-async def scrape_reviews(url: str, ASIN, max_pages: Optional[int] = None) -> List[Review]:
-    """scrape product reviews of a given URL of an amazon product"""
-    if max_pages > 10:
-        raise ValueError("max_pages cannot be greater than 10 as Amazon paging stops at 10 pages. Try splitting search through multiple filters and sorting to get more results")
-    # url = url.split("/ref=")[0]
-    log.info(f"scraping review page: {url}")
-    # todo: seems to be blocked
-    first_page_result = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-    
-    reviews = parse_reviews(first_page_result)
-    raise ValueError
-    # find total reviews
-    # todo: debug
-    total_reviews = first_page_result.selector.css("div[data-hook=cr-filter-info-review-rating-count] ::text").re(
-        r"(\d+,*\d*)"
-    )[1]
-    total_reviews = int(total_reviews.replace(",", ""))
-    _reviews_per_page = max(len(reviews), 1)
-
-    total_pages = int(math.ceil(total_reviews / _reviews_per_page))
-    if max_pages and total_pages > max_pages:
-        total_pages = max_pages
+def _parse_review_count(result: ScrapeApiResponse) -> int:
+    """total reviews matching the filters of a review page, e.g. "1,234 total ratings, 567 with reviews" """
+    counts = result.selector.css("div[data-hook=cr-filter-info-review-rating-count] ::text").re(r"(\d+,*\d*)")
+    return int(counts[1].replace(",", "")) if len(counts) > 1 else 0
 
-    log.info(f"found total {total_reviews} reviews across {total_pages} pages -> scraping")
-    other_pages = []
-    for page in range(4, total_pages + 1):
-        url_prefix = url.split(f'{ASIN}')[0]
-        url = url_prefix + f'ref=cm_cr_getr_d_paging_btm_next_{page}?pageNumber={page}&pageSize={_reviews_per_page}'
-        other_pages.append(ScrapeConfig(url, **BASE_CONFIG))
-    async for result in SCRAPFLY.concurrent_scrape(other_pages):
-        page_reviews = parse_reviews(result)
+
+# amazon stops review paging at 10 pages of 10 reviews, every filter combination is paged separately
+REVIEW_SPLITS = [
+    ("filterByStar", ["five_star", "four_star", "three_star", "two_star", "one_star"]),
+    ("sortBy", ["recent", "helpful"]),
+    ("mediaType", ["all_contents", "media_reviews_only"]),
+    ("formatType", ["all_formats", "current_format"]),
+]
+
+
+def _split_review_filters(filters: Dict) -> List[Dict]:
+    """narrow review filters with the next filter of REVIEW_SPLITS that isn't set yet"""
+    for name, values in REVIEW_SPLITS:
+        if name not in filters:
+            return [{**filters, name: value} for value in values]
+    return []
+
+
+async def _scrape_review_pages(url: str, first_page: ScrapeApiResponse, total_pages: int) -> List[Review]:
+    reviews = await parse_response(parse_reviews, first_page)
+    other_pages = [
+        ScrapeConfig(_add_or_replace_url_parameters(url, pageNumber=page), **BASE_CONFIG)
+        for page in range(2, total_pages + 1)
+    ]
+    async for page_reviews in parse_responses(SCRAPFLY.concurrent_scrape(other_pages), parse_reviews):
+        if isinstance(page_reviews, Exception):
+            log.error(f"failed to scrape review page: {page_reviews}")
+            continue
         reviews.extend(page_reviews)
+    return reviews
+
+
+async def scrape_reviews(url: str, ASIN=None, max_pages: Optional[int] = None) -> List[Review]:
+    """
+    scrape product reviews of a given review page URL of an amazon product.
+    Amazon paging stops at 10 pages, to scrape more (max_pages above 10 or None for all reviews) the reviews are
+    split by star rating, sort order, media and format filters and each filter combination is paged separately.
+    """
+    log.info(f"scraping review page: {url}")
+    if max_pages is not None and max_pages <= 10:
+        first_page = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
+        total_pages = min(math.ceil(_parse_review_count(first_page) / 10), max_pages)
+        log.info(f"scraping {total_pages} review pages")
+        reviews = await _scrape_review_pages(url, first_page, total_pages)
+        log.info(f"scraped total {len(reviews)} reviews")
+        return reviews
+
+    async def probe(filters: Dict):
+        response = await SCRAPFLY.async_scrape(
+            ScrapeConfig(_add_or_replace_url_parameters(url, pageNumber=1, **filters), **BASE_CONFIG)
+        )
+        return _parse_review_count(response), response
+
+    async def scrape_filters(shard: Shard) -> List[Review]:
+        total_pages = min(math.ceil(shard.total / 10), 10)
+        return await _scrape_review_pages(shard.page.context["url"], shard.page, total_pages)
+
+    reviews = []
+    # closing the crawl on break cancels the shards still being scraped
+    async with aclosing(crawl_shards(
+        {},
+        probe=probe,
+        split=_split_review_filters,
+        scrape=scrape_filters,
+        cap=10 * 10,
+        key=lambda review: review["id"],
+    )) as shard_reviews:
+        async for review in shard_reviews:
+            reviews.append(review)
+            if max_pages and len(reviews) >= max_pages * 10:
+                break
     log.info(f"scraped total {len(reviews)} reviews")
     return reviews
 
@@ -252,7 +296,7 @@ async def scrape_product(url: str) -> List[Product]:
         product_result = await SCRAPFLY.async_scrape(ScrapeConfig(
             url, **BASE_CONFIG, render_js=True, wait_for_selector="#productDetails_detailBullets_sections1 tr"
         ))
-        variants = [parse_product(product_result)]
+        variants = [await parse_response(parse_product, product_result)]
         return variants
     except:
         log.info(f'{url} not found. skip...')
@@ -270,15 +314,18 @@ async def scrape_product(url: str) -> List[Product]:
 
 
 async def scrape_products(urls: List[str]) -> List[Product]:
-    """scrape multiple Amazon.com products"""
+    """scrape multiple Amazon.com products, each product is also streamed to results/products_on_time.jsonl"""
     products = []
     product_urls = [url.split("/ref=")[0] for url in urls]
     log.info(f"scraping {len(product_urls)} products")
     _to_scrape = [ScrapeConfig(url, **BASE_CONFIG) for url in product_urls]
-    async for result in SCRAPFLY.concurrent_scrape(_to_scrape):
-        res = parse_product(result)
-        with output.joinpath(f"products_on_time.json").open('a', encoding='utf-8') as file:
-            file.write(json.dumps(res, indent=2) + ",\n")
-        products.extend(res)
+    with JsonlSink(output.joinpath("products_on_time.jsonl")) as sink:
+        # product pages are parsed in worker processes when parse workers are enabled
+        async for res in parse_responses(SCRAPFLY.concurrent_scrape(_to_scrape), parse_product):
+            if isinstance(res, Exception):
+                log.error(f"failed to scrape product page: {res}")
+                continue
+            sink.write(res)
+            products.append(res)
 
     return products
\ No newline at end of file
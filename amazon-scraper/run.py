@@ -1,6 +1,7 @@
 import asyncio
 import json
 from pathlib import Path
+from scraper_runtime import JsonlSink
 import amazon
 
 output = Path(__file__).parent / "results"
@@ -35,27 +36,27 @@ async def run():
         # products = await iherb.scrape_products(urls)
         # output.joinpath(f"search_{k}_products.json").write_text(json.dumps(products, indent=2))
         
-        for product in search:
-            url = product["url"]
-            # brand = product.get('brand', '')
-            product_data = await amazon.scrape_product(url)
-            if not product_data:
-                continue
-            product_data = product_data[0]
-            with output.joinpath(f"search_california_poppy_{k}_products_only.json").open('a', encoding='utf-8') as file:
-                file.write(json.dumps(product_data, indent=2) + ",\n") 
-
-            # if not ASIN:
-            #     continue
-            # else:
-            #     review_url = url.split(f'dp/{ASIN}')[0]  + 'product-reviews/' + ASIN + '/ref=cm_cr_dp_d_show_all_btm?ie=UTF8&reviewerType=all_reviews'
-            #     reviews = await amazon.scrape_reviews(review_url, ASIN, max_pages=5)
-            #     for review in reviews:
-            #         review.update(product_data)
-            #         review.update({'brand': brand})
-
-            #         with output.joinpath(f"search_california_poppy_{k}_products_reviews.json").open('a', encoding='utf-8') as file:
-            #             file.write(json.dumps(review, indent=2) + ",\n") 
+        with JsonlSink(output.joinpath(f"search_california_poppy_{k}_products_only.jsonl")) as sink:
+            for product in search:
+                url = product["url"]
+                # brand = product.get('brand', '')
+                product_data = await amazon.scrape_product(url)
+                if not product_data:
+                    continue
+                product_data = product_data[0]
+                sink.write(product_data)
+
+                # if not ASIN:
+                #     continue
+                # else:
+                #     review_url = url.split(f'dp/{ASIN}')[0]  + 'product-reviews/' + ASIN + '/ref=cm_cr_dp_d_show_all_btm?ie=UTF8&reviewerType=all_reviews'
+                #     reviews = await amazon.scrape_reviews(review_url, ASIN, max_pages=5)
+                #     for review in reviews:
+                #         review.update(product_data)
+                #         review.update({'brand': brand})
+
+                #         with output.joinpath(f"search_california_poppy_{k}_products_reviews.json").open('a', encoding='utf-8') as file:
+                #             file.write(json.dumps(review, indent=2) + ",\n") 
 
 
 if __name__ == "__main__":
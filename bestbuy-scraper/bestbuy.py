@@ -5,42 +5,33 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
-import gzip
 import json
-import jmespath
-from typing import Dict, List, Union
-from parsel import Selector
+from pathlib import Path
+from typing import Dict, List, Optional, Union
 from urllib.parse import urlencode, quote_plus
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import ChangeTracker, JsonlSink, crawl_sitemaps, get_client, iter_sitemap, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("bestbuy")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("bestbuy", {
     # bypass bestbuy.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
-}
+})
 
 
 def parse_sitemaps(response: ScrapeApiResponse) -> List[str]:
     """parse links for bestbuy sitemap"""
-    # decode the .gz file
-    bytes_data = response.scrape_result['content'].getvalue()
-    xml = str(gzip.decompress(bytes_data), 'utf-8')
-    selector = Selector(xml)
-    data = []
-    for url in selector.xpath("//url/loc/text()"):
-        data.append(url.get())
-    return data
+    # the .gz file is decompressed and parsed as a stream
+    return [entry.loc for entry in iter_sitemap(response.content)]
 
 
 async def scrape_sitemaps(url: str) -> List[str]:
-    """scrape link data from bestbuy sitemap"""
-    response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-    promo_urls = parse_sitemaps(response)
+    """scrape link data from bestbuy sitemap, the sitemaps of a sitemap index are scraped concurrently"""
+    promo_urls = [entry.loc async for entry in crawl_sitemaps(SCRAPFLY, [url], BASE_CONFIG)]
     log.success(f"scraped {len(promo_urls)} urls from sitemaps")
     return promo_urls
 
@@ -50,7 +41,7 @@ def refine_product(data: Dict) -> Dict:
     parsed_product = {}
     specifications = data["shop-specifications"]["specifications"]["categories"]
     pricing = data["pricing"]["app"]["data"]["skuPriceDomain"]
-    ratings = jmespath.search(
+    ratings = query(
         """{
         featureRatings: aggregateSecondaryRatings,
         positiveFeatures: distillation.positiveFeatures[].{name: name, score: representativeQuote.score, totalReviewCount: totalReviewCount},
@@ -60,7 +51,7 @@ def refine_product(data: Dict) -> Dict:
     )
     faqs = []
     for item in data["faqs"]["app"]["questions"]["results"]:
-        result = jmespath.search(
+        result = query(
             """{
             sku: sku,
             questionTitle: questionTitle,
@@ -107,6 +98,31 @@ async def scrape_products(urls: List[str]) -> List[Dict]:
     return data
 
 
+async def scrape_product(url: str) -> Dict:
+    """scrape a single bestbuy product page"""
+    response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
+    return parse_product(response)
+
+
+async def track_sitemaps(url: str, output: Path, interval: int = 24 * 60 * 60, polls: Optional[int] = None):
+    """
+    keep bestbuy product data up to date: poll the sitemap (index) every interval seconds and scrape only the
+    new product pages and pages whose lastmod changed, appending them as JSON lines to the output file.
+    Scraped versions persist in an SQLite file next to the output so restarts pick up where they left off.
+    """
+    tracker = ChangeTracker(
+        output.with_suffix(".db"),
+        source=url,
+        poll=lambda since: crawl_sitemaps(SCRAPFLY, [url], BASE_CONFIG, since=since),
+        scrape=scrape_product,
+    )
+    try:
+        with JsonlSink(output) as sink:
+            await tracker.track(sink.write, interval=interval, polls=polls)
+    finally:
+        tracker.store.close()
+
+
 def parse_search(response: ScrapeApiResponse):
     """parse search data from search pages"""
     selector = response.selector
@@ -5,20 +5,20 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 import re
-import os
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, site_config
 from typing import Dict, List
 from urllib.parse import urlencode
 from loguru import logger as log
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("bing")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("bing", {
     # bypass Bing web scraping blocking
     "asp": True,
     # set the poxy location to US to get the result in English
     "country": "US",
-}
+})
 
 
 def parse_serps(response: ScrapeApiResponse) -> List[Dict]:
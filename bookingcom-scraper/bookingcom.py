@@ -7,23 +7,31 @@ $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 
 For example use instructions see ./run.py
 """
+import asyncio
+import copy
 import json
-import os
 import re
 from collections import defaultdict
-from typing import Dict, List, Optional, TypedDict
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, TypedDict, Union
 from urllib.parse import urlencode
-from uuid import uuid4
 
 from loguru import logger as log
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+from scraper_runtime import BudgetExceeded, CsvSink, GraphQLBatcher, SessionPool, get_client, parse_response, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("bookingcom")
+BASE_CONFIG = site_config("bookingcom", {
     # Booking.com requires Anti Scraping Protection bypass feature:
     "asp": True,
     "country": "US",
-}
+})
+# the hotel page and its pricing graphql request have to come from the same session,
+# sessions are reused by the following hotels instead of starting a new one per hotel
+SESSIONS = SessionPool(SCRAPFLY)
+# graphql operations requested at once are sent together in batches when the endpoint accepts them
+GRAPHQL = GraphQLBatcher(SCRAPFLY)
 
 
 class Location(TypedDict):
@@ -92,9 +100,15 @@ def retrieve_graphql_body(result: ScrapeApiResponse) -> List[Dict]:
     }
 
 
-def generate_graphql_request(url_params: str, body: Dict, offset: int):
-    """create a scrape config for the search graphql request"""
-    body["variables"]["input"]["pagination"]["offset"] = offset
+def search_operation(body: Dict, offset: int) -> Dict:
+    """the search graphql operation of a result offset"""
+    operation = copy.deepcopy(body)
+    operation["variables"]["input"]["pagination"]["offset"] = offset
+    return operation
+
+
+def generate_graphql_request(url_params: str, body: Optional[Dict] = None):
+    """create a scrape config for the search graphql request, the body is set by GRAPHQL when left out"""
     return ScrapeConfig(
         "https://www.booking.com/dml/graphql?" + url_params,
             headers={
@@ -106,17 +120,20 @@ def generate_graphql_request(url_params: str, body: Dict, offset: int):
                 "priority":"u=1, i",
                 "referer":"https://www.booking.com/searchresults.en-gb.html?" + url_params,
             },
-        data=body,
+        body=json.dumps(body or {}),
         method="POST",
         asp=True
     )
 
 
+def parse_graphql_result(result: Dict) -> List[Dict]:
+    """parse the search results from a graphql operation result"""
+    return result["data"]["searchQueries"]["search"]["results"]
+
+
 def parse_graphql_response(response: ScrapeApiResponse) -> List[Dict]:
     """parse the search results from the graphql response"""
-    data = json.loads(response.content)
-    parsed_data = data["data"]["searchQueries"]["search"]["results"]
-    return parsed_data
+    return parse_graphql_result(json.loads(response.content))
 
 
 async def scrape_search(
@@ -162,13 +179,14 @@ async def scrape_search(
 
     data = []
     body = retrieve_graphql_body(first_page)
-    to_scrape = [
-        generate_graphql_request(url_params, body, offset)
-        for offset in range(0, _total_results, 25)
-    ]
-    log.info(f"scraping search results from the graphql api: {len(to_scrape)} pages to request")
-    async for response in SCRAPFLY.concurrent_scrape(to_scrape):
-        data.extend(parse_graphql_response(response))
+    offsets = range(0, _total_results, 25)
+    log.info(f"scraping search results from the graphql api: {len(offsets)} pages to request")
+    # the offsets are sent in batches of operations when the endpoint accepts them
+    results = await GRAPHQL.execute_many(
+        (search_operation(body, offset), generate_graphql_request(url_params)) for offset in offsets
+    )
+    for result in results:
+        data.extend(parse_graphql_result(result))
     log.success(f"scraped {len(data)} results from search pages")
     return data
        
@@ -222,6 +240,55 @@ def parse_hotel(result: ScrapeApiResponse) -> Hotel:
     return data
 
 
+def availability_calendar_operation(hotel_country: str, hotel_name: str, checkin: str, price_n_days: int) -> Dict:
+    """graphql AvailabilityCalendar operation of a hotel's prices from checkin for price_n_days days"""
+    return {
+        "operationName": "AvailabilityCalendar",
+        # hotel varialbes go here
+        # you can adjust number of adults, room number etc.
+        "variables": {
+            "input": {
+                "travelPurpose": 2,
+                "pagenameDetails": {
+                    "countryCode": hotel_country,
+                    "pagename": hotel_name,
+                },
+                "searchConfig": {
+                    "searchConfigDate": {
+                        "startDate": checkin,
+                        "amountOfDays": price_n_days,
+                    },
+                    "nbAdults": 2,
+                    "nbRooms": 1,
+                },
+            }
+        },
+        "extensions": {},
+        # this is the query itself, don't alter it
+        "query": "query AvailabilityCalendar($input: AvailabilityCalendarQueryInput!) {\n  availabilityCalendar(input: $input) {\n    ... on AvailabilityCalendarQueryResult {\n      hotelId\n      days {\n        available\n        avgPriceFormatted\n        checkin\n        minLengthOfStay\n        __typename\n      }\n      __typename\n    }\n    ... on AvailabilityCalendarQueryError {\n      message\n      __typename\n    }\n    __typename\n  }\n}\n",
+    }
+
+
+def availability_calendar_config(result: ScrapeApiResponse, session: str) -> ScrapeConfig:
+    """request of the graphql AvailabilityCalendar operations of a hotel page, in the page's session"""
+    _csrf_token = re.findall(r"b_csrf_token:\s*'(.+?)'", result.content)[0]
+    return ScrapeConfig(
+        "https://www.booking.com/dml/graphql?lang=en-gb",
+        method="POST",
+        # the body is set by GRAPHQL
+        body="{}",
+        # note that we need to set headers to avoid being blocked
+        headers={
+            "content-type": "application/json",
+            "x-booking-csrf-token": _csrf_token,
+            "referer": result.context["url"],
+            "origin": "https://www.booking.com",
+        },
+        session=session,
+        **BASE_CONFIG,
+    )
+
+
 async def scrape_hotel(url: str, checkin: str, price_n_days=61) -> Hotel:
     """
     Scrape Booking.com hotel data and pricing information.
@@ -232,69 +299,110 @@ async def scrape_hotel(url: str, checkin: str, price_n_days=61) -> Hotel:
     if BASE_CONFIG.get("cache"):
         raise Exception("scrapfly cache cannot be used with sessions when scraping hotel data")
     log.info(f"scraping hotel {url} {checkin} with {price_n_days} days of pricing data")
-    session = str(uuid4()).replace("-", "")
-    result = await SCRAPFLY.async_scrape(
-        ScrapeConfig(
-            url,
-            session=session,
-            **BASE_CONFIG,
-        )
-    )
-    hotel = parse_hotel(result)
+    async with SESSIONS.lease() as session:
+        result = await session.scrape(ScrapeConfig(url, **BASE_CONFIG))
+        # parsed in a worker process when parse workers are enabled
+        hotel = await parse_response(parse_hotel, result)
 
-    # To scrape price we'll be calling Booking.com's graphql service
-    # in particular we'll be calling AvailabilityCalendar query
-    # first, extract hotel variables:
-    _hotel_country = re.findall(r'hotelCountry:\s*"(.+?)"', result.content)[0]
-    _hotel_name = re.findall(r'hotelName:\s*"(.+?)"', result.content)[0]
-    _csrf_token = re.findall(r"b_csrf_token:\s*'(.+?)'", result.content)[0]
-    # then create graphql query
-    gql_body = json.dumps(
-        {
-            "operationName": "AvailabilityCalendar",
-            # hotel varialbes go here
-            # you can adjust number of adults, room number etc.
-            "variables": {
-                "input": {
-                    "travelPurpose": 2,
-                    "pagenameDetails": {
-                        "countryCode": _hotel_country,
-                        "pagename": _hotel_name,
-                    },
-                    "searchConfig": {
-                        "searchConfigDate": {
-                            "startDate": checkin,
-                            "amountOfDays": price_n_days,
-                        },
-                        "nbAdults": 2,
-                        "nbRooms": 1,
-                    },
-                }
-            },
-            "extensions": {},
-            # this is the query itself, don't alter it
-            "query": "query AvailabilityCalendar($input: AvailabilityCalendarQueryInput!) {\n  availabilityCalendar(input: $input) {\n    ... on AvailabilityCalendarQueryResult {\n      hotelId\n      days {\n        available\n        avgPriceFormatted\n        checkin\n        minLengthOfStay\n        __typename\n      }\n      __typename\n    }\n    ... on AvailabilityCalendarQueryError {\n      message\n      __typename\n    }\n    __typename\n  }\n}\n",
-        },
-        # note: this removes unnecessary whitespace in JSON output
-        separators=(",", ":"),
-    )
-    # scrape booking graphql
-    result_price = await SCRAPFLY.async_scrape(
-        ScrapeConfig(
-            "https://www.booking.com/dml/graphql?lang=en-gb",
-            method="POST",
-            body=gql_body,
-            session=session,
-            # note that we need to set headers to avoid being blocked
-            headers={
-                "content-type": "application/json",
-                "x-booking-csrf-token": _csrf_token,
-                "referer": result.context["url"],
-                "origin": "https://www.booking.com",
-            },
-            **BASE_CONFIG,
-        )
-    )
-    price_data = json.loads(result_price.content)
+        # To scrape price we'll be calling Booking.com's graphql service
+        # in particular we'll be calling AvailabilityCalendar query
+        # first, extract hotel variables:
+        _hotel_country = re.findall(r'hotelCountry:\s*"(.+?)"', result.content)[0]
+        _hotel_name = re.findall(r'hotelName:\s*"(.+?)"', result.content)[0]
+        # then send the graphql query, calendar operations of the same session are batched together
+        try:
+            price_data = await GRAPHQL.execute(
+                availability_calendar_operation(_hotel_country, _hotel_name, checkin, price_n_days),
+                availability_calendar_config(result, session.id),
+            )
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            # a failed calendar counts against the session, successes aren't counted as extra uses
+            session.record(e)
+            raise
     hotel["price"] = price_data["data"]["availabilityCalendar"]["days"]
     return hotel
+
+
+PRICE_COLUMNS = ["hotel_id", "date", "price", "available", "min_los", "scraped_at"]
+
+
+def calendar_windows(start: str, end: str, window_days: int = 61) -> List[Tuple[str, int]]:
+    """(checkin, number of days) AvailabilityCalendar windows covering start to end, both included"""
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    windows = []
+    while first <= last:
+        days = min(window_days, (last - first).days + 1)
+        windows.append((first.isoformat(), days))
+        first += timedelta(days=days)
+    return windows
+
+
+def parse_price(formatted: Optional[str]) -> Optional[float]:
+    """numeric price of a formatted price like "US$1,234" """
+    number = re.sub(r"[^\d.]", "", formatted or "")
+    return float(number) if number else None
+
+
+async def scrape_price_calendars(
+    urls: List[str], start: str, end: str, output: Union[str, Path], window_days: int = 61, concurrency: int = 8
+) -> int:
+    """
+    Scrape the daily prices of many Booking.com hotels from start to end (e.g. 2024-06-01 to 2025-05-31)
+    to a CSV table of hotel_id, date, price, available, min_los and scraped_at rows, returns the number of rows written.
+    Every hotel is scraped in one session: its page, then all its calendar windows at once.
+    Runs into the same output append their rows, scraped_at (the UTC start of the run) tells them apart.
+    """
+    if BASE_CONFIG.get("cache"):
+        raise Exception("scrapfly cache cannot be used with sessions when scraping hotel data")
+    windows = calendar_windows(start, end, window_days)
+    scraped_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    log.info(f"scraping {len(urls)} hotel price calendars from {start} to {end} in {len(windows)} windows each")
+    # a session per hotel in flight, reused by the following hotels
+    sessions = SessionPool(SCRAPFLY, size=concurrency)
+
+    async def scrape_calendar(url: str, sink: CsvSink) -> int:
+        async with sessions.lease() as session:
+            result = await session.scrape(ScrapeConfig(url, **BASE_CONFIG))
+            hotel_id = re.findall(r"b_hotel_id:\s*'(.+?)'", result.content)[0]
+            _hotel_country = re.findall(r'hotelCountry:\s*"(.+?)"', result.content)[0]
+            _hotel_name = re.findall(r'hotelName:\s*"(.+?)"', result.content)[0]
+            config = availability_calendar_config(result, session.id)
+            # the windows share the session and are sent together as one batch of graphql operations
+            try:
+                calendars = await GRAPHQL.execute_many(
+                    (availability_calendar_operation(_hotel_country, _hotel_name, checkin, days), config)
+                    for checkin, days in windows
+                )
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                session.record(e)
+                raise
+        rows = 0
+        for calendar in calendars:
+            for day in calendar["data"]["availabilityCalendar"].get("days") or []:
+                if not start <= day["checkin"] <= end:
+                    continue
+                sink.write([
+                    hotel_id,
+                    day["checkin"],
+                    parse_price(day.get("avgPriceFormatted")),
+                    int(bool(day.get("available"))),
+                    day.get("minLengthOfStay"),
+                    scraped_at,
+                ])
+                rows += 1
+        return rows
+
+    with CsvSink(output, PRICE_COLUMNS) as sink:
+        results = await asyncio.gather(*[scrape_calendar(url, sink) for url in urls], return_exceptions=True)
+    for url, result in zip(urls, results):
+        if isinstance(result, BudgetExceeded):
+            raise result
+        if isinstance(result, Exception):
+            log.warning(f"failed to scrape the price calendar of {url}: {result}")
+    rows = sum(result for result in results if isinstance(result, int))
+    log.success(f"scraped {rows} daily prices of {len(urls)} hotels to {output}")
+    return rows
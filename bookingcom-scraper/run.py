@@ -37,6 +37,15 @@ async def run():
     )
     output.joinpath("hotel.json").write_text(json.dumps(result_hotel, indent=2, ensure_ascii=False), encoding="utf-8")
 
+    # daily prices of many hotels over a date range as a compact csv table
+    output.joinpath("prices.csv").unlink(missing_ok=True)
+    await bookingcom.scrape_price_calendars(
+        ["https://www.booking.com/hotel/gb/gardencourthotel.en-gb.html"],
+        start=WEEK_FROM_NOW,
+        end=MONTH_FROM_NOW,
+        output=output.joinpath("prices.csv"),
+    )
+
 
 if __name__ == "__main__":
     asyncio.run(run())
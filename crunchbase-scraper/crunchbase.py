@@ -6,25 +6,23 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 from datetime import datetime
-import gzip
 import json
-import os
-import jmespath
+from pathlib import Path
 
-from parsel import Selector
-from typing import Dict, Iterator, List, Literal, Tuple, TypedDict
+from typing import Dict, Iterator, List, Literal, Optional, Tuple, TypedDict
 
 from loguru import logger as log
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+from scraper_runtime import ChangeTracker, JsonlSink, crawl_sitemaps, get_client, iter_sitemap, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("crunchbase")
+BASE_CONFIG = site_config("crunchbase", {
     # Crunchbase.com requires Anti Scraping Protection bypass feature.
     # for more: https://scrapfly.io/docs/scrape-api/anti-scraping-protection
     "asp": True,
     "render_js": True,
     "proxy_pool": "public_residential_pool"
-}
+})
 
 
 class CompanyData(TypedDict):
@@ -91,26 +89,13 @@ def parse_person(result: ScrapeApiResponse) -> Dict:
     return _reduce_person_dataset(dataset)
 
 
-async def _scrape_sitemap_index() -> List[str]:
-    """scrape Crunchbase Sitemap index for all sitemap urls"""
-    log.info("scraping sitemap index for sitemap urls")
-    result = await SCRAPFLY.async_scrape(
-        ScrapeConfig("https://www.crunchbase.com/www-sitemaps/sitemap-index.xml", **BASE_CONFIG)
-    )
-    urls = result.selector.xpath("//sitemap/loc/text()").getall()
-    log.info(f"found {len(urls)} sitemaps")
-    return urls
+SITEMAP_INDEX = "https://www.crunchbase.com/www-sitemaps/sitemap-index.xml"
 
 
 def parse_sitemap(result: ScrapeApiResponse) -> Iterator[Tuple[str, datetime]]:
     """parse sitemap for location urls and their last modification times"""
-    sel = Selector(text=gzip.decompress(result.content.read()).decode())
-    urls = sel.xpath("//url")
-    log.info(f"found {len(urls)} in sitemap {result.context['url']}")
-    for url_node in urls:
-        url = url_node.xpath("loc/text()").get()
-        last_modified = datetime.fromisoformat(url_node.xpath("lastmod/text()").get().strip("Z"))
-        yield url, last_modified
+    for entry in iter_sitemap(result.content):
+        yield entry.loc, entry.lastmod
 
 
 async def discover_target(target: Literal["organizations", "people"], min_last_modified=None):
@@ -120,16 +105,31 @@ async def discover_target(target: Literal["organizations", "people"], min_last_m
     
     The min_last_modified field can be used to discover only recently updated targets
     """
-    sitemap_urls = await _scrape_sitemap_index()
-    urls = [url for url in sitemap_urls if target in url]
-    log.info(f"found {len(urls)} matching sitemap urls (from total of {len(sitemap_urls)})")
-    for url in urls:
-        log.info(f"scraping sitemap: {url}")
-        result = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-        for url, mod_time in parse_sitemap(result):
-            if min_last_modified and mod_time < min_last_modified:
-                continue  # skip
-            yield url
+    # the matching sitemaps of the index are scraped concurrently and their urls streamed as each one arrives
+    async for entry in crawl_sitemaps(SCRAPFLY, [SITEMAP_INDEX], BASE_CONFIG, follow=target, since=min_last_modified):
+        yield entry.loc
+
+
+async def track_target(
+    target: Literal["organizations", "people"], output: Path, interval: int = 24 * 60 * 60, polls: Optional[int] = None
+):
+    """
+    keep a crunchbase target (organizations or people) up to date: poll the sitemaps every interval seconds and
+    scrape only the new pages and pages whose lastmod changed, appending them as JSON lines to the output file.
+    Scraped versions persist in an SQLite file next to the output so restarts pick up where they left off.
+    """
+    tracker = ChangeTracker(
+        output.with_suffix(".db"),
+        source=f"crunchbase-{target}",
+        # after the first poll only shards and urls modified since the previous poll are listed
+        poll=lambda since: crawl_sitemaps(SCRAPFLY, [SITEMAP_INDEX], BASE_CONFIG, follow=target, since=since),
+        scrape=scrape_company if target == "organizations" else scrape_person,
+    )
+    try:
+        with JsonlSink(output) as sink:
+            await tracker.track(sink.write, interval=interval, polls=polls)
+    finally:
+        tracker.store.close()
 
 
 def _reduce_organization_dataset(data: Dict) -> Dict:
@@ -139,7 +139,7 @@ def _reduce_organization_dataset(data: Dict) -> Dict:
     Note that Crunchbase dataset is huge and contains a lot of different fields.
     This example is using jmespath to select most commonly requested fields.
     """
-    return jmespath.search(
+    return query(
         """{
         id: properties.identifier.permalink,
         name: properties.title,
@@ -237,7 +237,7 @@ def _reduce_employee_dataset(data: Dict) -> List[Dict]:
     parsed = []
     for person in data["entities"]:
         parsed.append(
-            jmespath.search(
+            query(
                 """{
                 name: properties.name,    
                 linkedin: properties.linkedin,
@@ -252,7 +252,7 @@ def _reduce_employee_dataset(data: Dict) -> List[Dict]:
 
 def _reduce_person_dataset(dataset: dict) -> Dict:
     """Reduce person dataset to a smaller subset of the most important fields"""
-    parsed = jmespath.search(
+    parsed = query(
         """{
         name: properties.identifier.value,
         title: properties.title,
@@ -5,24 +5,23 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
-import jmespath
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, query, site_config
 from typing import Dict, List
 from pathlib import Path
 from loguru import logger as log
 
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("domaincom")
 
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("domaincom", {
     # bypass domain.com.au scraping blocking
     "asp": True,
     # set the proxy country to australia
     "country": "AU",
-}
+})
 
 
 output = Path(__file__).parent / "results"
@@ -60,7 +59,7 @@ def parse_page_props(data: Dict) -> Dict:
     data = data["__APOLLO_STATE__"]
     key = next(k for k in data if k.startswith("Property:"))
     data = data[key]
-    result = jmespath.search(
+    result = query(
         """{
         propertyId: propertyId,
         unitNumber: address.unitNumber,
@@ -82,7 +81,7 @@ def parse_component_props(data: Dict) -> Dict:
     """refine property pages data"""
     if not data:
         return
-    result = jmespath.search(
+    result = query(
         """{
     listingId: listingId,
     listingUrl: listingUrl,
@@ -124,7 +123,7 @@ def parse_search_page(data):
     # iterate over card items in the search data
     for key in data.keys():
         item = data[key]
-        parsed_data = jmespath.search(
+        parsed_data = query(
             """{
         id: id,
         listingType: listingType,
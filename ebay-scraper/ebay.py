@@ -7,7 +7,6 @@ $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 import json
 import math
-import os
 import re
 from pathlib import Path
 from collections import defaultdict
@@ -17,17 +16,18 @@ from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 import dateutil
 from loguru import logger as log
 
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient, ScrapflyScrapeError
+from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyScrapeError
+from scraper_runtime import fan_out, find_json_object, get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("ebay")
+BASE_CONFIG = site_config("ebay", {
     # Ebay.com requires Anti Scraping Protection bypass feature.
     # for more: https://scrapfly.io/docs/scrape-api/anti-scraping-protection
     "asp": True,
     "country": "US",  # change country for geo details like currency and shipping
     "lang": ["en-US"],
 
-}
+})
 
 
 output = Path(__file__).parent / "results"
@@ -41,19 +41,39 @@ def update_page_number(url, new_page_number):
     return url
 
 
-def _find_json_objects(text: str, decoder=json.JSONDecoder()):
-    """Find JSON objects in text, and generate decoded JSON data"""
-    pos = 0
-    while True:
-        match = text.find("{", pos)
-        if match == -1:
-            break
-        try:
-            result, index = decoder.raw_decode(text[match:])
-            yield result
-            pos = match + index
-        except ValueError:
-            pos = match + 1
+def parse_variants(result: ScrapeApiResponse) -> List[Dict]:
+    """
+    Parse variant data from Ebay's listing page of a product with variants.
+    This data is located in a js variable MSKU hidden in a <script> element.
+    """
+    script = result.selector.xpath('//script[contains(., "MSKU")]/text()').get()
+    if not script:
+        return []
+    data = find_json_object(script, "MSKU")
+    if data is None:
+        return []
+    data = data["MSKU"]
+    # the selection names are the visible names of the variant menus, e.g. {0: "Color", 3: "Storage Capacity"}
+    selection_names = {}
+    for menu in data["selectMenus"]:
+        for id_ in menu["menuItemValueIds"]:
+            selection_names[id_] = menu["displayLabel"]
+    # then every variant combination is resolved to its selected values and price
+    results = []
+    for combination, variant_id in data["variationCombinations"].items():
+        variant = data["variationsMap"][str(variant_id)]
+        product = {"id": str(variant_id)}
+        for menu_item_id in combination.split("_"):
+            menu_item = data["menuItemMap"][menu_item_id]
+            product[selection_names[int(menu_item_id)]] = menu_item["displayName"]
+        price = variant.get("binModel", {}).get("price", {})
+        product["price_original"] = price.get("value", {}).get("value")
+        product["price_original_currency"] = price.get("value", {}).get("currency")
+        product["price_converted"] = price.get("convertedFromValue", {}).get("value")
+        product["price_converted_currency"] = price.get("convertedFromValue", {}).get("currency")
+        product["out_of_stock"] = variant.get("quantity", {}).get("outOfStock")
+        results.append(product)
+    return results
 
 
 def parse_product(result: ScrapeApiResponse):
@@ -138,21 +158,18 @@ def parse_reviews(result: ScrapeApiResponse) -> List:
     print(parsed)
     return parsed
 
-async def scrape_reviews(url: str, max_pages: Optional[int] = None) -> List:
-    """scrape product reviews of a given URL of an ebay product"""
-
-    log.info(f"scraping review page: {url}")
-    first_page_result = await SCRAPFLY.async_scrape(ScrapeConfig(url, 
+def _review_config(url: str) -> ScrapeConfig:
+    return ScrapeConfig(url, 
                                 #     js_scenario=[
                                 #     {
                                 #         "wait": 500
                                 #     }
                                 # ], render_js = True,
-                                **BASE_CONFIG))
-    try:
-        reviews = parse_reviews(first_page_result)
-    except:
-        reviews = []
+                                **BASE_CONFIG)
+
+
+def _other_review_pages(url: str, reviews: List, max_pages: Optional[int] = None) -> List[ScrapeConfig]:
+    """scrape configs of the review pages after the first one from the reviews of the first page"""
     if not reviews:
         return []
     # find total reviews
@@ -167,23 +184,32 @@ async def scrape_reviews(url: str, max_pages: Optional[int] = None) -> List:
         total_pages = max_pages
 
     log.info(f"found total {total_reviews} reviews across {total_pages} pages -> scraping")
-    other_pages = []
-    for page in range(2, total_pages + 1):
-        url = update_page_number(url, page)
-        other_pages.append(ScrapeConfig(url, 
-                                #          js_scenario=[
-                                #     {
-                                #         "wait": 500
-                                #     }
-                                # ], render_js = True,
-                                        **BASE_CONFIG))
+    return [_review_config(update_page_number(url, page)) for page in range(2, (total_pages or 1) + 1)]
 
-    async for result in SCRAPFLY.concurrent_scrape(other_pages):
+
+def _save_reviews(result: ScrapeApiResponse) -> List:
+    """parse a review page and append its reviews to the results file"""
+    page_reviews = parse_reviews(result)
+    with output.joinpath(f"reviews_on_time_.json").open('a', encoding='utf-8') as file:
+        file.write(json.dumps(page_reviews, indent=2) + ",")
+    return page_reviews
+
+
+async def scrape_reviews(url: str, max_pages: Optional[int] = None) -> List:
+    """scrape product reviews of a given URL of an ebay product"""
+
+    log.info(f"scraping review page: {url}")
+    first_page_result = await SCRAPFLY.async_scrape(_review_config(url))
+    try:
+        reviews = parse_reviews(first_page_result)
+    except:
+        reviews = []
+    if not reviews:
+        return []
+
+    async for result in SCRAPFLY.concurrent_scrape(_other_review_pages(url, reviews, max_pages)):
         try:
-            page_reviews = parse_reviews(result)
-            with output.joinpath(f"reviews_on_time_.json").open('a', encoding='utf-8') as file:
-                file.write(json.dumps(page_reviews, indent=2) + ",")
-            reviews.extend(page_reviews)
+            reviews.extend(_save_reviews(result))
         except:
             continue
             
@@ -192,10 +218,19 @@ async def scrape_reviews(url: str, max_pages: Optional[int] = None) -> List:
 
 
 async def scrape_all_reviews(urls: List[str], max_pages: Optional[int] = None):
-    """scrape all reviews of multiple iherb.com products"""
+    """scrape all reviews of multiple ebay products"""
+    # review pages of all products share one queue instead of scraping product after product
+    reviews_per_product = await fan_out(
+        SCRAPFLY,
+        urls,
+        first_page=_review_config,
+        other_pages=lambda url, first: _other_review_pages(url, parse_reviews(first), max_pages),
+        parse=_save_reviews,
+    )
     reviews = []
-    for url in urls:
-        reviews.extend(await scrape_reviews(url, max_pages))
+    for url, product_reviews in zip(urls, reviews_per_product):
+        log.info(f"scraped total {len(product_reviews)} reviews for url {url}")
+        reviews.extend(product_reviews)
     return reviews
 
 
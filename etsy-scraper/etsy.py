@@ -4,24 +4,24 @@ This is an example web scraper for etsy.com.
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
 import re
 import math
 import json
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
-from typing import Dict, List
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import Stage, get_client, run_pipeline, site_config
+from typing import AsyncIterator, Dict, List
 from loguru import logger as log
 
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("etsy")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("etsy", {
     # bypass Etsy.com web scraping blocking
     "asp": True,
     # set the poxy location to US
     "country": "US",
 
-}
+})
 
 def strip_text(text):
     """remove extra spaces while handling None values"""
@@ -152,13 +152,14 @@ async def parse_product_page(response, max_review_pages = 5) -> Dict:
         log.success(f"Scraped {len(product_data)} review pages")
     return product_data
 
-async def scrape_search(url: str, max_pages: int = None) -> List[Dict]:
-    """scrape product listing data from Etsy search pages"""
+async def iter_search(url: str, max_pages: int = None) -> AsyncIterator[Dict]:
+    """scrape Etsy search pages yielding product listings as soon as each page is parsed"""
     log.info("scraping the first search page")
     # etsy search pages are dynaminc, requiring render_js enabled
     first_page = await SCRAPFLY.async_scrape(ScrapeConfig(url, wait_for_selector="//div[@data-search-pagination]", render_js=True, **BASE_CONFIG))
     data = parse_search(first_page)
-    search_data = data["search_data"]
+    for item in data["search_data"]:
+        yield item
 
     # get the number of total pages to scrape
     total_pages = data["total_pages"]
@@ -175,10 +176,16 @@ async def scrape_search(url: str, max_pages: int = None) -> List[Dict]:
     async for response in SCRAPFLY.concurrent_scrape(other_pages):
         try:
             data = parse_search(response)
-            search_data.extend(data["search_data"])
         except Exception as e:
             log.error(f"failed to scrape search page: {e}")
-            pass
+            continue
+        for item in data["search_data"]:
+            yield item
+
+
+async def scrape_search(url: str, max_pages: int = None) -> List[Dict]:
+    """scrape product listing data from Etsy search pages"""
+    search_data = [item async for item in iter_search(url, max_pages=max_pages)]
     log.success(f"scraped {len(search_data)} product listings from search")
     return search_data
 
@@ -229,3 +236,34 @@ async def scrape_search_and_products(search_url: str, max_pages: int = None, max
     log.success(f"Scraped {len(products_data)} product pages successfully")
     
     return search_data, products_data
+
+
+async def scrape_product_page(url: str, max_review_pages: int = 5) -> List[Dict]:
+    """scrape a single product page and its review pages"""
+    response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
+    return await parse_product_page(response, max_review_pages=max_review_pages)
+
+
+async def stream_search_and_products(
+    search_urls: List[str], max_pages: int = None, max_review_pages: int = 5
+) -> AsyncIterator[Dict]:
+    """scrape search and product pages as one overlapping pipeline,
+    product pages are scraped as soon as their search page is parsed.
+    Yields each search listing with its product review data"""
+
+    async def search_listings(search_url: str) -> AsyncIterator[Dict]:
+        async for item in iter_search(search_url, max_pages=max_pages):
+            if item["productLink"]:
+                yield item
+
+    async def scrape_listing(listing: Dict) -> Dict:
+        product_data = await scrape_product_page(listing["productLink"], max_review_pages=max_review_pages)
+        return {**listing, "product_data": product_data}
+
+    async for product in run_pipeline(
+        search_urls,
+        Stage(search_listings, name="search"),
+        Stage(scrape_listing, concurrency=BASE_CONFIG.max_concurrency, name="products"),
+    ):
+        yield product
+
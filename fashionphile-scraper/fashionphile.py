@@ -5,22 +5,22 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
 from typing import Dict, List
 from pathlib import Path
 from loguru import logger as log
 from urllib.parse import parse_qs, urlencode, urlparse
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("fashionphile")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("fashionphile", {
     # bypass fashionphile.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -4,20 +4,37 @@ This is an example web scraper for g2.com.
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
 import math
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import EscalationLadder, get_client, site_config
 from typing import Dict, List, Literal
+from pathlib import Path
 from loguru import logger as log
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("g2")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("g2", {
     # bypass G2 web scraping blocking
     "asp": True,
     # set the poxy location to US
     "country": "US",
-}
+})
+
+# G2 blocks some pages on datacenter proxies, these are escalated to residential proxies and a headless browser
+# per URL, and the tier every page type needs is remembered in the results directory
+LADDER = EscalationLadder(SCRAPFLY, path=Path(__file__).parent / "results" / "escalation.json")
+
+
+def _has_search_results(response: ScrapeApiResponse) -> bool:
+    return bool(response.selector.xpath("//div[@class='ml-half']"))
+
+
+def _has_reviews(response: ScrapeApiResponse) -> bool:
+    return bool(response.selector.xpath("//div[@itemprop='review']"))
+
+
+def _has_alternatives(response: ScrapeApiResponse) -> bool:
+    return bool(response.selector.xpath("//div[@class='product-listing--competitor']"))
 
 
 def parse_search_page(response: ScrapeApiResponse):
@@ -61,7 +78,7 @@ def parse_search_page(response: ScrapeApiResponse):
 async def scrape_search(url: str, max_scrape_pages: int = None) -> List[Dict]:
     """scrape company listings from search pages"""
     log.info(f"scraping search page {url}")
-    first_page = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
+    first_page = await LADDER.scrape(ScrapeConfig(url, **BASE_CONFIG), check=_has_search_results)
     data = parse_search_page(first_page)
     search_data = data["search_data"]
     total_pages = data["total_pages"]
@@ -70,31 +87,17 @@ async def scrape_search(url: str, max_scrape_pages: int = None) -> List[Dict]:
     if max_scrape_pages and max_scrape_pages < total_pages:
         total_pages = max_scrape_pages
 
-    # scrape the remaining search pages concurrently and remove the successful request URLs
+    # scrape the remaining search pages concurrently, blocked pages are escalated one tier at a time
     log.info(f"scraping search pagination, remaining ({total_pages - 1}) more pages")
-    remaining_urls = [url + f"&page={page_number}" for page_number in range(2, total_pages + 1)]
-    to_scrape = [ScrapeConfig(url, **BASE_CONFIG) for url in remaining_urls]
-    async for response in SCRAPFLY.concurrent_scrape(to_scrape):
-        try:
-            data = parse_search_page(response)
-            search_data.extend(data["search_data"])
-            # remove the successful requests from the URLs list            
-            remaining_urls.remove(response.context["url"])
-        except Exception as e:  # catch any exception
-            log.error(f"Error encountered: {e}")
+    to_scrape = [
+        ScrapeConfig(url + f"&page={page_number}", **BASE_CONFIG) for page_number in range(2, total_pages + 1)
+    ]
+    async for response in LADDER.concurrent_scrape(to_scrape, check=_has_search_results):
+        if isinstance(response, Exception):
+            log.error(f"Error encountered: {response}")
             continue
-
-    # try again with the blocked requests if any using headless browsers and residential proxies   
-    if len(remaining_urls) != 0:
-        log.debug(f"{len(remaining_urls)} requests are blocked, trying again with render_js enabled and residential proxies")        
-        try:
-            failed_requests = [ScrapeConfig(url, **BASE_CONFIG, render_js=True, proxy_pool="public_residential_pool") for url in remaining_urls]
-            async for response in SCRAPFLY.concurrent_scrape(failed_requests):
-                data = parse_search_page(response)
-                search_data.extend(data["search_data"])
-        except Exception as e:  # catching any exception
-                log.error(f"Error encountered: {e}")
-                pass
+        data = parse_search_page(response)
+        search_data.extend(data["search_data"])
     log.success(f"scraped {len(search_data)} company listings from G2 search pages with the URL {url}")
     return search_data
 
@@ -149,7 +152,7 @@ def parse_review_page(response: ScrapeApiResponse):
 async def scrape_reviews(url: str, max_review_pages: int = None) -> List[Dict]:
     """scrape company reviews from G2 review pages"""
     log.info(f"scraping first review page from company URL {url}")
-    first_page = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
+    first_page = await LADDER.scrape(ScrapeConfig(url, **BASE_CONFIG), check=_has_reviews)
     data = parse_review_page(first_page)
     reviews_data = data["reviews_data"]
     total_pages = data["total_pages"]
@@ -158,29 +161,15 @@ async def scrape_reviews(url: str, max_review_pages: int = None) -> List[Dict]:
     if max_review_pages and max_review_pages < total_pages:
         total_pages = max_review_pages
 
-    # scrape the remaining review pages
+    # scrape the remaining review pages, blocked pages are escalated one tier at a time
     log.info(f"scraping reviews pagination, remaining ({total_pages - 1}) more pages")
-    remaining_urls = [url + f"?page={page_number}" for page_number in range(2, total_pages + 1)]
-    to_scrape = [ScrapeConfig(url, **BASE_CONFIG) for url in remaining_urls]
-    async for response in SCRAPFLY.concurrent_scrape(to_scrape):
-        try:
-            data = parse_review_page(response)
-            reviews_data.extend(data["reviews_data"])
-            remaining_urls.remove(response.context["url"])
-        except Exception as e:  # catch any exception
-            log.error(f"Error encountered: {e}")
+    to_scrape = [ScrapeConfig(url + f"?page={page_number}", **BASE_CONFIG) for page_number in range(2, total_pages + 1)]
+    async for response in LADDER.concurrent_scrape(to_scrape, check=_has_reviews):
+        if isinstance(response, Exception):
+            log.error(f"Error encountered: {response}")
             continue
-   
-    if len(remaining_urls) != 0:
-        log.debug(f"{len(remaining_urls)} requests are blocked, trying again with render_js enabled and residential proxies")        
-        try:
-            failed_requests = [ScrapeConfig(url, **BASE_CONFIG, render_js=True, proxy_pool="public_residential_pool") for url in remaining_urls]
-            async for response in SCRAPFLY.concurrent_scrape(failed_requests):
-                data = parse_search_page(response)
-                reviews_data.extend(data["reviews_data"])
-        except Exception as e:  # catch any exception
-                log.error(f"Error encountered: {e}")
-                pass
+        data = parse_review_page(response)
+        reviews_data.extend(data["reviews_data"])
     log.success(f"scraped {len(reviews_data)} company reviews from G2 review pages with the URL {url}")
     return reviews_data
 
@@ -221,17 +210,10 @@ async def scrape_alternatives(
     url = f"https://www.g2.com/products/{product}/competitors/alternatives/{alternatives}"
     log.info(f"scraping alternative page {url}")
     try:
-        response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-        data = parse_alternatives(response)
+        response = await LADDER.scrape(ScrapeConfig(url, **BASE_CONFIG), check=_has_alternatives)
     except Exception as e:  # Catching any exception
-            log.error(f"Error encountered: {e}, trying")
-            pass
-    if not data:
-        log.debug("request is blocked, trying again with render_js enabled and residential proxies")
-        try:
-            response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG, render_js=True, proxy_pool="public_residential_pool"))
-            data = parse_alternatives(response)
-        except:
-            return
+        log.error(f"Error encountered: {e}")
+        return
+    data = parse_alternatives(response)
     log.success(f"scraped {len(data)} company alternatives from G2 alternative pages")
     return data
@@ -7,63 +7,44 @@ $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 from enum import Enum
 import json
-import os
 import re
 from typing import Dict, List, Optional, Tuple, TypedDict
 from urllib.parse import urljoin
 
 from loguru import logger as log
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient, ScrapflyScrapeError
+from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyScrapeError
+from scraper_runtime import ApolloGraph, GraphNode, HiddenData, get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("glassdoor")
+BASE_CONFIG = site_config("glassdoor", {
     # Glassdoor.com requires Anti Scraping Protection bypass feature.
     # for more: https://scrapfly.io/docs/scrape-api/anti-scraping-protection
     "asp": True,
     "country": "US",
-}
+})
 
 
-def find_hidden_data(result: ScrapeApiResponse) -> dict:
+def find_hidden_data(result: ScrapeApiResponse) -> GraphNode:
     """
     Extract hidden web cache (Apollo Graphql framework) from Glassdoor page HTML
-    It's either in NEXT_DATA script or direct apolloState js variable
+    It's either in NEXT_DATA script or direct apolloState js variable.
+    Glassdoor's cache is a graph of __ref references, the returned ROOT_QUERY view follows them on access.
     """
     # data can be in __NEXT_DATA__ cache
-    data = result.selector.css("script#__NEXT_DATA__::text").get()
+    hidden = HiddenData(result.content)
+    data = hidden.get("__NEXT_DATA__")
     if data:
-        data = json.loads(data)["props"]["pageProps"]["apolloCache"]
+        data = data["props"]["pageProps"]["apolloCache"]
     else:  # or in direct apolloState cache
-        data = re.findall(r'apolloState":\s*({.+})};', result.content)[0]
-        data = json.loads(data)
-
-    def _unpack_apollo_data(apollo_data):
-        """
-        Glassdoor uses Apollo GraphQL client and the dataset is a graph of references.
-        This function unpacks the __ref references to actual values.
-        """
-
-        def resolve_refs(data, root):
-            if isinstance(data, dict):
-                if "__ref" in data:
-                    return resolve_refs(root[data["__ref"]], root)
-                else:
-                    return {k: resolve_refs(v, root) for k, v in data.items()}
-            elif isinstance(data, list):
-                return [resolve_refs(i, root) for i in data]
-            else:
-                return data
-
-        return resolve_refs(apollo_data.get("ROOT_QUERY") or apollo_data, apollo_data)
-
-    return _unpack_apollo_data(data)
+        data = hidden["apolloState"]
+    return ApolloGraph(data).root
 
 
 def parse_jobs(result: ScrapeApiResponse) -> Tuple[List[Dict], List[str]]:
     """Parse Glassdoor jobs page for job data and other page pagination urls"""
     cache = find_hidden_data(result)
     job_cache = next(v for k, v in cache.items() if k.startswith("jobListings"))
-    jobs = [v["jobview"]["header"] for v in job_cache["jobListings"]]
+    jobs = [v["jobview"]["header"].resolve() for v in job_cache["jobListings"]]
     other_pages = [
         urljoin(result.context["url"], page["urlLink"])
         for page in job_cache["paginationLinks"]
@@ -97,7 +78,7 @@ def parse_reviews(result: ScrapeApiResponse) -> Dict:
     """parse Glassdoor reviews page for review data"""
     cache = find_hidden_data(result)
     reviews = next(v for k, v in cache.items() if k.startswith("employerReviews") and v.get("reviews"))
-    return reviews
+    return reviews.resolve()
 
 
 async def scrape_reviews(url: str, max_pages: Optional[int] = None) -> Dict:
@@ -128,7 +109,7 @@ def parse_salaries(result: ScrapeApiResponse) -> Dict:
     """Parse Glassdoor salaries page for salary data"""
     cache = find_hidden_data(result)
     salaries = next(v for k, v in cache.items() if k.startswith("aggregatedSalaryEstimates") and v.get("results"))
-    return salaries
+    return salaries.resolve()
 
 
 async def scrape_salaries(url: str, max_pages: Optional[int] = None) -> Dict:
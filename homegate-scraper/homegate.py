@@ -4,21 +4,20 @@ This is an example web scraper for homegate.ch.
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
-import json
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, hidden_data, site_config
 from typing import Dict, List
 from pathlib import Path
 from loguru import logger as log
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("homegate")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("homegate", {
     # bypass web scraping blocking
     "asp": True,
     # set the proxy country to switzerland
     "country": "CH",
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -26,15 +25,8 @@ output.mkdir(exist_ok=True)
 
 def parse_next_data(response: ScrapeApiResponse) -> Dict:
     """parse data from script tags"""
-    selector = response.selector
     # extract data in JSON from script tags
-    next_data = selector.xpath(
-        "//script[contains(text(),'window.__INITIAL_STATE__')]/text()"
-    ).get()
-    if not next_data:
-        return
-    next_data_json = json.loads(next_data.strip("window.__INITIAL_STATE__="))
-    return next_data_json
+    return hidden_data(response.content, "__INITIAL_STATE__")
 
 
 async def scrape_properties(urls: List[str]) -> List[Dict]:
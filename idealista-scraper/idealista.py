@@ -5,11 +5,11 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
 import re
 import math
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import EscalationLadder, Shard, crawl_shards, get_client, parse_response, parse_responses, site_config, split_range
 from typing import Dict, List
 from typing_extensions import TypedDict
 from collections import defaultdict
@@ -17,18 +17,22 @@ from urllib.parse import urljoin
 from pathlib import Path
 from loguru import logger as log
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("idealista")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("idealista", {
     # bypass web scraping blocking
     "asp": True,
     # set the proxy country to Spain
     "country": "ES",
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
 
+# province pages are escalated from datacenter proxies up to a headless browser per URL,
+# the tier they need is remembered between runs
+LADDER = EscalationLadder(SCRAPFLY, retries=2, path=output / "escalation.json")
+
 
 def parse_province(response: ScrapeApiResponse) -> List[str]:
     """parse province page for area search urls"""
@@ -105,20 +109,14 @@ async def scrape_provinces(urls: List[str]) -> List[str]:
     for search page urls like:
     https://www.idealista.com/en/venta-viviendas/marbella-malaga/con-chalets/
     """
-    # Add province pages to a scraping list
-    to_scrape = [ScrapeConfig(url, **BASE_CONFIG, render_js=True, proxy_pool="public_residential_pool") for url in urls]
+    # Add province pages to a scraping list, pages without locations are escalated to the next tier
+    to_scrape = [ScrapeConfig(url, **BASE_CONFIG) for url in urls]
     search_urls = []
-    
-    for _ in range(3):  # retry falied requests
-        async for response in SCRAPFLY.concurrent_scrape(to_scrape):
-            parsed_urls = parse_province(response)
-            if parsed_urls:
-                search_urls.extend(parsed_urls)
-        
-        if search_urls:
-            break
-        else:
-            log.debug("No results retrieved, retrying...")
+    async for response in LADDER.concurrent_scrape(to_scrape, check=parse_province):
+        if isinstance(response, Exception):
+            log.error(f"failed to scrape province page: {response}")
+            continue
+        search_urls.extend(parse_province(response))
 
     log.success(f"Scraped {len(search_urls)} search URLs")
     return search_urls
@@ -214,7 +212,7 @@ async def crawl_search(url: str, max_scrape_pages: int = None) -> List[str]:
 async def scrape_search(url: str, max_scrape_pages: int = None) -> List[Dict]:
     """scrape Idealista search results"""
     first_page = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-    data = parse_search_data(first_page)
+    data = await parse_response(parse_search_data, first_page)
     search_data = data["search_data"]
     max_pages = data["max_pages"]
 
@@ -229,8 +227,67 @@ async def scrape_search(url: str, max_scrape_pages: int = None) -> List[Dict]:
     ]
     log.info(f"scraping search pagination, {max_pages - 1} pages remaining")
 
-    async for response in SCRAPFLY.concurrent_scrape(to_scrape):
-        # skip invalid property pages
-        search_data.extend(parse_search_data(response)["search_data"])
+    # search pages are parsed in worker processes when parse workers are enabled
+    async for data in parse_responses(SCRAPFLY.concurrent_scrape(to_scrape), parse_search_data):
+        # skip failed search pages
+        if isinstance(data, Exception):
+            log.error(f"failed to scrape search page: {data}")
+            continue
+        search_data.extend(data["search_data"])
     log.success(f"scraped {len(search_data)} property listings from search pages")
-    return search_data
\ No newline at end of file
+    return search_data
+
+def search_price_url(url: str, min_price: int, max_price: int) -> str:
+    """
+    add a price band filter to a search url like:
+    https://www.idealista.com/en/venta-viviendas/marbella-malaga/con-chalets/
+    """
+    base, _, filters = url.rstrip("/").rpartition("/")
+    price = f"precio-hasta_{max_price},precio-desde_{min_price}"
+    if not filters.startswith("con-"):
+        return f"{url.rstrip('/')}/con-{price}/"
+    # replace the price filter of the url, keep the other ones
+    others = [item for item in filters[len("con-"):].split(",") if not item.startswith("precio-")]
+    return f"{base}/con-{','.join([price] + others)}/"
+
+
+async def scrape_full_search(url: str, max_price: int = 50_000_000, concurrency: int = 5) -> List[Dict]:
+    """
+    scrape every listing of an Idealista search, even above the 60 page limit:
+    the search is split into price bands until each band fits into 60 pages and the bands are scraped concurrently
+    """
+
+    async def probe(band):
+        response = await SCRAPFLY.async_scrape(ScrapeConfig(search_price_url(url, *band), **BASE_CONFIG))
+        total_results = response.selector.css("h1#h1-container").re(": (.+) houses")
+        return (int(total_results[0].replace(",", "")) if total_results else 0), response
+
+    async def scrape_band(shard: Shard):
+        data = await parse_response(parse_search_data, shard.page)
+        for item in data["search_data"]:
+            yield item
+        to_scrape = [
+            ScrapeConfig(shard.page.context["url"] + f"pagina-{page}.htm", **BASE_CONFIG)
+            for page in range(2, data["max_pages"] + 1)
+        ]
+        async for page in parse_responses(SCRAPFLY.concurrent_scrape(to_scrape), parse_search_data):
+            if isinstance(page, Exception):
+                log.error(f"failed to scrape search page: {page}")
+                continue
+            for item in page["search_data"]:
+                yield item
+
+    search_data = [
+        item
+        async for item in crawl_shards(
+            (0, max_price),
+            probe=probe,
+            split=lambda band: split_range(*band),
+            scrape=scrape_band,
+            cap=60 * 30,
+            key=lambda item: item["link"],
+            concurrency=concurrency,
+        )
+    ]
+    log.success(f"scraped {len(search_data)} property listings from search price bands")
+    return search_data
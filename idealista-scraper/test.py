@@ -2,10 +2,9 @@ from cerberus import Validator
 import idealista
 import pytest
 import pprint
-import os
-from scrapfly import ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeConfig
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = idealista.SCRAPFLY
 
 BASE_CONFIG = {
     # bypass web scraping blocking
@@ -7,24 +7,24 @@ $ export $SCRAPFLY_KEY="your key from https://SCRAPFLY.io/dashboard"
 """
 import json
 import math
-import os
 import re
 from pathlib import Path
 from typing import Dict, List, TypedDict, Optional
 from urllib.parse import urljoin, urlparse, parse_qsl, urlencode, urlunparse
 
 from loguru import logger as log
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+from scraper_runtime import fan_out, get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("iherb")
+BASE_CONFIG = site_config("iherb", {
     # iherb.com requires Anti Scraping Protection bypass feature.
     # for more: https://SCRAPFLY.io/docs/scrape-api/anti-scraping-protection
     "asp": True,
     # to change region see change the country code
     "country": "US",
     "proxy_pool": "public_residential_pool"
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -165,19 +165,11 @@ def parse_reviews(result: ScrapeApiResponse) -> List[Review]:
     return parsed
 
 
-async def scrape_reviews(url: str, max_pages: Optional[int] = None) -> List[Review]:
-    """scrape product reviews of a given URL of an iherb product"""
-    # if max_pages > 10:
-    #     raise ValueError("max_pages cannot be greater than 10 as iherb paging stops at 10 pages. Try splitting search through multiple filters and sorting to get more results")
-
-    # scrape first review page
-    log.info(f"scraping review page: {url}")
-    first_page_result = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-    reviews = parse_reviews(first_page_result)
-
+def _other_review_pages(url: str, reviews: List[Review], max_pages: Optional[int] = None) -> List[ScrapeConfig]:
+    """scrape configs of the review pages after the first one from the reviews of the first page"""
     # find total reviews
     _reviews_per_page = max(len(reviews), 1)
-    total_reviews = reviews[0].get('total_reviews', 0)
+    total_reviews = reviews[0].get('total_reviews', 0) if reviews else 0
     # raise ValueError
     total_pages = int(math.ceil(int(total_reviews) / _reviews_per_page))
     if max_pages and total_pages > max_pages:
@@ -186,15 +178,31 @@ async def scrape_reviews(url: str, max_pages: Optional[int] = None) -> List[Revi
     log.info(f"found total {total_reviews} reviews across {total_pages} pages -> scraping")
     other_pages = []
     for page in range(6, total_pages + 1):
-        url = url + f'?sort=6&isshowtranslated=true&p={page}'
-        other_pages.append(ScrapeConfig(url, **BASE_CONFIG))
+        other_pages.append(ScrapeConfig(url + f'?sort=6&isshowtranslated=true&p={page}', **BASE_CONFIG))
+    return other_pages
 
-    async for result in SCRAPFLY.concurrent_scrape(other_pages):
+
+def _save_reviews(result: ScrapeApiResponse) -> List[Review]:
+    """parse a review page and append its reviews to the results file"""
+    page_reviews = parse_reviews(result)
+    with output.joinpath(f"reviews_on_time_.json").open('a', encoding='utf-8') as file:
+        file.write(json.dumps(page_reviews, indent=2) + ",")
+    return page_reviews
+
+
+async def scrape_reviews(url: str, max_pages: Optional[int] = None) -> List[Review]:
+    """scrape product reviews of a given URL of an iherb product"""
+    # if max_pages > 10:
+    #     raise ValueError("max_pages cannot be greater than 10 as iherb paging stops at 10 pages. Try splitting search through multiple filters and sorting to get more results")
+
+    # scrape first review page
+    log.info(f"scraping review page: {url}")
+    first_page_result = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
+    reviews = parse_reviews(first_page_result)
+
+    async for result in SCRAPFLY.concurrent_scrape(_other_review_pages(url, reviews, max_pages)):
         try:
-            page_reviews = parse_reviews(result)
-            with output.joinpath(f"reviews_on_time_.json").open('a', encoding='utf-8') as file:
-                file.write(json.dumps(page_reviews, indent=2) + ",")
-            reviews.extend(page_reviews)
+            reviews.extend(_save_reviews(result))
         except:
             continue
             
@@ -293,7 +301,16 @@ async def scrape_products(urls: List[str]) -> List[Product]:
 
 async def scrape_all_reviews(urls: List[str], max_pages: Optional[int] = None):
     """scrape all reviews of multiple iherb.com products"""
+    # review pages of all products share one queue instead of scraping product after product
+    reviews_per_product = await fan_out(
+        SCRAPFLY,
+        urls,
+        first_page=lambda url: ScrapeConfig(url, **BASE_CONFIG),
+        other_pages=lambda url, first: _other_review_pages(url, parse_reviews(first), max_pages),
+        parse=_save_reviews,
+    )
     reviews = []
-    for url in urls:
-        reviews.extend(await scrape_reviews(url, max_pages))
+    for url, product_reviews in zip(urls, reviews_per_product):
+        log.info(f"scraped total {len(product_reviews)} reviews for url {url}")
+        reviews.extend(product_reviews)
     return reviews
\ No newline at end of file
@@ -4,41 +4,25 @@ This is an example web scraper for immobilienscout24.de.
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
-import json
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import find_json_object, get_client, site_config
 from typing import Dict, List
 from pathlib import Path
 from loguru import logger as log
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("immobilienscout24")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("immobilienscout24", {
     # bypass web scraping blocking
     "asp": True,
     # set the proxy country to Germany
     "country": "de"
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
 
 
-def find_json_objects(text: str, decoder=json.JSONDecoder()):
-    """Find JSON objects in text, and generate decoded JSON data"""
-    pos = 0
-    while True:
-        match = text.find("{", pos)
-        if match == -1:
-            break
-        try:
-            result, index = decoder.raw_decode(text[match:])
-            yield result
-            pos = match + index
-        except ValueError:
-            pos = match + 1
-
-
 def strip_text(text):
     """remove extra spaces while handling None values"""
     if text != None:
@@ -142,7 +126,7 @@ def parse_search(response: ScrapeApiResponse) -> List[Dict]:
     """parse script tags for json search results """
     selector = response.selector
     script = selector.xpath("//script[contains(text(),'searchResponseModel')]/text()").get()
-    json_data = [i for i in list(find_json_objects(script)) if "searchResponseModel" in i][0]["searchResponseModel"]["resultlist.resultlist"]
+    json_data = find_json_object(script, "searchResponseModel")["searchResponseModel"]["resultlist.resultlist"]
     search_data = json_data["resultlistEntries"][0]["resultlistEntry"]
     max_pages = json_data["paging"]["numberOfPages"]
     return {"search_data": search_data, "max_pages": max_pages}
@@ -4,21 +4,20 @@ This is an example web scraper for immoscout24.ch.
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
-import json
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, hidden_data, site_config
 from typing import Dict, List
 from pathlib import Path
 from loguru import logger as log
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("immoscout24")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("immoscout24", {
     # bypass web scraping blocking
     "asp": True,
     # set the proxy country to switzerland
     "country": "CH",
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -26,16 +25,8 @@ output.mkdir(exist_ok=True)
 
 def parse_next_data(response: ScrapeApiResponse) -> Dict:
     """parse listing data from script tags"""
-    selector = response.selector
-    # extract data in JSON from script tags
-    script = selector.xpath("//script[contains(text(),'INITIAL_STATE')]/text()").get()
-    if not script:
-        return
-    next_data = script.strip("window.__INITIAL_STATE__=")
-    # replace undefined values
-    next_data = next_data.replace("undefined", "null")
-    next_data_json = json.loads(next_data)
-    return next_data_json
+    # extract data in JSON from script tags, undefined values are decoded as null
+    return hidden_data(response.content, "__INITIAL_STATE__")
 
 
 async def scrape_properties(urls: List[str]) -> List[Dict]:
@@ -4,23 +4,23 @@ This is an example web scraper for immowelt.de.
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
 import json
 import math
 
 from typing import Dict, List
 from pathlib import Path
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("immowelt")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("immowelt", {
     # bypass web scraping blocking
     "asp": True,
     # set the proxy country to switzerland
     "country": "DE"
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -55,21 +55,6 @@ async def scrape_properties(urls: List[str]) -> List[Dict]:
     return properties
 
 
-def find_json_objects(text: str, decoder=json.JSONDecoder()):
-    """Find JSON objects in text, and generate decoded JSON data"""
-    pos = 0
-    while True:
-        match = text.find("{", pos)
-        if match == -1:
-            break
-        try:
-            result, index = decoder.raw_decode(text[match:])
-            yield result
-            pos = match + index
-        except ValueError:
-            pos = match + 1
-
-
 def parse_search_pages(response: ScrapeApiResponse) -> List[Dict]:
     """parse search data from script tags"""
     selector = response.selector
@@ -5,28 +5,25 @@ https://scrapfly.io/blog/how-to-scrape-indeedcom/
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import json
 import math
-import os
-import re
 from typing import Dict, List
 import urllib
 
 from loguru import logger as log
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient, ScrapflyScrapeError
+from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyScrapeError
+from scraper_runtime import get_client, hidden_data, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("indeed")
+BASE_CONFIG = site_config("indeed", {
     # Indeed.com requires Anti Scraping Protection bypass feature.
     "asp": True,
     "country": "US",
-}
+})
 
 
 def parse_search_page(result):
     """Find hidden web data of search results in Indeed.com search page HTML"""
-    data = re.findall(r'window.mosaic.providerData\["mosaic-provider-jobcards"\]=(\{.+?\});', result.content)
-    data = json.loads(data[0])
+    data = hidden_data(result.content, 'mosaic.providerData["mosaic-provider-jobcards"]')
     return {
         "results": data["metaData"]["mosaicProviderJobCardsModel"]["results"],
         "meta": data["metaData"]["mosaicProviderJobCardsModel"]["tierSummaries"],
@@ -71,8 +68,7 @@ async def scrape_search(url: str, max_results: int = 1000) -> List[Dict]:
 
 def parse_job_page(result: ScrapeApiResponse):
     """parse job data from job listing page"""
-    data = re.findall(r"_initialData=(\{.+?\});", result.content)
-    data = json.loads(data[0])
+    data = hidden_data(result.content, "_initialData")
     data = data["jobInfoWrapperModel"]["jobInfoModel"]
     return {
         "description": data['sanitizedJobDescription'],
@@ -6,28 +6,27 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 import json
-import os
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from urllib.parse import quote
 
-import jmespath
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeConfig
+from scraper_runtime import get_client, paginate_many, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("instagram")
+BASE_CONFIG = site_config("instagram", {
     # Instagram.com requires Anti Scraping Protection bypass feature.
     # for more: https://scrapfly.io/docs/scrape-api/anti-scraping-protection
     "asp": True,
     "country": "CA",  # change country for relevant results
-}
+})
 INSTAGRAM_APP_ID = "936619743392459"  # this is the public app id for instagram.com
 
 
 def parse_user(data: Dict) -> Dict:
     """Reduce the user data to the relevant fields"""
     log.debug("parsing user data {}", data["username"])
-    result = jmespath.search(
+    result = query(
         """{
         name: full_name,
         username: username,
@@ -106,7 +105,7 @@ async def scrape_user(username: str) -> Dict:
 def parse_comments(data: Dict) -> Dict:
     """Parse the comments data from the post dataset"""
     if "edge_media_to_comment" in data:
-        return jmespath.search(
+        return query(
             """{
                 comments_count: edge_media_to_comment.count,
                 comments_disabled: comments_disabled,
@@ -124,7 +123,7 @@ def parse_comments(data: Dict) -> Dict:
             data,
         )
     else:
-        return jmespath.search(
+        return query(
             """{
                 comments_count: edge_media_to_parent_comment.count,
                 comments_disabled: comments_disabled,
@@ -146,7 +145,7 @@ def parse_comments(data: Dict) -> Dict:
 def parse_post(data: Dict) -> Dict:
     """Reduce post dataset to the most important fields"""
     log.debug("parsing post data {}", data["shortcode"])
-    result = jmespath.search(
+    result = query(
         """{
         id: id,
         shortcode: shortcode,
@@ -204,32 +203,48 @@ async def scrape_post(url_or_shortcode: str) -> Dict:
     return parse_post(data["data"]["shortcode_media"])
 
 
+INSTAGRAM_POSTS_QUERY = "https://www.instagram.com/graphql/query/?query_hash=e769aa130647d2354c40ea6a439bfc08&variables="
+
+
+async def _scrape_posts_page(cursor: Tuple[str, Optional[str], int]) -> Tuple[Tuple, Dict]:
+    """scrape a page of user posts, the cursor is (user id, end cursor of the previous page, page size)"""
+    user_id, after, page_size = cursor
+    variables = {"id": user_id, "first": page_size, "after": after}
+    result = await SCRAPFLY.async_scrape(ScrapeConfig(INSTAGRAM_POSTS_QUERY + quote(json.dumps(variables)), **BASE_CONFIG))
+    data = json.loads(result.content)
+    posts = data["data"]["user"]["edge_owner_to_timeline_media"]
+    if after is None:
+        log.info(f"scraping total {posts['count']} posts of {user_id}")
+    return cursor, posts
+
+
+def _next_posts_page(page: Tuple[Tuple, Dict]) -> Optional[Tuple[str, str, int]]:
+    (user_id, _, page_size), posts = page
+    page_info = posts["page_info"]
+    if not page_info["has_next_page"]:
+        return None
+    return user_id, page_info["end_cursor"], page_size
+
+
+def _parse_posts_page(page: Tuple[Tuple, Dict]) -> Iterator[Dict]:
+    _, posts = page
+    for post in posts["edges"]:
+        yield parse_post(post["node"])
+
+
+async def scrape_users_posts(user_ids: List[str], page_size=24, max_pages: Optional[int] = None):
+    """
+    Scrape all posts of several instagram users of given numeric user ids and yield (user id, post) pairs.
+    The users are paginated concurrently and each next page is requested while the current one is parsed.
+    """
+    starts = [(user_id, None, page_size) for user_id in user_ids]
+    async for (user_id, _, _), post in paginate_many(
+        starts, _scrape_posts_page, _next_posts_page, _parse_posts_page, max_pages=max_pages or None
+    ):
+        yield user_id, post
+
+
 async def scrape_user_posts(user_id: str, page_size=24, max_pages: Optional[int] = None):
     """Scrape all posts of an instagram user of given numeric user id"""
-    base_url = "https://www.instagram.com/graphql/query/?query_hash=e769aa130647d2354c40ea6a439bfc08&variables="
-    variables = {
-        "id": user_id,
-        "first": page_size,
-        "after": None,
-    }
-    _page_number = 1
-    while True:
-        url = base_url + quote(json.dumps(variables))
-        result = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-        data = json.loads(result.content)
-        posts = data["data"]["user"]["edge_owner_to_timeline_media"]
-        for post in posts["edges"]:
-            yield parse_post(post["node"])
-        page_info = posts["page_info"]
-        if _page_number == 1:
-            log.info(f"scraping total {posts['count']} posts of {user_id}")
-        else:
-            log.info(f"scraping posts page {_page_number}")
-        if not page_info["has_next_page"]:
-            break
-        if variables["after"] == page_info["end_cursor"]:
-            break
-        variables["after"] = page_info["end_cursor"]
-        _page_number += 1
-        if max_pages and _page_number > max_pages:
-            break
+    async for _, post in scrape_users_posts([user_id], page_size=page_size, max_pages=max_pages):
+        yield post
@@ -4,18 +4,18 @@ This is an example web scraper for leboncoin.com.
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
 import json
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, site_config
 from typing import Dict, List
 from pathlib import Path
 from loguru import logger as log
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("leboncoin")
+BASE_CONFIG = site_config("leboncoin", {
     "asp": True,
     "country": "fr",
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
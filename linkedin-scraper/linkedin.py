@@ -5,18 +5,17 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
-import jmespath
 from typing import Dict, List
 from urllib.parse import urlencode, quote_plus
 from parsel import Selector
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("linkedin")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("linkedin", {
     # bypass linkedin.com web scraping blocking
     "asp": True,
     # set the proxy country to US
@@ -24,7 +23,7 @@ BASE_CONFIG = {
     "headers": {
         "Accept-Language": "en-US,en;q=0.5"
     }
-}
+})
 
 def refine_profile(data: Dict) -> Dict: 
     """refine and clean the parsed profile data"""
@@ -102,7 +101,7 @@ def parse_company_overview(response: ScrapeApiResponse) -> Dict:
     """parse company main overview page"""
     selector = response.selector
     script_data = json.loads(selector.xpath("//script[@type='application/ld+json']/text()").get())
-    script_data = jmespath.search(
+    script_data = query(
         """{
         name: name,
         url: url,
@@ -5,28 +5,27 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
-import jmespath
 from typing import Dict, List
 from urllib.parse import urlencode, parse_qs, urlparse
 from nested_lookup import nested_lookup
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("nordstorm")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("nordstorm", {
     # bypass nordstorm.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
-}
+})
 
 
 def parse_product(data: dict) -> dict:
     # parse product basic data like id, name, features etc.
-    product = jmespath.search(
+    product = query(
         """{
         id: id,
         title: productTitle,
@@ -48,7 +47,7 @@ def parse_product(data: dict) -> dict:
     colors_by_id = data["filters"]["color"]["byId"]
     product["media"] = []
     for media_item in data["mediaExperiences"]["carouselsByColor"]:
-        item = jmespath.search(
+        item = query(
             """{
                 colorCode: colorCode,
                 colorName: colorName
@@ -61,7 +60,7 @@ def parse_product(data: dict) -> dict:
     product["variants"] = {}
     for sku, sku_data in data["skus"]["byId"].items():
         # get basic variant data
-        parsed = jmespath.search(
+        parsed = query(
             """{
                 id: id,
                 sizeId: sizeId,
@@ -73,7 +72,7 @@ def parse_product(data: dict) -> dict:
         # get variant price from
         parsed["price"] = prices_by_sku[sku]["regular"]["price"] if prices_by_sku else None
         # get variant color data
-        parsed["color"] = jmespath.search(
+        parsed["color"] = query(
             """{
             id: id,
             value: value,
@@ -4,23 +4,21 @@ This is an example web scraper for realestate.com.au
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
-import re
 import json
-import jmespath
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, hidden_data, query, site_config
 from typing import Dict, List
 from pathlib import Path
 from loguru import logger as log
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("realestate")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("realestate", {
     # bypass realesta.com.au scraping blocking
     "asp": True,
     # set the proxy country to australia
     "country": "AU",
-}
+})
 
 
 output = Path(__file__).parent / "results"
@@ -31,7 +29,7 @@ def parse_property_data(data: Dict) -> Dict:
     """refine property data from JSON"""
     if not data:
         return
-    result = jmespath.search(
+    result = query(
         """{
         id: id,
         propertyType: propertyType.display,
@@ -56,12 +54,8 @@ def parse_property_data(data: Dict) -> Dict:
 
 def parse_hidden_data(response: ScrapeApiResponse) -> Dict:
     """parse JSON data from script tag"""
-    selector = response.selector
-    script = selector.xpath(
-        "//script[contains(text(),'window.ArgonautExchange')]/text()"
-    ).get()
     # data needs to be parsed mutiple times
-    data = json.loads(re.findall(r"window.ArgonautExchange=(\{.+\});", script)[0])
+    data = hidden_data(response.content, "ArgonautExchange")
     data = json.loads(data["resi-property_listing-experience-web"]["urqlClientCache"])
     data = json.loads(list(data.values())[0]["data"])
     return data
@@ -5,26 +5,24 @@ https://scrapfly.io/blog/how-to-scrape-realtorcom/
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import asyncio
 import json
 import math
-import os
-import jmespath
 
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional
 from loguru import logger as log
 from parsel import Selector
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+from scraper_runtime import ChangeTracker, JsonlSink, get_client, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("realtorcom")
+BASE_CONFIG = site_config("realtorcom", {
     # realtor.com requires Anti Scraping Protection bypass feature.
     # for more: https://scrapfly.io/docs/scrape-api/anti-scraping-protection
     "asp": True,
     "country": "US",
-}
+})
 
 
 def parse_property(result: ScrapeApiResponse) -> Dict:
@@ -39,7 +37,7 @@ def parse_property(result: ScrapeApiResponse) -> Dict:
         return
     data = json.loads(data)
     raw_data = data["props"]["pageProps"]["initialReduxState"]
-    reduced = jmespath.search(
+    reduced = query(
         """{
         id: propertyDetails.listing_id,
         slug: slug,
@@ -146,25 +144,19 @@ async def scrape_feed(url) -> Dict[str, datetime]:
     return results
 
 
-async def track_feed(url: str, output: Path, interval=60):
-    """Track Realtor.com feed, scrape new listings and append them as JSON to the output file"""
-    seen = set()
-    output.touch(exist_ok=True)
+async def track_feed(url: str, output: Path, interval=60, polls: Optional[int] = None):
+    """
+    Track Realtor.com feed, scrape new and changed listings and append them as JSON lines to the output file.
+    Seen "url: publish date" versions persist in an SQLite file next to the output, so restarts don't re-scrape.
+    """
+    tracker = ChangeTracker(
+        output.with_suffix(".db"),
+        source=url,
+        poll=lambda since: scrape_feed(url),
+        scrape=scrape_property,
+    )
     try:
-        while True:
-            changed = await scrape_feed(url=url)
-            # check deduplication filter
-            changed = {k: v for k, v in changed.items() if f"{k}:{v}" not in seen}
-            if changed:
-                # scrape properties and save to file - 1 property as JSON per line
-                properties = await asyncio.gather(scrape_property(url) for url in changed.keys())
-                with output.open("a") as f:
-                    f.write("\n".join(json.dumps(property) for property in properties))
-
-                # add seen to deduplication filter
-                for k, v in changed.items():
-                    seen.add(f"{k}:{v}")
-            print(f"scraped {len(properties)} properties; waiting {interval} seconds")
-            await asyncio.sleep(interval)
-    except KeyboardInterrupt:
-        print("stopping price tracking")
+        with JsonlSink(output) as sink:
+            await tracker.track(sink.write, interval=interval, polls=polls)
+    finally:
+        tracker.store.close()
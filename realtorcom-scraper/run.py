@@ -9,6 +9,8 @@ import asyncio
 from datetime import datetime
 import json
 from pathlib import Path
+import sys
+from loguru import logger as log
 import realtorcom
 
 output = Path(__file__).parent / "results"
@@ -34,6 +36,12 @@ async def run():
     output.joinpath("feed.json").write_text(json.dumps(result_feed, indent=2, cls=DateTimeEncoder))
 
 
+async def track():
+    print("tracking the Realtor.com price feed and saving changed properties to ./results/tracked.jsonl")
+    url = "https://www.realtor.com/realestateandhomes-detail/sitemap-rss-price/rss-price-ca.xml"
+    await realtorcom.track_feed(url, output.joinpath("tracked.jsonl"), interval=60)
+
+
 class DateTimeEncoder(json.JSONEncoder):
     """Custom JSONEncoder subclass that knows how to encode datetime values."""
 
@@ -45,4 +53,8 @@ class DateTimeEncoder(json.JSONEncoder):
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    try:
+        # python run.py track keeps polling the price feed until interrupted
+        asyncio.run(track() if sys.argv[1:] == ["track"] else run())
+    except KeyboardInterrupt:
+        log.info("stopping price tracking")
@@ -5,15 +5,16 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
-from typing import Dict, List, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 from datetime import datetime
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from parsel import Selector
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import Downgrade, get_client, paginate, paginate_many, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("reddit")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("reddit", {
     # enable the anti scraping protection
     "asp": True,
     # set the proxy country to US
@@ -21,7 +22,13 @@ BASE_CONFIG = {
     # bypassing reddit requires emabling JavaScript and using the residential proxy pool
     "render_js": True,
     "proxy_pool": "public_residential_pool"
-}
+})
+# pages that render without the browser or residential proxies are scraped without them
+BASE_CONFIG.downgrade = Downgrade(
+    check=lambda response: bool(
+        response.selector.xpath("//shreddit-post | //shreddit-subreddit-header | //div[contains(@class, 'sitetable')]")
+    )
+)
 
 def parse_subreddit(response: ScrapeApiResponse) -> Dict:
     """parse article data from HTML"""
@@ -73,31 +80,52 @@ def parse_subreddit(response: ScrapeApiResponse) -> Dict:
     return {"post_data": post_data, "info": info, "cursor": cursor_id}
 
 
-async def scrape_subreddit(subreddit_id: str, max_pages: int = None) -> Dict:
-    """scrape articles on a subreddit"""
-    base_url = f"https://www.reddit.com/r/{subreddit_id}/"
-    response = await SCRAPFLY.async_scrape(ScrapeConfig(base_url, **BASE_CONFIG))
-    subreddit_data = {}
-    data = parse_subreddit(response)
-    subreddit_data["info"] = data["info"]
-    subreddit_data["posts"] = data["post_data"]
-    cursor = data["cursor"]
-
-    def make_pagination_url(cursor_id: str):
-        return f"https://www.reddit.com/svc/shreddit/community-more-posts/hot/?after={cursor_id}%3D%3D&t=DAY&name=wallstreetbets&feedLength=3" 
-        
-    while cursor and (max_pages is None or max_pages > 0):
-        url = make_pagination_url(cursor)
-        response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
+def _subreddit_page_url(subreddit_id: str, cursor_id: Optional[str] = None) -> str:
+    if cursor_id is None:
+        return f"https://www.reddit.com/r/{subreddit_id}/"
+    return f"https://www.reddit.com/svc/shreddit/community-more-posts/hot/?after={cursor_id}%3D%3D&t=DAY&name={subreddit_id}&feedLength=3"
+
+
+async def _scrape_subreddit_page(cursor: Tuple[str, str]) -> Tuple[str, ScrapeApiResponse]:
+    subreddit_id, url = cursor
+    return subreddit_id, await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
+
+
+def _next_subreddit_page(page: Tuple[str, ScrapeApiResponse]) -> Optional[Tuple[str, str]]:
+    subreddit_id, response = page
+    # id for the next posts batch
+    cursor_id = response.selector.xpath("//shreddit-post/@more-posts-cursor").get()
+    return (subreddit_id, _subreddit_page_url(subreddit_id, cursor_id)) if cursor_id else None
+
+
+async def scrape_subreddits(subreddit_ids: List[str], max_pages: int = None) -> Dict[str, Dict]:
+    """scrape articles on several subreddits, the feeds are paginated concurrently"""
+    subreddits = {subreddit_id: {"info": None, "posts": []} for subreddit_id in subreddit_ids}
+
+    def parse(page: Tuple[str, ScrapeApiResponse]) -> List[Dict]:
+        subreddit_id, response = page
         data = parse_subreddit(response)
-        cursor = data["cursor"]
+        # the subreddit info is on the first page only, the pages after it are post batches
+        if subreddits[subreddit_id]["info"] is None:
+            subreddits[subreddit_id]["info"] = data["info"]
+        return data["post_data"]
 
-        post_data = data["post_data"]
-        subreddit_data["posts"].extend(post_data)
-        if max_pages is not None:
-            max_pages -= 1
-    log.success(f"scraped {len(subreddit_data['posts'])} posts from the rubreddit: r/{subreddit_id}")
-    return subreddit_data
+    starts = [(subreddit_id, _subreddit_page_url(subreddit_id)) for subreddit_id in subreddit_ids]
+    pages = max_pages + 1 if max_pages is not None else None
+    # the next batch is requested as soon as a page arrives, while the page itself is being parsed
+    async for (subreddit_id, _), post in paginate_many(
+        starts, _scrape_subreddit_page, _next_subreddit_page, parse, max_pages=pages
+    ):
+        subreddits[subreddit_id]["posts"].append(post)
+    for subreddit_id, subreddit_data in subreddits.items():
+        log.success(f"scraped {len(subreddit_data['posts'])} posts from the rubreddit: r/{subreddit_id}")
+    return subreddits
+
+
+async def scrape_subreddit(subreddit_id: str, max_pages: int = None) -> Dict:
+    """scrape articles on a subreddit"""
+    subreddits = await scrape_subreddits([subreddit_id], max_pages=max_pages)
+    return subreddits[subreddit_id]
 
 
 def parse_post_info(response: ScrapeApiResponse) -> Dict:
@@ -123,53 +151,64 @@ def parse_post_info(response: ScrapeApiResponse) -> Dict:
     return info
 
 
-def parse_post_comments(response: ScrapeApiResponse) -> List[Dict]:
-    """parse post comments"""
+def parse_comment(box: Selector) -> Dict:
+    """parse a comment object, only from its own entry so the replies nested in it are never read"""
+    entry = box.xpath("./div[contains(@class, 'entry')]")
+    author = box.xpath("./@data-author").get()
+    link = box.xpath("./@data-permalink").get()
+    dislikes = entry.xpath(".//span[contains(@class, 'dislikes')]/@title").get()
+    upvotes = entry.xpath(".//span[contains(@class, 'likes')]/@title").get()
+    downvotes = entry.xpath(".//span[contains(@class, 'unvoted')]/@title").get()
+    return {
+        "authorId": box.xpath("./@data-author-fullname").get(),
+        "author": author,
+        "authorProfile": "https://www.reddit.com/user/" + author if author else None,
+        "commentId": box.xpath("./@data-fullname").get(),
+        "link": "https://www.reddit.com" + link if link else None,
+        "publishingDate": entry.xpath(".//time/@datetime").get(),
+        "commentBody": entry.xpath(".//div[@class='md']/p/text()").get(),
+        "upvotes": int(upvotes) if upvotes else None,
+        "dislikes": int(dislikes) if dislikes else None,
+        "downvotes": int(downvotes) if downvotes else None,
+    }
 
-    def parse_comment(parent_selector) -> Dict:
-        """parse a comment object"""
-        author = parent_selector.xpath("./@data-author").get()
-        link = parent_selector.xpath("./@data-permalink").get()
-        dislikes = parent_selector.xpath(".//span[contains(@class, 'dislikes')]/@title").get()
-        upvotes = parent_selector.xpath(".//span[contains(@class, 'likes')]/@title").get()
-        downvotes = parent_selector.xpath(".//span[contains(@class, 'unvoted')]/@title").get()        
-        return {
-            "authorId": parent_selector.xpath("./@data-author-fullname").get(),
-            "author": author,
-            "authorProfile": "https://www.reddit.com/user/" + author if author else None,
-            "commentId": parent_selector.xpath("./@data-fullname").get(),
-            "link": "https://www.reddit.com" + link if link else None,
-            "publishingDate": parent_selector.xpath(".//time/@datetime").get(),
-            "commentBody": parent_selector.xpath(".//div[@class='md']/p/text()").get(),
-            "upvotes": int(upvotes) if upvotes else None,
-            "dislikes": int(dislikes) if dislikes else None,
-            "downvotes": int(downvotes) if downvotes else None,            
-        }
-
-    def parse_replies(what) -> List[Dict]:
-        """recursively parse replies"""
-        replies = []
-        for reply_box in what.xpath(".//div[@data-type='comment']"):
-            reply_comment = parse_comment(reply_box)
-            child_replies = parse_replies(reply_box)
-            if child_replies:
-                reply_comment["replies"] = child_replies
-            replies.append(reply_comment)
-        return replies
 
-    selector = response.selector
+def iter_post_comments(response: ScrapeApiResponse) -> Iterator[Dict]:
+    """
+    walk the comment tree of an old.reddit post page once and yield every comment exactly once,
+    in page order, linked to the comment it replies to by parentId
+    """
+    top_level = response.selector.xpath("//div[@class='sitetable nestedlisting']/div[@data-type='comment']")
+    stack = [(box, None, 0) for box in reversed(top_level)]
+    while stack:
+        box, parent_id, depth = stack.pop()
+        comment = parse_comment(box)
+        comment["parentId"] = parent_id
+        comment["depth"] = depth
+        yield comment
+        # only the direct replies, their own replies are reached from them
+        replies = box.xpath("./div[@class='child']/div/div[@data-type='comment']")
+        stack.extend((reply, comment["commentId"], depth + 1) for reply in reversed(replies))
+
+
+def parse_post_comments(response: ScrapeApiResponse, nested: bool = True) -> List[Dict]:
+    """parse post comments as a tree of replies or as a flat list linked by parentId"""
+    if not nested:
+        return list(iter_post_comments(response))
     data = []
-    for item in selector.xpath("//div[@class='sitetable nestedlisting']/div[@data-type='comment']"):
-        comment_data = parse_comment(item)
-        replies = parse_replies(item)
-        if replies:
-            comment_data["replies"] = replies
-        data.append(comment_data)            
+    by_id = {}
+    for comment in iter_post_comments(response):
+        by_id[comment["commentId"]] = comment
+        parent = by_id.get(comment["parentId"])
+        if parent is None:
+            data.append(comment)
+        else:
+            parent.setdefault("replies", []).append(comment)
     return data
 
 
-async def scrape_post(url: str, sort: Union["old", "new", "top"]) -> Dict:
-    """scrape eubreddit post and comment data"""
+async def scrape_post(url: str, sort: Union["old", "new", "top"], nested: bool = True) -> Dict:
+    """scrape eubreddit post and comment data, with the comments as a reply tree or a flat list when not nested"""
     response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
     post_data = {}
     post_data["info"] = parse_post_info(response)
@@ -177,11 +216,20 @@ async def scrape_post(url: str, sort: Union["old", "new", "top"]) -> Dict:
     # click the load more button on the page to retrieve another results    
     bulk_comments_page_url = post_data["info"]["postLink"].replace("www", "old") + f"?sort={sort}&limit=500"
     response = await SCRAPFLY.async_scrape(ScrapeConfig(bulk_comments_page_url, **BASE_CONFIG))
-    post_data["comments"] = parse_post_comments(response) 
+    post_data["comments"] = parse_post_comments(response, nested=nested)
     log.success(f"scraped {len(post_data['comments'])} comments from the post {url}")
     return post_data
 
 
+async def _scrape_page(url: str) -> ScrapeApiResponse:
+    return await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
+
+
+def _next_page_url(response: ScrapeApiResponse) -> Optional[str]:
+    """the next page of an old.reddit listing"""
+    return response.selector.xpath("//span[@class='next-button']/a/@href").get()
+
+
 def parse_user_posts(response: ScrapeApiResponse) -> List[Dict]:
     """parse user posts from user profiles"""
     selector = response.selector
@@ -214,17 +262,13 @@ def parse_user_posts(response: ScrapeApiResponse) -> List[Dict]:
 async def scrape_user_posts(username: str, sort: Union["new", "top", "controversial"], max_pages: int = None) -> List[Dict]:
     """scrape user posts"""
     url = f"https://old.reddit.com/user/{username}/submitted/?sort={sort}"
-    response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-    data = parse_user_posts(response)
-    post_data, next_page_url = data["data"], data["url"]
-
-    while next_page_url and (max_pages is None or max_pages > 0):
-        response = await SCRAPFLY.async_scrape(ScrapeConfig(next_page_url, **BASE_CONFIG))
-        data = parse_user_posts(response)
-        next_page_url = data["url"]
-        post_data.extend(data["data"])
-        if max_pages is not None:
-            max_pages -= 1
+    pages = max_pages + 1 if max_pages is not None else None
+    post_data = [
+        post
+        async for post in paginate(
+            url, _scrape_page, _next_page_url, lambda response: parse_user_posts(response)["data"], max_pages=pages
+        )
+    ]
     log.success(f"scraped {len(post_data)} posts from the {username} reddit profile")
     return post_data
 
@@ -265,16 +309,12 @@ def parse_user_comments(response: ScrapeApiResponse) -> List[Dict]:
 async def scrape_user_comments(username: str, sort: Union["new", "top", "controversial"], max_pages: int = None) -> List[Dict]:
     """scrape user posts"""
     url = f"https://old.reddit.com/user/{username}/comments/?sort={sort}"
-    response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-    data = parse_user_comments(response)
-    post_data, next_page_url = data["data"], data["url"]
-
-    while next_page_url and (max_pages is None or max_pages > 0):
-        response = await SCRAPFLY.async_scrape(ScrapeConfig(next_page_url, **BASE_CONFIG))
-        data = parse_user_comments(response)
-        next_page_url = data["url"]
-        post_data.extend(data["data"])
-        if max_pages is not None:
-            max_pages -= 1
+    pages = max_pages + 1 if max_pages is not None else None
+    post_data = [
+        post
+        async for post in paginate(
+            url, _scrape_page, _next_page_url, lambda response: parse_user_comments(response)["data"], max_pages=pages
+        )
+    ]
     log.success(f"scraped {len(post_data)} posts from the {username} reddit profile")
     return post_data
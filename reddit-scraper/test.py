@@ -179,6 +179,15 @@ async def test_post_scraping():
 
     assert len(post_data["comments"]) >= 50
 
+    # every comment is parsed exactly once
+    def comment_ids(comments):
+        for comment in comments:
+            yield comment["commentId"]
+            yield from comment_ids(comment.get("replies", []))
+
+    ids = list(comment_ids(post_data["comments"]))
+    assert len(ids) == len(set(ids))
+
 
 @pytest.mark.asyncio
 async def test_user_post_scraping():
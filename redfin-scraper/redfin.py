@@ -6,20 +6,20 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 import json
-import os
 from typing import List, Dict
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("redfin")
 
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("redfin", {
     # Redfin.com requires Anti Scraping Protection bypass feature:
     "asp": True,
     # Set the proxy location to US
     "country": "US",
-}
+})
 
 
 def parse_search_api(response: ScrapeApiResponse) -> List[Dict]:
@@ -4,22 +4,21 @@ This is an example web scraper for rightmove.com.
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
 import json
-import jmespath
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import find_json_object, get_client, query, site_config
 from typing import List
 from pathlib import Path
 from loguru import logger as log
 from typing import TypedDict
 from urllib.parse import urlencode
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("rightmove")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("rightmove", {
     "asp": True,
     "country": "GB",
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -98,30 +97,15 @@ def parse_property(data) -> PropertyResult:
     }
     results = {}
     for key, path in parse_map.items():
-        value = jmespath.search(path, data)
+        value = query(path, data)
         results[key] = value
     return results
 
 
-def find_json_objects(text: str, decoder=json.JSONDecoder()):
-    """Find JSON objects in text, and generate decoded JSON data"""
-    pos = 0
-    while True:
-        match = text.find("{", pos)
-        if match == -1:
-            break
-        try:
-            result, index = decoder.raw_decode(text[match:])
-            yield result
-            pos = match + index
-        except ValueError:
-            pos = match + 1
-
-
 def extract_property(result: ScrapeApiResponse) -> dict:
     """extract property data from rightmove PAGE_MODEL javascript variable"""
     data = result.selector.xpath("//script[contains(.,'PAGE_MODEL = ')]/text()").get()
-    json_data = list(find_json_objects(data))[0]
+    json_data = find_json_object(data, "propertyData")
     return json_data["propertyData"]
 
 
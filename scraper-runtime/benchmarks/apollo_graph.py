@@ -0,0 +1,140 @@
+"""
+Benchmark of Apollo cache unpacking: the recursive resolve_refs() glassdoor used
+before and wellfound's deepcopy based unpack_node_references() against
+scraper_runtime.ApolloGraph.
+
+The generated caches are shaped like a Glassdoor reviews page (reviews sharing
+employer and office location nodes) and a Wellfound search page (startup
+results sharing badges).
+
+$ python benchmarks/apollo_graph.py --nodes 5000
+"""
+import argparse
+import time
+import tracemalloc
+from copy import deepcopy
+from typing import Callable, Dict, Tuple
+
+from scraper_runtime import ApolloGraph
+
+
+def glassdoor_before(apollo_data: Dict):
+    def resolve_refs(data, root):
+        if isinstance(data, dict):
+            if "__ref" in data:
+                return resolve_refs(root[data["__ref"]], root)
+            else:
+                return {k: resolve_refs(v, root) for k, v in data.items()}
+        elif isinstance(data, list):
+            return [resolve_refs(i, root) for i in data]
+        else:
+            return data
+
+    return resolve_refs(apollo_data.get("ROOT_QUERY") or apollo_data, apollo_data)
+
+
+def glassdoor_after(apollo_data: Dict):
+    return ApolloGraph(apollo_data).root.resolve()
+
+
+def wellfound_before(graph: Dict):
+    def unpack_node_references(node, graph):
+        def flatten(value):
+            try:
+                if value["type"] != "id":
+                    return value
+            except (KeyError, TypeError):
+                return value
+            data = deepcopy(graph[value["id"]])
+            if data.get("node"):
+                data = flatten(data["node"])
+            return data
+
+        node = flatten(node)
+        for key, value in node.items():
+            if isinstance(value, list):
+                node[key] = [flatten(v) for v in value]
+            elif isinstance(value, dict):
+                node[key] = unpack_node_references(value, graph)
+        return node
+
+    return [unpack_node_references(graph[key], graph) for key in graph if key.startswith("StartupResult")]
+
+
+def wellfound_after(graph: Dict):
+    graph = ApolloGraph(graph, unwrap="node")
+    return [graph.resolve(graph.cache[key]) for key in graph if key.startswith("StartupResult")]
+
+
+def glassdoor_cache(count: int) -> Dict:
+    cache = {"ROOT_QUERY": {"employerReviews({\"page\":1})": {"reviews": []}}}
+    for i in range(count // 100):
+        cache[f"Employer:{i}"] = {
+            "name": f"Employer {i}",
+            "squareLogoUrl": f"https://media.glassdoor.com/{i}.png",
+            "ratings": {"overallRating": 4.1, "ceoRating": 0.9, "recommendToFriendRating": 0.8},
+            "headquarters": {"__ref": f"City:{i % 50}"},
+            "officeLocations": [{"__ref": f"City:{j % 50}"} for j in range(i, i + 30)],
+        }
+    for i in range(50):
+        cache[f"City:{i}"] = {"name": f"City {i}", "country": "US"}
+    for i in range(count):
+        cache[f"EmployerReview:{i}"] = {
+            "reviewId": i,
+            "pros": "good people " * 10,
+            "cons": "long hours " * 10,
+            "employer": {"__ref": f"Employer:{i % (count // 100)}"},
+            "location": {"__ref": f"City:{i % 50}"},
+        }
+        cache["ROOT_QUERY"]["employerReviews({\"page\":1})"]["reviews"].append({"__ref": f"EmployerReview:{i}"})
+    return cache
+
+
+def wellfound_cache(count: int) -> Dict:
+    cache = {}
+    for i in range(count):
+        cache[f"JobListing:{i}"] = {"id": i, "title": f"Engineer {i}", "description": "build things " * 20}
+        cache[f"Badge:{i % 20}"] = {"name": f"badge {i % 20}", "tooltip": "Actively hiring " * 50}
+    for i in range(count // 5):
+        cache[f"Startup:{i}"] = {
+            "name": f"Startup {i}",
+            "badges": [{"type": "id", "id": f"Badge:{j % 20}"} for j in range(i, i + 10)],
+            "highlightedJobListings": [{"type": "id", "id": f"JobListing:{j}"} for j in range(i * 5, i * 5 + 5)],
+        }
+        cache[f"StartupResultEdge:{i}"] = {"node": {"type": "id", "id": f"Startup:{i}"}}
+        cache[f"StartupResult:{i}"] = {"startup": {"type": "id", "id": f"StartupResultEdge:{i}"}}
+    return cache
+
+
+def measure(func: Callable, cache: Callable[[], Dict]) -> Tuple[float, float]:
+    """run time and peak memory (MB) of unpacking a cache, the old wellfound code modifies the cache it unpacks"""
+    data = cache()
+    started = time.perf_counter()
+    func(data)
+    seconds = time.perf_counter() - started
+    # measured in a separate run, tracing allocations slows python down a lot
+    data = cache()
+    tracemalloc.start()
+    func(data)
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=5000)
+    args = parser.parse_args()
+
+    for name, cache, before, after in (
+        ("glassdoor reviews", glassdoor_cache, glassdoor_before, glassdoor_after),
+        ("wellfound search", wellfound_cache, wellfound_before, wellfound_after),
+    ):
+        print(f"\n{name}: {len(cache(args.nodes))} nodes")
+        for label, func in (("before", before), ("ApolloGraph", after)):
+            seconds, peak = measure(func, lambda: cache(args.nodes))
+            print(f"  {label:<12} {seconds * 1000:>10.1f} ms {peak:>10.1f} MB peak")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark of scraping with the most expensive options for every page, of the
+hand-rolled "retry blocked pages with render_js and residential proxies" path
+g2 used, and of scraper_runtime.EscalationLadder.
+
+Pages of a simulated site need a given tier: most render on datacenter proxies,
+some page types need residential proxies or a browser. Requests cost the
+credits and take the time of their tier.
+
+$ python benchmarks/escalation.py --pages 1000 --residential 0.3 --browser 0.1
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from requests import Response
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+
+import scraper_runtime
+from scraper_runtime import EscalationLadder, cost_report, get_client
+
+# (credits, seconds) of a request per tier
+COSTS = {"datacenter": (1, 0.02), "residential": (25, 0.04), "render_js": (30, 0.1)}
+
+
+def tier_of(config: ScrapeConfig) -> str:
+    if config.render_js:
+        return "render_js"
+    return "residential" if config.proxy_pool == "public_residential_pool" else "datacenter"
+
+
+class SimulatedClient:
+    max_concurrency = 1
+
+    def __init__(self, needs):
+        self.needs = needs
+
+    async def async_scrape(self, config: ScrapeConfig) -> ScrapeApiResponse:
+        tier = tier_of(config)
+        credits, seconds = COSTS[tier]
+        await asyncio.sleep(seconds)
+        order = list(COSTS)
+        ok = order.index(tier) >= order.index(self.needs[config.url.split("/")[3]])
+        response = Response()
+        response.status_code = 200
+        response.headers["X-Scrapfly-Api-Cost"] = str(credits)
+        api_result = {
+            "config": {"url": config.url, "method": "GET", "headers": {}},
+            "context": {"url": config.url},
+            "result": {
+                "success": ok,
+                "status_code": 200 if ok else 403,
+                "reason": "OK" if ok else "Forbidden",
+                "format": "text",
+                "content": "<h1>data</h1>" if ok else "",
+                "request_headers": {},
+                "response_headers": {},
+            },
+        }
+        return ScrapeApiResponse(request=None, response=response, scrape_config=config, api_result=api_result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000, help="pages to scrape")
+    parser.add_argument("--types", type=int, default=20, help="page types (url patterns) of the site")
+    parser.add_argument("--residential", type=float, default=0.3, help="share of page types needing residential proxies")
+    parser.add_argument("--browser", type=float, default=0.1, help="share of page types needing a browser")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight at once")
+    args = parser.parse_args()
+
+    random.seed(1)
+    needs = {}
+    for number in range(args.types):
+        roll = random.random()
+        needs[f"type{number}"] = (
+            "render_js" if roll < args.browser else "residential" if roll < args.browser + args.residential else "datacenter"
+        )
+    urls = [f"https://example.com/type{random.randrange(args.types)}/page/{i}" for i in range(args.pages)]
+
+    async def expensive(client):
+        configs = [ScrapeConfig(url, render_js=True, proxy_pool="public_residential_pool") for url in urls]
+        async for _ in client.concurrent_scrape(configs):
+            pass
+
+    async def retry_blocked(client):
+        blocked = []
+        async for response in client.concurrent_scrape([ScrapeConfig(url) for url in urls]):
+            if response.upstream_status_code != 200:
+                blocked.append(response.context["url"])
+        retries = [ScrapeConfig(url, render_js=True, proxy_pool="public_residential_pool") for url in blocked]
+        async for _ in client.concurrent_scrape(retries):
+            pass
+
+    async def escalate(client):
+        ladder = EscalationLadder(client, check=lambda response: "data" in response.content)
+        async for _ in ladder.concurrent_scrape([ScrapeConfig(url) for url in urls]):
+            pass
+
+    print(f"{args.pages} pages of {args.types} types, {args.concurrency} concurrent requests")
+    for number, (label, func) in enumerate(
+        (("render_js always", expensive), ("retry blocked", retry_blocked), ("escalation", escalate))
+    ):
+        scraper_runtime.costs._LEDGER = scraper_runtime.CostLedger()
+        scraper_runtime.configure(max_concurrency=args.concurrency, client=SimulatedClient(needs))
+        site = f"benchmark{number}"
+        scraper_runtime.site_config(site, max_concurrency=args.concurrency).controller.enabled = False
+        started = time.perf_counter()
+        asyncio.run(func(get_client(site)))
+        total = cost_report()["total"]
+        print(
+            f"  {label:<18} {time.perf_counter() - started:>7.2f} s {total['requests']:>7} requests "
+            f"{total['credits']:>8} credits"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of scraping the reviews of many products product after product, like
+iherb.scrape_all_reviews and ebay.scrape_all_reviews used to (first page, then
+the remaining pages concurrently), against scraper_runtime.fan_out() which
+scrapes the review pages of every product as one queue.
+
+Products have a random number of review pages, most have a few and some have
+many. Requests are simulated with a fixed latency.
+
+$ python benchmarks/fanout.py --products 100 --max-pages 20 --latency 0.05 --concurrency 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from requests import Response
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+
+import scraper_runtime
+from scraper_runtime import fan_out, get_client
+
+
+class SimulatedClient:
+    max_concurrency = 1
+
+    def __init__(self, pages, latency):
+        self.pages = pages
+        self.latency = latency
+
+    async def async_scrape(self, config: ScrapeConfig) -> ScrapeApiResponse:
+        await asyncio.sleep(self.latency)
+        product = config.url.split("/")[3]
+        response = Response()
+        response.status_code = 200
+        api_result = {
+            "config": {"url": config.url, "method": "GET", "headers": {}},
+            "context": {"url": config.url},
+            "result": {
+                "success": True,
+                "status_code": 200,
+                "reason": "OK",
+                "format": "text",
+                "content": f'<html data-pages="{self.pages[product]}"><p>review</p><p>review</p></html>',
+                "request_headers": {},
+                "response_headers": {},
+            },
+        }
+        return ScrapeApiResponse(request=None, response=response, scrape_config=config, api_result=api_result)
+
+
+def page_count(response) -> int:
+    return int(response.selector.xpath("//html/@data-pages").get())
+
+
+def parse(response):
+    return response.selector.xpath("//p/text()").getall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100, help="products to scrape the reviews of")
+    parser.add_argument("--max-pages", type=int, default=20, help="most review pages of a product")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds a page request takes")
+    parser.add_argument("--concurrency", type=int, default=20, help="site concurrency limit")
+    args = parser.parse_args()
+
+    random.seed(1)
+    # most products have a few review pages, some have many
+    pages = {f"p{i}": min(args.max_pages, int(random.paretovariate(1.2))) for i in range(args.products)}
+    products = list(pages)
+
+    def first_page(product):
+        return ScrapeConfig(f"https://example.com/{product}/1")
+
+    def other_pages(product, first):
+        return [ScrapeConfig(f"https://example.com/{product}/{page}") for page in range(2, page_count(first) + 1)]
+
+    async def product_by_product(client):
+        reviews = []
+        for product in products:
+            first = await client.async_scrape(first_page(product))
+            reviews.extend(parse(first))
+            async for response in client.concurrent_scrape(other_pages(product, first)):
+                reviews.extend(parse(response))
+        return len(reviews)
+
+    async def fanned_out(client):
+        results = await fan_out(client, products, first_page, other_pages, parse)
+        return sum(map(len, results))
+
+    print(f"{args.products} products with {sum(pages.values())} review pages, {args.latency}s requests")
+    for number, (label, func) in enumerate((("product by product", product_by_product), ("fan out", fanned_out))):
+        scraper_runtime.configure(max_concurrency=args.concurrency, client=SimulatedClient(pages, args.latency))
+        site = f"benchmark{number}"
+        scraper_runtime.site_config(site, max_concurrency=args.concurrency).controller.enabled = False
+        started = time.perf_counter()
+        count = asyncio.run(func(get_client(site)))
+        print(f"  {label:<18} {time.perf_counter() - started:>7.2f} s {count:>7} reviews")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark of hidden page data extraction per site: the parsel Selector / greedy
+regex code the scrapers used before against scraper_runtime.HiddenData.
+
+Every measurement runs in a fresh process so the peak memory (max RSS growth
+while parsing, which includes the lxml tree a Selector builds) is comparable.
+
+$ python benchmarks/hidden_data.py                      # generated pages shaped like each site's
+$ python benchmarks/hidden_data.py --cache ../.scrapfly-cache --site zillow --match zillow.com/homedetails/
+"""
+import argparse
+import json
+import re
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from parsel import Selector
+
+from scraper_runtime import HiddenData, ResponseCache
+
+
+# the extraction each scraper did before, only the part that locates and decodes the data
+def zillow_before(html: str):
+    data = Selector(text=html).css("script#__NEXT_DATA__::text").get()
+    return json.loads(data)
+
+
+def homegate_before(html: str):
+    next_data = Selector(text=html).xpath("//script[contains(text(),'window.__INITIAL_STATE__')]/text()").get()
+    return json.loads(next_data.strip("window.__INITIAL_STATE__="))
+
+
+def immoscout24_before(html: str):
+    script = Selector(text=html).xpath("//script[contains(text(),'INITIAL_STATE')]/text()").get()
+    return json.loads(script.strip("window.__INITIAL_STATE__=").replace("undefined", "null"))
+
+
+def glassdoor_before(html: str):
+    return json.loads(re.findall(r'apolloState":\s*({.+})};', html)[0])
+
+
+def realestate_before(html: str):
+    script = Selector(text=html).xpath("//script[contains(text(),'window.ArgonautExchange')]/text()").get()
+    return json.loads(re.findall(r"window.ArgonautExchange=(\{.+\});", script)[0])
+
+
+def indeed_before(html: str):
+    data = re.findall(r'window.mosaic.providerData\["mosaic-provider-jobcards"\]=(\{.+?\});', html)
+    return json.loads(data[0])
+
+
+def similarweb_before(html: str):
+    script = Selector(text=html).xpath("//script[contains(text(), 'window.__APP_DATA__')]/text()").get()
+    return json.loads(re.findall(r"(\{.*?)(?=window\.__APP_META__)", script, re.DOTALL)[0])
+
+
+# site: (blob name, extraction before)
+SITES: Dict[str, Tuple[str, Callable[[str], Dict]]] = {
+    "zillow": ("__NEXT_DATA__", zillow_before),
+    "zoopla": ("__NEXT_DATA__", zillow_before),
+    "homegate": ("__INITIAL_STATE__", homegate_before),
+    "immoscout24": ("__INITIAL_STATE__", immoscout24_before),
+    "glassdoor": ("apolloState", glassdoor_before),
+    "realestate": ("ArgonautExchange", realestate_before),
+    "indeed": ('mosaic.providerData["mosaic-provider-jobcards"]', indeed_before),
+    "similarweb": ("__APP_DATA__", similarweb_before),
+}
+
+
+def listings(count: int) -> List[Dict]:
+    return [
+        {"id": i, "title": f"Listing {i}", "price": 1000 + i, "description": "bright flat near the park " * 8}
+        for i in range(count)
+    ]
+
+
+def generated_page(site: str) -> str:
+    """a page with the site's hidden data between a lot of unrelated html and scripts"""
+    state = {"props": {"pageProps": {"listings": listings(2000)}}, "meta": {"page": 1}}
+    blob = json.dumps(state)
+    scripts = {
+        "zillow": f'<script id="__NEXT_DATA__" type="application/json">{blob}</script>',
+        "zoopla": f'<script id="__NEXT_DATA__" type="application/json">{blob}</script>',
+        "homegate": f"<script>window.__INITIAL_STATE__={blob}</script>",
+        "immoscout24": f"<script>window.__INITIAL_STATE__={blob[:-1]}, \"ad\": undefined}}</script>",
+        "glassdoor": f'<script>window.appCache={{"apolloState": {blob}}};</script>',
+        "realestate": f"<script>window.ArgonautExchange={blob};</script>",
+        "indeed": f'<script>window.mosaic.providerData["mosaic-provider-jobcards"]={blob};</script>',
+        "similarweb": f'<script>window.__APP_DATA__ = {blob}\nwindow.__APP_META__ = {{"v": 1}}</script>',
+    }
+    body = "".join(
+        f"<div class='card-{i}'><a href='/item/{i}'><span>{'lorem ipsum ' * 8}</span></a></div>\n"
+        + (f"<script>window.dataLayer.push({{event: 'view', id: {i}}});</script>\n" if i % 50 == 0 else "")
+        for i in range(20000)
+    )
+    return f"<html><head><title>{site}</title></head><body>{body}{scripts[site]}{body[:200000]}</body></html>"
+
+
+def _run(site: str, method: str, path: str, repeat: int) -> Tuple[float, float, str]:
+    """parse a saved page in this process, returns best time, peak memory growth (MB) and a result digest"""
+    html = Path(path).read_text(encoding="utf-8")
+    name, before = SITES[site]
+    func = before if method == "before" else (lambda html: HiddenData(html).get(name))
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(html)
+        best = min(best, time.perf_counter() - started)
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024
+    return best, peak, json.dumps(result, sort_keys=True)[:200]
+
+
+def measure(site: str, method: str, path: str, repeat: int) -> Tuple[float, float, str]:
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(_run, site, method, path, repeat).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--site", choices=sorted(SITES), action="append", help="sites to benchmark, default all")
+    parser.add_argument("--cache", help="response cache directory to take recorded pages of --site from")
+    parser.add_argument("--match", help="only use recorded pages whose url contains this")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pages: List[Tuple[str, str, Path]] = []
+        for site in args.site or sorted(SITES):
+            if args.cache:
+                for index, response in enumerate(ResponseCache(args.cache).responses(args.match)):
+                    path = Path(directory, f"{site}-{index}.html")
+                    path.write_text(response.content, encoding="utf-8")
+                    pages.append((site, response.context["url"], path))
+            else:
+                path = Path(directory, f"{site}.html")
+                path.write_text(generated_page(site), encoding="utf-8")
+                pages.append((site, "generated page", path))
+
+        print(f"{'site':<12} {'page':<30} {'MB':>5} {'before ms':>10} {'after ms':>10} {'before peak MB':>15} {'after peak MB':>14}")
+        for site, label, path in pages:
+            before_time, before_peak, before_result = measure(site, "before", str(path), args.repeat)
+            after_time, after_peak, after_result = measure(site, "after", str(path), args.repeat)
+            same = "" if before_result == after_result else "  (results differ)"
+            print(
+                f"{site:<12} {label[:30]:<30} {path.stat().st_size / 1e6:>5.1f} {before_time * 1000:>10.1f} "
+                f"{after_time * 1000:>10.1f} {before_peak:>15.1f} {after_peak:>14.1f}{same}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark of embedded JSON extraction: the old per-scraper find_json_objects()
+helper (raw_decode on text[match:] at every "{") against
+scraper_runtime.find_json_objects with the json and orjson backends.
+
+Run it on saved pages, either html files or responses recorded by the response cache:
+
+$ python benchmarks/hidden_json.py ebay-item.html rightmove-property.html
+$ python benchmarks/hidden_json.py --cache ../.scrapfly-cache --match ebay.com/itm/ --key MSKU
+$ python benchmarks/hidden_json.py --cache ../.scrapfly-cache --match rightmove.co.uk/properties/ --key propertyData
+
+Without pages it benchmarks generated pages shaped like eBay product pages
+(a large MSKU variant object in a script between a lot of html and javascript)
+and Rightmove property pages (a PAGE_MODEL object).
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from scraper_runtime import ResponseCache, find_json_objects
+
+
+def legacy_find_json_objects(text: str, decoder=json.JSONDecoder()):
+    """the helper previously copied into the ebay, rightmove, immowelt and immobilienscout24 scrapers"""
+    pos = 0
+    while True:
+        match = text.find("{", pos)
+        if match == -1:
+            break
+        try:
+            result, index = decoder.raw_decode(text[match:])
+            yield result
+            pos = match + index
+        except ValueError:
+            pos = match + 1
+
+
+def filler(size: int) -> str:
+    """html and javascript noise around the hidden data"""
+    blocks = []
+    for i in range(size):
+        blocks.append(f"<div class='item-{i}'><span>{'lorem ipsum ' * 10}</span></div>\n")
+        if i % 5 == 0:
+            blocks.append(f"<script>function track{i}(e){{ if (e) {{ return {{id: {i}, t: e.type}}; }} }}</script>\n")
+    return "".join(blocks)
+
+
+def ebay_page() -> str:
+    variations = {
+        str(662315637000 + i): {
+            "binModel": {"price": {"value": {"value": random.randint(100, 900), "currency": "CAD"}}},
+            "quantity": {"outOfStock": random.random() < 0.3},
+            "menuItemValueIds": [i % 3, 3 + i % 4],
+            "description": "Excellent - Refurbished, ships from Montréal" * 3,
+        }
+        for i in range(3000)
+    }
+    msku = {
+        "MSKU": {
+            "selectMenus": [
+                {"displayLabel": "Color", "menuItemValueIds": [0, 1, 2]},
+                {"displayLabel": "Storage Capacity", "menuItemValueIds": [3, 4, 5, 6]},
+            ],
+            "variationsMap": variations,
+        }
+    }
+    tracking = json.dumps({"tracking": [{"event": i, "tags": ["a", "b"]} for i in range(500)]})
+    return (
+        filler(15000)
+        + f"<script>$ssgST={tracking};</script>"
+        + f"<script>$vi.push({json.dumps(msku)});</script>"
+        + filler(15000)
+    )
+
+
+def rightmove_page() -> str:
+    page_model = {
+        "propertyData": {
+            "id": "139286711",
+            "text": {"description": "<p>" + "A charming two bedroom flat. " * 200 + "</p>"},
+            "images": [{"url": f"https://media.rightmove.co.uk/{i}.jpeg", "caption": f"Photo {i}"} for i in range(60)],
+            "nearestStations": [{"name": f"Station {i}", "distance": i / 10} for i in range(10)],
+        },
+        "metadata": {"analyticsInfo": {"analyticsProperty": {"beds": 2, "price": 450000}}},
+    }
+    return filler(20000) + f"<script>window.PAGE_MODEL = {json.dumps(page_model)}</script>" + filler(5000)
+
+
+def saved_pages(paths: List[str], cache: Optional[str], match: Optional[str]) -> List[Tuple[str, str]]:
+    pages = [(path, Path(path).read_text(encoding="utf-8")) for path in paths]
+    if cache:
+        pages.extend((response.context["url"], response.content) for response in ResponseCache(cache).responses(match))
+    return pages
+
+
+def measure(func: Callable[[], List[Dict]], repeat: int) -> Tuple[float, List[Dict]]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="saved html pages")
+    parser.add_argument("--cache", help="response cache directory to take recorded pages from")
+    parser.add_argument("--match", help="only use recorded pages whose url contains this")
+    parser.add_argument("--key", action="append", help="key the hidden data object is found by, e.g. MSKU")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="don't run the slow quadratic helper")
+    args = parser.parse_args()
+
+    random.seed(0)
+    pages = saved_pages(args.pages, args.cache, args.match)
+    keys = args.key
+    if not pages:
+        pages = [("generated eBay product", ebay_page()), ("generated Rightmove property", rightmove_page())]
+        keys = keys or ["MSKU", "propertyData"]
+
+    backends = ["json"]
+    try:
+        import orjson  # noqa: F401
+
+        backends.append("orjson")
+    except ImportError:
+        print("orjson is not installed, only benchmarking the json backend")
+
+    for name, text in pages:
+        print(f"\n{name}: {len(text) / 1e6:.1f} MB")
+        runs = {}
+        if not args.skip_legacy:
+            runs["legacy text[match:]"] = lambda: list(legacy_find_json_objects(text))
+        for backend in backends:
+            runs[f"{backend} all objects"] = lambda backend=backend: list(find_json_objects(text, backend=backend))
+            if keys:
+                runs[f"{backend} keys={keys}"] = lambda backend=backend: list(
+                    find_json_objects(text, keys=keys, backend=backend)
+                )
+        baseline = None
+        for label, func in runs.items():
+            seconds, result = measure(func, 1 if label.startswith("legacy") else args.repeat)
+            if label.startswith("legacy") or label.endswith("all objects"):
+                baseline = baseline if baseline is not None else result
+                assert result == baseline, f"{label} found different objects"
+            print(f"  {label:<40} {seconds * 1000:>10.1f} ms  {len(result):>5} objects")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Load test of the runtime's concurrency machinery against a local
+scraper_runtime.MockScrapflyApi: the real ScrapflyClient, connection pool,
+site and global limiters and adaptive controllers scrape generated pages over
+HTTP from a mock API with a given latency and account concurrency.
+
+Runs once with the global budget matching the account concurrency and once with
+a budget over it, where the global controller has to back off from the 429s.
+
+$ python benchmarks/mockapi.py --pages 2000 --latency 0.05 --account 20 --over 40
+"""
+import argparse
+import asyncio
+import time
+
+from scrapfly import ScrapeConfig, ScrapflyClient
+
+import scraper_runtime
+from scraper_runtime import MockScrapflyApi, get_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=2000, help="pages to scrape")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the mock api takes per request")
+    parser.add_argument("--account", type=int, default=20, help="account concurrency of the mock api")
+    parser.add_argument("--over", type=int, default=40, help="global budget of the second run, over the account concurrency")
+    parser.add_argument("--size", type=int, default=50_000, help="bytes of every generated page")
+    args = parser.parse_args()
+
+    page = "<html><body>" + "x" * args.size + "</body></html>"
+
+    async def scrape(site: str):
+        client = get_client(site)
+        configs = [ScrapeConfig(f"https://example.com/{site}/{i}") for i in range(args.pages)]
+        failed = 0
+        async for result in client.concurrent_scrape(configs):
+            failed += isinstance(result, Exception)
+        return failed
+
+    print(f"{args.pages} pages of {args.size / 1024:.0f} KiB, {args.latency}s latency, account concurrency {args.account}")
+    for budget in (args.account, args.over):
+        with MockScrapflyApi(pages=lambda url: page, latency=args.latency, max_concurrency=args.account) as api:
+            runtime = scraper_runtime.configure(
+                max_concurrency=budget, client=ScrapflyClient(key="mock", host=api.url)
+            )
+            site = f"load{budget}"
+            scraper_runtime.site_config(site, max_concurrency=budget)
+            started = time.perf_counter()
+            failed = asyncio.run(scrape(site))
+            took = time.perf_counter() - started
+            print(
+                f"  budget {budget:>4} {took:>7.2f} s {args.pages / took:>8.1f} pages/s "
+                f"peak in flight {api.peak_in_flight:>4} throttled {api.stats['throttled']:>5} failed {failed:>5} "
+                f"final global limit {runtime.limiter.limit}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark of cursor pagination: the fetch -> parse -> fetch loops the reddit and
+instagram scrapers used before against scraper_runtime.paginate(), which
+requests the next page while the current one is parsed, and paginate_many()
+over several cursor chains.
+
+Requests are simulated by sleeping in a thread pool like the scrapfly client's
+blocking requests do, parsing by burning CPU on the event loop.
+
+$ python benchmarks/pagination.py --pages 20 --latency 0.2 --parse 0.1 --chains 5
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from scraper_runtime import paginate, paginate_many
+
+POOL = ThreadPoolExecutor(max_workers=32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20, help="pages of every cursor chain")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds a page request takes")
+    parser.add_argument("--parse", type=float, default=0.1, help="seconds of CPU parsing a page takes")
+    parser.add_argument("--chains", type=int, default=5, help="cursor chains (users, subreddits) to paginate")
+    args = parser.parse_args()
+
+    async def fetch(cursor):
+        await asyncio.get_running_loop().run_in_executor(POOL, time.sleep, args.latency)
+        return cursor
+
+    def next_cursor(page):
+        name, number = page
+        return (name, number + 1) if number < args.pages else None
+
+    def parse(page) -> List:
+        deadline = time.perf_counter() + args.parse
+        while time.perf_counter() < deadline:
+            pass
+        return [page] * 25
+
+    async def before(starts) -> int:
+        count = 0
+        for cursor in starts:
+            while cursor:
+                page = await fetch(cursor)
+                count += len(parse(page))
+                cursor = next_cursor(page)
+        return count
+
+    async def single(starts) -> int:
+        count = 0
+        for start in starts:
+            count += len([item async for item in paginate(start, fetch, next_cursor, parse)])
+        return count
+
+    async def many(starts) -> int:
+        return len([item async for item in paginate_many(starts, fetch, next_cursor, parse)])
+
+    starts = [(f"user{i}", 1) for i in range(args.chains)]
+    print(f"{args.chains} chains of {args.pages} pages, {args.latency}s requests, {args.parse}s parsing")
+    for label, func in (("before", before), ("paginate", single), ("paginate_many", many)):
+        started = time.perf_counter()
+        count = asyncio.run(func(starts))
+        print(f"  {label:<14} {time.perf_counter() - started:>8.2f} s {count:>8} items")
+
+
+if __name__ == "__main__":
+    main()
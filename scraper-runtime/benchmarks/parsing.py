@@ -0,0 +1,103 @@
+"""
+Benchmark of parsing scraped pages inline in the scrape loop, like the site
+scrapers used to, against scraper_runtime.parse_responses() with parse workers,
+which hands the pages to a process pool as they arrive.
+
+Requests are simulated by sleeping in a thread pool like the scrapfly client's
+blocking requests do, pages are generated product listings parsed with the
+same kind of XPath queries the parse_* functions run.
+
+$ python benchmarks/parsing.py --pages 200 --items 2000 --latency 0.2 --concurrency 20 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from scraper_runtime import PageResponse, ParseExecutor
+
+
+def make_page(number: int, items: int) -> str:
+    boxes = "".join(
+        f'<article class="item" data-id="{number}-{i}"><div><a href="/item/{i}" title="item {i}">item {i}</a></div>'
+        f'<span class="item-price">{i * 10:,}<span>EUR</span></span><ul><li>rooms {i % 5}</li><li>{i} m2</li></ul>'
+        "</article>"
+        for i in range(items)
+    )
+    return f'<html><body><h1 id="h1-container">page {number}</h1><section class="items-list">{boxes}</section></body></html>'
+
+
+def parse_page(response) -> List[Dict]:
+    results = []
+    for box in response.selector.xpath("//section[contains(@class, 'items-list')]/article[contains(@class, 'item')]"):
+        price = box.xpath(".//span[contains(@class, 'item-price')]/text()").get()
+        results.append({
+            "id": box.xpath("@data-id").get(),
+            "title": box.xpath(".//div/a/@title").get(),
+            "link": box.xpath(".//div/a/@href").get(),
+            "price": int(price.replace(",", "")) if price else None,
+            "details": box.xpath(".//li/text()").getall(),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200, help="pages to scrape")
+    parser.add_argument("--items", type=int, default=2000, help="listings on every page")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds a page request takes")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight at once")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parse worker processes")
+    args = parser.parse_args()
+
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    # every simulated response carries its own copy of the body like a real scrape does
+    body = make_page(0, args.items)
+
+    async def scrape(number: int) -> PageResponse:
+        await asyncio.get_running_loop().run_in_executor(pool, time.sleep, args.latency)
+        return PageResponse(body.replace("page 0", f"page {number}"), f"https://example.com/search?page={number}")
+
+    async def concurrent_scrape():
+        # like SiteClient.concurrent_scrape: a bounded number of requests in flight, results as they complete
+        pending = set()
+        for number in range(args.pages):
+            pending.add(asyncio.ensure_future(scrape(number)))
+            if len(pending) >= args.concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in asyncio.as_completed(pending):
+            yield await future
+
+    async def inline() -> int:
+        count = 0
+        async for response in concurrent_scrape():
+            count += len(parse_page(response))
+        return count
+
+    async def workers(executor: ParseExecutor) -> int:
+        count = 0
+        async for results in executor.parse_many(concurrent_scrape(), parse_page):
+            count += len(results)
+        return count
+
+    print(
+        f"{args.pages} pages of {len(body) / 1024:.0f} KiB, {args.latency}s requests, "
+        f"{args.concurrency} concurrent requests, {args.workers} parse workers"
+    )
+    started = time.perf_counter()
+    count = asyncio.run(inline())
+    print(f"  {'inline':<14} {time.perf_counter() - started:>8.2f} s {count:>10} items")
+    with ParseExecutor(workers=args.workers) as executor:
+        # start the workers outside of the measurement
+        asyncio.run(executor.parse(parse_page, PageResponse(make_page(0, 1), "https://example.com/")))
+        started = time.perf_counter()
+        count = asyncio.run(workers(executor))
+        print(f"  {'parse workers':<14} {time.perf_counter() - started:>8.2f} s {count:>10} items")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark of the reducer queries: jmespath.search() parsing the expression on
+every record against scraper_runtime.query() with its compiled query registry.
+
+The records are generated tweets and TikTok comments shaped like the datasets
+parsed by twitter.parse_tweet and tiktok.parse_comments.
+
+$ python benchmarks/queries.py --records 100000
+"""
+import argparse
+import time
+from typing import Callable, Dict, List, Tuple
+
+import jmespath
+
+from scraper_runtime import compile_query, query
+
+TWEET = """{
+    created_at: legacy.created_at,
+    attached_urls: legacy.entities.urls[].expanded_url,
+    attached_media: legacy.entities.media[].media_url_https,
+    tagged_users: legacy.entities.user_mentions[].screen_name,
+    tagged_hashtags: legacy.entities.hashtags[].text,
+    favorite_count: legacy.favorite_count,
+    reply_count: legacy.reply_count,
+    retweet_count: legacy.retweet_count,
+    text: legacy.full_text,
+    language: legacy.lang,
+    user_id: legacy.user_id_str,
+    id: legacy.id_str,
+    source: source,
+    views: views.count
+}"""
+
+COMMENT = """{
+    text: text,
+    comment_language: comment_language,
+    digg_count: digg_count,
+    reply_comment_total: reply_comment_total,
+    author_pin: author_pin,
+    create_time: create_time,
+    cid: cid,
+    nickname: user.nickname,
+    unique_id: user.unique_id,
+    aweme_id: aweme_id
+}"""
+
+
+def tweets(count: int) -> List[Dict]:
+    return [
+        {
+            "legacy": {
+                "created_at": "Tue Mar 14 17:41:30 +0000 2023",
+                "entities": {
+                    "urls": [{"expanded_url": f"https://example.com/{i}"}],
+                    "media": [{"media_url_https": f"https://pbs.twimg.com/media/{i}.jpg"}] * 2,
+                    "user_mentions": [{"screen_name": "scrapfly_dev"}],
+                    "hashtags": [{"text": "webscraping"}, {"text": "python"}],
+                },
+                "favorite_count": i,
+                "reply_count": i % 7,
+                "retweet_count": i % 13,
+                "full_text": f"tweet number {i}",
+                "lang": "en",
+                "user_id_str": "1310623081300402178",
+                "id_str": str(1635000000000000000 + i),
+            },
+            "source": "Twitter Web App",
+            "views": {"count": str(i * 10)},
+        }
+        for i in range(count)
+    ]
+
+
+def comments(count: int) -> List[Dict]:
+    return [
+        {
+            "text": f"comment {i}",
+            "comment_language": "en",
+            "digg_count": i,
+            "reply_comment_total": i % 5,
+            "author_pin": False,
+            "create_time": 1700000000 + i,
+            "cid": str(7300000000000000000 + i),
+            "user": {"nickname": f"user {i}", "unique_id": f"user_{i}"},
+            "aweme_id": "7198206283571285294",
+        }
+        for i in range(count)
+    ]
+
+
+def measure(func: Callable[[], List], repeat: int) -> Tuple[float, List]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--source", action="store_true", help="print the generated python of the queries")
+    args = parser.parse_args()
+
+    for name, expression, records in (
+        ("tweets", TWEET, tweets(args.records)),
+        ("tiktok comments", COMMENT, comments(args.records)),
+    ):
+        print(f"\n{name}: {len(records)} records")
+        compiled = jmespath.compile(expression)
+        runs = {
+            "jmespath.search": lambda: [jmespath.search(expression, record) for record in records],
+            "jmespath.compile once": lambda: [compiled.search(record) for record in records],
+            "scraper_runtime.query": lambda: [query(expression, record) for record in records],
+        }
+        baseline = None
+        for label, func in runs.items():
+            seconds, result = measure(func, args.repeat)
+            baseline = baseline if baseline is not None else result
+            assert result == baseline, f"{label} reduced the records differently"
+            print(f"  {label:<25} {seconds * 1000:>10.1f} ms")
+        if args.source:
+            print(compile_query(expression).source)
+
+
+if __name__ == "__main__":
+    main()
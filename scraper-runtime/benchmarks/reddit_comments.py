@@ -0,0 +1,142 @@
+"""
+Benchmark of reddit comment tree parsing: the recursive parse_post_comments()
+that queried all descendant comments of every comment against the single pass
+reddit.iter_post_comments() walker, in nested and flat mode.
+
+$ python benchmarks/reddit_comments.py                     # generated 2k comment old.reddit thread
+$ python benchmarks/reddit_comments.py post.html           # saved old.reddit post pages
+$ python benchmarks/reddit_comments.py --cache ../.scrapfly-cache --match old.reddit.com/r/
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+
+from parsel import Selector
+
+from scraper_runtime import ResponseCache
+
+sys.path.insert(0, str(Path(__file__).parents[2] / "reddit-scraper"))
+import reddit  # noqa: E402
+
+
+def parse_post_comments_before(response) -> List[Dict]:
+    """the recursive parser reddit.py used before"""
+
+    def parse_comment(parent_selector) -> Dict:
+        author = parent_selector.xpath("./@data-author").get()
+        link = parent_selector.xpath("./@data-permalink").get()
+        dislikes = parent_selector.xpath(".//span[contains(@class, 'dislikes')]/@title").get()
+        upvotes = parent_selector.xpath(".//span[contains(@class, 'likes')]/@title").get()
+        downvotes = parent_selector.xpath(".//span[contains(@class, 'unvoted')]/@title").get()
+        return {
+            "authorId": parent_selector.xpath("./@data-author-fullname").get(),
+            "author": author,
+            "authorProfile": "https://www.reddit.com/user/" + author if author else None,
+            "commentId": parent_selector.xpath("./@data-fullname").get(),
+            "link": "https://www.reddit.com" + link if link else None,
+            "publishingDate": parent_selector.xpath(".//time/@datetime").get(),
+            "commentBody": parent_selector.xpath(".//div[@class='md']/p/text()").get(),
+            "upvotes": int(upvotes) if upvotes else None,
+            "dislikes": int(dislikes) if dislikes else None,
+            "downvotes": int(downvotes) if downvotes else None,
+        }
+
+    def parse_replies(what) -> List[Dict]:
+        replies = []
+        for reply_box in what.xpath(".//div[@data-type='comment']"):
+            reply_comment = parse_comment(reply_box)
+            child_replies = parse_replies(reply_box)
+            if child_replies:
+                reply_comment["replies"] = child_replies
+            replies.append(reply_comment)
+        return replies
+
+    data = []
+    for item in response.selector.xpath("//div[@class='sitetable nestedlisting']/div[@data-type='comment']"):
+        comment_data = parse_comment(item)
+        replies = parse_replies(item)
+        if replies:
+            comment_data["replies"] = replies
+        data.append(comment_data)
+    return data
+
+
+def comment_html(index: int, replies: str) -> str:
+    score = random.randint(1, 500)
+    return f"""<div class=" thing id-t1_c{index} comment" data-type="comment" data-fullname="t1_c{index}"
+ data-author="user{index}" data-author-fullname="t2_u{index}" data-permalink="/r/test/comments/abc/post/c{index}/">
+<p class="parent"></p><div class="midcol unvoted"></div>
+<div class="entry unvoted"><p class="tagline"><a class="author">user{index}</a>
+<span class="score dislikes" title="{score - 1}">{score - 1} points</span>
+<span class="score unvoted" title="{score}">{score} points</span>
+<span class="score likes" title="{score + 1}">{score + 1} points</span>
+<time datetime="2024-04-15T20:03:15+00:00">3 hours ago</time></p>
+<form class="usertext"><div class="usertext-body"><div class="md"><p>comment {index} {'text ' * 30}</p></div></div></form>
+<ul class="flat-list buttons"><li><a href="#">reply</a></li></ul></div>
+<div class="child"><div class="sitetable listing">{replies}</div></div></div>"""
+
+
+def generated_thread(count: int) -> str:
+    """an old.reddit post page with threads up to 10 replies deep"""
+    counter = iter(range(count))
+
+    def thread(depth: int) -> str:
+        index = next(counter, None)
+        if index is None:
+            return ""
+        replies = "".join(thread(depth + 1) for _ in range(random.randint(1, 2) if depth < 10 else 0))
+        return comment_html(index, replies)
+
+    threads = []
+    while (top := thread(0)) != "":
+        threads.append(top)
+    return f"<html><body><div class='sitetable nestedlisting'>{''.join(threads)}</div></body></html>"
+
+
+def count(comments: List[Dict]) -> int:
+    return sum(1 + count(comment.get("replies", [])) for comment in comments)
+
+
+def measure(func: Callable[[], List[Dict]], repeat: int) -> Tuple[float, List[Dict]]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="saved old.reddit post pages")
+    parser.add_argument("--cache", help="response cache directory to take recorded pages from")
+    parser.add_argument("--match", help="only use recorded pages whose url contains this")
+    parser.add_argument("--comments", type=int, default=2000, help="size of the generated thread")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(0)
+    pages = [(path, Path(path).read_text(encoding="utf-8")) for path in args.pages]
+    if args.cache:
+        pages.extend((response.context["url"], response.content) for response in ResponseCache(args.cache).responses(args.match))
+    if not pages:
+        pages = [(f"generated {args.comments} comment thread", generated_thread(args.comments))]
+
+    for name, html in pages:
+        response = SimpleNamespace(selector=Selector(text=html))
+        print(f"\n{name}: {len(html) / 1e6:.1f} MB")
+        for label, func in (
+            ("before", lambda: parse_post_comments_before(response)),
+            ("nested", lambda: reddit.parse_post_comments(response)),
+            ("flat", lambda: reddit.parse_post_comments(response, nested=False)),
+        ):
+            seconds, result = measure(func, args.repeat)
+            print(f"  {label:<8} {seconds * 1000:>10.1f} ms {count(result):>8} comments in output")
+
+
+if __name__ == "__main__":
+    main()
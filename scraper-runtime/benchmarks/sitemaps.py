@@ -0,0 +1,87 @@
+"""
+Benchmark of sitemap shard parsing: gzip.decompress() into a string and a parsel
+Selector over the whole document (what the crunchbase, bestbuy and similarweb
+scrapers did before) against the streaming scraper_runtime.iter_sitemap.
+
+Every measurement runs in a fresh process so the peak memory (max RSS growth
+while parsing) is comparable.
+
+$ python benchmarks/sitemaps.py --urls 200000
+$ python benchmarks/sitemaps.py sitemap-organizations-1.xml.gz
+"""
+import argparse
+import gzip
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Tuple
+
+from parsel import Selector
+
+from scraper_runtime import iter_sitemap
+
+
+def parse_before(body: bytes) -> int:
+    selector = Selector(text=gzip.decompress(body).decode())
+    count = 0
+    for url_node in selector.xpath("//url"):
+        url_node.xpath("loc/text()").get()
+        url_node.xpath("lastmod/text()").get()
+        count += 1
+    return count
+
+
+def parse_after(body: bytes) -> int:
+    return sum(1 for _ in iter_sitemap(body))
+
+
+def generated_shard(count: int) -> bytes:
+    urls = "".join(
+        f"<url><loc>https://www.crunchbase.com/organization/company-{i}</loc>"
+        f"<lastmod>2024-05-{i % 28 + 1:02d}T10:00:00Z</lastmod><changefreq>daily</changefreq></url>\n"
+        for i in range(count)
+    )
+    # without an <?xml?> declaration, parsel would parse it as namespaced xml where the old "//url" matches nothing
+    xml = f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n{urls}</urlset>'
+    return gzip.compress(xml.encode())
+
+
+def _run(method: str, path: str) -> Tuple[float, float, int]:
+    body = Path(path).read_bytes()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    count = (parse_before if method == "before" else parse_after)(body)
+    seconds = time.perf_counter() - started
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024
+    return seconds, peak, count
+
+
+def measure(method: str, path: str) -> Tuple[float, float, int]:
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(_run, method, path).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("shards", nargs="*", help="saved gzipped sitemap shards")
+    parser.add_argument("--urls", type=int, default=200000, help="urls of the generated shard")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        shards = list(args.shards)
+        if not shards:
+            path = Path(directory, "generated.xml.gz")
+            path.write_bytes(generated_shard(args.urls))
+            shards = [str(path)]
+        for shard in shards:
+            print(f"\n{shard}: {Path(shard).stat().st_size / 1e6:.1f} MB gzipped")
+            for method in ("before", "after"):
+                seconds, peak, count = measure(method, shard)
+                print(f"  {method:<8} {seconds * 1000:>10.1f} ms {peak:>10.1f} MB peak {count:>10} urls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Shared runtime for the scrapfly scrapers.
+
+Scraper modules register their default scrape options and get a client bound to
+the process-wide runtime:
+
+    BASE_CONFIG = site_config("walmart", {"asp": True, "country": "US"})
+    SCRAPFLY = get_client("walmart")
+"""
+from .adaptive import AdaptiveController
+from .cache import CacheMissError, ResponseCache, fingerprint
+from .checkpoint import Checkpoint
+from .client import ScraperRuntime, SiteClient, configure, get_client, get_runtime, metrics
+from .config import SITES, SiteConfig, get_site, site_config
+from .costs import BudgetExceeded, CostLedger, Downgrade, cost_report, get_ledger, job_scope, set_budget
+from .escalation import EscalationFailed, EscalationLadder, Tier, ladder, url_pattern
+from .extract import HiddenData, find_json_object, find_json_objects, hidden_data
+from .fanout import fan_out
+from .graph import ApolloGraph, GraphList, GraphNode
+from .graphql import GraphQLBatcher, GraphQLError
+from .jobs import Job, load_job_file, run_jobs
+from .limits import ConcurrencyLimiter
+from .mockapi import MockScrapflyApi, mock_from_env, request_key
+from .paginate import paginate, paginate_many
+from .parsing import PageResponse, ParseExecutor, configure_parsing, get_parse_executor, parse_response, parse_responses
+from .pipeline import Stage, run_pipeline
+from .query import Query, compile_query, query
+from .sessions import Session, SessionPool
+from .shards import Shard, crawl_shards, plan_shards, split_box, split_range
+from .sink import CsvSink, JsonlSink, read_csv, read_jsonl
+from .sitemap import SitemapEntry, crawl_sitemaps, iter_sitemap
+from .tracker import ChangeTracker, VersionStore
+
+__all__ = [
+    "AdaptiveController",
+    "ApolloGraph",
+    "BudgetExceeded",
+    "CacheMissError",
+    "ChangeTracker",
+    "Checkpoint",
+    "ConcurrencyLimiter",
+    "CostLedger",
+    "CsvSink",
+    "Downgrade",
+    "EscalationFailed",
+    "EscalationLadder",
+    "GraphList",
+    "GraphNode",
+    "GraphQLBatcher",
+    "GraphQLError",
+    "HiddenData",
+    "Job",
+    "JsonlSink",
+    "MockScrapflyApi",
+    "PageResponse",
+    "ParseExecutor",
+    "Query",
+    "ResponseCache",
+    "SITES",
+    "ScraperRuntime",
+    "Session",
+    "SessionPool",
+    "Shard",
+    "SiteClient",
+    "SiteConfig",
+    "SitemapEntry",
+    "Stage",
+    "Tier",
+    "VersionStore",
+    "compile_query",
+    "configure",
+    "configure_parsing",
+    "cost_report",
+    "crawl_shards",
+    "crawl_sitemaps",
+    "fan_out",
+    "find_json_object",
+    "find_json_objects",
+    "fingerprint",
+    "get_client",
+    "get_ledger",
+    "get_parse_executor",
+    "get_runtime",
+    "get_site",
+    "hidden_data",
+    "iter_sitemap",
+    "job_scope",
+    "ladder",
+    "load_job_file",
+    "metrics",
+    "mock_from_env",
+    "paginate",
+    "paginate_many",
+    "parse_response",
+    "parse_responses",
+    "plan_shards",
+    "query",
+    "read_csv",
+    "read_jsonl",
+    "request_key",
+    "run_jobs",
+    "run_pipeline",
+    "set_budget",
+    "site_config",
+    "split_box",
+    "split_range",
+    "url_pattern",
+]
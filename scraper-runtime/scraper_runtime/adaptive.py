@@ -0,0 +1,215 @@
+"""
+Adaptive (AIMD) concurrency control.
+
+Every site limiter is driven by an AdaptiveController which watches the outcome
+of each scrape and moves the limit between 1 and the configured maximum:
+
+- additive increase: after a full window of healthy responses (one per slot)
+  the limit grows by one slot
+- multiplicative decrease: 429 throttling, anti scraping protection (ASP)
+  blocks, or latency/credit cost climbing well above the site's baseline cut
+  the limit in half, at most once per window of requests
+
+so scrapers don't need hand-tuned batch sizes and a target that starts blocking
+is backed off from instead of being hammered. The global budget has its own
+controller which only reacts to the Scrapfly account itself throttling us.
+Set $SCRAPFLY_ADAPTIVE=0 to keep every limit fixed at its maximum.
+"""
+import os
+import time
+from typing import Any, Collection, Dict, Optional
+
+from loguru import logger as log
+from scrapfly.errors import (
+    ApiHttpClientError,
+    HttpError,
+    ScrapflyAspError,
+    ScrapflyThrottleError,
+    TooManyConcurrentRequest,
+    TooManyRequest,
+    UpstreamHttpError,
+)
+
+from .limits import ConcurrencyLimiter
+
+ADAPTIVE = os.environ.get("SCRAPFLY_ADAPTIVE", "1").lower() not in ("0", "false", "no")
+
+OK = "ok"
+THROTTLED = "throttled"
+BLOCKED = "blocked"
+ACCOUNT_THROTTLED = "account_throttled"
+ERROR = "error"
+
+# upstream status codes meaning the target is rate limiting or blocking us
+THROTTLE_STATUS = {429}
+BLOCK_STATUS = {403, 503}
+
+# outcomes site limits back off from, the global budget only backs off from the account limits
+SITE_SIGNALS = (THROTTLED, BLOCKED)
+ACCOUNT_SIGNALS = (ACCOUNT_THROTTLED,)
+
+
+def classify(result: Any) -> str:
+    """outcome of a scrape from its ScrapeApiResponse or raised exception"""
+    if isinstance(result, (TooManyConcurrentRequest, TooManyRequest, ScrapflyThrottleError)):
+        return ACCOUNT_THROTTLED
+    if isinstance(result, ApiHttpClientError) and result.http_status_code == 429:
+        # the sdk raises API errors like ERR::THROTTLE::MAX_CONCURRENT_REQUEST_EXCEEDED as generic client errors
+        return ACCOUNT_THROTTLED
+    if isinstance(result, ScrapflyAspError):
+        return BLOCKED
+    if isinstance(result, UpstreamHttpError):
+        status = result.http_status_code
+        return THROTTLED if status in THROTTLE_STATUS else BLOCKED if status in BLOCK_STATUS else ERROR
+    if isinstance(result, (HttpError, Exception)):
+        return ERROR
+    # responses of scrapes made with raise_on_upstream_error=False
+    status = getattr(result, "upstream_status_code", None)
+    if status in THROTTLE_STATUS:
+        return THROTTLED
+    error = getattr(result, "error", None) or {}
+    if "::ASP::" in str(error.get("code", "")) or status in BLOCK_STATUS:
+        return BLOCKED
+    return OK
+
+
+class AdaptiveController:
+    """AIMD controller moving a ConcurrencyLimiter between 1 and its maximum"""
+
+    def __init__(
+        self,
+        limiter: ConcurrencyLimiter,
+        ceiling: Optional[int] = None,
+        signals: Collection[str] = SITE_SIGNALS,
+        backoff: float = 0.5,
+        latency_tolerance: Optional[float] = 2.0,
+        cost_tolerance: Optional[float] = 2.0,
+        enabled: bool = ADAPTIVE,
+    ):
+        """
+        limiter: the limiter whose limit is adjusted
+        ceiling: maximum limit, defaults to the current limit
+        signals: outcomes the limit is cut on
+        backoff: factor the limit is multiplied with on throttling or blocks
+        latency_tolerance / cost_tolerance: how far latency and credit cost may
+            climb above their baseline before it's treated as congestion, None to ignore them
+        enabled: when disabled outcomes are still counted but the limit stays at the ceiling
+        """
+        self.limiter = limiter
+        self.name = limiter.name
+        self._ceiling = ceiling or limiter.limit
+        self.signals = set(signals)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cost_tolerance = cost_tolerance
+        self.enabled = enabled
+        self.limiter.limit = self._ceiling
+        self.outcomes = {OK: 0, THROTTLED: 0, BLOCKED: 0, ACCOUNT_THROTTLED: 0, ERROR: 0}
+        self.credits = 0
+        self.latency: Optional[float] = None
+        self.latency_baseline: Optional[float] = None
+        self.cost: Optional[float] = None
+        self.cost_baseline: Optional[float] = None
+        self.increases = 0
+        self.decreases = 0
+        self._healthy = 0
+        self._last_decrease = 0.0
+
+    def __repr__(self) -> str:
+        return f"<AdaptiveController {self.name} {self.limit}/{self.ceiling}>"
+
+    @property
+    def limit(self) -> int:
+        return self.limiter.limit
+
+    @property
+    def ceiling(self) -> int:
+        return self._ceiling
+
+    @ceiling.setter
+    def ceiling(self, value: int):
+        """setting a new maximum also restarts the limit from it"""
+        self._ceiling = max(1, int(value))
+        self.limiter.limit = self._ceiling
+        self._healthy = 0
+
+    def record(self, result: Any, started: float, latency: float, cost: Optional[int] = None) -> str:
+        """
+        feed the outcome of one scrape, started at time.monotonic() `started` and taking `latency` seconds.
+        Returns the outcome it was classified as.
+        """
+        outcome = classify(result)
+        self.outcomes[outcome] += 1
+        if cost:
+            self.credits += cost
+        if outcome == ERROR:
+            return outcome
+        if outcome == OK:
+            self.latency, self.latency_baseline = self._track(self.latency, self.latency_baseline, latency)
+            if cost:
+                self.cost, self.cost_baseline = self._track(self.cost, self.cost_baseline, cost)
+        if not self.enabled:
+            return outcome
+        # requests already in flight when the limit was cut report the same congestion again, ignore them
+        fresh = started >= self._last_decrease
+        if outcome in self.signals:
+            if fresh:
+                self._decrease(outcome)
+            return outcome
+        if outcome != OK:
+            return outcome
+        congestion = self._congestion()
+        if congestion:
+            if fresh:
+                self._decrease(congestion)
+            return outcome
+        self._healthy += 1
+        if self._healthy >= self.limit and self.limit < self._ceiling:
+            self._healthy = 0
+            self.increases += 1
+            self.limiter.limit = self.limit + 1
+            log.debug(f"{self.name}: concurrency raised to {self.limit}/{self._ceiling}")
+        return outcome
+
+    @staticmethod
+    def _track(average: Optional[float], baseline: Optional[float], value: float):
+        """update the moving average of a measure and its slowly drifting best observed level"""
+        average = value if average is None else 0.8 * average + 0.2 * value
+        # the baseline follows improvements immediately and regressions very slowly
+        baseline = average if baseline is None else min(average, baseline * 1.01)
+        return average, baseline
+
+    def _congestion(self) -> Optional[str]:
+        if self.outcomes[OK] < 10:
+            return None
+        if self.latency_tolerance and self.latency > self.latency_baseline * self.latency_tolerance:
+            return "latency"
+        if self.cost_tolerance and self.cost and self.cost > self.cost_baseline * self.cost_tolerance:
+            return "cost"
+        return None
+
+    def _decrease(self, reason: str):
+        self._healthy = 0
+        self._last_decrease = time.monotonic()
+        limit = max(1, int(self.limit * self.backoff))
+        if limit == self.limit:
+            return
+        self.decreases += 1
+        self.limiter.limit = limit
+        log.warning(f"{self.name}: {reason}, concurrency lowered to {limit}/{self._ceiling}")
+
+    def metrics(self) -> Dict[str, Any]:
+        """current limits and observed outcomes"""
+        return {
+            "limit": self.limit,
+            "max_concurrency": self._ceiling,
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiting,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            **self.outcomes,
+            "latency": self.latency,
+            "latency_baseline": self.latency_baseline,
+            "cost": self.cost,
+            "credits": self.credits,
+        }
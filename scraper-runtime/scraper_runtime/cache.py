@@ -0,0 +1,237 @@
+"""
+Local on-disk store of raw Scrapfly responses.
+
+Every successful scrape can be recorded as a gzip compressed JSON file named
+after the fingerprint of its ScrapeConfig. Recorded responses are replayed as
+regular ScrapeApiResponse objects, so parser fixes can be re-run at disk speed
+and tests can run fully offline against recorded fixtures:
+
+    cache = ResponseCache("./.scrapfly-cache")
+    products = dict(cache.replay(walmart.parse_product, match="/ip/"))
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from loguru import logger as log
+from requests import Response
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+
+# ScrapeConfig options that don't change what the scraped page looks like
+IGNORED_OPTIONS = {
+    "cache",
+    "cache_clear",
+    "cache_ttl",
+    "correlation_id",
+    "cost_budget",
+    "debug",
+    "key",
+    "raise_on_upstream_error",
+    "retry",
+    "session",
+    "session_sticky_proxy",
+    "tags",
+    "timeout",
+    "webhook",
+}
+
+
+class CacheMissError(KeyError):
+    """raised in offline mode when a scrape has no recorded response"""
+
+
+def _normalize_url(url: str) -> str:
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse(parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), query=query, fragment=""))
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def fingerprint(scrape_config: ScrapeConfig) -> str:
+    """hash of the ScrapeConfig options that determine the scraped result"""
+    options = {key: value for key, value in vars(scrape_config).items() if key not in IGNORED_OPTIONS and value}
+    options["url"] = _normalize_url(scrape_config.url)
+    options["method"] = scrape_config.method.upper()
+    if "headers" in options:
+        options["headers"] = {key.lower(): value for key, value in options["headers"].items()}
+    if "cookies" in options:
+        options["cookies"] = {key.lower(): value for key, value in options["cookies"].items()}
+    normalized = json.dumps(options, sort_keys=True, default=_to_json)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def replay_response(record: Dict, scrape_config: Optional[ScrapeConfig] = None) -> ScrapeApiResponse:
+    """turn a recorded api result back into a ScrapeApiResponse"""
+    if scrape_config is None:
+        scrape_config = ScrapeConfig(record["result"]["config"]["url"], method=record["result"]["config"].get("method", "GET"))
+    response = Response()
+    response.status_code = 200
+    response.headers.update(record.get("headers", {}))
+    return ScrapeApiResponse(request=None, response=response, scrape_config=scrape_config, api_result=record["result"])
+
+
+class ResponseCache:
+    """content-addressed store of raw scrape responses with TTL and size based LRU eviction"""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        ttl: Optional[float] = None,
+        max_size: Optional[int] = None,
+        offline: bool = False,
+    ):
+        """
+        path: directory the responses are stored in
+        ttl: seconds after which a recorded response is considered stale, None to keep forever
+        max_size: maximum total size of the store in bytes, least recently used responses are evicted first
+        offline: never scrape, missing responses raise CacheMissError
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.size = sum(file.stat().st_size for file in self._files())
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self) -> str:
+        return f"<ResponseCache {self.path} {self.size} bytes hits={self.hits} misses={self.misses}>"
+
+    def _file(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.json.gz"
+
+    def _files(self) -> Iterator[Path]:
+        return self.path.glob("*/*.json.gz")
+
+    def _load(self, file: Path) -> Optional[Dict]:
+        try:
+            with gzip.open(file, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            log.warning(f"removing unreadable cached response {file}")
+            self._remove(file)
+            return None
+
+    def _remove(self, file: Path):
+        try:
+            size = file.stat().st_size
+            file.unlink()
+        except FileNotFoundError:
+            return
+        self.size -= size
+
+    def _expired(self, record: Dict) -> bool:
+        return self.ttl is not None and time.time() - record["stored_at"] > self.ttl
+
+    def get_record(self, key: str) -> Optional[Dict]:
+        """find the record stored under a key, None when it's missing or expired"""
+        file = self._file(key)
+        record = self._load(file) if file.exists() else None
+        if record is not None and self._expired(record):
+            self._remove(file)
+            record = None
+        if record is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # file modification time doubles as the last access time for LRU eviction
+        os.utime(file)
+        return record
+
+    def get(self, scrape_config: ScrapeConfig) -> Optional[ScrapeApiResponse]:
+        """find the recorded response of a scrape config"""
+        record = self.get_record(fingerprint(scrape_config))
+        if record is None:
+            if self.offline:
+                raise CacheMissError(f"no recorded response for {scrape_config.url}")
+            return None
+        return replay_response(record, scrape_config)
+
+    def put(self, response: ScrapeApiResponse, scrape_config: Optional[ScrapeConfig] = None) -> bool:
+        """
+        record a successful text response, returns whether it was stored
+        scrape_config: the config to record it for, defaults to the one it was scraped with
+        """
+        if not response.scrape_success or response.scrape_result.get("format") != "text":
+            return False
+        record = {
+            "stored_at": time.time(),
+            "headers": {key: value for key, value in response.headers.items() if key.lower().startswith("x-scrapfly")},
+            "result": response.result,
+        }
+        self.put_record(fingerprint(scrape_config or response.scrape_config), record)
+        return True
+
+    def put_record(self, key: str, record: Dict):
+        """store a {"stored_at", "headers", "result"} record under a key"""
+        file = self._file(key)
+        file.parent.mkdir(exist_ok=True)
+        if file.exists():
+            self._remove(file)
+        # write to a temporary file first so a crash never leaves half written responses behind
+        temp = file.with_suffix(".tmp")
+        with gzip.open(temp, "wt", encoding="utf-8") as f:
+            json.dump(record, f, default=_to_json)
+        temp.replace(file)
+        self.size += file.stat().st_size
+        if self.max_size is not None and self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """remove least recently used responses until the store is 90% of its max size"""
+        target = self.max_size * 0.9
+        files = sorted(((file.stat().st_mtime, file) for file in self._files()), key=lambda item: item[0])
+        evicted = 0
+        for _, file in files:
+            if self.size <= target:
+                break
+            self._remove(file)
+            evicted += 1
+        log.debug(f"evicted {evicted} cached responses, cache size is now {self.size} bytes")
+
+    def clear(self):
+        for file in list(self._files()):
+            self._remove(file)
+
+    def responses(self, match: Optional[str] = None) -> Iterator[ScrapeApiResponse]:
+        """iterate all recorded responses, optionally only those whose url contains match"""
+        for file in self._files():
+            record = self._load(file)
+            if record is None or self._expired(record):
+                continue
+            if match and match not in record["result"]["config"]["url"]:
+                continue
+            yield replay_response(record)
+
+    def replay(self, parse: Callable[[ScrapeApiResponse], Any], match: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """run a parse_* function over recorded responses yielding (url, parsed result) pairs"""
+        for response in self.responses(match):
+            yield response.config["url"], parse(response)
+
+
+def cache_from_env() -> Optional[ResponseCache]:
+    """create the response cache configured through $SCRAPFLY_RESPONSE_CACHE environment variables"""
+    path = os.environ.get("SCRAPFLY_RESPONSE_CACHE")
+    if not path:
+        return None
+    ttl = os.environ.get("SCRAPFLY_RESPONSE_CACHE_TTL")
+    max_size = os.environ.get("SCRAPFLY_RESPONSE_CACHE_SIZE")
+    return ResponseCache(
+        path,
+        ttl=float(ttl) if ttl else None,
+        max_size=int(max_size) if max_size else None,
+        offline=os.environ.get("SCRAPFLY_OFFLINE", "").lower() in ("1", "true", "yes"),
+    )
@@ -0,0 +1,157 @@
+"""
+Resumable multi-stage crawls.
+
+A Checkpoint persists the completion state (and result) of every item of every
+crawl stage in a SQLite file. Running a stage again skips the items that are
+already done, so a crashed search -> products -> reviews crawl continues where
+it stopped instead of starting from zero:
+
+    checkpoint = Checkpoint(output / "lemon_balm.db")
+    search = await checkpoint.run_stage("search", ["lemon balm"], str, scrape_search)
+    products = await checkpoint.run_stage("products", urls, str, scrape_product, concurrency=10)
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Union
+
+from loguru import logger as log
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    stage TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (stage, key)
+)
+"""
+
+DONE = "done"
+FAILED = "failed"
+
+
+class Checkpoint:
+    """SQLite backed per-item completion state of a multi-stage crawl"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        # WAL keeps every commit cheap and the file readable after a crash
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(_SCHEMA)
+        self.db.commit()
+
+    def __repr__(self) -> str:
+        return f"<Checkpoint {self.path}>"
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self) -> "Checkpoint":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def done_keys(self, stage: str) -> Set[str]:
+        rows = self.db.execute("SELECT key FROM items WHERE stage = ? AND status = ?", (stage, DONE))
+        return {key for (key,) in rows}
+
+    def is_done(self, stage: str, key: Hashable) -> bool:
+        row = self.db.execute(
+            "SELECT 1 FROM items WHERE stage = ? AND key = ? AND status = ?", (stage, str(key), DONE)
+        ).fetchone()
+        return row is not None
+
+    def result(self, stage: str, key: Hashable) -> Any:
+        row = self.db.execute(
+            "SELECT result FROM items WHERE stage = ? AND key = ? AND status = ?", (stage, str(key), DONE)
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def results(self, stage: str) -> Iterator[Any]:
+        """stored results of all finished items of a stage"""
+        rows = self.db.execute("SELECT result FROM items WHERE stage = ? AND status = ? ORDER BY rowid", (stage, DONE))
+        for (result,) in rows:
+            if result is not None:
+                yield json.loads(result)
+
+    def failed(self, stage: str) -> Dict[str, str]:
+        """keys and errors of the items of a stage that failed"""
+        rows = self.db.execute("SELECT key, error FROM items WHERE stage = ? AND status = ?", (stage, FAILED))
+        return dict(rows.fetchall())
+
+    def mark_done(self, stage: str, key: Hashable, result: Any = None):
+        self._mark(stage, key, DONE, result=json.dumps(result, ensure_ascii=False, default=str))
+
+    def mark_failed(self, stage: str, key: Hashable, error: BaseException):
+        self._mark(stage, key, FAILED, error=f"{type(error).__name__}: {error}")
+
+    def _mark(self, stage: str, key: Hashable, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        self.db.execute(
+            """
+            INSERT INTO items (stage, key, status, result, error, attempts, updated_at) VALUES (?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT (stage, key) DO UPDATE SET
+                status = excluded.status, result = excluded.result, error = excluded.error,
+                attempts = attempts + 1, updated_at = excluded.updated_at
+            """,
+            (stage, str(key), status, result, error, time.time()),
+        )
+        self.db.commit()
+
+    def reset(self, stage: Optional[str] = None):
+        """forget the progress of a stage (or of every stage) so it's scraped again"""
+        if stage is None:
+            self.db.execute("DELETE FROM items")
+        else:
+            self.db.execute("DELETE FROM items WHERE stage = ?", (stage,))
+        self.db.commit()
+
+    async def run_stage(
+        self,
+        stage: str,
+        items: Iterable[Any],
+        key: Callable[[Any], Hashable],
+        scrape: Callable[[Any], Awaitable[Any]],
+        concurrency: int = 1,
+    ) -> List[Any]:
+        """
+        run scrape(item) for every item that isn't done yet and store its result.
+        Failures are logged and recorded so they are retried by the next run.
+        Returns the results of all finished items, including those from earlier runs, in item order.
+        """
+        items = list(items)
+        done = self.done_keys(stage)
+        todo = [item for item in items if str(key(item)) not in done]
+        log.info(f"{stage}: {len(items) - len(todo)} of {len(items)} items already done, scraping {len(todo)}")
+        limiter = asyncio.Semaphore(concurrency)
+
+        async def run(item):
+            item_key = key(item)
+            async with limiter:
+                try:
+                    result = await scrape(item)
+                except Exception as e:
+                    log.opt(exception=e).error(f"{stage}: failed to scrape {item_key}")
+                    self.mark_failed(stage, item_key, e)
+                    return
+            self.mark_done(stage, item_key, result)
+
+        await asyncio.gather(*(run(item) for item in todo))
+        failed = self.failed(stage)
+        if failed:
+            log.warning(f"{stage}: {len(failed)} items failed and will be retried on the next run")
+        results = []
+        for item in items:
+            result = self.result(stage, key(item))
+            if result is not None:
+                results.append(result)
+        return results
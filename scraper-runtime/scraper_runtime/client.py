@@ -0,0 +1,247 @@
+"""
+Process-wide Scrapfly client.
+
+All scrapers share one ScraperRuntime: a single ScrapflyClient with one pooled
+HTTP session, one executor and one global concurrency budget. Scraper modules
+get a SiteClient view of it through get_client("<site>") which exposes the same
+async_scrape()/concurrent_scrape() calls as ScrapflyClient, so a single process
+can drive many sites without them fighting over connections or account
+concurrency.
+
+The runtime is created lazily on the first scrape from the $SCRAPFLY_KEY and
+$SCRAPFLY_CONCURRENCY environment variables, or explicitly with configure().
+When a ResponseCache is configured (see cache.py) scrapes are answered from
+recorded responses first and every new response is recorded. The outcome of
+every scrape that reaches the API feeds the adaptive concurrency controllers
+(see adaptive.py), their state is available through metrics(). Credits,
+latency and bytes of every scrape are accounted per site, scraper function and
+job in the process-wide CostLedger (see costs.py), available through cost_report().
+With $SCRAPFLY_MOCK_API set the client talks to a local MockScrapflyApi serving
+recorded responses instead (see mockapi.py), $SCRAPFLY_API_HOST points it at any
+other scrape API host.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Union
+
+from loguru import logger as log
+from requests.adapters import HTTPAdapter
+from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient
+
+from .adaptive import ACCOUNT_SIGNALS, AdaptiveController
+from .cache import ResponseCache, cache_from_env
+from .config import SITES, SiteConfig, get_site
+from .costs import CostLedger, caller, get_ledger
+from .limits import ConcurrencyLimiter
+from .mockapi import MockScrapflyApi, mock_from_env
+
+DEFAULT_CONCURRENCY = 5
+
+
+class ScraperRuntime:
+    """shared scrapfly client, connection pool and global concurrency budget"""
+
+    def __init__(
+        self,
+        key: Optional[str] = None,
+        max_concurrency: Union[int, str, None] = None,
+        client: Optional[ScrapflyClient] = None,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.cache = cache if cache is not None else cache_from_env()
+        self.mock: Optional[MockScrapflyApi] = None
+        if client is None:
+            host = os.environ.get("SCRAPFLY_API_HOST")
+            self.mock = mock_from_env()
+            if self.mock is not None:
+                host = self.mock.start().url
+            if (self.cache is not None and self.cache.offline) or (self.mock is not None and not self.mock.record):
+                # offline replays never reach the API so they don't need a key
+                key = key or os.environ.get("SCRAPFLY_KEY", "offline")
+            options = {"host": host} if host else {}
+            client = ScrapflyClient(key=key or os.environ["SCRAPFLY_KEY"], **options)
+        self.client = client
+        if max_concurrency is None:
+            max_concurrency = os.environ.get("SCRAPFLY_CONCURRENCY", DEFAULT_CONCURRENCY)
+        if max_concurrency == ScrapflyClient.CONCURRENCY_AUTO:
+            # use whatever the scrapfly account allows
+            max_concurrency = self.client.account()["subscription"]["max_concurrency"]
+        max_concurrency = int(max_concurrency)
+        self.client.max_concurrency = max_concurrency
+        self.limiter = ConcurrencyLimiter(max_concurrency, name="global")
+        # slow or blocked targets are handled by their site limits, the global budget only follows the account
+        self.controller = AdaptiveController(
+            self.limiter, signals=ACCOUNT_SIGNALS, latency_tolerance=None, cost_tolerance=None
+        )
+        self._open_pool(max_concurrency)
+
+    def _open_pool(self, size: int):
+        """share one keep-alive session and worker pool sized for the global budget"""
+        if not hasattr(self.client, "open"):
+            return
+        self.client.open()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+        self.client.http_session.mount("https://", adapter)
+        self.client.http_session.mount("http://", adapter)
+        # the default executor has min(32, cpus + 4) threads which would silently cap the budget
+        self.client.async_executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="scrapfly")
+
+    @property
+    def ledger(self) -> CostLedger:
+        return get_ledger()
+
+    def close(self):
+        if hasattr(self.client, "close"):
+            self.client.close()
+        if self.mock is not None:
+            self.mock.stop()
+
+    async def async_scrape(
+        self, scrape_config: ScrapeConfig, site: SiteConfig, function: str = "unknown"
+    ) -> ScrapeApiResponse:
+        """
+        scrape a single page within the site and global concurrency limits
+        function: the scraper function the request is accounted to
+        """
+        if self.cache is not None:
+            cached = self.cache.get(scrape_config)
+            if cached is not None:
+                self.ledger.record_cached(site.name, function)
+                return cached
+        if site.downgrade is not None:
+            fetch = partial(self._fetch, site=site, function=function, requested=scrape_config)
+            response = await site.downgrade.scrape(fetch, scrape_config)
+        else:
+            response = await self._fetch(scrape_config, site, function)
+        if self.cache is not None:
+            # responses of cheaper options are recorded for the options that were asked for
+            self.cache.put(response, scrape_config)
+        return response
+
+    async def _fetch(
+        self,
+        scrape_config: ScrapeConfig,
+        site: SiteConfig,
+        function: str,
+        requested: Optional[ScrapeConfig] = None,
+    ) -> ScrapeApiResponse:
+        # take the site slot first so a blocked site waits without holding global slots
+        async with site.limiter, self.limiter:
+            reservation = self.ledger.reserve(site.name, function)
+            started = time.monotonic()
+            try:
+                response = await self.client.async_scrape(scrape_config)
+            except Exception as e:
+                self._record(site, function, scrape_config, e, started, reservation, requested)
+                raise
+        self._record(site, function, scrape_config, response, started, reservation, requested)
+        return response
+
+    def _record(
+        self,
+        site: SiteConfig,
+        function: str,
+        scrape_config: ScrapeConfig,
+        result: Any,
+        started: float,
+        reservation,
+        requested: Optional[ScrapeConfig],
+    ):
+        latency = time.monotonic() - started
+        cost = getattr(result, "cost", None) if isinstance(result, ScrapeApiResponse) else None
+        site.controller.record(result, started, latency, cost)
+        self.controller.record(result, started, latency, cost)
+        self.ledger.record(site.name, function, scrape_config, result, latency, reservation, requested)
+
+
+_RUNTIME: Optional[ScraperRuntime] = None
+
+
+def configure(
+    key: Optional[str] = None,
+    max_concurrency: Union[int, str, None] = None,
+    client: Optional[ScrapflyClient] = None,
+    cache: Optional[ResponseCache] = None,
+) -> ScraperRuntime:
+    """(re)create the process-wide runtime, e.g. from a job runner before scraping starts"""
+    global _RUNTIME
+    if _RUNTIME is not None:
+        _RUNTIME.close()
+    _RUNTIME = ScraperRuntime(key=key, max_concurrency=max_concurrency, client=client, cache=cache)
+    log.debug(f"scraper runtime configured with global concurrency of {_RUNTIME.limiter.limit}")
+    return _RUNTIME
+
+
+def get_runtime() -> ScraperRuntime:
+    """get the process-wide runtime, creating it from environment variables if needed"""
+    if _RUNTIME is None:
+        return configure()
+    return _RUNTIME
+
+
+class SiteClient:
+    """ScrapflyClient lookalike bound to one site of the shared runtime"""
+
+    def __init__(self, site: SiteConfig):
+        self.site = site
+
+    def __repr__(self) -> str:
+        return f"<SiteClient {self.site.name}>"
+
+    @property
+    def runtime(self) -> ScraperRuntime:
+        return get_runtime()
+
+    async def async_scrape(self, scrape_config: ScrapeConfig, function: Optional[str] = None) -> ScrapeApiResponse:
+        """function: the scraper function the request is accounted to, defaults to the calling function"""
+        return await self.runtime.async_scrape(scrape_config, self.site, function or caller())
+
+    async def concurrent_scrape(
+        self, scrape_configs: Iterable[ScrapeConfig], concurrency: Optional[int] = None
+    ) -> AsyncIterator[Union[ScrapeApiResponse, Exception]]:
+        """
+        scrape many pages concurrently and yield responses as they complete.
+        Like ScrapflyClient.concurrent_scrape failed scrapes are yielded as exceptions
+        rather than raised, but the given config list is left untouched.
+        """
+        configs = iter(list(scrape_configs))
+        pending = set()
+        function = caller()
+
+        def fill():
+            # keep just enough tasks around to saturate the site limit, the limiters do the rest
+            window = concurrency or self.site.limiter.limit
+            while len(pending) < window:
+                config = next(configs, None)
+                if config is None:
+                    return
+                config.raise_on_upstream_error = False
+                pending.add(asyncio.ensure_future(self.async_scrape(config, function)))
+
+        fill()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    error = task.exception()
+                    yield error if error is not None else task.result()
+                fill()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    """current concurrency limits and scrape outcomes of the global budget and every site"""
+    result = {"global": get_runtime().controller.metrics()} if _RUNTIME is not None else {}
+    result.update((name, site.controller.metrics()) for name, site in SITES.items())
+    return result
+
+
+def get_client(site: str) -> SiteClient:
+    """get the scrapfly client of a site, sharing the process-wide runtime"""
+    return SiteClient(get_site(site))
@@ -0,0 +1,64 @@
+"""
+Per-site scrape configuration.
+
+Each scraper module registers its default ScrapeConfig options once through
+site_config() and keeps the result as its BASE_CONFIG. The returned SiteConfig
+is still a plain dict so `ScrapeConfig(url, **BASE_CONFIG)` and run/test script
+overrides like `walmart.BASE_CONFIG["cache"] = True` keep working.
+
+max_concurrency is the most requests a site may have in flight, its adaptive
+controller (see adaptive.py) lowers the actual limit while the site pushes back.
+"""
+import os
+from typing import Dict, Optional
+
+from .adaptive import AdaptiveController
+from .limits import ConcurrencyLimiter
+
+# how many requests a single site may have in flight when it doesn't set its own limit
+DEFAULT_SITE_CONCURRENCY = int(os.environ.get("SCRAPFLY_SITE_CONCURRENCY", 5))
+
+
+class SiteConfig(dict):
+    """default ScrapeConfig options and concurrency limit of a single scraped site"""
+
+    def __init__(self, name: str, options: Optional[Dict] = None, max_concurrency: Optional[int] = None):
+        super().__init__(options or {})
+        self.name = name
+        self.limiter = ConcurrencyLimiter(max_concurrency or DEFAULT_SITE_CONCURRENCY, name=name)
+        self.controller = AdaptiveController(self.limiter)
+        # a costs.Downgrade learning which expensive options the site's pages can do without
+        self.downgrade = None
+
+    def __repr__(self) -> str:
+        return f"<SiteConfig {self.name} {dict.__repr__(self)}>"
+
+    @property
+    def max_concurrency(self) -> int:
+        return self.controller.ceiling
+
+    @max_concurrency.setter
+    def max_concurrency(self, value: int):
+        self.controller.ceiling = value
+
+
+SITES: Dict[str, SiteConfig] = {}
+
+
+def site_config(name: str, options: Optional[Dict] = None, max_concurrency: Optional[int] = None) -> SiteConfig:
+    """register the default scrape options of a site and return its SiteConfig"""
+    site = SITES.get(name)
+    if site is None:
+        site = SITES[name] = SiteConfig(name, options, max_concurrency)
+        return site
+    # re-importing a scraper module refreshes its options in place so existing references stay valid
+    site.clear()
+    site.update(options or {})
+    if max_concurrency:
+        site.max_concurrency = max_concurrency
+    return site
+
+
+def get_site(name: str) -> SiteConfig:
+    """get the SiteConfig of a registered site, registering an empty one if needed"""
+    return SITES.get(name) or site_config(name)
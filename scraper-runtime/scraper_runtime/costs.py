@@ -0,0 +1,446 @@
+"""
+Scrape cost accounting, credit budgets and downgrading of expensive options.
+
+Every scrape that reaches the API is recorded in the process-wide CostLedger with
+its credit cost, latency, bytes and the expensive options it was sent with
+(render_js, asp, residential proxies). Scrapes of a URL already scraped before
+(hand-rolled retry paths) count as retries, cache hits are counted as free.
+The ledger aggregates per site and per scraper function, the function being
+the first caller outside of the runtime (e.g. walmart.scrape_products), and
+per job of the job runner:
+
+    cost_report()["sites"]["walmart"]["functions"]["walmart.scrape_products"]
+    # {"requests": 120, "ok": 118, "credits": 3000, "credits_per_request": 25.0, "latency": 7.2, "retries": 2,
+    #  "bytes": 31457280, "render_js": 120, "asp": 120, "residential": 120, ...}
+
+set_budget() puts a hard credit limit on all scraping, a site or a job: once
+the credits spent plus the estimated cost of the requests in flight would pass
+it, further scrapes raise BudgetExceeded instead of reaching the API.
+
+A Downgrade set on a site learns which expensive options its pages don't need:
+every few requests it probes a cheaper variant (render_js off, datacenter
+instead of residential proxies) and after enough probes pass the site's check
+the cheaper option is used for all its requests. A cheap request that fails is
+repeated with the original options and the downgrade is dropped:
+
+    BASE_CONFIG.downgrade = Downgrade(check=lambda response: bool(response.selector.css("h1")))
+"""
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from copy import copy
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from loguru import logger as log
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+
+from .adaptive import BLOCKED, ERROR, OK, classify
+
+# the job runner marks the scrapes of each job so they're accounted to it
+_JOB: ContextVar[Optional[str]] = ContextVar("scraper_runtime_job", default=None)
+
+# modules skipped when looking for the scraper function that made a request
+_INTERNAL_MODULES = ("scraper_runtime", "asyncio", "contextlib", "concurrent.futures")
+_COMPREHENSIONS = {"<listcomp>", "<dictcomp>", "<setcomp>", "<genexpr>"}
+
+RESIDENTIAL_POOL = "public_residential_pool"
+DATACENTER_POOL = "public_datacenter_pool"
+
+
+class BudgetExceeded(Exception):
+    """raised instead of scraping once a credit budget is used up"""
+
+
+def caller(depth: int = 2) -> str:
+    """'<module>.<function>' of the first frame outside of the runtime, the scraper function making a request"""
+    frame = sys._getframe(depth)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        # comprehensions run in frames of their own, account them to the function they're in
+        if not module.startswith(_INTERNAL_MODULES) and frame.f_code.co_name not in _COMPREHENSIONS:
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+@contextmanager
+def job_scope(name: str) -> Iterator[None]:
+    """account the scrapes made in this context, and the tasks it starts, to a job"""
+    token = _JOB.set(name)
+    try:
+        yield
+    finally:
+        _JOB.reset(token)
+
+
+def _cost(result: Any) -> int:
+    if not isinstance(result, ScrapeApiResponse):
+        # failed scrapes carry the API response they were billed with, if any
+        result = getattr(result, "api_response", None)
+    return getattr(result, "cost", None) or 0
+
+
+def _size(result: Any) -> int:
+    response = getattr(result, "response", None)
+    try:
+        return len(response.content or b"") if response is not None else 0
+    except Exception:
+        return 0
+
+
+class CostStats:
+    """request, credit, latency and option counts of one site, function or job"""
+
+    def __init__(self):
+        self.requests = 0
+        self.ok = 0
+        self.failed = 0
+        self.cached = 0
+        self.retries = 0
+        self.downgraded = 0
+        self.credits = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.render_js = 0
+        self.asp = 0
+        self.residential = 0
+
+    def __repr__(self) -> str:
+        return f"<CostStats requests={self.requests} credits={self.credits}>"
+
+    def add(
+        self,
+        config: Optional[ScrapeConfig],
+        ok: bool,
+        credits: int,
+        latency: float,
+        size: int,
+        retry: bool,
+        downgraded: bool,
+    ):
+        self.requests += 1
+        self.ok += ok
+        self.failed += not ok
+        self.credits += credits
+        self.seconds += latency
+        self.bytes += size
+        self.retries += retry
+        self.downgraded += downgraded
+        if config is not None:
+            self.render_js += bool(getattr(config, "render_js", False))
+            self.asp += bool(getattr(config, "asp", False))
+            self.residential += getattr(config, "proxy_pool", None) == RESIDENTIAL_POOL
+
+    def credits_per_request(self) -> Optional[float]:
+        return self.credits / self.requests if self.requests else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "ok": self.ok,
+            "failed": self.failed,
+            "cached": self.cached,
+            "retries": self.retries,
+            "credits": self.credits,
+            "credits_per_request": self.credits_per_request(),
+            "latency": self.seconds / self.requests if self.requests else None,
+            "bytes": self.bytes,
+            "render_js": self.render_js,
+            "asp": self.asp,
+            "residential": self.residential,
+            "downgraded": self.downgraded,
+        }
+
+
+# a budget scope: ("total", None), ("site", "<site>") or ("job", "<job name>")
+Scope = Tuple[str, Optional[str]]
+
+
+class CostLedger:
+    """cost of every scrape per site, scraper function and job, with optional credit budgets"""
+
+    def __init__(self):
+        self.total = CostStats()
+        self.sites: Dict[str, CostStats] = defaultdict(CostStats)
+        self.functions: Dict[Tuple[str, str], CostStats] = defaultdict(CostStats)
+        self.jobs: Dict[str, CostStats] = defaultdict(CostStats)
+        self.budgets: Dict[Scope, int] = {}
+        self.reserved: Dict[Scope, float] = defaultdict(float)
+        self._seen: Dict[str, Set[int]] = defaultdict(set)
+        self._exceeded: Set[Scope] = set()
+
+    def __repr__(self) -> str:
+        return f"<CostLedger requests={self.total.requests} credits={self.total.credits}>"
+
+    def set_budget(self, credits: Optional[int], site: Optional[str] = None, job: Optional[str] = None):
+        """limit the credits of all scrapes, or of a site's or a job's scrapes, None removes the limit"""
+        scope: Scope = ("job", job) if job else ("site", site) if site else ("total", None)
+        if credits is None:
+            self.budgets.pop(scope, None)
+        else:
+            self.budgets[scope] = int(credits)
+        self._exceeded.discard(scope)
+
+    def _spent(self, scope: Scope) -> int:
+        kind, name = scope
+        if kind == "total":
+            return self.total.credits
+        stats = (self.sites if kind == "site" else self.jobs).get(name)
+        return stats.credits if stats is not None else 0
+
+    def estimate(self, site: str, function: str) -> float:
+        """expected credits of the next request, from the average cost of the function or site so far"""
+        for stats in (self.functions.get((site, function)), self.sites.get(site)):
+            if stats is not None and stats.requests:
+                return max(stats.credits_per_request(), 1)
+        return 1
+
+    def reserve(self, site: str, function: str) -> Tuple[List[Scope], float]:
+        """claim the estimated cost of a request against the budgets, raises BudgetExceeded when it doesn't fit"""
+        scopes = [("total", None), ("site", site), ("job", _JOB.get())]
+        scopes = [scope for scope in scopes if scope in self.budgets]
+        if not scopes:
+            return [], 0
+        estimate = self.estimate(site, function)
+        for scope in scopes:
+            spent = self._spent(scope)
+            if spent + self.reserved[scope] + estimate > self.budgets[scope]:
+                if scope not in self._exceeded:
+                    self._exceeded.add(scope)
+                    log.warning(f"{scope[0]} {scope[1] or ''} budget of {self.budgets[scope]} credits used up")
+                raise BudgetExceeded(
+                    f"{scope[0]} {scope[1] or ''} budget of {self.budgets[scope]} credits used up ({spent} spent)"
+                )
+        for scope in scopes:
+            self.reserved[scope] += estimate
+        return scopes, estimate
+
+    def record(
+        self,
+        site: str,
+        function: str,
+        config: Optional[ScrapeConfig],
+        result: Any,
+        latency: float,
+        reservation: Tuple[List[Scope], float] = ([], 0),
+        requested: Optional[ScrapeConfig] = None,
+    ):
+        """
+        account a scrape that reached the API: its ScrapeApiResponse or raised exception
+        requested: the config the scraper asked for when a cheaper one was sent instead
+        """
+        scopes, estimate = reservation
+        for scope in scopes:
+            self.reserved[scope] -= estimate
+        ok = classify(result) == OK
+        credits = _cost(result)
+        size = _size(result)
+        retry = False
+        if config is not None:
+            key = hash((config.method, config.url, config.body))
+            retry = key in self._seen[site]
+            self._seen[site].add(key)
+        downgraded = requested is not None and requested is not config
+        job = _JOB.get()
+        targets = [self.total, self.sites[site], self.functions[(site, function)]]
+        if job is not None:
+            targets.append(self.jobs[job])
+        for stats in targets:
+            stats.add(config, ok, credits, latency, size, retry, downgraded)
+
+    def record_cached(self, site: str, function: str):
+        """account a scrape answered from the response cache"""
+        job = _JOB.get()
+        targets = [self.total, self.sites[site], self.functions[(site, function)]]
+        if job is not None:
+            targets.append(self.jobs[job])
+        for stats in targets:
+            stats.cached += 1
+
+    def report(self) -> Dict[str, Any]:
+        """aggregated costs: totals, per site with its scraper functions, and per job"""
+        sites = {
+            site: {"total": stats.as_dict(), "functions": {}} for site, stats in sorted(self.sites.items())
+        }
+        for (site, function), stats in sorted(self.functions.items()):
+            sites[site]["functions"][function] = stats.as_dict()
+        return {
+            "total": self.total.as_dict(),
+            "sites": sites,
+            "jobs": {job: stats.as_dict() for job, stats in sorted(self.jobs.items())},
+            "budgets": {f"{kind}:{name}" if name else kind: credits for (kind, name), credits in self.budgets.items()},
+        }
+
+
+def _render_js_applies(config: ScrapeConfig) -> bool:
+    # js, scenarios, scrolling and screenshots need the browser, only plain page loads can skip it
+    return bool(config.render_js) and not (config.js or config.js_scenario or config.auto_scroll or config.screenshots)
+
+
+def _without_render_js(config: ScrapeConfig) -> ScrapeConfig:
+    config = copy(config)
+    config.render_js = False
+    config.wait_for_selector = None
+    config.rendering_wait = None
+    return config
+
+
+def _datacenter_applies(config: ScrapeConfig) -> bool:
+    return config.proxy_pool == RESIDENTIAL_POOL
+
+
+def _datacenter(config: ScrapeConfig) -> ScrapeConfig:
+    config = copy(config)
+    config.proxy_pool = DATACENTER_POOL
+    return config
+
+
+# cheaper variants of expensive options, learned in this order: (name, applies to a config, cheaper config)
+DOWNGRADES = (
+    ("render_js", _render_js_applies, _without_render_js),
+    ("proxy_pool", _datacenter_applies, _datacenter),
+)
+
+PROBING = "probing"
+ADOPTED = "adopted"
+REJECTED = "rejected"
+
+
+class Downgrade:
+    """learns which expensive options of a site can be dropped by probing cheaper requests"""
+
+    def __init__(
+        self,
+        check: Optional[Callable[[ScrapeApiResponse], bool]] = None,
+        probes: int = 5,
+        every: int = 5,
+        failures: int = 3,
+        steps=DOWNGRADES,
+    ):
+        """
+        check: whether a response has the data the scraper needs, by default a cheaper response
+            has to be at least half the size of the responses scraped with all options
+        probes: passing probes before a cheaper option is used for every request
+        every: one in this many requests probes the next cheaper option
+        failures: probes in a row failing with errors (timeouts, 5xx, throttling) before an option is kept,
+            a cheaper page that fails the check or is blocked keeps it right away
+        """
+        self.check = check
+        self.probes = probes
+        self.every = every
+        self.failures = failures
+        self.steps = steps
+        self.state = {name: PROBING for name, _, _ in steps}
+        self.passed = {name: 0 for name, _, _ in steps}
+        self.failed = {name: 0 for name, _, _ in steps}
+        self.requests = 0
+        self.fallbacks = 0
+        self._full_size: Optional[float] = None
+
+    def __repr__(self) -> str:
+        return f"<Downgrade {self.state}>"
+
+    def plan(self, config: ScrapeConfig) -> Tuple[ScrapeConfig, List[str], Optional[str]]:
+        """the config to send for a requested config, the adopted downgrades it uses and the one it probes"""
+        self.requests += 1
+        adopted = []
+        for name, applies, cheaper in self.steps:
+            if not applies(config):
+                continue
+            state = self.state[name]
+            if state == ADOPTED:
+                config = cheaper(config)
+                adopted.append(name)
+            elif state == PROBING:
+                # without a check probes need the size of a full response to compare with
+                ready = self.check is not None or self._full_size is not None
+                if ready and self.requests % self.every == 0:
+                    return cheaper(config), adopted, name
+                break
+        return config, adopted, None
+
+    def passes(self, response: Any) -> bool:
+        if isinstance(response, Exception) or classify(response) != OK:
+            return False
+        return self._checks(response)
+
+    def _checks(self, response: ScrapeApiResponse) -> bool:
+        if self.check is not None:
+            try:
+                return bool(self.check(response))
+            except Exception as e:
+                log.debug(f"downgrade check failed on {response.context['url']}: {e}")
+                return False
+        return self._full_size is not None and len(response.content) >= self._full_size * 0.5
+
+    def _observe(self, response: Any):
+        if isinstance(response, ScrapeApiResponse) and classify(response) == OK:
+            size = len(response.content)
+            self._full_size = size if self._full_size is None else 0.8 * self._full_size + 0.2 * size
+
+    async def scrape(self, fetch: Callable[[ScrapeConfig], Awaitable[Any]], config: ScrapeConfig) -> Any:
+        """scrape with the cheapest options learned so far, falling back to the requested options"""
+        cheaper, adopted, probe = self.plan(config)
+        if cheaper is config:
+            response = await fetch(config)
+            self._observe(response)
+            return response
+        try:
+            response = await fetch(cheaper)
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            response = e
+        if self.passes(response):
+            if probe is not None:
+                self.passed[probe] += 1
+                self.failed[probe] = 0
+                if self.passed[probe] >= self.probes and self.state[probe] == PROBING:
+                    self.state[probe] = ADOPTED
+                    log.info(f"{config.url}: pages pass without {probe}, dropping it for the site")
+            return response
+        self.fallbacks += 1
+        # a blocked page or one without the data shows the option is needed, errors like timeouts may be transient
+        outcome = ERROR if isinstance(response, Exception) else classify(response)
+        conclusive = outcome == BLOCKED or outcome == OK and not self._checks(response)
+        if probe is not None and self.state[probe] == PROBING:
+            self.failed[probe] += 1
+            if conclusive or self.failed[probe] >= self.failures:
+                self.state[probe] = REJECTED
+                log.info(f"{config.url}: pages need {probe}, keeping it")
+        for name in adopted if probe is None and conclusive else ():
+            # the site started needing the option again, learn it anew
+            if self.state[name] == ADOPTED:
+                self.state[name] = PROBING
+                self.passed[name] = 0
+                log.warning(f"{config.url}: failed without {name}, using it again")
+        response = await fetch(config)
+        self._observe(response)
+        return response
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "state": dict(self.state),
+            "passed": dict(self.passed),
+            "failed": dict(self.failed),
+            "fallbacks": self.fallbacks,
+        }
+
+
+_LEDGER = CostLedger()
+
+
+def get_ledger() -> CostLedger:
+    """the process-wide cost ledger scrapes are accounted in"""
+    return _LEDGER
+
+
+def cost_report() -> Dict[str, Any]:
+    """credits, latency, retries and bytes of the scrapes so far, in total, per site and scraper function and per job"""
+    return _LEDGER.report()
+
+
+def set_budget(credits: Optional[int], site: Optional[str] = None, job: Optional[str] = None):
+    """limit the credits spent by all scrapes, or by the scrapes of a site or a job, None removes the limit"""
+    _LEDGER.set_budget(credits, site=site, job=job)
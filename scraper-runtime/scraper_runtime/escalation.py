@@ -0,0 +1,277 @@
+"""
+Tiered escalation of scrape options per URL.
+
+Blocked pages are usually retried with every expensive option at once (render_js
+and residential proxies) and pages that never needed them pay for them too. An
+EscalationLadder scrapes every URL with the cheapest tier first and only
+escalates the URLs a tier fails for, one tier at a time:
+
+    datacenter -> residential -> render_js -> render_js + js_scenario
+
+A tier fails when the request raises, gets blocked or the site's check rejects
+the page. The ladder learns the tier every URL pattern (the domain with the
+first and last path segments, see url_pattern()) needs: once requests of a
+pattern keep escalating past their start tier, later requests of the pattern
+start at the tier that worked, and every so often one of them tries a tier lower again
+in case the target relaxed. The learned start tiers can be kept in a JSON file
+so the next run starts there too:
+
+    LADDER = EscalationLadder(SCRAPFLY, check=has_listings, path=output / "escalation.json")
+    async for response in LADDER.concurrent_scrape([ScrapeConfig(url, **BASE_CONFIG) for url in urls]):
+        if isinstance(response, Exception):  # every tier failed
+            continue
+        ...
+"""
+import asyncio
+import json
+import re
+from copy import copy
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+from loguru import logger as log
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+
+from .adaptive import OK, classify
+from .costs import DATACENTER_POOL, RESIDENTIAL_POOL, BudgetExceeded, caller
+
+
+class Tier(NamedTuple):
+    """a named set of ScrapeConfig options, applied over the requested config"""
+
+    name: str
+    options: Dict[str, Any]
+
+
+def ladder(js_scenario: Optional[List[Dict]] = None, wait_for_selector: Optional[str] = None) -> List[Tier]:
+    """
+    the default tiers: datacenter -> residential -> render_js -> render_js + js_scenario
+    js_scenario: browser actions of the last tier, which is left out without them
+    wait_for_selector: selector the browser tiers wait for
+    """
+    browser = {"render_js": True, "proxy_pool": RESIDENTIAL_POOL}
+    if wait_for_selector:
+        browser["wait_for_selector"] = wait_for_selector
+    tiers = [
+        Tier("datacenter", {"render_js": False, "proxy_pool": DATACENTER_POOL}),
+        Tier("residential", {"render_js": False, "proxy_pool": RESIDENTIAL_POOL}),
+        Tier("render_js", browser),
+    ]
+    if js_scenario:
+        tiers.append(Tier("js_scenario", {**browser, "js_scenario": js_scenario}))
+    return tiers
+
+
+# numbers, and longer tokens containing digits (slugs with ids, ASINs, hashes)
+_ID_SEGMENT = re.compile(r"^\d+$|^(?=.*\d)[\w.-]{8,}$|^[A-Za-z0-9_-]{24,}$")
+
+
+def url_pattern(url: str) -> str:
+    """
+    '<domain>/<first segment>/*/<last segment>' of a url, numbers and id-like path segments become *:
+    https://www.g2.com/products/digitalocean/reviews?page=2 -> www.g2.com/products/*/reviews
+    """
+    parsed = urlparse(url)
+    parts = ["*" if _ID_SEGMENT.search(part) else part for part in parsed.path.split("/") if part]
+    if len(parts) > 2:
+        parts = [parts[0], "*", parts[-1]]
+    # the page type is in the first and last segments, everything between is usually a slug
+    collapsed = [part for i, part in enumerate(parts) if not (part == "*" and i and parts[i - 1] == "*")]
+    return "/".join([parsed.netloc.lower(), *collapsed])
+
+
+class EscalationFailed(Exception):
+    """every tier of the ladder failed for a url, `response` is the result of the last tier"""
+
+    def __init__(self, url: str, response: Any):
+        super().__init__(f"every tier failed for {url}: {response}")
+        self.url = url
+        self.response = response
+
+
+class EscalationLadder:
+    """scrapes urls with the cheapest tier that works for them and learns it per url pattern"""
+
+    def __init__(
+        self,
+        client,
+        tiers: Optional[List[Tier]] = None,
+        check: Optional[Callable[[ScrapeApiResponse], bool]] = None,
+        pattern: Callable[[str], str] = url_pattern,
+        patience: int = 3,
+        probe_every: int = 50,
+        retries: int = 0,
+        path: Union[str, Path, None] = None,
+    ):
+        """
+        client: the site's SiteClient
+        check: whether a response has the data the scraper needs, on top of not being blocked
+        pattern: the key tiers are learned by, see url_pattern()
+        patience: escalations in a row from a pattern's start tier before it starts at the lowest tier that worked
+        probe_every: one in this many requests of a pattern starts one tier below its start tier
+        retries: extra attempts with the last tier before a page fails
+        path: JSON file the learned start tiers are kept in between runs
+        """
+        self.client = client
+        self.tiers = tiers or ladder()
+        self.check = check
+        self.pattern = pattern
+        self.patience = patience
+        self.probe_every = probe_every
+        self.retries = retries
+        self.path = Path(path) if path else None
+        self.start: Dict[str, int] = {}
+        # escalations in a row from the start tier of a pattern and the lowest tier that worked for them
+        self.escalations: Dict[str, Tuple[int, int]] = {}
+        self.requests: Dict[str, int] = {}
+        # successful scrapes per tier name
+        self.succeeded: Dict[str, int] = {tier.name: 0 for tier in self.tiers}
+        self.failed = 0
+        self._load()
+
+    def __repr__(self) -> str:
+        return f"<EscalationLadder {[tier.name for tier in self.tiers]} patterns={len(self.start)}>"
+
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        names = [tier.name for tier in self.tiers]
+        learned = json.loads(self.path.read_text(encoding="utf-8"))
+        # tiers are stored by name so a changed ladder doesn't shift them
+        self.start = {pattern: names.index(name) for pattern, name in learned.items() if name in names}
+
+    def _save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_suffix(".tmp")
+        learned = {pattern: self.tiers[index].name for pattern, index in sorted(self.start.items())}
+        temporary.write_text(json.dumps(learned, indent=2), encoding="utf-8")
+        temporary.replace(self.path)
+
+    def _set_start(self, pattern: str, index: int):
+        if self.start.get(pattern, 0) == index:
+            return
+        log.info(f"{pattern}: starting at tier {self.tiers[index].name}")
+        self.start[pattern] = index
+        self.escalations.pop(pattern, None)
+        self._save()
+
+    def config(self, scrape_config: ScrapeConfig, tier: Tier) -> ScrapeConfig:
+        """the requested config with the options of a tier"""
+        config = copy(scrape_config)
+        for option, value in tier.options.items():
+            setattr(config, option, value)
+        # blocked pages are returned rather than raised so the next tier can be tried
+        config.raise_on_upstream_error = False
+        return config
+
+    def passes(self, response: Any, check: Optional[Callable[[ScrapeApiResponse], bool]] = None) -> bool:
+        if isinstance(response, Exception) or classify(response) != OK:
+            return False
+        check = check or self.check
+        if check is None:
+            return True
+        try:
+            return bool(check(response))
+        except Exception as e:
+            log.debug(f"escalation check failed on {response.context['url']}: {e}")
+            return False
+
+    async def scrape(
+        self,
+        scrape_config: ScrapeConfig,
+        check: Optional[Callable[[ScrapeApiResponse], bool]] = None,
+        function: Optional[str] = None,
+    ) -> ScrapeApiResponse:
+        """
+        scrape a page with the first tier passing the check, starting at the tier learned for its url pattern.
+        Raises EscalationFailed when every tier failed
+        check: overrides the ladder's check for this page
+        """
+        function = function or caller()
+        pattern = self.pattern(scrape_config.url)
+        count = self.requests[pattern] = self.requests.get(pattern, 0) + 1
+        start = self.start.get(pattern, 0)
+        first = start - 1 if start and count % self.probe_every == 0 else start
+        response = None
+        last = len(self.tiers) - 1
+        for index in [*range(first, last + 1), *[last] * self.retries]:
+            tier = self.tiers[index]
+            try:
+                response = await self.client.async_scrape(self.config(scrape_config, tier), function)
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                response = e
+            if self.passes(response, check):
+                self.succeeded[tier.name] += 1
+                self._learn(pattern, start, index)
+                return response
+            log.debug(f"{scrape_config.url}: tier {tier.name} failed")
+        self.failed += 1
+        self._learn(pattern, start, last)
+        raise EscalationFailed(scrape_config.url, response)
+
+    def _learn(self, pattern: str, start: int, worked: int):
+        """update the start tier of a pattern from the tier that worked for a request started at `start`"""
+        current = self.start.get(pattern, 0)
+        if worked < current:
+            # a tier below the start tier passed, the target relaxed
+            self._set_start(pattern, worked)
+        elif start != current:
+            # the request started before the start tier moved
+            return
+        elif worked > start:
+            count, lowest = self.escalations.get(pattern, (0, worked))
+            count, lowest = count + 1, min(lowest, worked)
+            if count >= self.patience:
+                self._set_start(pattern, lowest)
+            else:
+                self.escalations[pattern] = (count, lowest)
+        else:
+            self.escalations.pop(pattern, None)
+
+    async def concurrent_scrape(
+        self,
+        scrape_configs: Iterable[ScrapeConfig],
+        check: Optional[Callable[[ScrapeApiResponse], bool]] = None,
+        concurrency: Optional[int] = None,
+    ) -> AsyncIterator[Union[ScrapeApiResponse, Exception]]:
+        """
+        escalate many pages concurrently and yield their responses as they complete,
+        pages every tier failed for are yielded as EscalationFailed exceptions
+        """
+        configs = iter(list(scrape_configs))
+        pending = set()
+        function = caller()
+
+        def fill():
+            window = concurrency or self.client.site.limiter.limit
+            while len(pending) < window:
+                config = next(configs, None)
+                if config is None:
+                    return
+                pending.add(asyncio.ensure_future(self.scrape(config, check, function)))
+
+        fill()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    error = task.exception()
+                    yield error if error is not None else task.result()
+                fill()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def metrics(self) -> Dict[str, Any]:
+        """learned start tiers per url pattern and successful scrapes per tier"""
+        return {
+            "start": {pattern: self.tiers[index].name for pattern, index in self.start.items()},
+            "succeeded": dict(self.succeeded),
+            "failed": self.failed,
+        }
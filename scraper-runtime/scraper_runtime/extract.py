@@ -0,0 +1,245 @@
+"""
+Hidden web data extraction.
+
+Many sites embed their page data as JSON objects inside javascript:
+
+    window.PAGE_MODEL = {"propertyData": {...}, ...};
+    $vi.push({"MSKU": {...}})
+
+find_json_objects() scans such a page or script once and decodes the objects
+in place with raw_decode(text, index) instead of re-slicing the remaining text
+at every "{" (which made the old per-scraper helpers quadratic in page size).
+Only positions that can start a JSON object are tried, and with keys= only the
+objects owning one of the given keys are decoded at all:
+
+    data = find_json_object(script, "MSKU")["MSKU"]
+
+The optional orjson backend (pip install orjson) decodes large objects faster.
+
+HiddenData locates the well known hidden state blobs of a whole page
+(__NEXT_DATA__ scripts, window.__*__ = {...} assignments, apolloState caches,
+mosaic.providerData[...]) in one pass over the html without building a DOM and
+only decodes the ones asked for:
+
+    data = HiddenData(response.content).get("__NEXT_DATA__")
+"""
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Pattern, Tuple, Union
+
+# "{" followed by a quoted key or "}", rules out most javascript blocks without decoding them
+_OBJECT_START = re.compile(r'\{\s*["}]')
+
+# orjson windows start small so failed candidates stay cheap and grow 4x until the object fits
+_WINDOW = 4096
+
+Decode = Callable[[int], Tuple[Dict, int]]
+
+
+def _import_orjson():
+    try:
+        import orjson
+    except ImportError as e:
+        raise ImportError("the orjson backend requires the orjson package: pip install orjson") from e
+    return orjson
+
+
+def _json_decoder(text: str, decoder=json.JSONDecoder()) -> Decode:
+    def decode(start: int) -> Tuple[Dict, int]:
+        return decoder.raw_decode(text, start)
+
+    return decode
+
+
+def _orjson_decoder(text: str) -> Decode:
+    orjson = _import_orjson()
+    size = len(text)
+
+    def decode(start: int) -> Tuple[Dict, int]:
+        # orjson has no raw_decode and reads all of its input, so parse growing windows of the page
+        # instead of the whole remaining page
+        window, last_error = _WINDOW, None
+        while True:
+            end = min(size, start + window)
+            try:
+                return orjson.loads(text[start:end]), end
+            except orjson.JSONDecodeError as e:
+                error = e.pos
+            if 0 < error < end - start:
+                # the object may have ended before the window did and be followed by other content
+                try:
+                    return orjson.loads(text[start : start + error]), start + error
+                except orjson.JSONDecodeError:
+                    pass
+            # an error that stays put when the window grows is a real syntax error
+            if end == size or error == last_error:
+                raise ValueError(f"no JSON object at {start}")
+            last_error = error
+            window *= 4
+
+    return decode
+
+
+def _key_pattern(keys: Iterable[str]) -> Pattern:
+    return re.compile('"(?:%s)"\\s*:' % "|".join(re.escape(key) for key in keys))
+
+
+def _scan(text: str, decode: Decode) -> Iterator[Dict]:
+    """decode every JSON object of the text, skipping over the ones already decoded"""
+    position = 0
+    while match := _OBJECT_START.search(text, position):
+        start = match.start()
+        try:
+            data, end = decode(start)
+        except ValueError:
+            position = start + 1
+            continue
+        yield data
+        position = end
+
+
+def _scan_keys(text: str, decode: Decode, keys: Tuple[str, ...]) -> Iterator[Dict]:
+    """decode only the innermost JSON objects around occurrences of the keys"""
+    covered = 0
+    for match in _key_pattern(keys).finditer(text):
+        position = match.start()
+        if position < covered:
+            # part of an object that was already yielded
+            continue
+        start = position
+        while (start := text.rfind("{", 0, start)) != -1:
+            if not _OBJECT_START.match(text, start):
+                continue
+            try:
+                data, end = decode(start)
+            except ValueError:
+                continue
+            if end <= position:
+                # a sibling value before the key, keep looking in front of it
+                continue
+            if any(key in data for key in keys):
+                yield data
+                covered = end
+            break
+
+
+def find_json_objects(
+    text: str, keys: Union[str, Iterable[str], None] = None, backend: str = "json"
+) -> Iterator[Dict]:
+    """
+    find and decode the JSON objects embedded in a page or script in a single pass
+    keys: only decode objects with one of these keys at their top level, all others are skipped undecoded
+    backend: "json" for the standard library or "orjson"
+    """
+    if backend not in ("json", "orjson"):
+        raise ValueError(f"unknown JSON backend {backend!r}, use 'json' or 'orjson'")
+    if not text:
+        return
+    decode = _orjson_decoder(text) if backend == "orjson" else _json_decoder(text)
+    if keys is None:
+        yield from _scan(text, decode)
+        return
+    keys = (keys,) if isinstance(keys, str) else tuple(keys)
+    yield from _scan_keys(text, decode, keys)
+
+
+def find_json_object(text: str, key: str, backend: str = "json") -> Optional[Dict]:
+    """first JSON object embedded in the text that has the given top level key"""
+    return next(find_json_objects(text, keys=key, backend=backend), None)
+
+
+# case sensitive so the regex engine can skip ahead to "<script" literals, html5 pages use lowercase tags
+_SCRIPT = re.compile(r"<script\b([^>]*)>")
+_SCRIPT_END = re.compile(r"</script\s*>")
+_SCRIPT_ID = re.compile(r"""\bid\s*=\s*["']?([^"'\s>]+)""", re.IGNORECASE)
+# window.__INITIAL_STATE__ = {, window.mosaic.providerData["mosaic-provider-jobcards"]={
+_WINDOW_ASSIGNMENT = re.compile(r"""window\.((?:[\w$]+\.)*[\w$]+(?:\[["'][^"'\]]+["']\])?)\s*=\s*(?=[{\[])""")
+# "apolloState": { inside a larger script object
+_APOLLO_STATE = re.compile(r'"(apolloState)"\s*:\s*(?=\{)')
+# literal markers are found with str.find which is much faster than running the patterns over whole scripts
+_MARKERS = (("window.", _WINDOW_ASSIGNMENT), ('"apolloState"', _APOLLO_STATE))
+# javascript's undefined as a value, it's not valid JSON
+_UNDEFINED = re.compile(r"(?<=[:,\[])(\s*)undefined(?=\s*[,}\]])")
+_DECODER = json.JSONDecoder()
+
+
+def _skip_space(text: str, start: int, end: int) -> int:
+    while start < end and text[start].isspace():
+        start += 1
+    return start
+
+
+class HiddenData:
+    """hidden state blobs of a page located in a single pass and decoded on demand"""
+
+    def __init__(self, html: str):
+        self.html = html
+        # name -> (offset of the blob in the html, offset of the end of its script)
+        self.locations: Dict[str, Tuple[int, int]] = {}
+        self._decoded: Dict[str, Any] = {}
+        self._locate()
+
+    def __repr__(self) -> str:
+        return f"<HiddenData {list(self.locations)}>"
+
+    def _locate(self):
+        html = self.html
+        position = 0
+        while script := _SCRIPT.search(html, position):
+            start = script.end()
+            end_tag = _SCRIPT_END.search(html, start)
+            end = end_tag.start() if end_tag else len(html)
+            position = end_tag.end() if end_tag else end
+            script_id = _SCRIPT_ID.search(script.group(1))
+            if script_id:
+                # e.g. <script id="__NEXT_DATA__" type="application/json">{...}</script>
+                body = _skip_space(html, start, end)
+                if body < end and html[body] in "{[":
+                    self.locations.setdefault(script_id.group(1), (body, end))
+                    continue
+            for marker, pattern in _MARKERS:
+                index = html.find(marker, start, end)
+                while index != -1:
+                    assignment = pattern.match(html, index, end)
+                    if assignment:
+                        self.locations.setdefault(assignment.group(1), (assignment.end(), end))
+                    index = html.find(marker, index + 1, end)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.locations
+
+    def names(self) -> List[str]:
+        return list(self.locations)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """decode a single hidden data blob"""
+        if name not in self.locations:
+            return default
+        if name not in self._decoded:
+            self._decoded[name] = self._decode(*self.locations[name])
+        return self._decoded[name]
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self.locations:
+            raise KeyError(name)
+        return self.get(name)
+
+    def first(self, *names: str) -> Any:
+        """the first of the named blobs found on the page"""
+        for name in names:
+            if name in self.locations:
+                return self.get(name)
+        return None
+
+    def _decode(self, start: int, end: int) -> Any:
+        try:
+            return _DECODER.raw_decode(self.html, start)[0]
+        except ValueError:
+            # javascript object literals sometimes contain undefined values
+            text = _UNDEFINED.sub(r"\1null", self.html[start:end])
+            return _DECODER.raw_decode(text)[0]
+
+
+def hidden_data(html: str, *names: str) -> Any:
+    """decode the first of the named hidden data blobs found in the page html"""
+    return HiddenData(html).first(*names)
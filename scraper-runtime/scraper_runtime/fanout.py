@@ -0,0 +1,137 @@
+"""
+Review fan-out across many products.
+
+Catalog-wide review crawls used to loop over products and scrape one product's
+review pages at a time, so only one product's pagination was ever in flight
+and most of the concurrency budget sat idle on products with a few review
+pages. fan_out() flattens the review pages of every product into one
+prioritized queue scraped under the site's concurrency limits:
+
+- first pages go first, as they tell how many pages each product has
+- the remaining pages of products with the most pages go next, so the longest
+  product doesn't start last and the crawl finishes in about the time of the
+  longest product rather than the sum of all of them
+- pages of a product are requested in page order and their items are returned
+  in page order, grouped by product
+
+    reviews_per_product = await fan_out(
+        SCRAPFLY, urls,
+        first_page=lambda url: ScrapeConfig(url, **BASE_CONFIG),
+        other_pages=lambda url, first: [ScrapeConfig(f"{url}?page={page}", **BASE_CONFIG) for page in range(2, pages(first) + 1)],
+        parse=parse_reviews,
+    )
+
+Per-domain limits cap the pages in flight on a domain on top of the site
+limits, for sites serving reviews from a separate API host.
+"""
+import asyncio
+import heapq
+import itertools
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from loguru import logger as log
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+
+from .costs import BudgetExceeded, caller
+
+# priority of first pages, other pages come after all first pages
+FIRST_PAGE = 0
+OTHER_PAGE = 1
+
+
+async def fan_out(
+    client,
+    products: Iterable[Any],
+    first_page: Callable[[Any], ScrapeConfig],
+    other_pages: Callable[[Any, ScrapeApiResponse], Iterable[ScrapeConfig]],
+    parse: Callable[[ScrapeApiResponse], Iterable[Any]],
+    concurrency: Optional[int] = None,
+    domain_limits: Optional[Dict[str, int]] = None,
+    domain_limit: Optional[int] = None,
+) -> List[List[Any]]:
+    """
+    scrape the pages of many products as one queue and return the items of every product, in product and page order
+    client: the site's SiteClient
+    first_page: config of the first page of a product
+    other_pages: configs of the remaining pages of a product given its first page
+    parse: the items of a page
+    concurrency: pages in flight at once, defaults to the site's current limit
+    domain_limits: most pages in flight per domain (netloc)
+    domain_limit: most pages in flight on domains without their own limit, None for no limit
+    """
+    products = list(products)
+    domain_limits = domain_limits or {}
+    function = caller()
+    queue: List[Tuple[tuple, int, int, int, ScrapeConfig]] = []
+    order = itertools.count()
+    pending: Dict[asyncio.Future, Tuple[int, int, str]] = {}
+    busy: Counter = Counter()
+    # parsed items of every page of every product, None for failed pages
+    pages: List[Dict[int, Optional[List[Any]]]] = [{} for _ in products]
+
+    def push(priority: tuple, index: int, page: int, config: ScrapeConfig):
+        heapq.heappush(queue, (priority, next(order), index, page, config))
+
+    def fill():
+        window = concurrency or client.site.limiter.limit
+        waiting = []
+        while queue and len(pending) < window:
+            item = heapq.heappop(queue)
+            config = item[4]
+            domain = urlparse(config.url).netloc
+            limit = domain_limits.get(domain, domain_limit)
+            if limit is not None and busy[domain] >= limit:
+                # the domain is at its limit, lower priority pages of other domains can go first
+                waiting.append(item)
+                continue
+            busy[domain] += 1
+            task = asyncio.ensure_future(client.async_scrape(config, function))
+            pending[task] = (item[2], item[3], domain)
+        for item in waiting:
+            heapq.heappush(queue, item)
+
+    def done(task: asyncio.Future, index: int, page: int):
+        product = products[index]
+        error = task.exception()
+        if isinstance(error, BudgetExceeded):
+            raise error
+        if error is not None:
+            log.warning(f"page {page} of {product!r:.100} failed: {error}")
+            pages[index][page] = None
+            return
+        response = task.result()
+        try:
+            pages[index][page] = list(parse(response))
+        except Exception as e:
+            log.opt(exception=e).error(f"failed to parse page {page} of {product!r:.100}")
+            pages[index][page] = None
+        if page == 0:
+            try:
+                following = list(other_pages(product, response))
+            except Exception as e:
+                log.opt(exception=e).error(f"failed to find the other pages of {product!r:.100}")
+                following = []
+            for number, config in enumerate(following, 1):
+                # products with the most pages left go first
+                push((OTHER_PAGE, -len(following), index, number), index, number, config)
+
+    for index, product in enumerate(products):
+        push((FIRST_PAGE, index), index, 0, first_page(product))
+    fill()
+    try:
+        while pending:
+            finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                index, page, domain = pending.pop(task)
+                busy[domain] -= 1
+                done(task, index, page)
+            fill()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    failed = sum(items is None for product_pages in pages for items in product_pages.values())
+    log.info(f"fanned out {sum(map(len, pages))} pages of {len(products)} products, {failed} failed")
+    return [[item for page in sorted(product_pages) for item in product_pages[page] or []] for product_pages in pages]
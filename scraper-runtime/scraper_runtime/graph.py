@@ -0,0 +1,164 @@
+"""
+Apollo GraphQL cache graphs.
+
+Sites built on the Apollo client (Glassdoor, Wellfound) ship their page data as a
+normalized cache: a flat mapping of node ids to nodes which refer to each other
+with {"__ref": "Employer:123"} (Apollo 3) or {"type": "id", "id": "Startup:1"}
+(Apollo 2) objects instead of nesting them.
+
+ApolloGraph is a lazy view of such a cache. Reading through it follows the
+references as they are accessed without copying any node, and resolve() turns a
+part of the graph into plain python data with every node expanded only once,
+however many times it's referenced:
+
+    graph = ApolloGraph(data)
+    listings = next(v for k, v in graph.root.items() if k.startswith("jobListings"))
+    jobs = [job["jobview"]["header"].resolve() for job in listings["jobListings"]]
+
+References closing a cycle (a job pointing back to its employer which lists the
+job) are left in place as references.
+"""
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Set, Union
+
+
+def reference(value: Any) -> Optional[str]:
+    """id of the node referenced by a value, None if it isn't a reference"""
+    if not isinstance(value, dict):
+        return None
+    if "__ref" in value:
+        return value["__ref"]
+    if value.get("type") == "id" and "id" in value:
+        return value["id"]
+    return None
+
+
+class ApolloGraph(Mapping):
+    """lazy, reference following view of a normalized Apollo cache"""
+
+    def __init__(self, cache: Dict[str, Dict], unwrap: Optional[str] = None, mark: Optional[str] = None):
+        """
+        cache: the normalized cache, node id -> node
+        unwrap: key of wrapper nodes (e.g. relay edges) that references are followed through to the node they wrap
+        mark: key to store the id of resolved nodes in, for debugging
+        """
+        self.cache = cache
+        self.unwrap = unwrap
+        self.mark = mark
+        self._resolved: Dict[str, Any] = {}
+        self._resolving: Set[str] = set()
+
+    def __repr__(self) -> str:
+        return f"<ApolloGraph {len(self.cache)} nodes>"
+
+    def __getitem__(self, key: str) -> "GraphNode":
+        return GraphNode(self, self.cache[key])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.cache)
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    @property
+    def root(self) -> "GraphNode":
+        """the ROOT_QUERY node the page's queries hang off, the whole cache if there is none"""
+        return GraphNode(self, self.cache.get("ROOT_QUERY") or self.cache)
+
+    def _target(self, key: str) -> Any:
+        """the node a reference points to, followed through wrapper nodes"""
+        node = self.cache[key]
+        if self.unwrap and isinstance(node, dict) and node.get(self.unwrap):
+            return node[self.unwrap]
+        return node
+
+    def view(self, value: Any) -> Any:
+        """lazy view of a raw cache value, references are followed on access"""
+        key = reference(value)
+        if key is not None and key in self.cache:
+            return self.view(self._target(key))
+        if isinstance(value, dict):
+            return GraphNode(self, value)
+        if isinstance(value, list):
+            return GraphList(self, value)
+        return value
+
+    def resolve(self, value: Any) -> Any:
+        """
+        plain python copy of a raw cache value with references replaced by the nodes they point to.
+        Every referenced node is resolved once and shared by all places referencing it.
+        """
+        if isinstance(value, (GraphNode, GraphList)):
+            value = value.raw
+        key = reference(value)
+        if key is not None:
+            if key not in self.cache or key in self._resolving:
+                # unknown node or a cycle back to a node that's being resolved
+                return value
+            if key not in self._resolved:
+                self._resolving.add(key)
+                try:
+                    resolved = self.resolve(self._target(key))
+                finally:
+                    self._resolving.discard(key)
+                if self.mark and isinstance(resolved, dict):
+                    resolved[self.mark] = key
+                self._resolved[key] = resolved
+            return self._resolved[key]
+        if isinstance(value, dict):
+            return {k: self.resolve(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.resolve(v) for v in value]
+        return value
+
+    def node(self, key: str) -> Any:
+        """resolved copy of the node with the given id"""
+        return self.resolve({"__ref": key})
+
+
+class GraphNode(Mapping):
+    """a node (or nested object) of an ApolloGraph, values are views too"""
+
+    __slots__ = ("graph", "raw")
+
+    def __init__(self, graph: ApolloGraph, raw: Dict):
+        self.graph = graph
+        self.raw = raw
+
+    def __repr__(self) -> str:
+        return f"<GraphNode {list(self.raw)}>"
+
+    def __getitem__(self, key: str) -> Any:
+        return self.graph.view(self.raw[key])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.raw)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def resolve(self) -> Dict:
+        return self.graph.resolve(self.raw)
+
+
+class GraphList(Sequence):
+    """a list of an ApolloGraph node, items are views too"""
+
+    __slots__ = ("graph", "raw")
+
+    def __init__(self, graph: ApolloGraph, raw: List):
+        self.graph = graph
+        self.raw = raw
+
+    def __repr__(self) -> str:
+        return f"<GraphList {len(self.raw)} items>"
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return GraphList(self.graph, self.raw[index])
+        return self.graph.view(self.raw[index])
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def resolve(self) -> List:
+        return self.graph.resolve(self.raw)
@@ -0,0 +1,217 @@
+"""
+Batching of GraphQL operations.
+
+Hidden GraphQL APIs often accept a JSON list of operations in one POST and
+answer with a list of results in the same order (Apollo style batching). The
+scrapers used to send one operation per request: one search page offset, one
+review page or one hotel price calendar at a time. A GraphQLBatcher coalesces
+the operations requested at about the same time into as few requests as the
+endpoint allows and hands every caller the result of its own operation:
+
+    GRAPHQL = GraphQLBatcher(SCRAPFLY, max_batch=10)
+
+    results = await GRAPHQL.execute_many(
+        (review_feed_operation(business_id, offset), reviews_api_config(url)) for offset in offsets
+    )
+
+Only operations with the same request config (url, headers, session and other
+options except the body) are batched together. The first batch sent to an
+endpoint is a probe: the other batches for it wait until the probe is answered.
+When a batched request fails its operations are retried one request each, and
+endpoints that only answer single operations aren't batched again, so the held
+batches go out one operation per request and an endpoint refusing batches
+costs a single failed batched request.
+"""
+import asyncio
+import copy
+import json
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from loguru import logger as log
+from scrapfly import ScrapeConfig
+
+from .cache import fingerprint
+from .costs import BudgetExceeded, caller
+
+
+class GraphQLError(Exception):
+    """the endpoint answered an operation with errors and no data"""
+
+    def __init__(self, errors: Any):
+        super().__init__(f"graphql operation failed: {errors}")
+        self.errors = errors
+
+
+class _Batch:
+    """operations waiting to be sent in one request"""
+
+    def __init__(self, config: ScrapeConfig, function: str):
+        self.config = config
+        self.function = function
+        self.operations: List[Dict] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class GraphQLBatcher:
+    """coalesces graphql operations into batched requests and demultiplexes their results"""
+
+    def __init__(self, client, max_batch: int = 10, delay: float = 0.01, single_as_list: bool = False):
+        """
+        client: the site's SiteClient
+        max_batch: most operations sent in one request
+        delay: seconds an operation waits for others to share its request
+        single_as_list: send single operations as a list of one too, for batch-only endpoints
+        """
+        self.client = client
+        self.max_batch = max_batch
+        self.delay = delay
+        self.single_as_list = single_as_list
+        self._open: Dict[Tuple[str, Optional[str]], _Batch] = {}
+        self._sending: Set[asyncio.Task] = set()
+        # endpoints (urls without a query) that answered a batched request
+        self.batched: Set[str] = set()
+        # endpoints (urls without a query) that failed batched requests but answered single ones
+        self.unbatched: Set[str] = set()
+        # endpoints with a probe batch in flight and the batches waiting for its answer
+        self._held: Dict[str, List[_Batch]] = {}
+        self.operations = 0
+        self.requests = 0
+        self.fallbacks = 0
+
+    def __repr__(self) -> str:
+        return f"<GraphQLBatcher {self.client.site.name} operations={self.operations} requests={self.requests}>"
+
+    async def execute(self, operation: Dict, config: ScrapeConfig, function: Optional[str] = None) -> Dict:
+        """
+        the result of a graphql operation, sent along with other operations of the same request config
+        config: the request the operation is sent with, its body is replaced by the operations
+        """
+        key = (fingerprint(_without_body(config)), config.session)
+        batch = self._open.get(key)
+        if batch is None:
+            batch = self._open[key] = _Batch(config, function or caller())
+            batch.timer = asyncio.get_running_loop().call_later(self.delay, self._flush, key)
+        future = asyncio.get_running_loop().create_future()
+        batch.operations.append(operation)
+        batch.futures.append(future)
+        self.operations += 1
+        if _endpoint(config.url) in self.unbatched or len(batch.operations) >= self.max_batch:
+            self._flush(key)
+        return await future
+
+    async def execute_many(
+        self, requests: Iterable[Tuple[Dict, ScrapeConfig]], return_exceptions: bool = False
+    ) -> List[Any]:
+        """the results of many (operation, config) pairs in the given order, like asyncio.gather"""
+        function = caller()
+        return await asyncio.gather(
+            *[self.execute(operation, config, function) for operation, config in requests],
+            return_exceptions=return_exceptions,
+        )
+
+    def _flush(self, key: Tuple[str, Optional[str]]):
+        batch = self._open.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        self._dispatch(batch)
+
+    def _dispatch(self, batch: _Batch):
+        """send a batch, or hold it while a probe batch finds out whether its endpoint takes batches"""
+        endpoint = _endpoint(batch.config.url)
+        probe = False
+        if len(batch.operations) > 1 and endpoint not in self.batched and endpoint not in self.unbatched:
+            if endpoint in self._held:
+                self._held[endpoint].append(batch)
+                return
+            self._held[endpoint] = []
+            probe = True
+        task = asyncio.ensure_future(self._send(batch, probe))
+        # keep a reference to the task until it's done, the event loop only keeps weak ones
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: _Batch, probe: bool = False):
+        endpoint = _endpoint(batch.config.url)
+        try:
+            if endpoint in self.unbatched and len(batch.operations) > 1:
+                # held while the probe batch failed
+                results = await self._send_singly(batch)
+            else:
+                results = await self._request(batch.config, batch.operations, batch.function)
+                if probe:
+                    self.batched.add(endpoint)
+        except BudgetExceeded as e:
+            results = [e] * len(batch.operations)
+        except Exception as e:
+            if len(batch.operations) == 1:
+                results = [e]
+            else:
+                results = await self._fall_back(batch, e)
+        finally:
+            if probe:
+                # without a verdict (the singles failed too) the next held batch probes again
+                for held in self._held.pop(endpoint):
+                    self._dispatch(held)
+        for future, result in zip(batch.futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            elif result.get("data") is None and result.get("errors"):
+                future.set_exception(GraphQLError(result["errors"]))
+            else:
+                future.set_result(result)
+
+    async def _fall_back(self, batch: _Batch, error: Exception) -> List[Any]:
+        """retry the operations of a failed batch one request each"""
+        self.fallbacks += 1
+        log.warning(f"batch of {len(batch.operations)} graphql operations to {batch.config.url} failed, sending them one by one: {error}")
+        results = await self._send_singly(batch)
+        if any(not isinstance(result, Exception) for result in results):
+            log.info(f"not batching graphql operations to {_endpoint(batch.config.url)} anymore")
+            self.unbatched.add(_endpoint(batch.config.url))
+        return results
+
+    async def _send_singly(self, batch: _Batch) -> List[Any]:
+        """the results of a batch's operations sent one request each, exceptions included"""
+        results = await asyncio.gather(
+            *[self._request(batch.config, [operation], batch.function) for operation in batch.operations],
+            return_exceptions=True,
+        )
+        return [result[0] if isinstance(result, list) else result for result in results]
+
+    async def _request(self, config: ScrapeConfig, operations: List[Dict], function: str) -> List[Dict]:
+        batched = len(operations) > 1 or self.single_as_list
+        config = copy.copy(config)
+        config.data = None
+        config.body = json.dumps(operations if batched else operations[0], separators=(",", ":"))
+        self.requests += 1
+        response = await self.client.async_scrape(config, function)
+        results = json.loads(response.content)
+        if not batched:
+            results = [results]
+        if not isinstance(results, list) or len(results) != len(operations):
+            raise ValueError(f"expected {len(operations)} graphql results from {config.url}, got: {response.content:.200}")
+        return results
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "operations": self.operations,
+            "requests": self.requests,
+            "fallbacks": self.fallbacks,
+            "batched": sorted(self.batched),
+            "unbatched": sorted(self.unbatched),
+        }
+
+
+def _endpoint(url: str) -> str:
+    return urlsplit(url)._replace(query="", fragment="").geturl()
+
+
+def _without_body(config: ScrapeConfig) -> ScrapeConfig:
+    config = copy.copy(config)
+    config.body = config.data = None
+    return config
@@ -0,0 +1,284 @@
+"""
+Declarative multi-site job runner.
+
+A job file lists scraper functions with their arguments and output files. All
+jobs run in one process and one event loop, sharing the runtime's client,
+connection pool and global concurrency budget, instead of one run.py
+invocation per site:
+
+    # nightly.toml
+    concurrency = 20          # global scrapfly concurrency
+    output = "results"        # output directory, relative to the job file
+    cache = ".scrapfly-cache" # optional response cache directory
+    budget = 50000            # optional credit budget of all jobs
+    site_budgets = { walmart = 20000 }
+
+    [[jobs]]
+    name = "walmart-search"
+    function = "walmart.scrape_search"
+    args = { query = "lemon balm", max_pages = 2 }
+
+    [[jobs]]
+    function = "etsy.scrape_product"
+    each = [{ urls = ["https://www.etsy.com/listing/..."] }, { urls = ["https://www.etsy.com/listing/..."] }]
+    output = "etsy/products.jsonl.gz"
+    config = { cache = true }  # BASE_CONFIG overrides of the site
+    site_concurrency = 3
+    budget = 5000             # credit budget of this job
+    downgrade = true          # learn which expensive options the site can do without
+
+    $ python -m scraper_runtime nightly.toml
+    $ python -m scraper_runtime nightly.yaml --only walmart-search
+
+`function` is "<site module>.<function>", site modules are imported from the
+<site>-scraper directories next to the job file (or the scraper_paths it sets).
+The function is called with `args`, or once per entry of `each` merged into
+`args`. Whatever it returns or yields is appended to a JsonlSink: every item of
+a list or async generator as its own line, any other value as one line. Scrapes
+over a budget fail with BudgetExceeded, the credits every job spent are
+reported at the end (see costs.py). YAML job files require the optional PyYAML
+package.
+"""
+import argparse
+import asyncio
+import importlib
+import inspect
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from loguru import logger as log
+
+from .cache import ResponseCache
+from .client import configure
+from .config import SITES
+from .costs import Downgrade, get_ledger, job_scope
+from .sink import JsonlSink
+
+
+def _import_yaml():
+    try:
+        import yaml
+    except ImportError as e:
+        raise ImportError("YAML job files require the pyyaml package: pip install pyyaml") from e
+    return yaml
+
+
+def load_job_file(path: Union[str, Path]) -> Dict:
+    """read a .toml, .yaml or .json job file"""
+    path = Path(path)
+    if path.suffix == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # python < 3.11
+            import tomli as tomllib
+        with path.open("rb") as f:
+            return tomllib.load(f)
+    if path.suffix in (".yaml", ".yml"):
+        with path.open(encoding="utf-8") as f:
+            return _import_yaml().safe_load(f) or {}
+    if path.suffix == ".json":
+        import json
+
+        return json.loads(path.read_text(encoding="utf-8"))
+    raise ValueError(f"unsupported job file format {path.suffix!r}, use .toml, .yaml or .json")
+
+
+class Job:
+    """a single scraper function call (or one call per `each` entry) of a job file"""
+
+    def __init__(
+        self,
+        function: str,
+        name: Optional[str] = None,
+        args: Optional[Dict] = None,
+        each: Optional[List[Dict]] = None,
+        output: Optional[str] = None,
+        config: Optional[Dict] = None,
+        site_concurrency: Optional[int] = None,
+        concurrency: int = 1,
+        budget: Optional[int] = None,
+        downgrade: bool = False,
+    ):
+        if "." not in function:
+            raise ValueError(f"job function {function!r} has to be '<site module>.<function>'")
+        self.function = function
+        self.module, _, self.attribute = function.rpartition(".")
+        self.name = name or function.replace(".", "-")
+        self.args = args or {}
+        self.each = each
+        self.output = output or f"{self.name}.jsonl"
+        self.config = config or {}
+        self.site_concurrency = site_concurrency
+        # calls of an `each` job running at once, pages within a call are limited by the site client
+        self.concurrency = concurrency
+        self.budget = budget
+        self.downgrade = downgrade
+        self.items = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self.credits = 0
+
+    def __repr__(self) -> str:
+        return f"<Job {self.name} {self.function} items={self.items} failed={self.failed} credits={self.credits}>"
+
+    def calls(self) -> List[Dict]:
+        if self.each is None:
+            return [self.args]
+        return [{**self.args, **kwargs} for kwargs in self.each]
+
+
+def _site_paths(roots: Iterable[Path]) -> Dict[str, Path]:
+    """site module name -> directory of every <site>-scraper directory in the roots"""
+    paths = {}
+    for root in roots:
+        for directory in sorted(root.glob("*-scraper")):
+            module = directory.name[: -len("-scraper")]
+            if (directory / f"{module}.py").exists():
+                paths.setdefault(module, directory)
+    return paths
+
+
+def resolve(function: str, roots: Iterable[Path] = ()) -> Callable:
+    """import "<site module>.<function>", site modules are found in the <site>-scraper directories of the roots"""
+    module_name, _, attribute = function.rpartition(".")
+    if module_name not in sys.modules:
+        directory = _site_paths(roots).get(module_name)
+        if directory is not None and str(directory) not in sys.path:
+            sys.path.insert(0, str(directory))
+    module = importlib.import_module(module_name)
+    try:
+        return getattr(module, attribute)
+    except AttributeError:
+        raise AttributeError(f"module {module_name} has no function {attribute!r}") from None
+
+
+async def _call(func: Callable, kwargs: Dict) -> Any:
+    result = func(**kwargs)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def _write(result: Any, sink: JsonlSink) -> int:
+    if inspect.isasyncgen(result):
+        count = 0
+        async for item in result:
+            sink.write(item)
+            count += 1
+        return count
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        sink.write_many(result)
+        return len(result)
+    sink.write(result)
+    return 1
+
+
+async def run_job(job: Job, output: Path, roots: Iterable[Path] = ()) -> Job:
+    """run every call of a job and append the results to its output file"""
+    func = resolve(job.function, roots)
+    module = sys.modules[func.__module__]
+    site_config = getattr(module, "BASE_CONFIG", None)
+    if job.config:
+        if site_config is None:
+            raise ValueError(f"job {job.name} sets config but {job.module} has no BASE_CONFIG")
+        site_config.update(job.config)
+    if job.site_concurrency or job.downgrade:
+        site = getattr(site_config, "name", None)
+        if site not in SITES:
+            raise ValueError(f"job {job.name} sets site options but {job.module} has no site_config()")
+        if job.site_concurrency:
+            SITES[site].max_concurrency = job.site_concurrency
+        if job.downgrade and SITES[site].downgrade is None:
+            SITES[site].downgrade = Downgrade()
+    ledger = get_ledger()
+    if job.budget is not None:
+        ledger.set_budget(job.budget, job=job.name)
+
+    path = output / job.output
+    path.parent.mkdir(parents=True, exist_ok=True)
+    semaphore = asyncio.Semaphore(job.concurrency)
+    started = time.monotonic()
+
+    with JsonlSink(path) as sink:
+
+        async def call(kwargs: Dict):
+            async with semaphore:
+                try:
+                    job.items += await _write(await _call(func, kwargs), sink)
+                except Exception as e:
+                    job.failed += 1
+                    log.opt(exception=e).error(f"job {job.name} failed for {kwargs!r:.200}")
+
+        # scrapes of the calls, and of the tasks they start, are accounted to the job
+        with job_scope(job.name):
+            await asyncio.gather(*(call(kwargs) for kwargs in job.calls()))
+    job.seconds = time.monotonic() - started
+    job.credits = ledger.jobs[job.name].credits if job.name in ledger.jobs else 0
+    log.info(
+        f"job {job.name}: {job.items} items in {job.seconds:.1f}s, {job.failed} failed calls, "
+        f"{job.credits} credits -> {path}"
+    )
+    return job
+
+
+async def run_jobs(spec: Dict, base: Path = Path("."), only: Optional[Iterable[str]] = None) -> List[Job]:
+    """
+    run the jobs of a loaded job file concurrently in the current event loop
+    base: directory output, cache and scraper paths are relative to
+    only: names of the jobs to run, all by default
+    """
+    jobs = [Job(**job) for job in spec.get("jobs", [])]
+    if only:
+        only = set(only)
+        unknown = only - {job.name for job in jobs}
+        if unknown:
+            raise ValueError(f"unknown jobs: {', '.join(sorted(unknown))}")
+        jobs = [job for job in jobs if job.name in only]
+    if len({job.name for job in jobs}) != len(jobs):
+        raise ValueError("job names have to be unique, set `name` on jobs calling the same function")
+
+    cache = spec.get("cache")
+    if "concurrency" in spec or cache:
+        configure(
+            max_concurrency=spec.get("concurrency"),
+            cache=ResponseCache(base / cache, offline=spec.get("offline", False)) if cache else None,
+        )
+    ledger = get_ledger()
+    if spec.get("budget") is not None:
+        ledger.set_budget(spec["budget"])
+    for site, credits in spec.get("site_budgets", {}).items():
+        ledger.set_budget(credits, site=site)
+    output = base / spec.get("output", "results")
+    roots = [base / path for path in spec.get("scraper_paths", [".", ".."])]
+
+    async def run(job: Job) -> Job:
+        try:
+            return await run_job(job, output, roots)
+        except Exception as e:
+            job.failed += 1
+            log.opt(exception=e).error(f"job {job.name} failed")
+            return job
+
+    return await asyncio.gather(*(run(job) for job in jobs))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m scraper_runtime", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("job_file", help="a .toml, .yaml or .json job file")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="run only these jobs")
+    args = parser.parse_args(argv)
+
+    path = Path(args.job_file)
+    spec = load_job_file(path)
+    started = time.monotonic()
+    jobs = asyncio.run(run_jobs(spec, base=path.parent, only=args.only))
+    for job in jobs:
+        print(f"{job.name:<30} {job.items:>10} items {job.failed:>5} failed {job.credits:>10} credits {job.seconds:>10.1f}s")
+    print(f"{len(jobs)} jobs in {time.monotonic() - started:.1f}s, {sum(job.credits for job in jobs)} credits")
+    return 1 if any(job.failed for job in jobs) else 0
@@ -0,0 +1,76 @@
+"""
+Concurrency limits shared by every scraper running in the same process.
+
+A single global limiter caps the total number of in-flight Scrapfly requests
+(the account concurrency) while each site gets its own limiter so one slow or
+blocked target cannot take over the whole budget.
+"""
+import asyncio
+from collections import deque
+from typing import Deque
+
+
+class ConcurrencyLimiter:
+    """asyncio semaphore whose limit can be changed while requests are in flight"""
+
+    def __init__(self, limit: int, name: str = "global"):
+        if limit < 1:
+            raise ValueError(f"concurrency limit of {name} must be at least 1, got {limit}")
+        self.name = name
+        self._limit = limit
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def __repr__(self) -> str:
+        return f"<ConcurrencyLimiter {self.name} {self.in_flight}/{self._limit} waiting={len(self._waiters)}>"
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @limit.setter
+    def limit(self, value: int):
+        self._limit = max(1, int(value))
+        self._wake()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """wait for a free slot and take it"""
+        while self.in_flight >= self._limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                # the slot we were woken for has to go to the next waiter
+                self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self):
+        """give back a slot taken by acquire()"""
+        if self.in_flight <= 0:
+            raise RuntimeError(f"{self.name} limiter released more times than acquired")
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        free = self._limit - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if waiter.done() or waiter.get_loop().is_closed():
+                continue
+            waiter.set_result(None)
+            free -= 1
+
+    async def __aenter__(self) -> "ConcurrencyLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -0,0 +1,338 @@
+"""
+Local stand-in for the Scrapfly scrape API.
+
+MockScrapflyApi is a small HTTP server implementing the part of the scrape API
+the scrapers use: GET/POST/PUT/PATCH /scrape with the ScrapeConfig options as
+query parameters and the request body forwarded as is, plus /account. It
+answers from recorded API responses, so a scraper and its test.py can run
+offline in seconds through the real ScrapflyClient, connection pool and
+concurrency machinery:
+
+    $ SCRAPFLY_MOCK_API=./fixtures SCRAPFLY_MOCK_RECORD=1 pytest test.py   # record once, costs credits
+    $ SCRAPFLY_MOCK_API=./fixtures pytest test.py                          # replay offline
+
+In record mode requests without a recorded response are forwarded to the real
+API with $SCRAPFLY_KEY and whatever the API answers is recorded. Responses are
+stored in the ResponseCache format (see cache.py), keyed by the API request
+(url, method, body, headers and scrape options, ignoring things like the key,
+`session` or `tags`), so recorded fixtures can also be replayed through parse_*
+functions with ResponseCache.replay().
+
+As a load-test target the server can add latency to every response, emulate the
+account concurrency limit with 429 errors and generate pages for any url:
+
+    with MockScrapflyApi(latency=0.2, max_concurrency=20, pages=lambda url: "<html>...</html>") as api:
+        scraper_runtime.configure(client=ScrapflyClient(key="mock", host=api.url), max_concurrency=30)
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlparse
+
+import requests
+from loguru import logger as log
+
+from .cache import ResponseCache, _normalize_url
+
+UPSTREAM = "https://api.scrapfly.io"
+
+# API parameters that don't change what the scraped page looks like, see cache.IGNORED_OPTIONS
+IGNORED_PARAMS = {
+    "cache",
+    "cache_clear",
+    "cache_ttl",
+    "correlation_id",
+    "cost_budget",
+    "debug",
+    "key",
+    "retry",
+    "session",
+    "session_sticky_proxy",
+    "tags",
+    "timeout",
+    "webhook_name",
+}
+
+
+def request_key(method: str, params: Dict[str, str], body: bytes = b"") -> str:
+    """hash of the scrape API request parameters that determine the scraped result"""
+    options = {}
+    for name, value in params.items():
+        if name in IGNORED_PARAMS:
+            continue
+        if name.startswith("headers["):
+            name = name.lower()
+        options[name] = value
+    options["url"] = _normalize_url(params.get("url", ""))
+    options["method"] = method.upper()
+    if body:
+        options["body"] = hashlib.sha256(body).hexdigest()
+    normalized = json.dumps(options, sort_keys=True)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def api_result(url: str, content: str, method: str = "GET", status_code: int = 200) -> Dict:
+    """a scrape API result of a generated page"""
+    success = status_code < 400
+    return {
+        "config": {"url": url, "method": method, "headers": {}},
+        "context": {"url": url},
+        "result": {
+            "status": "DONE",
+            "success": success,
+            "status_code": status_code,
+            "reason": "OK" if success else "Error",
+            "duration": 0,
+            "log_url": "",
+            "url": url,
+            "format": "text",
+            "content": content,
+            "cookies": [],
+            "request_headers": {},
+            "response_headers": {"content-type": "text/html"},
+            "error": None if success else {
+                "code": "ERR::SCRAPE::BAD_UPSTREAM_RESPONSE",
+                "http_code": status_code,
+                "message": f"the target responded with {status_code}",
+                "retryable": False,
+            },
+        },
+    }
+
+
+def api_error(status: int, code: str, message: str, retryable: bool = False) -> Dict:
+    """an error of the API itself (as opposed to a failed scrape), raised as ApiHttpClientError by the SDK"""
+    return {"error_id": str(uuid.uuid4()), "http_code": status, "code": code, "message": message, "retryable": retryable}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.api.handle(self)
+
+    do_POST = do_PUT = do_PATCH = do_DELETE = do_GET
+
+    def log_message(self, format, *args):
+        log.trace(f"mock scrapfly api: {format % args}")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    api: "MockScrapflyApi"
+
+
+class MockScrapflyApi:
+    """local scrape API serving recorded responses, optionally recording them from the real API"""
+
+    def __init__(
+        self,
+        fixtures: Union[str, Path, None] = None,
+        record: bool = False,
+        key: Optional[str] = None,
+        upstream: str = UPSTREAM,
+        pages: Optional[Callable[[str], Optional[str]]] = None,
+        latency: float = 0,
+        max_concurrency: Optional[int] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """
+        fixtures: directory recorded responses are kept in, None to only serve generated pages
+        record: forward requests without a recorded response to the upstream API and record the answers
+        key: Scrapfly key of the upstream API, defaults to $SCRAPFLY_KEY
+        pages: generates the content of urls without a recorded response, None for a 404 API error
+        latency: seconds added to every response
+        max_concurrency: account concurrency, requests over it get a 429 API error like the real API
+        port: 0 picks a free port
+        """
+        self.store = ResponseCache(fixtures) if fixtures is not None else None
+        if record and self.store is None:
+            raise ValueError("record mode needs a fixtures directory")
+        self.record = record
+        self.key = key or os.environ.get("SCRAPFLY_KEY")
+        self.upstream = upstream.rstrip("/")
+        self.pages = pages
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.address = (host, port)
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self.in_flight = 0
+        self.stats = {"requests": 0, "replayed": 0, "generated": 0, "recorded": 0, "missing": 0, "throttled": 0}
+        # most concurrent requests seen, to check clients stay within their budget
+        self.peak_in_flight = 0
+        # requests per session
+        self.sessions: Dict[str, int] = {}
+
+    def __repr__(self) -> str:
+        return f"<MockScrapflyApi {self.url if self._server else 'stopped'} {self.stats}>"
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockScrapflyApi":
+        self._server = _Server(self.address, _Handler)
+        self._server.api = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-scrapfly-api", daemon=True)
+        self._thread.start()
+        log.info(f"mock scrapfly api listening on {self.url}, {'recording' if self.record else 'replaying'}")
+        return self
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._session.close()
+
+    def __enter__(self) -> "MockScrapflyApi":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        parsed = urlparse(request.path)
+        params = dict(parse_qsl(parsed.query, keep_blank_values=True))
+        length = int(request.headers.get("content-length") or 0)
+        body = request.rfile.read(length) if length else b""
+        if parsed.path.rstrip("/") == "/account":
+            status, headers, result = 200, {}, self.account()
+        elif parsed.path.rstrip("/") == "/scrape":
+            status, headers, result = self.scrape(request.command, params, body, request.headers)
+        else:
+            status, headers, result = 404, {}, api_error(404, "ERR::MOCK::NOT_FOUND", f"{parsed.path} isn't mocked")
+        payload = json.dumps(result).encode()
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.send_header("content-type", "application/json; charset=utf-8")
+        request.send_header("content-length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def account(self) -> Dict:
+        return {"subscription": {"max_concurrency": self.max_concurrency or 1000}, "mock": True}
+
+    def scrape(self, method: str, params: Dict[str, str], body: bytes, headers) -> Tuple[int, Dict, Dict]:
+        """answer a scrape request with (status, headers, api result)"""
+        with self._lock:
+            self.stats["requests"] += 1
+            if params.get("session"):
+                self.sessions[params["session"]] = self.sessions.get(params["session"], 0) + 1
+            if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+                self.stats["throttled"] += 1
+                message = f"the account concurrency of {self.max_concurrency} is exceeded"
+                return 429, {"Retry-After": "1"}, api_error(
+                    429, "ERR::THROTTLE::MAX_CONCURRENT_REQUEST_EXCEEDED", message, retryable=True
+                )
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            return self._answer(method, params, body, headers)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _answer(self, method: str, params: Dict[str, str], body: bytes, headers) -> Tuple[int, Dict, Dict]:
+        url = params.get("url", "")
+        key = request_key(method, params, body)
+        if self.store is not None:
+            with self._lock:
+                record = self.store.get_record(key)
+            if record is not None:
+                self._count("replayed")
+                return 200, record.get("headers", {}), record["result"]
+        if self.pages is not None:
+            content = self.pages(url)
+            if content is not None:
+                self._count("generated")
+                return 200, {"X-Scrapfly-Api-Cost": "1"}, api_result(url, content, method)
+        if self.record:
+            return self._forward(key, method, params, body, headers)
+        self._count("missing")
+        log.warning(f"mock scrapfly api has no recorded response for {method} {url}")
+        return 404, {}, api_error(404, "ERR::MOCK::NO_FIXTURE", f"no recorded response for {method} {url}")
+
+    def _forward(self, key: str, method: str, params: Dict[str, str], body: bytes, headers) -> Tuple[int, Dict, Dict]:
+        """scrape through the upstream API and record the answer"""
+        if not self.key:
+            raise RuntimeError("record mode needs $SCRAPFLY_KEY")
+        forwarded = {name: value for name, value in headers.items() if name.lower() == "content-type"}
+        response = self._session.request(
+            method,
+            self.upstream + "/scrape",
+            params={**params, "key": self.key},
+            data=body or None,
+            headers={**forwarded, "accept": "application/json"},
+            timeout=(30, 160),
+        )
+        result = response.json()
+        scrapfly_headers = {name: value for name, value in response.headers.items() if name.lower().startswith("x-scrapfly")}
+        # API errors (throttling, bad keys) are passed through but never recorded
+        if response.status_code == 200:
+            with self._lock:
+                self.store.put_record(key, {"stored_at": time.time(), "headers": scrapfly_headers, "result": result})
+            self._count("recorded")
+        return response.status_code, scrapfly_headers, result
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+
+def mock_from_env() -> Optional[MockScrapflyApi]:
+    """create the mock API configured through $SCRAPFLY_MOCK_API environment variables"""
+    path = os.environ.get("SCRAPFLY_MOCK_API")
+    if not path:
+        return None
+    latency = os.environ.get("SCRAPFLY_MOCK_LATENCY")
+    concurrency = os.environ.get("SCRAPFLY_MOCK_CONCURRENCY")
+    return MockScrapflyApi(
+        path,
+        record=os.environ.get("SCRAPFLY_MOCK_RECORD", "").lower() in ("1", "true", "yes"),
+        latency=float(latency) if latency else 0,
+        max_concurrency=int(concurrency) if concurrency else None,
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m scraper_runtime.mockapi", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("fixtures", help="directory the responses are recorded in")
+    parser.add_argument("--record", action="store_true", help="record missing responses from the real API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every response")
+    parser.add_argument("--concurrency", type=int, default=None, help="emulated account concurrency")
+    args = parser.parse_args(argv)
+    api = MockScrapflyApi(
+        args.fixtures, record=args.record, port=args.port, latency=args.latency, max_concurrency=args.concurrency
+    )
+    api.start()
+    print(f"export SCRAPFLY_API_HOST={api.url}")
+    try:
+        api._thread.join()
+    except KeyboardInterrupt:
+        api.stop()
+        print(api.stats)
+
+
+if __name__ == "__main__":
+    main()
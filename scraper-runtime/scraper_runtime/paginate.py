@@ -0,0 +1,119 @@
+"""
+Prefetching cursor pagination.
+
+Cursor paginated listings (subreddit feeds, profile timelines) can only request
+page N+1 once page N told them its cursor. paginate() reads the cursor of a page
+as soon as it arrives and starts fetching the next page right away, so the
+next request is in flight while the current page is parsed and its items are
+consumed by the caller:
+
+    async for post in paginate(first_url, fetch, next_cursor=lambda r: r.selector.css(...).get(), parse=parse_posts):
+        sink.write(post)
+
+paginate_many() runs many independent cursor chains (users, subreddits) at
+once under one concurrency budget and streams (start, item) pairs in the order
+pages arrive. Every chain keeps at most one page prefetched and the output
+queue is bounded, so a slow consumer slows the crawl down instead of piling up
+pages in memory.
+
+A failed page ends its chain. The other chains keep going, and once they're
+done the first error is raised, so a listing that can't be scraped fails like a
+plain loop over its pages would. With tolerate_errors=True failed chains are
+only logged and the items of the pages before the failure are kept.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional, Tuple
+
+from loguru import logger as log
+
+_DONE = object()
+
+
+async def paginate_many(
+    starts: Iterable[Any],
+    fetch: Callable[[Any], Awaitable[Any]],
+    next_cursor: Callable[[Any], Any],
+    parse: Callable[[Any], Iterable[Any]],
+    max_pages: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    maxsize: int = 1000,
+    tolerate_errors: bool = False,
+) -> AsyncIterator[Tuple[Any, Any]]:
+    """
+    follow several cursor chains concurrently and yield (start, item) pairs as pages are parsed
+    starts: the first cursor of every chain (e.g. a first page url), passed to fetch() as is
+    fetch: coroutine fetching the page of a cursor
+    next_cursor: the cursor of the page after a fetched page, or None on the last page
+    parse: the items of a fetched page
+    max_pages: maximum pages fetched per chain
+    concurrency: maximum pages fetched at once across all chains, the site client's limits apply regardless
+    maxsize: parsed items buffered before chains wait for the consumer
+    tolerate_errors: log failed chains instead of raising their first error once the other chains are done
+    """
+    starts = list(starts)
+    errors = []
+    output: asyncio.Queue = asyncio.Queue(maxsize)
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def limited_fetch(cursor: Any) -> Any:
+        if semaphore is None:
+            return await fetch(cursor)
+        async with semaphore:
+            return await fetch(cursor)
+
+    async def chain(start: Any):
+        pages = 0
+        cursor = start
+        prefetch: Optional[asyncio.Future] = asyncio.ensure_future(limited_fetch(cursor))
+        try:
+            while prefetch is not None:
+                page = await prefetch
+                pages += 1
+                prefetch = None
+                following = next_cursor(page)
+                # the next request goes out before this page is parsed and consumed
+                if following and following != cursor and (max_pages is None or pages < max_pages):
+                    cursor = following
+                    prefetch = asyncio.ensure_future(limited_fetch(cursor))
+                    # let the request go out before parsing takes over the event loop
+                    await asyncio.sleep(0)
+                for item in parse(page):
+                    await output.put((start, item))
+            log.debug(f"paginated {start!r:.100}: {pages} pages")
+        except Exception as e:
+            log.opt(exception=e).error(f"pagination of {start!r:.100} stopped after {pages} pages at {cursor!r:.100}")
+            errors.append(e)
+        finally:
+            if prefetch is not None:
+                prefetch.cancel()
+
+    async def finish(chains):
+        await asyncio.gather(*chains, return_exceptions=True)
+        await output.put(_DONE)
+
+    tasks = [asyncio.ensure_future(chain(start)) for start in starts]
+    tasks.append(asyncio.ensure_future(finish(list(tasks))))
+    try:
+        while (result := await output.get()) is not _DONE:
+            yield result
+        if errors and not tolerate_errors:
+            raise errors[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def paginate(
+    start: Any,
+    fetch: Callable[[Any], Awaitable[Any]],
+    next_cursor: Callable[[Any], Any],
+    parse: Callable[[Any], Iterable[Any]],
+    max_pages: Optional[int] = None,
+    maxsize: int = 1000,
+    tolerate_errors: bool = False,
+) -> AsyncIterator[Any]:
+    """follow a single cursor chain, prefetching the next page while the current one is parsed and consumed"""
+    async for _, item in paginate_many(
+        [start], fetch, next_cursor, parse, max_pages=max_pages, maxsize=maxsize, tolerate_errors=tolerate_errors
+    ):
+        yield item
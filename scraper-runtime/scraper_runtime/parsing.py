@@ -0,0 +1,210 @@
+"""
+Optional process pool for parsing scraped pages.
+
+parse_* functions run lxml/parsel queries synchronously, so a scrape loop that
+parses big pages inline stalls the event loop and stops issuing requests while
+it parses. With parse workers enabled, parse_responses() hands every response
+to a process pool as it arrives and yields the parse results as they finish,
+so requests keep flowing while all cores parse:
+
+    async for hotel in parse_responses(SCRAPFLY.concurrent_scrape(to_scrape), parse_hotel):
+        if isinstance(hotel, Exception):
+            continue
+        ...
+
+Workers are enabled with $SCRAPFLY_PARSE_WORKERS (a number, or "auto" for
+one per core) or configure_parsing(); by default parsing stays inline in the
+event loop and nothing changes. A worker gets a PageResponse with the same
+content, selector, context and status attributes parse functions read from a
+ScrapeApiResponse. Page bodies are handed over through shared memory instead
+of being pickled, only the parse results travel back pickled. Parse functions
+have to be module level functions so workers can import them.
+"""
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import cached_property, partial
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Optional, Set, Union
+
+from loguru import logger as log
+from parsel import Selector
+
+# bodies smaller than this are cheaper to pickle than to put in shared memory
+SHARED_MEMORY_THRESHOLD = 64 * 1024
+
+
+class PageResponse:
+    """the parts of a ScrapeApiResponse parse functions use, rebuilt from the page body in a parse worker"""
+
+    def __init__(
+        self, content: str, url: str, status_code: int = 200, upstream_status_code: Optional[int] = None
+    ):
+        self.content = content
+        self.status_code = status_code
+        self.upstream_status_code = upstream_status_code
+        self.context = {"url": url}
+        self.scrape_result = {"content": content, "url": url, "status_code": upstream_status_code}
+        self.result = {"config": {"url": url}, "result": self.scrape_result}
+
+    def __repr__(self) -> str:
+        return f"<PageResponse {self.upstream_status_code} {self.context['url']}>"
+
+    @cached_property
+    def selector(self) -> Selector:
+        return Selector(text=self.content)
+
+
+def _meta(response: Any) -> Dict:
+    return {
+        "url": response.context["url"],
+        "status_code": getattr(response, "status_code", 200),
+        "upstream_status_code": getattr(response, "upstream_status_code", None),
+    }
+
+
+def _parse_page(func: Callable, content: str, meta: Dict, args: tuple, kwargs: Dict) -> Any:
+    return func(PageResponse(content, **meta), *args, **kwargs)
+
+
+def _parse_shared(func: Callable, name: str, size: int, meta: Dict, args: tuple, kwargs: Dict) -> Any:
+    """parse a page body the parent process put in shared memory"""
+    shared = SharedMemory(name=name)
+    try:
+        content = bytes(shared.buf[:size]).decode("utf-8")
+    finally:
+        # the parent unlinks the block, spawned workers share its resource tracker
+        shared.close()
+    return _parse_page(func, content, meta, args, kwargs)
+
+
+class ParseExecutor:
+    """runs parse functions on responses, in a process pool or inline when workers is 0"""
+
+    def __init__(self, workers: Optional[int] = None, shared_memory_threshold: int = SHARED_MEMORY_THRESHOLD):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.shared_memory_threshold = shared_memory_threshold
+        self.pool: Optional[Executor] = None
+        if self.workers > 0:
+            # spawned workers don't inherit the client's threads and sockets
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"))
+        self.parsed = 0
+
+    def __repr__(self) -> str:
+        return f"<ParseExecutor workers={self.workers} parsed={self.parsed}>"
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    def __enter__(self) -> "ParseExecutor":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def parse(self, func: Callable, response: Any, *args, **kwargs) -> Any:
+        """func(response, *args, **kwargs) in a worker process"""
+        self.parsed += 1
+        if self.pool is None or not isinstance(response.content, str):
+            return func(response, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        body = response.content.encode("utf-8")
+        if len(body) < self.shared_memory_threshold:
+            call = partial(_parse_page, func, response.content, _meta(response), args, kwargs)
+            return await loop.run_in_executor(self.pool, call)
+        size = len(body)
+        shared = SharedMemory(create=True, size=size)
+        try:
+            shared.buf[:size] = body
+            del body
+            call = partial(_parse_shared, func, shared.name, size, _meta(response), args, kwargs)
+            return await loop.run_in_executor(self.pool, call)
+        finally:
+            shared.close()
+            shared.unlink()
+
+    async def parse_many(
+        self, responses: Union[Iterable[Any], AsyncIterable[Any]], func: Callable, *args, **kwargs
+    ) -> AsyncIterator[Any]:
+        """
+        parse responses as they arrive and yield the results as they finish.
+        Exceptions in responses (failed scrapes from concurrent_scrape) and failed parses are yielded as exceptions
+        """
+        pending: Set[asyncio.Future] = set()
+        # keep every worker busy without buffering the whole response stream
+        window = max(1, self.workers * 2)
+
+        async def parsed(response: Any) -> Any:
+            if isinstance(response, Exception):
+                return response
+            try:
+                return await self.parse(func, response, *args, **kwargs)
+            except Exception as e:
+                log.opt(exception=e).error(f"failed to parse {response.context['url']}")
+                return e
+
+        async def drain(limit: int) -> AsyncIterator[Any]:
+            nonlocal pending
+            while len(pending) > limit:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        try:
+            if isinstance(responses, AsyncIterable):
+                async for response in responses:
+                    pending.add(asyncio.ensure_future(parsed(response)))
+                    async for result in drain(window):
+                        yield result
+            else:
+                for response in responses:
+                    pending.add(asyncio.ensure_future(parsed(response)))
+                    async for result in drain(window):
+                        yield result
+            async for result in drain(0):
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+_EXECUTOR: Optional[ParseExecutor] = None
+
+
+def _workers_from_env() -> int:
+    value = os.environ.get("SCRAPFLY_PARSE_WORKERS", "0").strip().lower()
+    if value == "auto":
+        return os.cpu_count() or 1
+    return int(value or 0)
+
+
+def configure_parsing(workers: Optional[int] = None, **kwargs) -> ParseExecutor:
+    """(re)create the process-wide parse executor, workers=0 parses inline, None uses one worker per core"""
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.close()
+    _EXECUTOR = ParseExecutor(workers, **kwargs)
+    log.debug(f"parse executor configured with {_EXECUTOR.workers} workers")
+    return _EXECUTOR
+
+
+def get_parse_executor() -> ParseExecutor:
+    """get the process-wide parse executor, creating it from $SCRAPFLY_PARSE_WORKERS if needed"""
+    if _EXECUTOR is None:
+        return configure_parsing(_workers_from_env())
+    return _EXECUTOR
+
+
+async def parse_response(func: Callable, response: Any, *args, **kwargs) -> Any:
+    """parse a single response with the process-wide parse executor"""
+    return await get_parse_executor().parse(func, response, *args, **kwargs)
+
+
+def parse_responses(
+    responses: Union[Iterable[Any], AsyncIterable[Any]], func: Callable, *args, **kwargs
+) -> AsyncIterator[Any]:
+    """parse a stream of responses with the process-wide parse executor, yielding results as they finish"""
+    return get_parse_executor().parse_many(responses, func, *args, **kwargs)
@@ -0,0 +1,110 @@
+"""
+Overlapping producer/consumer scrape pipelines.
+
+Instead of scraping every search page, then every product, then every review
+page, items flow through bounded asyncio queues from one stage to the next as
+soon as they are parsed, so total crawl time approaches the slowest stage
+rather than the sum of all stages:
+
+    async for product in run_pipeline(
+        ["lemon balm", "chamomile"],
+        Stage(iter_search, name="search"),                      # async generator: one query -> many listings
+        Stage(scrape_product, concurrency=10, name="products"),  # coroutine: one listing -> one product
+        Stage(scrape_product_reviews, concurrency=5, name="reviews"),
+    ):
+        sink.write(product)
+
+A stage function either returns a single result (None drops the item) or is
+an async generator yielding any number of results. Items that fail a stage are
+logged and dropped without stopping the pipeline.
+"""
+import asyncio
+import inspect
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Iterable, List, Optional, Union
+
+from loguru import logger as log
+
+_DONE = object()
+
+
+class Stage:
+    """a single step of a scrape pipeline run by `concurrency` workers"""
+
+    def __init__(self, func: Callable[[Any], Any], concurrency: int = 1, name: Optional[str] = None):
+        self.func = func
+        self.concurrency = concurrency
+        self.name = name or getattr(func, "__name__", "stage")
+        self.processed = 0
+        self.failed = 0
+
+    def __repr__(self) -> str:
+        return f"<Stage {self.name} processed={self.processed} failed={self.failed}>"
+
+
+async def _results(stage: Stage, item: Any) -> AsyncIterator[Any]:
+    result = stage.func(item)
+    if inspect.isasyncgen(result):
+        async for value in result:
+            yield value
+        return
+    if inspect.isawaitable(result):
+        result = await result
+    if result is not None:
+        yield result
+
+
+async def run_pipeline(
+    source: Union[Iterable[Any], AsyncIterable[Any]], *stages: Stage, maxsize: int = 100
+) -> AsyncIterator[Any]:
+    """push source items through the stages concurrently and yield the results of the last stage"""
+    # queues[i] feeds stages[i], the last queue holds the pipeline output
+    queues: List[asyncio.Queue] = [asyncio.Queue(maxsize) for _ in range(len(stages) + 1)]
+    alive = [stage.concurrency for stage in stages]
+    source_errors: List[BaseException] = []
+
+    def consumers(index: int) -> int:
+        return stages[index].concurrency if index < len(stages) else 1
+
+    async def produce():
+        try:
+            if isinstance(source, AsyncIterable):
+                async for item in source:
+                    await queues[0].put(item)
+            else:
+                for item in source:
+                    await queues[0].put(item)
+        except Exception as e:
+            source_errors.append(e)
+        finally:
+            for _ in range(consumers(0)):
+                await queues[0].put(_DONE)
+
+    async def work(index: int):
+        stage = stages[index]
+        inbox, outbox = queues[index], queues[index + 1]
+        while (item := await inbox.get()) is not _DONE:
+            try:
+                async for result in _results(stage, item):
+                    await outbox.put(result)
+                stage.processed += 1
+            except Exception as e:
+                stage.failed += 1
+                log.opt(exception=e).error(f"{stage.name}: failed to process {item!r:.200}")
+        alive[index] -= 1
+        if alive[index] == 0:
+            # the last worker of a stage tells every worker downstream that no more items are coming
+            for _ in range(consumers(index + 1)):
+                await outbox.put(_DONE)
+
+    tasks = [asyncio.ensure_future(produce())]
+    for index, stage in enumerate(stages):
+        tasks.extend(asyncio.ensure_future(work(index)) for _ in range(stage.concurrency))
+    try:
+        while (result := await queues[-1].get()) is not _DONE:
+            yield result
+        if source_errors:
+            raise source_errors[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+        log.debug("pipeline finished: " + ", ".join(repr(stage) for stage in stages))
@@ -0,0 +1,212 @@
+"""
+Precompiled JMESPath queries.
+
+jmespath.search(expression, data) looks its expression up in a small parser
+cache (re-parsing once more than 128 expressions are in use) and walks the
+parsed tree with a generic visitor, a method dispatch per node per record. For
+the large reducer expressions of the scrapers that costs much more than reading
+the data itself. query() keeps a registry of expressions keyed by their text and
+turns each one into a plain python function the first time it's used:
+
+    result = query(\"\"\"{
+        id: id,
+        text: legacy.full_text,
+        images: legacy.entities.media[].media_url_https
+    }\"\"\", data)
+
+returns exactly what jmespath.search() would. Fields, sub-expressions, indexes,
+projections, flattening, filters, multi-selects and pipes are generated as
+python; anything else (functions, slices) is evaluated by jmespath's own
+interpreter for that part of the expression only.
+"""
+import itertools
+from typing import Any, Callable, Dict, List
+
+import jmespath
+from jmespath.visitor import TreeInterpreter, _equals, _is_comparable
+
+_INTERPRETER = TreeInterpreter()
+
+
+def _is_true(value: Any) -> bool:
+    """JMESPath truthiness: empty strings, lists and objects are false, 0 isn't"""
+    return not (value is None or value is False or value == "" or value == [] or value == {})
+
+
+def _not(value: Any) -> bool:
+    # unlike in python !0 is false
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value == 0:
+        return False
+    return not value
+
+
+def _flatten(value: Any) -> Any:
+    if not isinstance(value, list):
+        return None
+    merged = []
+    for element in value:
+        if isinstance(element, list):
+            merged.extend(element)
+        else:
+            merged.append(element)
+    return merged
+
+
+def _index(value: Any, index: int) -> Any:
+    if not isinstance(value, list):
+        return None
+    try:
+        return value[index]
+    except IndexError:
+        return None
+
+
+def _values(value: Any) -> Any:
+    try:
+        return list(value.values())
+    except AttributeError:
+        return None
+
+
+def _ordered(operator: Callable[[Any, Any], bool]) -> Callable[[Any, Any], Any]:
+    def compare(left: Any, right: Any) -> Any:
+        # ordering is only defined for numbers
+        if not (_is_comparable(left) and _is_comparable(right)):
+            return None
+        return operator(left, right)
+
+    return compare
+
+
+_COMPARATORS = {
+    "eq": _equals,
+    "ne": lambda left, right: not _equals(left, right),
+    "lt": _ordered(lambda left, right: left < right),
+    "gt": _ordered(lambda left, right: left > right),
+    "lte": _ordered(lambda left, right: left <= right),
+    "gte": _ordered(lambda left, right: left >= right),
+}
+
+
+class _Generator:
+    """generates a python expression evaluating a parsed JMESPath tree"""
+
+    def __init__(self):
+        self.constants: List[Any] = []
+        self._names = itertools.count()
+
+    def name(self) -> str:
+        return f"_v{next(self._names)}"
+
+    def constant(self, value: Any) -> str:
+        self.constants.append(value)
+        return f"_c[{len(self.constants) - 1}]"
+
+    def bind(self, current: str):
+        """a name for the current value, so expressions using it several times evaluate it once"""
+        if current.isidentifier():
+            return current, current
+        name = self.name()
+        return name, f"({name} := {current})"
+
+    def generate(self, node: Dict, current: str) -> str:
+        kind = node["type"]
+        children = node.get("children", [])
+        if kind in ("current", "identity"):
+            return current
+        if kind == "literal":
+            return self.constant(node["value"])
+        if kind == "field":
+            name, bound = self.bind(current)
+            return f"({name}.get({node['value']!r}) if isinstance({bound}, dict) else None)"
+        if kind in ("subexpression", "index_expression", "pipe"):
+            for child in children:
+                current = self.generate(child, current)
+            return current
+        if kind == "index":
+            return f"_index({current}, {node['value']!r})"
+        if kind == "key_val_pair":
+            return self.generate(children[0], current)
+        if kind in ("multi_select_dict", "multi_select_list"):
+            name, bound = self.bind(current)
+            if kind == "multi_select_dict":
+                values = ", ".join(f"{child['value']!r}: {self.generate(child, name)}" for child in children)
+                collected = f"{{{values}}}"
+            else:
+                collected = "[%s]" % ", ".join(self.generate(child, name) for child in children)
+            return f"(None if {bound} is None else {collected})"
+        if kind == "flatten":
+            return f"_flatten({self.generate(children[0], current)})"
+        if kind in ("projection", "value_projection", "filter_projection"):
+            base = self.generate(children[0], current)
+            items, element, result = self.name(), self.name(), self.name()
+            right = self.generate(children[1], element)
+            condition = ""
+            if kind == "filter_projection":
+                condition = f"if _is_true({self.generate(children[2], element)}) "
+            collect = f"[{result} for {element} in {items} {condition}if ({result} := {right}) is not None]"
+            if kind == "value_projection":
+                return f"(None if ({items} := _values({base})) is None else {collect})"
+            return f"({collect} if isinstance(({items} := {base}), list) else None)"
+        if kind == "comparator":
+            left, right = (self.generate(child, current) for child in children)
+            return f"_compare[{node['value']!r}]({left}, {right})"
+        if kind in ("and_expression", "or_expression"):
+            left, right = (self.generate(child, current) for child in children)
+            name, bound = self.bind(left)
+            if kind == "and_expression":
+                return f"({right} if _is_true({bound}) else {name})"
+            return f"({name} if _is_true({bound}) else {right})"
+        if kind == "not_expression":
+            return f"_not({self.generate(children[0], current)})"
+        # functions, slices and anything newer are left to the jmespath interpreter
+        return f"_interpret({self.constant(node)}, {current})"
+
+
+class Query:
+    """a JMESPath expression compiled into a python function"""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.parsed = jmespath.compile(expression)
+        generator = _Generator()
+        body = generator.generate(self.parsed.parsed, "data")
+        self.source = f"def search(data):\n    return {body}\n"
+        namespace = {
+            "_c": generator.constants,
+            "_compare": _COMPARATORS,
+            "_flatten": _flatten,
+            "_index": _index,
+            "_interpret": _INTERPRETER.visit,
+            "_is_true": _is_true,
+            "_not": _not,
+            "_values": _values,
+        }
+        try:
+            exec(compile(self.source, f"<query {expression[:40]!r}>", "exec"), namespace)
+            self.search: Callable[[Any], Any] = namespace["search"]
+        except (SyntaxError, RecursionError, MemoryError):
+            # too deeply nested for the python parser, interpret it instead
+            self.search = self.parsed.search
+
+    def __repr__(self) -> str:
+        return f"<Query {self.expression!r}>"
+
+    def __call__(self, data: Any) -> Any:
+        return self.search(data)
+
+
+_QUERIES: Dict[str, Query] = {}
+
+
+def compile_query(expression: str) -> Query:
+    """the compiled query of an expression, compiled only once per process"""
+    compiled = _QUERIES.get(expression)
+    if compiled is None:
+        compiled = _QUERIES[expression] = Query(expression)
+    return compiled
+
+
+def query(expression: str, data: Any) -> Any:
+    """drop-in replacement of jmespath.search() using the compiled query registry"""
+    return compile_query(expression).search(data)
@@ -0,0 +1,213 @@
+"""
+Pool of warm Scrapfly sessions.
+
+Some sites only answer a session that went through their homepage first
+(cookies, tokens set by javascript), so scrapers used to open a fresh session
+for every item and pay a full render_js page load per url. A SessionPool warms
+a number of sessions once and leases them to concurrent scrapes, so the warm-up
+cost is shared by every item scraped in a session:
+
+    SESSIONS = SessionPool(SCRAPFLY, warmup=lambda session: ScrapeConfig(
+        "https://www.aliexpress.com/", **BASE_CONFIG, render_js=True, session=session
+    ))
+
+    async with SESSIONS.lease() as session:
+        result = await session.scrape(ScrapeConfig(url, **BASE_CONFIG))
+
+A session is leased to one scrape at a time, as Scrapfly sessions are
+meant for sequential requests, so the pool size caps how many sessioned scrapes
+run at once. Every scrape made through a session is checked for blocks: sessions
+that fail max_failures times in a row are retired, as are sessions older than
+max_age seconds or used max_uses times, and a new session is warmed in their
+place on the next lease.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from loguru import logger as log
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+
+from .adaptive import OK, classify
+from .costs import BudgetExceeded, caller
+
+
+class Session:
+    """a warm scrapfly session and its health"""
+
+    def __init__(self, pool: "SessionPool", session_id: str):
+        self.pool = pool
+        self.id = session_id
+        self.created = time.monotonic()
+        self.uses = 0
+        # failed scrapes in a row
+        self.failures = 0
+
+    def __repr__(self) -> str:
+        return f"<Session {self.id} uses={self.uses} failures={self.failures}>"
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created
+
+    @property
+    def healthy(self) -> bool:
+        return self.failures < self.pool.max_failures
+
+    @property
+    def expired(self) -> bool:
+        pool = self.pool
+        return (pool.max_age is not None and self.age > pool.max_age) or (
+            pool.max_uses is not None and self.uses >= pool.max_uses
+        )
+
+    def record(self, result: Any):
+        """count the outcome of a scrape made in this session, for scrapes not made through scrape()"""
+        self.uses += 1
+        if classify(result) == OK:
+            self.failures = 0
+        else:
+            self.failures += 1
+
+    async def scrape(self, scrape_config: ScrapeConfig, function: Optional[str] = None) -> ScrapeApiResponse:
+        """scrape a page in this session"""
+        scrape_config.session = self.id
+        try:
+            response = await self.pool.client.async_scrape(scrape_config, function or caller())
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            self.record(e)
+            raise
+        self.record(response)
+        return response
+
+
+class SessionPool:
+    """warm scrapfly sessions leased to one scrape at a time, retired when blocked or stale"""
+
+    def __init__(
+        self,
+        client,
+        warmup: Optional[Callable[[str], ScrapeConfig]] = None,
+        size: int = 4,
+        max_age: Optional[float] = 1800,
+        max_uses: Optional[int] = 200,
+        max_failures: int = 2,
+        warmup_attempts: int = 3,
+    ):
+        """
+        client: the site's SiteClient
+        warmup: config of the page a new session is warmed with given the session id, None to start sessions cold
+        size: sessions in the pool, the most sessioned scrapes running at once
+        max_age: seconds after which a session is retired, None to keep it
+        max_uses: scrapes after which a session is retired, None to keep it
+        max_failures: failed scrapes in a row after which a session is retired as blocked
+        warmup_attempts: warm-ups tried for a session before a lease fails
+        """
+        self.client = client
+        self.warmup = warmup
+        self.size = size
+        self.max_age = max_age
+        self.max_uses = max_uses
+        self.max_failures = max_failures
+        self.warmup_attempts = warmup_attempts
+        self._idle: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.warmed = 0
+        self.warmup_failures = 0
+        self.leases = 0
+        self.retired = {"blocked": 0, "expired": 0}
+
+    def __repr__(self) -> str:
+        return f"<SessionPool {self.client.site.name} size={self.size} warmed={self.warmed} leases={self.leases}>"
+
+    @property
+    def idle(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._idle is None or self._loop is not loop:
+            # queues are bound to their event loop, carry the idle sessions over when a new loop runs (e.g. per test)
+            slots = [] if self._idle is None else [self._idle.get_nowait() for _ in range(self._idle.qsize())]
+            # empty slots are None, a session is warmed for them on lease
+            slots += [None] * (self.size - len(slots))
+            self._idle = asyncio.Queue()
+            self._loop = loop
+            for slot in slots:
+                self._idle.put_nowait(slot)
+        return self._idle
+
+    async def _warm(self) -> Session:
+        session = Session(self, f"{self.client.site.name}-{uuid4().hex[:16]}")
+        if self.warmup is None:
+            return session
+        for attempt in range(1, self.warmup_attempts + 1):
+            try:
+                response = await self.client.async_scrape(self.warmup(session.id), "session_warmup")
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                response = e
+            if classify(response) == OK:
+                self.warmed += 1
+                log.debug(f"warmed session {session.id}")
+                return session
+            self.warmup_failures += 1
+            log.warning(f"warming session {session.id} failed ({attempt}/{self.warmup_attempts}): {response}")
+            # a session blocked during warm-up is unlikely to recover, start over with a new one
+            session = Session(self, f"{self.client.site.name}-{uuid4().hex[:16]}")
+        raise RuntimeError(f"couldn't warm a {self.client.site.name} session in {self.warmup_attempts} attempts")
+
+    def _retire(self, session: Session):
+        reason = "blocked" if not session.healthy else "expired"
+        self.retired[reason] += 1
+        log.info(f"retiring {reason} session {session.id} after {session.uses} scrapes")
+
+    async def warm(self):
+        """warm every empty slot of the pool at once, e.g. before a crawl starts"""
+        slots: List[Optional[Session]] = []
+        while not self.idle.empty():
+            slots.append(self.idle.get_nowait())
+        empty = [i for i, slot in enumerate(slots) if slot is None]
+        try:
+            warmed = await asyncio.gather(*[self._warm() for _ in empty], return_exceptions=True)
+            for i, session in zip(empty, warmed):
+                if isinstance(session, Session):
+                    slots[i] = session
+        finally:
+            for slot in slots:
+                self.idle.put_nowait(slot)
+        errors = [session for session in warmed if isinstance(session, Exception)]
+        for error in errors:
+            if isinstance(error, BudgetExceeded):
+                raise error
+        if errors and len(errors) == len(empty):
+            raise errors[0]
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[Session]:
+        """lease a warm session for the duration of the block"""
+        slot: Optional[Session] = await self.idle.get()
+        try:
+            if slot is not None and slot.expired:
+                self._retire(slot)
+                slot = None
+            if slot is None:
+                slot = await self._warm()
+            self.leases += 1
+            yield slot
+        finally:
+            if slot is not None and not slot.healthy:
+                self._retire(slot)
+                slot = None
+            self.idle.put_nowait(slot)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "warmed": self.warmed,
+            "warmup_failures": self.warmup_failures,
+            "leases": self.leases,
+            "retired": dict(self.retired),
+        }
@@ -0,0 +1,220 @@
+"""
+Query splitting for searches capped by the site.
+
+Most sites stop paginating a search after a fixed number of pages or results
+(idealista 60 pages, walmart 25 pages, zillow 500 results), so a broad query
+only ever returns its first few thousand results. crawl_shards() probes a
+query, and while it reports more results than the cap, recursively splits it
+into narrower queries (price bands, map quadrants, star filters, sort orders)
+that together cover it. Shards under the cap are scraped concurrently as soon
+as they're planned and their results deduplicated:
+
+    async for listing in crawl_shards(
+        (0, 10_000_000),                 # a price band
+        probe=probe_price_band,          # band -> (total results, first page)
+        split=lambda band: split_range(*band),
+        scrape=scrape_price_band,        # Shard -> listings of every page of the band
+        cap=60 * 30,
+        key=lambda listing: listing["id"],
+    ):
+        sink.write(listing)
+
+Splits don't have to partition the query exactly: overlapping shards (e.g. the
+same filter under different sort orders) are merged by `key`. A query over the
+cap that can't be split any further is scraped up to the cap with a warning.
+
+Failed probes are retried. A query that still can't be probed, or a shard that
+fails to scrape, doesn't stop the others, but once the crawl is done the first
+error is raised, so a crawl doesn't quietly return part of the catalog. With
+tolerate_errors=True failures are only logged.
+"""
+import asyncio
+import inspect
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from loguru import logger as log
+
+from .pipeline import Stage, run_pipeline
+
+_DONE = object()
+
+
+class Shard(NamedTuple):
+    """a query under the site's result cap, with the total and first page its probe returned"""
+
+    query: Any
+    total: int
+    page: Any = None
+    depth: int = 0
+
+
+def split_range(low: int, high: int, parts: int = 2, overlap: bool = False) -> List[Tuple[int, int]]:
+    """
+    split an inclusive integer range (e.g. a price band) into `parts` adjacent ranges, [] when it can't be split
+    overlap: adjacent ranges share their boundary, for values between integers like prices with cents
+             which would otherwise fall between two ranges, results on a boundary have to be deduplicated
+    """
+    if overlap:
+        parts = min(parts, high - low)
+        if parts < 2:
+            return []
+        step = (high - low) / parts
+        bounds = [low + round(step * i) for i in range(parts)] + [high]
+        return [(bounds[i], bounds[i + 1]) for i in range(parts)]
+    if high <= low:
+        return []
+    parts = min(parts, high - low + 1)
+    step = (high - low + 1) / parts
+    bounds = [low + round(step * i) for i in range(parts)] + [high + 1]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(parts)]
+
+
+def split_box(box: Dict[str, float], min_size: float = 1e-4) -> List[Dict[str, float]]:
+    """split a {north, east, south, west} map bounding box into 4 quadrants, [] when it's smaller than min_size"""
+    if box["north"] - box["south"] < min_size or box["east"] - box["west"] < min_size:
+        return []
+    middle_lat = (box["north"] + box["south"]) / 2
+    middle_lng = (box["east"] + box["west"]) / 2
+    return [
+        {"north": box["north"], "east": middle_lng, "south": middle_lat, "west": box["west"]},
+        {"north": box["north"], "east": box["east"], "south": middle_lat, "west": middle_lng},
+        {"north": middle_lat, "east": middle_lng, "south": box["south"], "west": box["west"]},
+        {"north": middle_lat, "east": box["east"], "south": box["south"], "west": middle_lng},
+    ]
+
+
+async def plan_shards(
+    query: Any,
+    probe: Callable[[Any], Awaitable[Tuple[int, Any]]],
+    split: Callable[[Any], Iterable[Any]],
+    cap: int,
+    concurrency: Optional[int] = None,
+    max_depth: int = 20,
+    retries: int = 2,
+    tolerate_errors: bool = False,
+) -> AsyncIterator[Shard]:
+    """
+    split a query until every part reports at most `cap` results and yield the parts as they're found
+    probe: coroutine returning the total result count of a query and its first page
+    split: narrower queries covering a query, empty when it can't be split any further
+    concurrency: maximum probes running at once, defaults to 10
+    max_depth: splits deeper than this are scraped up to the cap instead
+    retries: extra attempts of a failed probe
+    tolerate_errors: log queries that couldn't be probed instead of raising the first error once the others are done
+    """
+    errors = []
+    pending: asyncio.Queue = asyncio.Queue()
+    output: asyncio.Queue = asyncio.Queue()
+    pending.put_nowait((query, 0))
+
+    async def work():
+        while True:
+            query, depth = await pending.get()
+            try:
+                for attempt in range(retries + 1):
+                    try:
+                        total, page = await probe(query)
+                        break
+                    except Exception as e:
+                        if attempt == retries:
+                            raise
+                        log.warning(f"failed to probe {query!r:.100}, retrying: {e}")
+                parts = list(split(query)) if total > cap and depth < max_depth else []
+                if parts:
+                    log.debug(f"splitting {query!r:.100} with {total} results into {len(parts)} shards")
+                    for part in parts:
+                        pending.put_nowait((part, depth + 1))
+                else:
+                    if total > cap:
+                        log.warning(f"can't split {query!r:.100} any further, scraping {cap} of its {total} results")
+                    await output.put(Shard(query, total, page, depth))
+            except Exception as e:
+                log.opt(exception=e).error(f"failed to probe {query!r:.100}")
+                errors.append(e)
+            finally:
+                pending.task_done()
+
+    async def finish():
+        await pending.join()
+        await output.put(_DONE)
+
+    tasks = [asyncio.ensure_future(work()) for _ in range(concurrency or 10)]
+    tasks.append(asyncio.ensure_future(finish()))
+    try:
+        while (shard := await output.get()) is not _DONE:
+            yield shard
+        if errors:
+            if not tolerate_errors:
+                raise errors[0]
+            log.warning(f"{len(errors)} queries of {query!r:.100} couldn't be probed, their results are missing")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _items(result: Any) -> AsyncIterator[Any]:
+    if inspect.isawaitable(result):
+        result = await result
+    if hasattr(result, "__aiter__"):
+        async for item in result:
+            yield item
+    else:
+        for item in result or ():
+            yield item
+
+
+async def crawl_shards(
+    query: Any,
+    probe: Callable[[Any], Awaitable[Tuple[int, Any]]],
+    split: Callable[[Any], Iterable[Any]],
+    scrape: Callable[[Shard], Any],
+    cap: int,
+    key: Optional[Callable[[Any], Hashable]] = None,
+    concurrency: int = 5,
+    max_depth: int = 20,
+    retries: int = 2,
+    tolerate_errors: bool = False,
+) -> AsyncIterator[Any]:
+    """
+    scrape every result of a capped search by splitting it into shards under the cap
+    scrape: the results of a shard (a list, an async generator or a coroutine returning a list),
+        shard.page holds the first page the probe already scraped
+    key: identity of a result, results with a key seen before are dropped, results keyed None are always kept
+    concurrency: shards probed and scraped at once, pages within a shard are limited by the site client
+    retries: extra attempts of a failed probe
+    tolerate_errors: log failed probes and shards instead of raising the first error once the crawl is done
+    """
+    seen: Set[Hashable] = set()
+    errors = []
+    shards = duplicates = 0
+
+    async def scrape_shard(shard: Shard) -> AsyncIterator[Any]:
+        nonlocal shards
+        shards += 1
+        try:
+            async for item in _items(scrape(shard)):
+                yield item
+        except Exception as e:
+            errors.append(e)
+            raise
+
+    stage = Stage(scrape_shard, concurrency=concurrency, name="shards")
+    plan = plan_shards(
+        query, probe, split, cap, concurrency=concurrency, max_depth=max_depth, retries=retries,
+        tolerate_errors=tolerate_errors,
+    )
+    try:
+        async for item in run_pipeline(plan, stage):
+            if key is not None:
+                item_key = key(item)
+                if item_key is not None and item_key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(item_key)
+            yield item
+    finally:
+        log.info(
+            f"crawled {shards} shards of {query!r:.100}, {stage.failed} failed, dropped {duplicates} duplicate results"
+        )
+    if errors and not tolerate_errors:
+        raise errors[0]
@@ -0,0 +1,325 @@
+"""
+Streaming JSON lines result files.
+
+Scrapers write each scraped record as one line as soon as it's ready instead
+of re-dumping a growing list, so output cost stays linear and memory flat:
+
+    with JsonlSink(output / "reviews.jsonl.gz") as sink:
+        async for review in scrape_reviews(...):
+            sink.write(review)
+
+Files ending with .gz are gzip compressed and files ending with .zst are
+zstandard compressed (requires the optional zstandard package). Sinks always
+append, so an interrupted run can be resumed by skipping the records already
+returned by read_jsonl().
+
+Flat records with the same fields, like daily prices, are written more
+compactly as CSV rows with a single header by a CsvSink and read back with
+read_csv():
+
+    with CsvSink(output / "prices.csv.gz", ["hotel_id", "date", "price"]) as sink:
+        sink.write({"hotel_id": "123", "date": "2024-06-01", "price": 120.0})
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import IO, Any, AsyncIterable, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from loguru import logger as log
+
+
+def _compression(path: Path) -> Optional[str]:
+    if path.suffix == ".gz":
+        return "gzip"
+    if path.suffix == ".zst":
+        return "zstd"
+    return None
+
+
+def _import_zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(".zst sink files require the zstandard package: pip install zstandard") from e
+    return zstandard
+
+
+def _open_append(path: Path) -> IO[str]:
+    """open a (compressed) text file for appending"""
+    compression = _compression(path)
+    if compression == "gzip":
+        # appending starts a new gzip member which readers handle transparently
+        return gzip.open(path, "at", encoding="utf-8")
+    if compression == "zstd":
+        stream = _import_zstd().ZstdCompressor().stream_writer(open(path, "ab"), closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, "a", encoding="utf-8")
+
+
+def _split_name(path: Path) -> Tuple[str, str]:
+    """split a sink file name into its stem and its format + compression suffixes"""
+    suffixes = "".join(path.suffixes[-2 if _compression(path) else -1 :])
+    return path.name[: len(path.name) - len(suffixes)], suffixes
+
+
+def _parts(path: Path) -> List[Path]:
+    """rotated parts of a sink file followed by the file itself"""
+    stem, suffixes = _split_name(path)
+    parts = sorted(path.parent.glob(f"{stem}.[0-9][0-9][0-9][0-9][0-9]{suffixes}"))
+    return parts + [path] if path.exists() else parts
+
+
+def _decompressor(path: Path):
+    if _compression(path) == "gzip":
+        return zlib.decompressobj(wbits=31)
+    return _import_zstd().ZstdDecompressor().decompressobj()
+
+
+def _raw_chunks(path: Path, size: int = 256 * 1024, state: Optional[Dict] = None) -> Iterator[bytes]:
+    """
+    decompressed content of a sink file, a stream cut short by a crash just ends early instead of raising.
+    state["complete"] is set to whether the last compressed member/frame was fully written
+    """
+    compression = _compression(path)
+    state = state if state is not None else {}
+    with open(path, "rb") as f:
+        if compression is None:
+            while chunk := f.read(size):
+                yield chunk
+            state["complete"] = True
+            return
+        decompressor = _decompressor(path)
+        while chunk := f.read(size):
+            while chunk:
+                yield decompressor.decompress(chunk)
+                # appended writes start a new gzip member / zstd frame
+                chunk = decompressor.unused_data if decompressor.eof else b""
+                if chunk:
+                    decompressor = _decompressor(path)
+        state["complete"] = decompressor.eof
+
+
+def _read_lines(path: Path) -> Iterator[bytes]:
+    """complete lines of a single sink file, a truncated last line is dropped"""
+    rest = b""
+    for chunk in _raw_chunks(path):
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        yield from (line + b"\n" for line in lines)
+    if rest:
+        log.warning(f"ignoring truncated record at the end of {path}")
+
+
+def read_jsonl(path: Union[str, Path]) -> Iterator[Dict]:
+    """read all records of a sink file and its rotated parts, ignoring a truncated end"""
+    for part in _parts(Path(path)):
+        for line in _read_lines(part):
+            yield json.loads(line)
+
+
+def read_csv(path: Union[str, Path]) -> Iterator[Dict[str, str]]:
+    """read all rows of a csv sink file and its rotated parts as dicts of strings, ignoring a truncated end"""
+    for part in _parts(Path(path)):
+        # every part starts with its own header
+        yield from csv.DictReader(line.decode("utf-8") for line in _read_lines(part))
+
+
+class JsonlSink:
+    """append-only JSON lines writer with compression, fsync batching and size based rotation"""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        fsync_every: int = 100,
+        rotate_bytes: Optional[int] = None,
+        default: Callable[[Any], Any] = str,
+    ):
+        """
+        path: output file, .gz or .zst suffix enables compression
+        fsync_every: flush and fsync to disk after this many records
+        rotate_bytes: start a new file once the current one grows past this size
+        default: json.dumps fallback for values that aren't JSON serializable
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every
+        self.rotate_bytes = rotate_bytes
+        self.default = default
+        self.written = 0
+        self._unsynced = 0
+        self._file: Optional[IO[str]] = None
+
+    def __repr__(self) -> str:
+        return f"<JsonlSink {self.path} written={self.written}>"
+
+    def open(self) -> "JsonlSink":
+        if self._file is None:
+            self._repair()
+            self._file = _open_append(self.path)
+        return self
+
+    def _repair(self):
+        """drop a half written end left behind by an interrupted run so appended records stay readable"""
+        if not self.path.exists() or not self.path.stat().st_size:
+            return
+        if _compression(self.path) is None:
+            self._truncate_last_line()
+            return
+        if self._compressed_stream_complete():
+            return
+        # a compressed stream can't be truncated in place, copy the complete records to a fresh file
+        temp = self.path.with_name(self.path.name + ".repair")
+        with open(temp, "wb") as f:
+            writer = zlib.compressobj(wbits=31) if _compression(self.path) == "gzip" else None
+            if writer is None:
+                writer = _import_zstd().ZstdCompressor().compressobj()
+            for line in _read_lines(self.path):
+                f.write(writer.compress(line))
+            f.write(writer.flush())
+        os.replace(temp, self.path)
+        log.warning(f"recovered complete records of interrupted {self.path}")
+
+    def _compressed_stream_complete(self) -> bool:
+        state = {}
+        for _ in _raw_chunks(self.path, state=state):
+            pass
+        return state["complete"]
+
+    def _truncate_last_line(self):
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # walk back to the previous newline
+            position = size
+            while position > 0:
+                step = min(64 * 1024, position)
+                position -= step
+                f.seek(position)
+                index = f.read(step).rfind(b"\n")
+                if index != -1:
+                    f.truncate(position + index + 1)
+                    break
+            else:
+                f.truncate(0)
+        log.warning(f"removed truncated record at the end of {self.path}")
+
+    def write(self, record: Any):
+        """write a single record as one JSON line"""
+        if self._file is None:
+            self.open()
+        self._file.write(self._encode(record))
+        self.written += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+            if self.rotate_bytes and self.path.stat().st_size >= self.rotate_bytes:
+                self.rotate()
+
+    def _encode(self, record: Any) -> str:
+        return json.dumps(record, ensure_ascii=False, default=self.default) + "\n"
+
+    def write_many(self, records: Iterable[Any]):
+        for record in records:
+            self.write(record)
+
+    async def consume(self, records: AsyncIterable[Any]) -> int:
+        """write every record yielded by an async generator, returns number of records written"""
+        written = self.written
+        async for record in records:
+            self.write(record)
+        return self.written - written
+
+    def sync(self):
+        """flush buffered records to disk"""
+        if self._file is None:
+            return
+        self._file.flush()
+        try:
+            os.fsync(self._file.fileno())
+        except (AttributeError, OSError):
+            # compressed streams don't always expose the underlying descriptor
+            pass
+        self._unsynced = 0
+
+    def rotate(self):
+        """close the current file under the next numbered part name and start a new one"""
+        self.close()
+        if not self.path.exists():
+            return
+        stem, suffixes = _split_name(self.path)
+        index = len(_parts(self.path))
+        target = self.path.with_name(f"{stem}.{index:05d}{suffixes}")
+        os.replace(self.path, target)
+        log.debug(f"rotated {self.path} to {target}")
+
+    def close(self):
+        if self._file is None:
+            return
+        self.sync()
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> "JsonlSink":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def keys(self, key: Callable[[Dict], Any]) -> Set[Any]:
+        """keys of records already written, used to skip finished items when resuming"""
+        return {key(record) for record in read_jsonl(self.path)}
+
+
+class CsvSink(JsonlSink):
+    """append-only CSV writer of rows with fixed columns, a compact table of flat records"""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        columns: Iterable[str],
+        fsync_every: int = 1000,
+        rotate_bytes: Optional[int] = None,
+    ):
+        """
+        path: output file, .gz or .zst suffix enables compression
+        columns: column names, written as the header of every file
+        fsync_every: flush and fsync to disk after this many rows
+        rotate_bytes: start a new file once the current one grows past this size
+        """
+        super().__init__(path, fsync_every=fsync_every, rotate_bytes=rotate_bytes)
+        self.columns = list(columns)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+
+    def __repr__(self) -> str:
+        return f"<CsvSink {self.path} written={self.written}>"
+
+    def open(self) -> "CsvSink":
+        if self._file is None:
+            new = not self.path.exists() or not self.path.stat().st_size
+            super().open()
+            if new:
+                self._file.write(self._row(self.columns))
+        return self
+
+    def _row(self, values: Iterable[Any]) -> str:
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._writer.writerow(values)
+        return self._buffer.getvalue()
+
+    def _encode(self, record: Any) -> str:
+        """a row from a dict of columns or a sequence of values in column order, missing values are left empty"""
+        if isinstance(record, dict):
+            record = [record.get(column) for column in self.columns]
+        return self._row(record)
+
+    def keys(self, key: Callable[[Dict], Any]) -> Set[Any]:
+        """keys of rows already written, used to skip finished items when resuming"""
+        return {key(row) for row in read_csv(self.path)}
@@ -0,0 +1,159 @@
+"""
+Streaming sitemap discovery.
+
+crawl_sitemaps() fetches sitemap shards concurrently through a site client and
+yields their urls as each shard arrives, following sitemap indexes to the
+shards they list:
+
+    async for entry in crawl_sitemaps(SCRAPFLY, [index_url], BASE_CONFIG, follow="organizations", since=week_ago):
+        print(entry.loc, entry.lastmod)
+
+Shards are decompressed (when gzipped) and parsed incrementally with lxml's
+iterparse, every <url> element is dropped as soon as it's read, so parsing a
+50 MB shard takes a few hundred KB instead of the decompressed text plus a full
+DOM. Entries whose <lastmod> is older than `since` are skipped while streaming,
+and so are index entries pointing at shards not modified since then.
+"""
+import asyncio
+import gzip
+import io
+from functools import lru_cache
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Union
+
+from loguru import logger as log
+from lxml import etree
+from scrapfly import ScrapeConfig
+
+_GZIP_MAGIC = b"\x1f\x8b"
+# hand control back to the event loop every so many entries, large shards parse for a while
+_YIELD_EVERY = 1000
+
+
+class SitemapEntry(NamedTuple):
+    """a <url> of a sitemap, or a <sitemap> of a sitemap index when sitemap is True"""
+
+    loc: str
+    lastmod: Optional[datetime] = None
+    sitemap: bool = False
+
+
+# shards share a handful of distinct lastmod values, most are parsed only once
+@lru_cache(maxsize=4096)
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """W3C datetime of a <lastmod> as a naive UTC datetime"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _stream(content: Union[str, bytes, io.IOBase]) -> io.IOBase:
+    """binary stream of a sitemap body, gzipped bodies are decompressed as they're read"""
+    if isinstance(content, str):
+        stream = io.BytesIO(content.encode("utf-8"))
+    elif isinstance(content, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(content)
+    else:
+        # scrapfly returns binary bodies as BytesIO which the caller may have read already
+        stream = content
+        stream.seek(0)
+    magic = stream.read(2)
+    stream.seek(0)
+    return gzip.GzipFile(fileobj=stream) if magic == _GZIP_MAGIC else stream
+
+
+def iter_sitemap(content: Union[str, bytes, io.IOBase], since: Optional[datetime] = None) -> Iterator[SitemapEntry]:
+    """
+    stream the entries of a sitemap or sitemap index body (plain or gzipped xml)
+    since: skip entries with a lastmod older than this, naive datetimes are taken as UTC
+    """
+    since = parse_lastmod(since.isoformat()) if since else None
+    context = etree.iterparse(_stream(content), events=("end",), tag=("{*}url", "{*}sitemap"), huge_tree=True)
+    for _, element in context:
+        loc = lastmod = None
+        for child in element:
+            tag = child.tag
+            if not isinstance(tag, str):
+                continue
+            # tags are "{namespace}loc", comparing the ends is much cheaper than QName lookups
+            if tag == "loc" or tag.endswith("}loc"):
+                loc = child.text
+            elif tag == "lastmod" or tag.endswith("}lastmod"):
+                lastmod = child.text
+        is_index = element.tag.endswith("sitemap")
+        # drop the element and the already processed siblings before it to keep memory flat
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+        if not loc or not (loc := loc.strip()):
+            continue
+        lastmod = parse_lastmod(lastmod)
+        if since and lastmod and lastmod < since:
+            continue
+        yield SitemapEntry(loc, lastmod, is_index)
+
+
+def _matcher(follow: Union[str, Callable[[SitemapEntry], bool], None]) -> Callable[[SitemapEntry], bool]:
+    if follow is None:
+        return lambda entry: True
+    if isinstance(follow, str):
+        return lambda entry: follow in entry.loc
+    return follow
+
+
+async def crawl_sitemaps(
+    client: Any,
+    urls: Iterable[str],
+    config: Optional[Dict] = None,
+    follow: Union[str, Callable[[SitemapEntry], bool], None] = None,
+    since: Optional[datetime] = None,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[SitemapEntry]:
+    """
+    fetch sitemaps and the shards of sitemap indexes concurrently and yield their url entries as they're parsed
+    client: the site client (get_client()) to scrape with
+    config: scrape options of every sitemap request, e.g. the site's BASE_CONFIG
+    follow: substring or predicate an index entry has to match to be fetched, all are followed by default
+    since: skip urls (and shards) last modified before this
+    concurrency: maximum shards fetched at once, defaults to the site's limit
+    """
+    config = config or {}
+    matches = _matcher(follow)
+    pending = list(urls)
+    seen = set(pending)
+    while pending:
+        shards, pending = pending, []
+        responses = client.concurrent_scrape([ScrapeConfig(url, **config) for url in shards], concurrency=concurrency)
+        async for response in responses:
+            if isinstance(response, Exception):
+                log.error(f"failed to scrape sitemap: {response}")
+                continue
+            url = response.context["url"]
+            if response.upstream_status_code and response.upstream_status_code >= 400:
+                log.error(f"failed to scrape sitemap {url}: status {response.upstream_status_code}")
+                continue
+            found = followed = 0
+            try:
+                for index, entry in enumerate(iter_sitemap(response.content, since=since)):
+                    if index % _YIELD_EVERY == _YIELD_EVERY - 1:
+                        await asyncio.sleep(0)
+                    if not entry.sitemap:
+                        found += 1
+                        yield entry
+                    elif entry.loc not in seen and matches(entry):
+                        seen.add(entry.loc)
+                        pending.append(entry.loc)
+                        followed += 1
+            except etree.XMLSyntaxError as e:
+                # the entries before the error were already yielded
+                log.error(f"malformed sitemap {url}: {e}")
+            log.info(f"parsed sitemap {url}: {found} urls, {followed} sitemaps to follow")
@@ -0,0 +1,302 @@
+"""
+Incremental change tracking of feeds and sitemaps.
+
+A ChangeTracker polls a source listing urls with a version (an RSS pubDate, a
+sitemap lastmod) and only scrapes the urls that are new or whose version
+changed since they were last scraped. The last scraped version of every url is
+kept in a SQLite VersionStore, as a 64-bit hash of the url, so tracking
+survives restarts and millions of urls take tens of MB:
+
+    tracker = ChangeTracker(output / "feed.db", "rss-price-ca", poll=lambda since: scrape_feed(url), scrape=scrape_property)
+    with JsonlSink(output / "properties.jsonl") as sink:
+        await tracker.track(sink.write, interval=60)
+
+poll(since) returns a {url: version} dict or yields (url, version) pairs (e.g.
+crawl_sitemaps() entries). `since` is when the previous poll started, minus an
+overlap for coarse lastmod dates, so sources that can filter by modification
+time (sitemaps) only list what may have changed. Changed urls are scraped with
+bounded concurrency while the source is still being polled, and a url is only
+recorded once its scrape succeeded. Failed urls are kept in a retry table and
+scraped again on every following poll whatever `since` lists, until they
+succeed or fail `max_retries` times. A dead page then drops out until it's
+listed with a new version, so it doesn't hold up `since` or get retried forever.
+"""
+import asyncio
+import hashlib
+import inspect
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from loguru import logger as log
+
+from .pipeline import Stage, run_pipeline
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    source TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (source, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS polls (
+    source TEXT PRIMARY KEY,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS retries (
+    source TEXT NOT NULL,
+    url TEXT NOT NULL,
+    version TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    PRIMARY KEY (source, url)
+) WITHOUT ROWID;
+"""
+
+# keys looked up per query, below sqlite's bound parameter limit
+_BATCH = 500
+
+
+def _hash(key: str) -> int:
+    """compact 64-bit id of a tracked key"""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def _version(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class VersionStore:
+    """SQLite store of the last scraped version of every tracked key"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+        self.db.commit()
+
+    def __repr__(self) -> str:
+        return f"<VersionStore {self.path}>"
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self) -> "VersionStore":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def changed(self, source: str, items: Dict[str, Any]) -> Dict[str, str]:
+        """the items whose version differs from the stored one, or that were never stored"""
+        items = {key: _version(version) for key, version in items.items()}
+        hashes = {_hash(key): key for key in items}
+        stored = {}
+        ids = list(hashes)
+        for start in range(0, len(ids), _BATCH):
+            batch = ids[start : start + _BATCH]
+            rows = self.db.execute(
+                f"SELECT key, version FROM versions WHERE source = ? AND key IN ({','.join('?' * len(batch))})",
+                (source, *batch),
+            )
+            stored.update(rows)
+        return {key: version for hashed, key in hashes.items() if stored.get(hashed) != (version := items[key])}
+
+    def mark(self, source: str, items: Iterable[Tuple[str, Any]], commit: bool = True):
+        """store the scraped versions of keys"""
+        self.db.executemany(
+            """
+            INSERT INTO versions (source, key, version) VALUES (?, ?, ?)
+            ON CONFLICT (source, key) DO UPDATE SET version = excluded.version
+            """,
+            ((source, _hash(key), _version(version)) for key, version in items),
+        )
+        if commit:
+            self.db.commit()
+
+    def count(self, source: str) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM versions WHERE source = ?", (source,)).fetchone()[0]
+
+    def last_poll(self, source: str) -> Optional[datetime]:
+        """when the last completed poll of a source started, as naive UTC"""
+        row = self.db.execute("SELECT started_at FROM polls WHERE source = ?", (source,)).fetchone()
+        return datetime.fromtimestamp(row[0], timezone.utc).replace(tzinfo=None) if row else None
+
+    def mark_poll(self, source: str, started_at: float):
+        self.db.execute(
+            "INSERT INTO polls (source, started_at) VALUES (?, ?) "
+            "ON CONFLICT (source) DO UPDATE SET started_at = excluded.started_at",
+            (source, started_at),
+        )
+        self.db.commit()
+
+    def failed(self, source: str) -> Dict[str, Tuple[str, int]]:
+        """the {url: (version, failed attempts)} of a source's failed scrapes"""
+        rows = self.db.execute("SELECT url, version, attempts FROM retries WHERE source = ?", (source,))
+        return {url: (version, attempts) for url, version, attempts in rows}
+
+    def mark_failed(self, source: str, url: str, version: Any) -> int:
+        """count a failed scrape of a url's version and return the count, it starts over when the version changes"""
+        version = _version(version)
+        self.db.execute(
+            """
+            INSERT INTO retries (source, url, version, attempts) VALUES (?, ?, ?, 1)
+            ON CONFLICT (source, url) DO UPDATE SET
+                attempts = CASE WHEN version = excluded.version THEN attempts + 1 ELSE 1 END,
+                version = excluded.version
+            """,
+            (source, url, version),
+        )
+        attempts = self.db.execute(
+            "SELECT attempts FROM retries WHERE source = ? AND url = ?", (source, url)
+        ).fetchone()[0]
+        self.db.commit()
+        return attempts
+
+    def clear_failed(self, source: str, url: str, commit: bool = True):
+        self.db.execute("DELETE FROM retries WHERE source = ? AND url = ?", (source, url))
+        if commit:
+            self.db.commit()
+
+    def forget(self, source: Optional[str] = None):
+        """forget the scraped versions of a source (or of every source) so everything is scraped again"""
+        for table in ("versions", "polls", "retries"):
+            if source is None:
+                self.db.execute(f"DELETE FROM {table}")
+            else:
+                self.db.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+        self.db.commit()
+
+
+Poll = Callable[[Optional[datetime]], Any]
+
+
+class ChangeTracker:
+    """scrape only the new and changed urls of a polled feed or sitemap"""
+
+    def __init__(
+        self,
+        store: Union[str, Path, VersionStore],
+        source: str,
+        poll: Poll,
+        scrape: Callable[[str], Awaitable[Any]],
+        concurrency: int = 10,
+        overlap: timedelta = timedelta(days=1),
+        max_retries: int = 5,
+    ):
+        """
+        store: VersionStore or the path of its SQLite file, several trackers can share one
+        source: name the versions of this source are stored under
+        poll: poll(since) returning {url: version}, or an async iterable of (url, version, ...) tuples
+        scrape: coroutine scraping a single url
+        concurrency: maximum scrapes running at once
+        overlap: how much earlier than the previous poll `since` is set, for lastmod values with date precision
+        max_retries: failed scrapes of a url's version before it's given up until it's listed with a new version
+        """
+        self.store = store if isinstance(store, VersionStore) else VersionStore(store)
+        self.source = source
+        self.poll = poll
+        self.scrape = scrape
+        self.concurrency = concurrency
+        self.overlap = overlap
+        self.max_retries = max_retries
+        self.polls = 0
+        self.listed = 0
+        self.scraped = 0
+
+    def __repr__(self) -> str:
+        return f"<ChangeTracker {self.source} polls={self.polls} scraped={self.scraped}>"
+
+    async def _listing(self, since: Optional[datetime]) -> AsyncIterator[Tuple[str, Any]]:
+        listing = self.poll(since)
+        if inspect.isawaitable(listing):
+            listing = await listing
+        if isinstance(listing, dict):
+            for item in listing.items():
+                yield item
+            return
+        if hasattr(listing, "__aiter__"):
+            async for item in listing:
+                yield item[0], item[1]
+            return
+        for item in listing or ():
+            yield item[0], item[1]
+
+    async def _changed(self, since: Optional[datetime], failed: Dict[str, str]) -> AsyncIterator[Tuple[str, str]]:
+        """
+        the failed urls to retry, then the changed urls of the source looked up in batches as the listing streams in,
+        failed urls listed with the same version aren't scraped twice
+        """
+        for key, (version, attempts) in failed.items():
+            if attempts < self.max_retries:
+                yield key, version
+        batch: Dict[str, Any] = {}
+        async for key, version in self._listing(since):
+            self.listed += 1
+            batch[key] = version
+            if len(batch) >= _BATCH:
+                for key, version in self.store.changed(self.source, batch).items():
+                    if key not in failed or failed[key][0] != version:
+                        yield key, version
+                batch = {}
+        for key, version in self.store.changed(self.source, batch).items():
+            if key not in failed or failed[key][0] != version:
+                yield key, version
+
+    async def _scrape(self, item: Tuple[str, str], failed: Dict[str, Tuple[str, int]]) -> Any:
+        key, version = item
+        try:
+            result = await self.scrape(key)
+        except Exception:
+            attempts = self.store.mark_failed(self.source, key, version)
+            if attempts >= self.max_retries:
+                log.warning(f"{self.source}: giving up on {key} after {attempts} failed scrapes")
+            raise
+        # the version is stored only now, failed scrapes are retried by the next polls
+        self.store.mark(self.source, [(key, version)], commit=False)
+        if key in failed:
+            self.store.clear_failed(self.source, key, commit=False)
+        self.scraped += 1
+        if self.scraped % 100 == 0:
+            self.store.db.commit()
+        return result
+
+    async def check(self) -> AsyncIterator[Any]:
+        """poll the source once and yield the scrape results of its new and changed urls"""
+        started = time.time()
+        last_poll = self.store.last_poll(self.source)
+        since = last_poll - self.overlap if last_poll else None
+        scraped = self.scraped
+        failed = self.store.failed(self.source)
+        stage = Stage(lambda item: self._scrape(item, failed), concurrency=self.concurrency, name=self.source)
+        try:
+            async for result in run_pipeline(self._changed(since, failed), stage):
+                yield result
+        finally:
+            self.store.db.commit()
+        self.polls += 1
+        # failed urls are in the retry table, so the next poll can start listing from this one
+        self.store.mark_poll(self.source, started)
+        if stage.failed:
+            log.warning(f"{self.source}: poll {self.polls} failed to scrape {stage.failed} urls, retrying them next poll")
+        log.info(f"{self.source}: poll {self.polls} scraped {self.scraped - scraped} new or changed urls")
+
+    async def track(self, write: Callable[[Any], Any], interval: float = 60, polls: Optional[int] = None):
+        """poll the source every `interval` seconds (forever, or `polls` times) and write every scraped result"""
+        count = 0
+        while polls is None or count < polls:
+            started = time.monotonic()
+            async for result in self.check():
+                write(result)
+            count += 1
+            if polls is not None and count >= polls:
+                break
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
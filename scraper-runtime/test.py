@@ -0,0 +1,1246 @@
+import asyncio
+import contextlib
+import gzip
+import json
+import time
+from datetime import datetime
+
+import jmespath
+import pytest
+from requests import Response
+from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient
+from scrapfly.errors import ApiHttpClientError
+
+import scraper_runtime
+from scraper_runtime import (
+    ApolloGraph,
+    BudgetExceeded,
+    CacheMissError,
+    ChangeTracker,
+    Checkpoint,
+    ConcurrencyLimiter,
+    CostLedger,
+    CsvSink,
+    Downgrade,
+    EscalationFailed,
+    EscalationLadder,
+    GraphNode,
+    GraphQLBatcher,
+    GraphQLError,
+    HiddenData,
+    JsonlSink,
+    MockScrapflyApi,
+    PageResponse,
+    ParseExecutor,
+    ResponseCache,
+    SessionPool,
+    Shard,
+    SiteConfig,
+    Stage,
+    VersionStore,
+    compile_query,
+    crawl_shards,
+    crawl_sitemaps,
+    fan_out,
+    find_json_object,
+    find_json_objects,
+    fingerprint,
+    get_client,
+    iter_sitemap,
+    load_job_file,
+    metrics,
+    paginate,
+    paginate_many,
+    parse_responses,
+    query,
+    read_csv,
+    read_jsonl,
+    run_jobs,
+    run_pipeline,
+    site_config,
+    split_box,
+    split_range,
+)
+
+
+def make_response(
+    scrape_config: ScrapeConfig, content: str = "<html></html>", status_code: int = 200
+) -> ScrapeApiResponse:
+    """build a ScrapeApiResponse the way the scrapfly API would return it"""
+    response = Response()
+    response.status_code = 200
+    api_result = {
+        "config": {"url": scrape_config.url, "method": scrape_config.method, "headers": {}},
+        "context": {"url": scrape_config.url},
+        "result": {
+            "success": status_code < 400,
+            "status_code": status_code,
+            "reason": "OK" if status_code < 400 else "Error",
+            "format": "text",
+            "content": content,
+            "request_headers": {},
+            "response_headers": {"content-type": "text/html"},
+        },
+    }
+    return ScrapeApiResponse(request=None, response=response, scrape_config=scrape_config, api_result=api_result)
+
+
+class FakeScrapflyClient:
+    """stand-in for ScrapflyClient that records how many scrapes run at once"""
+
+    max_concurrency = 1
+
+    def __init__(self, delay: float = 0.01):
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+        self.scraped = []
+
+    async def async_scrape(self, scrape_config: ScrapeConfig):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if "fail" in scrape_config.url:
+                raise ValueError(scrape_config.url)
+            self.scraped.append(scrape_config.url)
+            return scrape_config.url
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def fake_client():
+    client = FakeScrapflyClient()
+    scraper_runtime.configure(max_concurrency=4, client=client)
+    return client
+
+
+def test_site_config_behaves_as_base_config():
+    config = site_config("test-site", {"asp": True, "country": "US"}, max_concurrency=2)
+    config["cache"] = True
+    assert isinstance(config, SiteConfig)
+    assert ScrapeConfig("https://example.com", **config).cache is True
+    assert config.max_concurrency == 2
+    # re-registering keeps the same object so module references stay valid
+    assert site_config("test-site", {"asp": False}) is config
+    assert config == {"asp": False}
+
+
+@pytest.mark.asyncio
+async def test_limiter_resize_wakes_waiters():
+    limiter = ConcurrencyLimiter(1, name="test")
+    await limiter.acquire()
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    limiter.limit = 2
+    await asyncio.wait_for(waiter, 1)
+    assert limiter.in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_scrape_respects_site_limit(fake_client):
+    site_config("limited-site", max_concurrency=2)
+    client = get_client("limited-site")
+    configs = [ScrapeConfig(f"https://example.com/{i}") for i in range(10)]
+    results = [result async for result in client.concurrent_scrape(configs)]
+    assert sorted(results) == sorted(config.url for config in configs)
+    assert fake_client.peak == 2
+    # unlike ScrapflyClient.concurrent_scrape the given list is not consumed
+    assert len(configs) == 10
+
+
+@pytest.mark.asyncio
+async def test_sites_share_global_budget(fake_client):
+    first = get_client(site_config("first-site", max_concurrency=4).name)
+    second = get_client(site_config("second-site", max_concurrency=4).name)
+
+    async def scrape_all(client, prefix):
+        configs = [ScrapeConfig(f"https://{prefix}.com/{i}") for i in range(8)]
+        return [result async for result in client.concurrent_scrape(configs)]
+
+    await asyncio.gather(scrape_all(first, "first"), scrape_all(second, "second"))
+    assert len(fake_client.scraped) == 16
+    assert fake_client.peak == 4
+
+
+@pytest.mark.asyncio
+async def test_concurrent_scrape_yields_errors(fake_client):
+    client = get_client("error-site")
+    configs = [ScrapeConfig("https://example.com/ok"), ScrapeConfig("https://example.com/fail")]
+    results = [result async for result in client.concurrent_scrape(configs)]
+    assert len(results) == 2
+    assert any(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_adaptive_concurrency_backs_off_and_recovers():
+    class ThrottlingClient(FakeScrapflyClient):
+        async def async_scrape(self, scrape_config):
+            await super().async_scrape(scrape_config)
+            return make_response(scrape_config, status_code=429 if "throttle" in scrape_config.url else 200)
+
+    client = ThrottlingClient()
+    scraper_runtime.configure(max_concurrency=10, client=client)
+    site = get_client(site_config("adaptive-site", max_concurrency=8).name)
+    # the simulated latency is too short to tell a gc pause from congestion
+    site.site.controller.latency_tolerance = None
+
+    throttled = [ScrapeConfig(f"https://example.com/throttle/{i}") for i in range(8)]
+    [response async for response in site.concurrent_scrape(throttled)]
+    # requests that were already in flight don't cut the limit again
+    assert site.site.controller.limit == 4
+    assert metrics()["adaptive-site"]["throttled"] == 8
+
+    healthy = [ScrapeConfig(f"https://example.com/ok/{i}") for i in range(40)]
+    [response async for response in site.concurrent_scrape(healthy)]
+    # one slot is added back after every full window of healthy responses
+    assert site.site.controller.limit == 8
+    assert metrics()["adaptive-site"]["increases"] == 4
+    # target throttling is a site problem, the global budget stays untouched
+    assert metrics()["global"]["limit"] == 10
+
+
+def test_fingerprint_ignores_volatile_options():
+    first = ScrapeConfig("https://example.com/search?b=2&a=1", asp=True, session="one", cache=True)
+    second = ScrapeConfig("https://EXAMPLE.com/search?a=1&b=2", asp=True, session="two")
+    assert fingerprint(first) == fingerprint(second)
+    assert fingerprint(first) != fingerprint(ScrapeConfig("https://example.com/search?a=1&b=2", render_js=True))
+
+
+def test_response_cache_replay(tmp_path):
+    cache = ResponseCache(tmp_path)
+    config = ScrapeConfig("https://example.com/product/1", asp=True)
+    assert cache.get(config) is None
+    assert cache.put(make_response(config, "<h1>product</h1>"))
+    replayed = cache.get(ScrapeConfig("https://example.com/product/1", asp=True))
+    assert replayed.selector.css("h1::text").get() == "product"
+    assert replayed.context["url"] == config.url
+    parsed = dict(cache.replay(lambda response: response.selector.css("h1::text").get(), match="/product/"))
+    assert parsed == {config.url: "product"}
+
+
+def test_response_cache_ttl_and_eviction(tmp_path):
+    cache = ResponseCache(tmp_path, ttl=60)
+    config = ScrapeConfig("https://example.com/stale")
+    cache.put(make_response(config))
+    file = next(tmp_path.glob("*/*.json.gz"))
+    assert cache.get(config) is not None
+    cache.ttl = -1
+    assert cache.get(config) is None
+    assert not file.exists()
+
+    cache = ResponseCache(tmp_path, max_size=3000)
+    for i in range(10):
+        cache.put(make_response(ScrapeConfig(f"https://example.com/{i}"), "x" * 1000 + str(time.time())))
+    assert cache.size <= 3000
+    # the latest response survives eviction
+    assert cache.get(ScrapeConfig("https://example.com/9")) is not None
+
+
+@pytest.mark.asyncio
+async def test_runtime_records_and_replays(tmp_path):
+    class RecordingClient(FakeScrapflyClient):
+        async def async_scrape(self, scrape_config):
+            await super().async_scrape(scrape_config)
+            return make_response(scrape_config, "<p>live</p>")
+
+    client = RecordingClient()
+    scraper_runtime.configure(max_concurrency=2, client=client, cache=ResponseCache(tmp_path))
+    site = get_client("cached-site")
+    await site.async_scrape(ScrapeConfig("https://example.com/page"))
+    response = await site.async_scrape(ScrapeConfig("https://example.com/page"))
+    assert response.content == "<p>live</p>"
+    assert len(client.scraped) == 1
+
+    scraper_runtime.configure(max_concurrency=2, client=client, cache=ResponseCache(tmp_path, offline=True))
+    assert (await site.async_scrape(ScrapeConfig("https://example.com/page"))).content == "<p>live</p>"
+    with pytest.raises(CacheMissError):
+        await site.async_scrape(ScrapeConfig("https://example.com/other"))
+
+
+@pytest.mark.parametrize("name", ["results.jsonl", "results.jsonl.gz"])
+def test_jsonl_sink_resumes_after_interrupted_run(tmp_path, name):
+    path = tmp_path / name
+    with JsonlSink(path, fsync_every=2) as sink:
+        sink.write_many({"id": i} for i in range(5))
+    # simulate a crash in the middle of writing the last record
+    data = path.read_bytes()
+    path.write_bytes(data[:-30])
+    recovered = [record["id"] for record in read_jsonl(path)]
+    assert recovered == list(range(len(recovered))) and len(recovered) < 5
+
+    with JsonlSink(path) as sink:
+        done = sink.keys(lambda record: record["id"])
+        sink.write_many({"id": i} for i in range(5) if i not in done)
+    assert [record["id"] for record in read_jsonl(path)] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_jsonl_sink_rotation(tmp_path):
+    async def records():
+        for i in range(100):
+            yield {"id": i, "text": "review " * 10}
+
+    path = tmp_path / "reviews.jsonl"
+    with JsonlSink(path, fsync_every=10, rotate_bytes=2000) as sink:
+        assert await sink.consume(records()) == 100
+    assert len(list(tmp_path.glob("reviews.*.jsonl"))) > 1
+    assert [record["id"] for record in read_jsonl(path)] == list(range(100))
+
+
+@pytest.mark.parametrize("name", ["prices.csv", "prices.csv.gz"])
+def test_csv_sink_writes_one_header_per_file_and_resumes(tmp_path, name):
+    path = tmp_path / name
+    columns = ["hotel_id", "date", "price"]
+    with CsvSink(path, columns, rotate_bytes=60, fsync_every=2) as sink:
+        sink.write({"hotel_id": "1", "date": "2024-06-01", "price": 120.5})
+        sink.write(["1", "2024-06-02", None])
+        sink.write_many({"hotel_id": "2", "date": f"2024-06-0{day}"} for day in range(1, 5))
+    rows = list(read_csv(path))
+    assert rows[:2] == [
+        {"hotel_id": "1", "date": "2024-06-01", "price": "120.5"},
+        {"hotel_id": "1", "date": "2024-06-02", "price": ""},
+    ]
+    assert len(rows) == 6 and len(list(tmp_path.glob("prices.*"))) > 1
+
+    # appending to an existing file doesn't repeat the header
+    with CsvSink(path, columns) as sink:
+        assert sink.keys(lambda row: row["hotel_id"]) == {"1", "2"}
+        sink.write({"hotel_id": "3", "date": "2024-06-01", "price": 99})
+    assert list(read_csv(path))[-1] == {"hotel_id": "3", "date": "2024-06-01", "price": "99"}
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_resumes_stage(tmp_path):
+    calls = []
+
+    async def scrape(item):
+        calls.append(item)
+        if item == 3 and calls.count(3) == 1:
+            raise ValueError("blocked")
+        return {"item": item}
+
+    with Checkpoint(tmp_path / "crawl.db") as checkpoint:
+        results = await checkpoint.run_stage("products", range(5), key=str, scrape=scrape, concurrency=2)
+        assert [result["item"] for result in results] == [0, 1, 2, 4]
+        assert list(checkpoint.failed("products")) == ["3"]
+
+    # a new run only scrapes what failed or never finished
+    with Checkpoint(tmp_path / "crawl.db") as checkpoint:
+        results = await checkpoint.run_stage("products", range(5), key=str, scrape=scrape)
+        assert [result["item"] for result in results] == [0, 1, 2, 3, 4]
+        assert checkpoint.failed("products") == {}
+    assert sorted(calls) == [0, 1, 2, 3, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_overlaps_stages():
+    events = []
+
+    async def search(query):
+        for page in range(3):
+            await asyncio.sleep(0.02)
+            events.append(f"search {query} page {page}")
+            yield f"{query}-{page}"
+
+    async def product(listing):
+        if listing == "b-1":
+            raise ValueError("blocked")
+        await asyncio.sleep(0.01)
+        events.append(f"product {listing}")
+        return {"listing": listing}
+
+    results = [
+        result
+        async for result in run_pipeline(
+            ["a", "b"], Stage(search, name="search"), Stage(product, concurrency=3, name="products")
+        )
+    ]
+    assert sorted(result["listing"] for result in results) == ["a-0", "a-1", "a-2", "b-0", "b-2"]
+    # products are scraped while later search pages are still being fetched
+    assert events.index("product a-0") < events.index("search b page 2")
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+def test_find_json_objects(backend):
+    pytest.importorskip(backend)
+    script = (
+        "function track(e) { if (e) { return {id: 1}; } }\n"
+        'var $c = {"tracking": [{"event": 1}]}; '
+        '$vi.push({"other": {"a": 1}, "MSKU": {"variationsMap": {"1": {"title": "Montr\u00e9al %s"}}}});'
+        % ("x" * 10000)
+    )
+    objects = list(find_json_objects(script, backend=backend))
+    assert [list(data) for data in objects] == [["tracking"], ["other", "MSKU"]]
+    # only the object owning the key is decoded, the key inside a string value doesn't match
+    assert find_json_object(script, "MSKU", backend=backend) == objects[1]
+    assert list(find_json_objects(script, keys=["a", "event"], backend=backend)) == [{"event": 1}, {"a": 1}]
+    assert find_json_object('{"text": "\\"MSKU\\": 1"}', "MSKU", backend=backend) is None
+
+
+def test_hidden_data_decodes_requested_blobs():
+    html = """<html><head>
+    <script src="/app.js"></script>
+    <script id="__NEXT_DATA__" type="application/json"> {"props": {"pageProps": {"id": 1}}}</script>
+    <script>window.__INITIAL_STATE__={"ad": undefined, "text": "undefined"};</script>
+    <script>window.__APP_DATA__ = {"layout": {"data": 1}}
+    window.__APP_META__ = {"version": 2}</script>
+    <script>window.mosaic.providerData["mosaic-provider-jobcards"]={"metaData": {}};</script>
+    <script>window.appCache={"apolloState": {"ROOT_QUERY": {"jobs": []}}};</script>
+    </head><body></body></html>"""
+    hidden = HiddenData(html)
+    assert hidden.names() == [
+        "__NEXT_DATA__",
+        "__INITIAL_STATE__",
+        "__APP_DATA__",
+        "__APP_META__",
+        'mosaic.providerData["mosaic-provider-jobcards"]',
+        "appCache",
+        "apolloState",
+    ]
+    assert hidden.get("__NEXT_DATA__") == {"props": {"pageProps": {"id": 1}}}
+    # javascript undefined values become null, strings are left alone
+    assert hidden["__INITIAL_STATE__"] == {"ad": None, "text": "undefined"}
+    assert hidden.get("__APP_DATA__") == {"layout": {"data": 1}}
+    assert hidden.first("__NUXT__", "apolloState") == {"ROOT_QUERY": {"jobs": []}}
+    assert hidden.get("missing") is None
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        """{id: id, text: legacy.full_text, media: legacy.entities.media[].media_url_https, views: views.count}""",
+        "comments[*].{text: text, user: user.nickname}",
+        "comments[0].user | nickname",
+        "comments[?digg_count > `1`].cid",
+        "comments[?user.nickname == 'b' || !author_pin].cid",
+        "legacy.*",
+        "[id, missing.field]",
+        "comments[:2].cid",
+    ],
+)
+def test_query_matches_jmespath(expression):
+    data = {
+        "id": "1",
+        "legacy": {"full_text": "hello", "entities": {"media": [{"media_url_https": "a.jpg"}, {"other": 1}]}},
+        "views": None,
+        "comments": [
+            {"cid": "1", "digg_count": 0, "author_pin": True, "user": {"nickname": "a"}},
+            {"cid": "2", "digg_count": 5, "author_pin": False, "user": {"nickname": "b"}},
+            {"cid": "3", "digg_count": 2, "author_pin": True, "user": None},
+        ],
+    }
+    assert query(expression, data) == jmespath.search(expression, data)
+    assert query(expression, []) == jmespath.search(expression, [])
+    # compiled once and reused
+    assert compile_query(expression) is compile_query(expression)
+
+
+def test_apollo_graph_resolves_shared_references_once():
+    cache = {
+        "ROOT_QUERY": {"employerReviews": {"reviews": [{"__ref": "Review:1"}, {"__ref": "Review:2"}]}},
+        "Review:1": {"id": 1, "employer": {"__ref": "Employer:1"}},
+        "Review:2": {"id": 2, "employer": {"__ref": "Employer:1"}, "missing": {"__ref": "Employer:9"}},
+        # the employer refers back to its reviews
+        "Employer:1": {"name": "eBay", "featuredReview": {"__ref": "Review:1"}},
+    }
+    graph = ApolloGraph(cache)
+    reviews = graph.root["employerReviews"]["reviews"]
+    # views follow references on access without copying
+    assert isinstance(reviews[1]["employer"], GraphNode)
+    assert reviews[1]["employer"]["name"] == "eBay"
+    resolved = reviews.resolve()
+    assert resolved[0]["employer"] is resolved[1]["employer"]
+    # the cycle back to the review being resolved and unknown nodes stay references
+    assert resolved[0]["employer"]["featuredReview"] == {"__ref": "Review:1"}
+    assert resolved[1]["missing"] == {"__ref": "Employer:9"}
+    assert cache["Review:1"]["employer"] == {"__ref": "Employer:1"}
+
+    # apollo 2 references and relay edge nodes
+    edges = ApolloGraph(
+        {"Edge:1": {"node": {"type": "id", "id": "Job:1"}}, "Job:1": {"title": "Engineer"}}, unwrap="node"
+    )
+    assert edges.resolve({"jobs": [{"type": "id", "id": "Edge:1", "generated": True}]}) == {
+        "jobs": [{"title": "Engineer"}]
+    }
+
+
+SITEMAP_INDEX = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+<sitemap><loc>https://example.com/sitemap-organizations-1.xml.gz</loc><lastmod>2024-05-01T00:00:00Z</lastmod></sitemap>
+<sitemap><loc>https://example.com/sitemap-organizations-0.xml.gz</loc><lastmod>2023-01-01T00:00:00Z</lastmod></sitemap>
+<sitemap><loc>https://example.com/sitemap-people-1.xml.gz</loc></sitemap>
+</sitemapindex>"""
+
+
+def urlset(*entries) -> str:
+    urls = "".join(f"<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>" for loc, lastmod in entries)
+    return f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+
+
+def test_iter_sitemap_streams_gzipped_shards():
+    shard = urlset(("https://example.com/a", "2024-05-02T10:00:00+02:00"), ("https://example.com/b", "2023-02-01"))
+    entries = list(iter_sitemap(gzip.compress(shard.encode())))
+    assert [entry.loc for entry in entries] == ["https://example.com/a", "https://example.com/b"]
+    # lastmod is naive UTC
+    assert entries[0].lastmod == datetime(2024, 5, 2, 8)
+    assert [entry.loc for entry in iter_sitemap(shard, since=datetime(2024, 1, 1))] == ["https://example.com/a"]
+    assert [entry.sitemap for entry in iter_sitemap(SITEMAP_INDEX)] == [True, True, True]
+
+
+@pytest.mark.asyncio
+async def test_crawl_sitemaps_follows_matching_shards():
+    pages = {
+        "https://example.com/sitemap-index.xml": SITEMAP_INDEX,
+        "https://example.com/sitemap-organizations-1.xml.gz": urlset(
+            ("https://example.com/organization/new", "2024-05-01"), ("https://example.com/organization/old", "2023-01-01")
+        ),
+    }
+
+    class SitemapClient:
+        scraped = []
+
+        async def concurrent_scrape(self, configs, concurrency=None):
+            for config in configs:
+                self.scraped.append(config.url)
+                yield make_response(config, pages[config.url])
+
+    client = SitemapClient()
+    entries = [
+        entry
+        async for entry in crawl_sitemaps(
+            client, ["https://example.com/sitemap-index.xml"], follow="organizations", since=datetime(2024, 1, 1)
+        )
+    ]
+    assert [entry.loc for entry in entries] == ["https://example.com/organization/new"]
+    # the people shard doesn't match and the old organizations shard wasn't modified since
+    assert client.scraped == ["https://example.com/sitemap-index.xml", "https://example.com/sitemap-organizations-1.xml.gz"]
+
+
+@pytest.mark.asyncio
+async def test_change_tracker_scrapes_new_and_changed_urls(tmp_path):
+    feed = {"https://example.com/a": datetime(2024, 5, 1), "https://example.com/b": datetime(2024, 5, 1)}
+    polled, scraped = [], []
+
+    async def poll(since):
+        polled.append(since)
+        return {url: version for url, version in feed.items() if since is None or version >= since}
+
+    async def scrape(url):
+        scraped.append(url)
+        if url.endswith("b") and scraped.count(url) == 1 or url.endswith("dead"):
+            raise ValueError("blocked")
+        return {"url": url}
+
+    tracker = ChangeTracker(tmp_path / "feed.db", "feed", poll=poll, scrape=scrape, concurrency=2)
+    assert [result async for result in tracker.check()] == [{"url": "https://example.com/a"}]
+    # b failed and is retried though the poll doesn't list it anymore, a is unchanged and c is new
+    feed["https://example.com/c"] = datetime.utcnow()
+    results = [result async for result in tracker.check()]
+    assert sorted(result["url"] for result in results) == ["https://example.com/b", "https://example.com/c"]
+    # the failed scrape didn't hold the poll mark back
+    assert polled[0] is None and polled[1] < datetime.utcnow()
+    assert [result async for result in tracker.check()] == []
+    assert scraped.count("https://example.com/b") == 2
+    tracker.store.close()
+
+    # a url failing every time is given up after max_retries, until it's listed with a new version
+    feed["https://example.com/dead"] = datetime.utcnow()
+    with VersionStore(tmp_path / "feed.db") as store:
+        tracker = ChangeTracker(store, "feed", poll=poll, scrape=scrape, max_retries=2)
+        await tracker.track(lambda result: None, interval=0, polls=3)
+        assert scraped.count("https://example.com/dead") == 2
+        feed["https://example.com/dead"] = datetime.utcnow()
+        await tracker.track(lambda result: None, interval=0, polls=1)
+        assert scraped.count("https://example.com/dead") == 3
+        assert {url: attempts for url, (_, attempts) in store.failed("feed").items()} == {"https://example.com/dead": 1}
+
+    # versions persist across runs, only the changed listing is scraped again
+    del feed["https://example.com/dead"]
+    feed["https://example.com/a"] = datetime.utcnow()
+    written = []
+    with VersionStore(tmp_path / "feed.db") as store:
+        tracker = ChangeTracker(store, "feed", poll=poll, scrape=scrape)
+        await tracker.track(written.append, interval=0, polls=2)
+        assert store.count("feed") == 3
+    assert written == [{"url": "https://example.com/a"}]
+    assert scraped.count("https://example.com/a") == 2
+
+
+@pytest.mark.asyncio
+async def test_paginate_prefetches_next_page():
+    events = []
+
+    async def fetch(cursor):
+        events.append(f"fetch {cursor}")
+        await asyncio.sleep(0.01)
+        return cursor
+
+    def parse(page):
+        events.append(f"parse {page}")
+        return [f"{page}-{i}" for i in range(2)]
+
+    items = [item async for item in paginate(1, fetch, lambda page: page + 1 if page < 3 else None, parse)]
+    assert items == ["1-0", "1-1", "2-0", "2-1", "3-0", "3-1"]
+    # page 2 is requested before page 1 is parsed
+    assert events[:3] == ["fetch 1", "fetch 2", "parse 1"]
+    assert [item async for item in paginate(1, fetch, lambda page: page + 1, parse, max_pages=2)] == items[:4]
+
+
+@pytest.mark.asyncio
+async def test_paginate_many_shares_concurrency_budget():
+    running, peak = 0, 0
+
+    async def fetch(cursor):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if cursor == ("b", 2):
+            raise ValueError("blocked")
+        return cursor
+
+    def next_cursor(page):
+        name, number = page
+        return (name, number + 1) if number < 3 else None
+
+    starts = [("a", 1), ("b", 1), ("c", 1)]
+    results = [
+        result
+        async for result in paginate_many(
+            starts, fetch, next_cursor, lambda page: [page], concurrency=2, tolerate_errors=True
+        )
+    ]
+    pages = {}
+    for start, page in results:
+        pages.setdefault(start[0], []).append(page[1])
+    # a failing page only ends its own chain
+    assert pages == {"a": [1, 2, 3], "b": [1], "c": [1, 2, 3]}
+    assert peak == 2
+
+    # by default the error is raised once the other chains are done
+    results = []
+    with pytest.raises(ValueError, match="blocked"):
+        async for result in paginate_many(starts, fetch, next_cursor, lambda page: [page], concurrency=2):
+            results.append(result)
+    assert len(results) == 7
+    # a failing first page fails a single chain right away
+    with pytest.raises(ValueError, match="blocked"):
+        [item async for item in paginate(("b", 2), fetch, next_cursor, lambda page: [page])]
+
+
+def test_split_range_and_box():
+    assert split_range(0, 9) == [(0, 4), (5, 9)]
+    assert split_range(0, 10, parts=3) == [(0, 3), (4, 6), (7, 10)]
+    assert split_range(5, 5) == []
+    assert split_range(0, 10, overlap=True) == [(0, 5), (5, 10)]
+    assert split_range(0, 10, parts=3, overlap=True) == [(0, 3), (3, 7), (7, 10)]
+    # a band one dollar wide can't be split without repeating itself
+    assert split_range(5, 6, overlap=True) == []
+    quadrants = split_box({"north": 2, "east": 2, "south": 0, "west": 0})
+    assert sorted((box["south"], box["west"]) for box in quadrants) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+
+@pytest.mark.asyncio
+async def test_crawl_shards_splits_until_under_cap():
+    # listings priced 0..999, a search returns at most 100 results
+    listings = [{"id": i, "price": i} for i in range(1000)]
+    probed = []
+
+    async def probe(band):
+        probed.append(band)
+        matching = [listing for listing in listings if band[0] <= listing["price"] <= band[1]]
+        return len(matching), matching[:100]
+
+    def split(band):
+        # overlapping bands to check deduplication
+        return [(low, min(high + 1, band[1])) for low, high in split_range(*band)]
+
+    results = [
+        result
+        async for result in crawl_shards(
+            (0, 999), probe, split, scrape=lambda shard: shard.page, cap=100, key=lambda listing: listing["id"]
+        )
+    ]
+    assert sorted(result["id"] for result in results) == list(range(1000))
+    # every band is probed once and bands under the cap aren't split any further
+    assert len(probed) == len(set(probed)) and probed[0] == (0, 999)
+    assert all(band[1] - band[0] >= 62 for band in probed)
+
+    # a query that can't be split is scraped up to the cap
+    shards = []
+
+    def scrape(shard: Shard):
+        shards.append(shard)
+        return shard.page
+
+    results = [result async for result in crawl_shards((0, 999), probe, lambda band: [], scrape=scrape, cap=100)]
+    assert len(results) == 100 and shards[0].total == 1000
+
+
+@pytest.mark.asyncio
+async def test_closing_crawl_shards_stops_scraping():
+    scraped = []
+
+    async def probe(query):
+        return (50 if query == "all" else 10), None
+
+    async def scrape(shard: Shard):
+        for page in range(10):
+            await asyncio.sleep(0.01)
+            scraped.append((shard.query, page))
+            yield page
+
+    async with contextlib.aclosing(
+        crawl_shards("all", probe, lambda query: [f"{query}-{i}" for i in range(5)] if query == "all" else [], scrape, cap=10)
+    ) as results:
+        async for _ in results:
+            break
+    stopped = len(scraped)
+    await asyncio.sleep(0.1)
+    assert len(scraped) == stopped < 50
+
+
+@pytest.mark.asyncio
+async def test_crawl_shards_retries_probes_and_raises_failures():
+    listings = list(range(100))
+    attempts = []
+
+    async def probe(band):
+        attempts.append(band)
+        if band == (50, 99) and attempts.count(band) <= failures:
+            raise ValueError("blocked")
+        matching = [listing for listing in listings if band[0] <= listing <= band[1]]
+        return len(matching), matching
+
+    async def crawl(**kwargs):
+        return [
+            result
+            async for result in crawl_shards((0, 99), probe, lambda band: split_range(*band), lambda shard: shard.page, cap=50, **kwargs)
+        ]
+
+    # a probe failing once is retried
+    failures = 1
+    assert sorted(await crawl()) == listings
+    # a probe that keeps failing fails the crawl once the other shards are done
+    failures, attempts = 3, []
+    with pytest.raises(ValueError, match="blocked"):
+        await crawl()
+    assert attempts.count((50, 99)) == 3
+    attempts = []
+    assert await crawl(tolerate_errors=True) == listings[:50]
+
+    # so does a failing shard
+    def scrape(shard: Shard):
+        if shard.query == (0, 49):
+            raise ValueError("shard blocked")
+        return shard.page
+
+    failures = 0
+    with pytest.raises(ValueError, match="shard blocked"):
+        [result async for result in crawl_shards((0, 99), probe, lambda band: split_range(*band), scrape, cap=50)]
+
+
+@pytest.mark.asyncio
+async def test_run_jobs_from_job_file(tmp_path):
+    site = tmp_path / "jobsite-scraper"
+    site.mkdir()
+    (site / "jobsite.py").write_text(
+        """
+from scraper_runtime import site_config
+
+BASE_CONFIG = site_config("jobsite", {"asp": True})
+
+
+async def scrape_search(query, max_pages=1):
+    for page in range(max_pages):
+        yield {"query": query, "page": page, "cache": BASE_CONFIG.get("cache")}
+
+
+async def scrape_product(url):
+    if "broken" in url:
+        raise ValueError("blocked")
+    return [{"url": url}]
+"""
+    )
+    (tmp_path / "jobs.toml").write_text(
+        """
+output = "out"
+
+[[jobs]]
+name = "search"
+function = "jobsite.scrape_search"
+args = { query = "lemon balm", max_pages = 3 }
+config = { cache = true }
+
+[[jobs]]
+function = "jobsite.scrape_product"
+each = [{ url = "https://example.com/1" }, { url = "https://example.com/broken" }, { url = "https://example.com/2" }]
+output = "products.jsonl.gz"
+site_concurrency = 2
+"""
+    )
+    spec = load_job_file(tmp_path / "jobs.toml")
+    jobs = await run_jobs(spec, base=tmp_path)
+    assert [(job.name, job.items, job.failed) for job in jobs] == [("search", 3, 0), ("jobsite-scrape_product", 2, 1)]
+    search = list(read_jsonl(tmp_path / "out" / "search.jsonl"))
+    assert [record["page"] for record in search] == [0, 1, 2] and search[0]["cache"] is True
+    products = list(read_jsonl(tmp_path / "out" / "products.jsonl.gz"))
+    assert sorted(record["url"] for record in products) == ["https://example.com/1", "https://example.com/2"]
+    assert scraper_runtime.SITES["jobsite"].max_concurrency == 2
+    with pytest.raises(ValueError):
+        await run_jobs(spec, base=tmp_path, only=["missing"])
+
+
+def parse_titles(response, suffix=""):
+    """module level so spawned parse workers can import it"""
+    if "broken" in response.context["url"]:
+        raise ValueError("no titles")
+    titles = response.selector.css("h2::text").getall()
+    return {"url": response.context["url"], "titles": [title + suffix for title in titles], "size": len(response.content)}
+
+
+@pytest.mark.asyncio
+async def test_parse_executor_parses_in_worker_processes():
+    # one small page pickled to the worker, one big page handed over through shared memory
+    pages = {
+        "https://example.com/small": "<h2>small</h2>",
+        "https://example.com/big": "<h2>big ✓</h2>" + "<p>filler</p>" * 10_000,
+    }
+    responses = [make_response(ScrapeConfig(url), content) for url, content in pages.items()]
+    with ParseExecutor(workers=2, shared_memory_threshold=1024) as executor:
+        big = await executor.parse(parse_titles, responses[1], suffix="!")
+        assert big == {"url": "https://example.com/big", "titles": ["big ✓!"], "size": len(pages["https://example.com/big"])}
+
+        async def scraped():
+            yield responses[0]
+            yield ValueError("blocked")
+            yield make_response(ScrapeConfig("https://example.com/broken"))
+            yield responses[1]
+
+        results = [result async for result in executor.parse_many(scraped(), parse_titles)]
+    # failed scrapes and failed parses are passed through as exceptions
+    errors = [str(result) for result in results if isinstance(result, Exception)]
+    assert sorted(errors) == ["blocked", "no titles"]
+    parsed = {result["url"]: result["titles"] for result in results if not isinstance(result, Exception)}
+    assert parsed == {"https://example.com/small": ["small"], "https://example.com/big": ["big ✓"]}
+    assert executor.pool is None
+
+
+@pytest.mark.asyncio
+async def test_parse_responses_inline_by_default(monkeypatch):
+    monkeypatch.delenv("SCRAPFLY_PARSE_WORKERS", raising=False)
+    monkeypatch.setattr(scraper_runtime.parsing, "_EXECUTOR", None)
+    responses = [make_response(ScrapeConfig(f"https://example.com/{i}"), f"<h2>{i}</h2>") for i in range(3)]
+    results = [result async for result in parse_responses(responses, parse_titles)]
+    assert sorted(result["titles"][0] for result in results) == ["0", "1", "2"]
+    assert scraper_runtime.parsing.get_parse_executor().workers == 0
+    page = PageResponse("<h2>a</h2>", "https://example.com/a", upstream_status_code=404)
+    assert parse_titles(page) == {"url": "https://example.com/a", "titles": ["a"], "size": 10}
+    assert page.result["config"]["url"] == page.context["url"]
+
+
+class CostingScrapflyClient:
+    """stand-in for ScrapflyClient billing like scrapfly: 25 credits with render_js, 25 with residential proxies"""
+
+    max_concurrency = 1
+
+    def __init__(self, blocks_datacenter: bool = True):
+        self.blocks_datacenter = blocks_datacenter
+        self.scraped = []
+
+    async def async_scrape(self, scrape_config: ScrapeConfig) -> ScrapeApiResponse:
+        await asyncio.sleep(0)
+        self.scraped.append(scrape_config)
+        blocked = self.blocks_datacenter and scrape_config.proxy_pool != "public_residential_pool"
+        response = make_response(scrape_config, "<h1>data</h1>", status_code=403 if blocked else 200)
+        cost = 25 if scrape_config.render_js or scrape_config.proxy_pool == "public_residential_pool" else 1
+        response.response.headers["X-Scrapfly-Api-Cost"] = str(cost)
+        return response
+
+
+async def scrape_cost_pages(client, urls, **options):
+    """module level so the ledger accounts the scrapes to it"""
+    configs = [ScrapeConfig(url, **options) for url in urls]
+    return [response async for response in client.concurrent_scrape(configs)]
+
+
+@pytest.mark.asyncio
+async def test_costs_are_accounted_per_function_and_budgeted(monkeypatch):
+    ledger = CostLedger()
+    monkeypatch.setattr(scraper_runtime.costs, "_LEDGER", ledger)
+    scraper_runtime.configure(max_concurrency=1, client=CostingScrapflyClient())
+    client = get_client("costly-site")
+    urls = [f"https://example.com/{i}" for i in range(3)]
+    await scrape_cost_pages(client, urls, render_js=True, asp=True, proxy_pool="public_residential_pool")
+    # the failed page is scraped again, with the default datacenter proxies which are blocked
+    await client.async_scrape(ScrapeConfig(urls[0], raise_on_upstream_error=False))
+
+    report = ledger.report()
+    functions = report["sites"]["costly-site"]["functions"]
+    pages = functions["test.scrape_cost_pages"]
+    assert pages["requests"] == 3 and pages["credits"] == 75 and pages["render_js"] == 3 and pages["residential"] == 3
+    retried = functions["test.test_costs_are_accounted_per_function_and_budgeted"]
+    assert retried["requests"] == 1 and retried["retries"] == 1 and retried["failed"] == 1 and retried["credits"] == 1
+    assert report["total"]["credits"] == 76
+
+    # the next request is estimated from the function's average cost and would pass the site budget
+    ledger.set_budget(110, site="costly-site")
+    results = await scrape_cost_pages(client, urls, render_js=True)
+    # results come in completion order, a refused request can finish before the one that fits
+    assert sorted(type(result).__name__ for result in results) == ["BudgetExceeded", "BudgetExceeded", "ScrapeApiResponse"]
+    assert ledger.total.credits == 101
+    ledger.set_budget(None, site="costly-site")
+    with scraper_runtime.job_scope("nightly"):
+        await scrape_cost_pages(client, urls[:1], render_js=True)
+    assert ledger.report()["jobs"] == {"nightly": ledger.jobs["nightly"].as_dict()} and ledger.jobs["nightly"].credits == 25
+
+
+@pytest.mark.asyncio
+async def test_downgrade_drops_options_pages_dont_need(monkeypatch):
+    monkeypatch.setattr(scraper_runtime.costs, "_LEDGER", CostLedger())
+    fake = CostingScrapflyClient(blocks_datacenter=True)
+    scraper_runtime.configure(max_concurrency=1, client=fake)
+    site = site_config("downgraded-site", {"render_js": True, "proxy_pool": "public_residential_pool"})
+    site.downgrade = Downgrade(check=lambda response: "data" in response.content, probes=2, every=2)
+    client = get_client("downgraded-site")
+    for i in range(12):
+        response = await client.async_scrape(ScrapeConfig(f"https://example.com/{i}", **site))
+        assert response.upstream_status_code == 200
+
+    # pages pass without render_js, but datacenter proxies are blocked so residential ones stay
+    assert site.downgrade.state == {"render_js": "adopted", "proxy_pool": "rejected"}
+    assert [config.render_js for config in fake.scraped[-3:]] == [False, False, False]
+    assert all(config.proxy_pool == "public_residential_pool" for config in fake.scraped[-3:])
+    # the blocked probe was repeated with the requested options
+    assert site.downgrade.fallbacks == 1 and len(fake.scraped) == 13
+    stats = scraper_runtime.cost_report()["sites"]["downgraded-site"]["total"]
+    assert stats["downgraded"] > 0
+
+
+@pytest.mark.asyncio
+async def test_downgrade_treats_probe_errors_as_inconclusive(monkeypatch):
+    class FlakyScrapflyClient(CostingScrapflyClient):
+        def __init__(self, errors):
+            super().__init__(blocks_datacenter=False)
+            self.errors = errors
+
+        async def async_scrape(self, scrape_config):
+            if not scrape_config.render_js and self.errors:
+                self.errors -= 1
+                raise asyncio.TimeoutError("timed out")
+            return await super().async_scrape(scrape_config)
+
+    monkeypatch.setattr(scraper_runtime.costs, "_LEDGER", CostLedger())
+    options = {"render_js": True, "proxy_pool": "public_residential_pool"}
+
+    # a timed out probe falls back without giving up on the option
+    scraper_runtime.configure(max_concurrency=1, client=FlakyScrapflyClient(errors=1))
+    site = site_config("flaky-site", options)
+    site.downgrade = Downgrade(check=lambda response: "data" in response.content, probes=2, every=1)
+    for i in range(4):
+        response = await get_client("flaky-site").async_scrape(ScrapeConfig(f"https://example.com/{i}", **site))
+        assert response.upstream_status_code == 200
+    assert site.downgrade.state["render_js"] == "adopted" and site.downgrade.fallbacks == 1
+
+    # probes failing again and again keep it
+    scraper_runtime.configure(max_concurrency=1, client=FlakyScrapflyClient(errors=10))
+    site = site_config("failing-site", options)
+    site.downgrade = Downgrade(check=lambda response: "data" in response.content, probes=2, every=1, failures=3)
+    for i in range(4):
+        await get_client("failing-site").async_scrape(ScrapeConfig(f"https://example.com/{i}", **site))
+    assert site.downgrade.state["render_js"] == "rejected" and site.downgrade.failed["render_js"] == 3
+
+
+class TieredScrapflyClient:
+    """stand-in for ScrapflyClient serving /spa/ pages only with render_js and blocking /blocked/ pages on datacenter proxies"""
+
+    max_concurrency = 1
+
+    def __init__(self):
+        self.scraped = []
+
+    async def async_scrape(self, scrape_config: ScrapeConfig) -> ScrapeApiResponse:
+        await asyncio.sleep(0)
+        self.scraped.append(scrape_config)
+        if "/blocked/" in scrape_config.url and scrape_config.proxy_pool != "public_residential_pool":
+            return make_response(scrape_config, status_code=403)
+        rendered = "/spa/" not in scrape_config.url or scrape_config.render_js
+        return make_response(scrape_config, "<h1>data</h1>" if rendered and "missing" not in scrape_config.url else "")
+
+
+@pytest.mark.asyncio
+async def test_escalation_ladder_learns_tier_per_pattern(tmp_path):
+    fake = TieredScrapflyClient()
+    scraper_runtime.configure(max_concurrency=1, client=fake)
+    client = get_client("ladder-site")
+    ladder = EscalationLadder(
+        client, check=lambda response: "data" in response.content, patience=2, path=tmp_path / "escalation.json"
+    )
+    configs = [ScrapeConfig(f"https://example.com/spa/{i}/page") for i in range(4)]
+    responses = [response async for response in ladder.concurrent_scrape(configs, concurrency=1)]
+    assert all(response.scrape_config.render_js for response in responses)
+    # the first two pages escalate through every tier, the rest start at the tier that worked for them
+    assert [config.url[-6:] for config in fake.scraped] == ["0/page"] * 3 + ["1/page"] * 3 + ["2/page", "3/page"]
+    assert ladder.metrics()["start"] == {"example.com/spa/*/page": "render_js"}
+
+    # other page types start from the cheapest tier
+    fake.scraped.clear()
+    response = await ladder.scrape(ScrapeConfig("https://example.com/blocked/1"))
+    assert [config.proxy_pool for config in fake.scraped] == ["public_datacenter_pool", "public_residential_pool"]
+    assert not response.scrape_config.render_js
+    with pytest.raises(EscalationFailed):
+        await ladder.scrape(ScrapeConfig("https://example.com/missing"))
+
+    # learned tiers are picked up by the next run
+    assert EscalationLadder(client, path=tmp_path / "escalation.json").start == {"example.com/spa/*/page": 2}
+
+
+@pytest.mark.asyncio
+async def test_mock_api_records_and_replays(tmp_path):
+    # the "real" api generates pages, the recording mock forwards to it
+    with MockScrapflyApi(pages=lambda url: f"<h1>{url}</h1>") as upstream:
+        with MockScrapflyApi(tmp_path, record=True, key="real-key", upstream=upstream.url) as api:
+            scraper_runtime.configure(max_concurrency=2, client=ScrapflyClient(key="test", host=api.url))
+            client = get_client("mock-site")
+            configs = [ScrapeConfig(f"https://example.com/{i}", session="s1") for i in range(3)]
+            configs.append(ScrapeConfig("https://example.com/search", method="POST", body='{"page": 2}',
+                                        headers={"content-type": "application/json"}))
+            recorded = [response async for response in client.concurrent_scrape(configs)]
+        assert api.stats["recorded"] == 4 and upstream.stats["generated"] == 4
+        assert api.sessions == {"s1": 3}
+
+    with MockScrapflyApi(tmp_path) as api:
+        scraper_runtime.configure(max_concurrency=2, client=ScrapflyClient(key="test", host=api.url))
+        client = get_client("mock-site")
+        # ignored options like the session don't change which response is replayed
+        response = await client.async_scrape(ScrapeConfig("https://example.com/1", session="other"))
+        assert response.content == "<h1>https://example.com/1</h1>"
+        post = await client.async_scrape(ScrapeConfig("https://example.com/search", method="POST", body='{"page": 2}',
+                                                      headers={"content-type": "application/json"}))
+        assert post.content in [response.content for response in recorded]
+        with pytest.raises(ApiHttpClientError):
+            await client.async_scrape(ScrapeConfig("https://example.com/search", method="POST", body='{"page": 3}',
+                                                   headers={"content-type": "application/json"}))
+        assert api.stats["replayed"] == 2 and api.stats["missing"] == 1
+    # fixtures are regular response cache records
+    assert len(list(ResponseCache(tmp_path).responses())) == 4
+
+
+@pytest.mark.asyncio
+async def test_mock_api_throttles_over_account_concurrency():
+    with MockScrapflyApi(pages=lambda url: "<html></html>", latency=0.05, max_concurrency=2) as api:
+        runtime = scraper_runtime.configure(max_concurrency=4, client=ScrapflyClient(key="test", host=api.url))
+        client = get_client("mock-load-site")
+        configs = [ScrapeConfig(f"https://example.com/{i}") for i in range(12)]
+        results = [result async for result in client.concurrent_scrape(configs)]
+    assert api.peak_in_flight == 2
+    assert api.stats["throttled"] == sum(isinstance(result, ApiHttpClientError) for result in results) > 0
+    # the global budget backs off from the account throttling
+    assert runtime.controller.outcomes["account_throttled"] == api.stats["throttled"]
+    assert runtime.limiter.limit < 4
+
+
+class SessionScrapflyClient:
+    """stand-in for ScrapflyClient answering only warmed sessions and blocking sessions after `block_after` scrapes"""
+
+    max_concurrency = 1
+
+    def __init__(self, block_after: int = 4):
+        self.block_after = block_after
+        self.warm = set()
+        self.uses = {}
+        self.in_flight = set()
+
+    async def async_scrape(self, scrape_config: ScrapeConfig) -> ScrapeApiResponse:
+        session = scrape_config.session
+        assert session not in self.in_flight, "a session was used by concurrent requests"
+        self.in_flight.add(session)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.in_flight.discard(session)
+        if scrape_config.url.endswith("/home"):
+            self.warm.add(session)
+            return make_response(scrape_config)
+        self.uses[session] = self.uses.get(session, 0) + 1
+        if session not in self.warm or self.uses[session] > self.block_after:
+            return make_response(scrape_config, status_code=403)
+        return make_response(scrape_config, "<h1>product</h1>")
+
+
+@pytest.mark.asyncio
+async def test_session_pool_reuses_warm_sessions_and_retires_blocked():
+    fake = SessionScrapflyClient(block_after=4)
+    scraper_runtime.configure(max_concurrency=4, client=fake)
+    client = get_client("session-site")
+    pool = SessionPool(
+        client, warmup=lambda session: ScrapeConfig("https://example.com/home", session=session), size=2, max_failures=1
+    )
+    await pool.warm()
+    assert pool.warmed == 2
+
+    async def scrape_product(i):
+        async with pool.lease() as session:
+            response = await session.scrape(ScrapeConfig(f"https://example.com/product/{i}"))
+            return response.upstream_status_code
+
+    statuses = await asyncio.gather(*[scrape_product(i) for i in range(8)])
+    # 8 products on 2 warm sessions, no extra warm-ups
+    assert statuses == [200] * 8 and pool.warmed == 2
+    statuses = await asyncio.gather(*[scrape_product(i) for i in range(4)])
+    # both sessions got blocked on their 5th use, got retired and replaced by new warm sessions
+    assert statuses.count(403) == 2 and statuses.count(200) == 2
+    assert pool.retired == {"blocked": 2, "expired": 0} and pool.warmed == 4
+
+
+class ReviewScrapflyClient:
+    """stand-in for ScrapflyClient serving `pages` review pages per product and counting requests per domain"""
+
+    max_concurrency = 1
+
+    def __init__(self, pages: dict):
+        self.pages = pages
+        self.scraped = []
+        self.in_flight = {}
+        self.peak = {}
+
+    async def async_scrape(self, scrape_config: ScrapeConfig) -> ScrapeApiResponse:
+        domain = scrape_config.url.split("/")[2]
+        self.in_flight[domain] = self.in_flight.get(domain, 0) + 1
+        self.peak[domain] = max(self.peak.get(domain, 0), self.in_flight[domain])
+        self.scraped.append(scrape_config.url)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.in_flight[domain] -= 1
+        product, page = scrape_config.url.rsplit("/", 2)[-2:]
+        if product == "broken" and page == "2":
+            raise ValueError("broken page")
+        content = f'<html data-pages="{self.pages[product]}"><p>{product}-{page}-a</p><p>{product}-{page}-b</p></html>'
+        return make_response(scrape_config, content)
+
+
+@pytest.mark.asyncio
+async def test_fan_out_scrapes_pages_of_many_products_as_one_queue():
+    pages = {"big": 6, "small": 1, "broken": 3, "api": 4}
+    fake = ReviewScrapflyClient(pages)
+    scraper_runtime.configure(max_concurrency=4, client=fake)
+    client = get_client("fan-out-site")
+
+    def page_url(product, page):
+        host = "api.example.com" if product == "api" else "www.example.com"
+        return f"https://{host}/{product}/{page}"
+
+    def other_pages(product, first):
+        total = int(first.selector.xpath("//html/@data-pages").get())
+        return [ScrapeConfig(page_url(product, page)) for page in range(2, total + 1)]
+
+    results = await fan_out(
+        client,
+        list(pages),
+        first_page=lambda product: ScrapeConfig(page_url(product, 1)),
+        other_pages=other_pages,
+        parse=lambda response: response.selector.xpath("//p/text()").getall(),
+        concurrency=4,
+        domain_limits={"api.example.com": 1},
+    )
+    # items are grouped by product in page order, failed pages are left out
+    assert results[0] == [f"big-{page}-{item}" for page in range(1, 7) for item in "ab"]
+    assert results[1] == ["small-1-a", "small-1-b"]
+    assert results[2] == ["broken-1-a", "broken-1-b", "broken-3-a", "broken-3-b"]
+    assert results[3] == [f"api-{page}-{item}" for page in range(1, 5) for item in "ab"]
+    # first pages go first, then the pages of the product with the most pages left
+    assert fake.scraped[:4] == [page_url(product, 1) for product in pages]
+    assert fake.scraped[4] == page_url("big", 2)
+    assert fake.peak["api.example.com"] == 1
+
+
+class GraphQLScrapflyClient:
+    """stand-in for ScrapflyClient answering graphql operations, batches only on the /batch endpoint"""
+
+    max_concurrency = 1
+
+    def __init__(self):
+        self.bodies = []
+
+    async def async_scrape(self, scrape_config: ScrapeConfig) -> ScrapeApiResponse:
+        await asyncio.sleep(0.01)
+        body = json.loads(scrape_config.body)
+        self.bodies.append(body)
+        if isinstance(body, list) and not scrape_config.url.endswith("/batch"):
+            raise ValueError("batches aren't supported")
+
+        def answer(operation):
+            if operation["variables"]["offset"] < 0:
+                return {"errors": [{"message": "bad offset"}]}
+            return {"data": {"offset": operation["variables"]["offset"]}}
+
+        result = [answer(operation) for operation in body] if isinstance(body, list) else answer(body)
+        return make_response(scrape_config, json.dumps(result))
+
+
+@pytest.mark.asyncio
+async def test_graphql_batcher_coalesces_operations_and_falls_back_to_single_requests():
+    fake = GraphQLScrapflyClient()
+    scraper_runtime.configure(max_concurrency=10, client=fake)
+    batcher = GraphQLBatcher(get_client("graphql-site"), max_batch=10)
+
+    def config(url):
+        return ScrapeConfig(url, method="POST", body="", headers={"content-type": "application/json"})
+
+    def operation(offset):
+        return {"operationName": "Page", "variables": {"offset": offset}}
+
+    # results are demultiplexed back to every operation in order
+    results = await batcher.execute_many((operation(offset), config("https://example.com/batch")) for offset in range(25))
+    assert [result["data"]["offset"] for result in results] == list(range(25))
+    assert [len(body) for body in fake.bodies] == [10, 10, 5]
+
+    # a failed batch is retried one operation per request and the endpoint isn't batched again
+    fake.bodies.clear()
+    results = await batcher.execute_many((operation(offset), config("https://example.com/single")) for offset in range(3))
+    assert [result["data"]["offset"] for result in results] == [0, 1, 2]
+    assert batcher.unbatched == {"https://example.com/single"}
+    fake.bodies.clear()
+    await batcher.execute_many((operation(offset), config("https://example.com/single")) for offset in range(3))
+    assert fake.bodies == [operation(offset) for offset in range(3)]
+
+    # operations with errors fail alone
+    results = await batcher.execute_many(
+        [(operation(1), config("https://example.com/batch")), (operation(-1), config("https://example.com/batch"))],
+        return_exceptions=True,
+    )
+    assert results[0] == {"data": {"offset": 1}}
+    assert isinstance(results[1], GraphQLError)
+    assert batcher.metrics()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_graphql_batcher_probes_endpoints_with_one_batch():
+    fake = GraphQLScrapflyClient()
+    scraper_runtime.configure(max_concurrency=10, client=fake)
+    batcher = GraphQLBatcher(get_client("graphql-probe-site"), max_batch=10)
+
+    def config(url):
+        return ScrapeConfig(url, method="POST", body="", headers={"content-type": "application/json"})
+
+    def operation(offset):
+        return {"operationName": "Page", "variables": {"offset": offset}}
+
+    # an endpoint refusing batches costs one failed batched request, not one per batch
+    results = await batcher.execute_many((operation(offset), config("https://example.com/single")) for offset in range(45))
+    assert [result["data"]["offset"] for result in results] == list(range(45))
+    assert [body for body in fake.bodies if isinstance(body, list)] == [[operation(offset) for offset in range(10)]]
+    assert len(fake.bodies) == 1 + 45
+    assert batcher.metrics()["fallbacks"] == 1
+
+    # once the probe is answered the held batches are sent batched
+    fake.bodies.clear()
+    results = await batcher.execute_many((operation(offset), config("https://example.com/batch")) for offset in range(45))
+    assert [result["data"]["offset"] for result in results] == list(range(45))
+    assert [len(body) for body in fake.bodies] == [10, 10, 10, 10, 5]
+    assert batcher.batched == {"https://example.com/batch"}
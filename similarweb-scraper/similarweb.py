@@ -5,31 +5,24 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import re
-import os
-import gzip
 import json
-import jmespath
-from parsel import Selector
 from typing import Dict, List, Optional
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import crawl_sitemaps, get_client, hidden_data, iter_sitemap, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("similarweb")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("similarweb", {
     # bypass bestbuy.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
-}
+})
 
 def parse_hidden_data(response: ScrapeApiResponse) -> List[Dict]:
     """parse website insights from hidden script tags"""
-    selector = response.selector
-    script = selector.xpath("//script[contains(text(), 'window.__APP_DATA__')]/text()").get()
-    data = json.loads(re.findall(r"(\{.*?)(?=window\.__APP_META__)", script, re.DOTALL)[0])
-    return data
+    return hidden_data(response.content, "__APP_DATA__")
 
 
 async def scrape_website(domains: List[str]) -> List[Dict]:
@@ -53,7 +46,7 @@ def parse_website_compare(response: ScrapeApiResponse, first_domain: str, second
         data_key = data["layout"]["data"]
         if second_domain:
             data_key = data_key["compareCompetitor"] # the 2nd website compare key is nested
-        parsed_data = jmespath.search(
+        parsed_data = query(
             """{
             overview: overview,
             traffic: traffic,
@@ -83,27 +76,18 @@ async def scrape_website_compare(first_domain: str, second_domain: str) -> Dict:
 
 
 def parse_sitemaps(response: ScrapeApiResponse) -> List[str]:
-    """parse links for bestbuy sitemap"""
-    bytes_data = response.scrape_result['content'].getvalue()
-    # decode the .gz file
-    xml = bytes_data.decode('utf-8')
-    selector = Selector(xml)
-    data = []
-    for url in selector.xpath("//url/loc/text()"):
-        data.append(url.get())
-    return data
+    """parse links for similarweb sitemap"""
+    # the sitemap is parsed as a stream, decompressing it if it's still gzipped
+    return [entry.loc for entry in iter_sitemap(response.content)]
 
 
 async def scrape_sitemaps(url: str) -> List[str]:
-    """scrape link data from bestbuy sitemap"""
-    promo_urls = None
-    try:
-        response = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-        promo_urls = parse_sitemaps(response)
+    """scrape link data from similarweb sitemap, the sitemaps of a sitemap index are scraped concurrently"""
+    promo_urls = [entry.loc async for entry in crawl_sitemaps(SCRAPFLY, [url], BASE_CONFIG)]
+    if promo_urls:
         log.success(f"scraped {len(promo_urls)} urls from sitemaps")
-    except:
+    else:
         log.info("couldnt' scrape sitemaps, request was blocked")
-        pass
     return promo_urls
 
 
@@ -7,8 +7,8 @@ $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
 import asyncio
-import json
 from pathlib import Path
+from scraper_runtime import JsonlSink
 import target
 
 output = Path(__file__).parent / "results"
@@ -30,21 +30,12 @@ async def run():
          ]
     
     for k in kw:
-        # search_data = await target.scrape_search(
-        #     query="california+poppy" + "+" + k,  max_pages=10
-        # )
-        # with open(output.joinpath(f"search_california_poppy_{k}.json"), "a", encoding="utf-8") as file:
-        #     json.dump(search_data, file, indent=2, ensure_ascii=False)
-        with open(output.joinpath(f"search_california_poppy_{k}.json"), "r", encoding="utf-8") as file:
-            search_data = json.load(file)   
-            
-        # search_data = [{'usItemId': '3931738164'}]
-        # res = ['https://www.target.com/p/yogi-tea-elderberry-lemon-balm-immune-stress-16ct/-/A-81503691#lnk=sametab']
-        # review = await target.scrape_reviews(res)
-        product_and_reviews = await target.scrape_product_and_reviews(search_data, key = k)
-    
-        with open(output.joinpath(f"target_product_and_reviews_california_poppy_{k}.json"), "a", encoding="utf-8") as file:
-            json.dump(product_and_reviews, file, indent=2, ensure_ascii=False)
+        # search, product and review pages are scraped as one overlapping pipeline
+        # and every product is written as soon as its reviews are scraped
+        with JsonlSink(output.joinpath(f"target_product_and_reviews_california_poppy_{k}.jsonl")) as sink:
+            await sink.consume(
+                target.stream_products_and_reviews(["california+poppy" + "+" + k], max_search_pages=10)
+            )
 
     # products_data = await target.scrape_products(
     #     urls=[
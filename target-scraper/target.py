@@ -5,28 +5,28 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
 import math
 import re
-from typing import Dict, List, TypedDict, Optional
+from typing import AsyncIterator, Dict, List, TypedDict, Optional
 from urllib.parse import urlencode
 from loguru import logger as log
 from lxml import html
 from parsel import Selector
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import Stage, fan_out, get_client, run_pipeline, site_config
 from pathlib import Path
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("target")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("target", {
     # bypass target.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
     "proxy_pool": "public_residential_pool"
 
-}
+})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -106,6 +106,33 @@ def parse_reviews(response: ScrapeApiResponse):
     return parsed
 
 
+def _product_config(url: str) -> ScrapeConfig:
+    """product page scrape config that expands the specifications section"""
+    return ScrapeConfig(url, 
+                        js_scenario=[
+                             {"condition": {
+                                "selector": '//div[@data-test="@web/site-top-of-funnel/ProductDetailCollapsible-Specifications"]',
+                                "selector_state": "not_existing",
+                                "timeout": 1000,
+                                "action": "exit_success"
+                            }
+                        },
+                            
+                            # {"scroll": {"selector": '//div[@data-test="@web/site-top-of-funnel/ProductDetailCollapsible-Specifications"]'}},
+                            {"click": {"selector": '//div[@data-test="@web/site-top-of-funnel/ProductDetailCollapsible-Specifications"]/button'}},
+                        {
+                            "wait_for_selector": {
+                                "selector": "//div[@data-test='item-details-specifications']",
+                                "state": "visible",
+                                "timeout": 1000
+                            }
+                        }
+                    ],
+                  render_js = True,
+                  **BASE_CONFIG,
+                 )
+
+
 async def scrape_products(res = None) -> List[Dict]:
     """scrape product data from product pages
     res: metadata of products from scrape_search"""
@@ -113,73 +140,57 @@ async def scrape_products(res = None) -> List[Dict]:
     result = []
     prefix = 'https://www.target.com'
     urls = [prefix + e['url'] for e in res]
-    to_scrape = [ScrapeConfig(url, 
-                                    js_scenario=[
-                                         {"condition": {
-                                            "selector": '//div[@data-test="@web/site-top-of-funnel/ProductDetailCollapsible-Specifications"]',
-                                            "selector_state": "not_existing",
-                                            "timeout": 1000,
-                                            "action": "exit_success"
-                                        }
-                                    },
-                                        
-                                        # {"scroll": {"selector": '//div[@data-test="@web/site-top-of-funnel/ProductDetailCollapsible-Specifications"]'}},
-                                        {"click": {"selector": '//div[@data-test="@web/site-top-of-funnel/ProductDetailCollapsible-Specifications"]/button'}},
-                                    {
-                                        "wait_for_selector": {
-                                            "selector": "//div[@data-test='item-details-specifications']",
-                                            "state": "visible",
-                                            "timeout": 1000
-                                        }
-                                    }
-                                ],
-                              render_js = True,
-                              **BASE_CONFIG,
-                             ) for url in urls]
-
-    for i in range(0, len(to_scrape), 20):
-        to_scrape_slice = to_scrape[i: i+20]
-        async for response in SCRAPFLY.concurrent_scrape(to_scrape_slice):
-            try:
-                parse_product(response)
-                result.append(parse_product(response))  
-            except:
-                continue
+    to_scrape = [_product_config(url) for url in urls]
+
+    # the site's adaptive concurrency limit paces the scrapes, no need to slice them by hand
+    async for response in SCRAPFLY.concurrent_scrape(to_scrape):
+        try:
+            result.append(parse_product(response))  
+        except:
+            continue
         if len(result)%10 == 0:
             log.info('scraped product data from product pages...')
 
     return result
 
 
+async def scrape_product(listing: Dict) -> Dict:
+    """scrape a single product page of a search listing"""
+    response = await SCRAPFLY.async_scrape(_product_config('https://www.target.com' + listing['url']))
+    return parse_product(response)
+
+
+def _reviews_config(url: str) -> ScrapeConfig:
+    """product page scrape config that expands the reviews section"""
+    return ScrapeConfig(
+        url,
+        js_scenario=[
+            {"scroll": {"selector": "bottom"}},
+            {"wait": 1000},
+            {"condition": {
+                "selector": '//div[@data-test="hide-show-reviews-btn"]/button',
+                "selector_state": "not_existing",
+                "timeout": 1000,
+                "action": "exit_success"
+            }},
+            {"click": {"selector": '//div[@data-test="hide-show-reviews-btn"]/button', "ignore_if_not_visible": True}},
+            {"wait": 500},
+            {"click": {"selector": '//div[@data-test="load-more-btn"]/button', "ignore_if_not_visible": True}},
+            {"wait": 500},
+            {"click": {"selector": '//div[@data-test="load-more-btn"]/button', "ignore_if_not_visible": True}},
+            {"wait": 500},
+        ],
+        render_js=True,
+        **BASE_CONFIG,
+    )
+
+
 async def scrape_reviews(res = None):
     """scrape product reviews from product pages
         res: metadata of product from scrape_products"""
     url = res['product']['url']
     # print(url)
-    first_page = await SCRAPFLY.async_scrape(ScrapeConfig(url, 
-                                                          js_scenario = 
-                                                          [ {"scroll": {"selector": "bottom"}},
-                                                            {"wait": 1000},
-                                                            {"condition": {
-                                                                "selector": '//div[@data-test="hide-show-reviews-btn"]/button',
-                                                                "selector_state": "not_existing",
-                                                                "timeout": 1000,
-                                                                "action": "exit_success"
-                                                            }
-                                                            },
-                                                            {"click":
-                                                                    {"selector": '//div[@data-test="hide-show-reviews-btn"]/button',
-                                                                    'ignore_if_not_visible': True}},
-                                                            {"wait": 500},
-                                                            {"click": {"selector": '//div[@data-test="load-more-btn"]/button', 
-                                                                    "ignore_if_not_visible": True}},
-                                                            {"wait": 500},
-                                                            {"click": {"selector": '//div[@data-test="load-more-btn"]/button', 
-                                                                    "ignore_if_not_visible": True}},
-                                                            {"wait": 500},
-                                                            ],
-                                                        render_js = True,
-                                                        **BASE_CONFIG))
+    first_page = await SCRAPFLY.async_scrape(_reviews_config(url))
     log.info(f"scraping reviews from {url}")
     reviews = parse_reviews(first_page)
     log.info(f"scraped {len(reviews)} reviews from {url}")
@@ -194,27 +205,58 @@ async def scrape_product_and_reviews(search_data = None, key = ''):
     # log.success(f'scraped {len(result)} products...')
     with open(output.joinpath(f"target_products_california_poppy_{key}.json"), "r", encoding="utf-8") as file:
         result = json.load(file) 
-        
+
+    products = [product for product in result if product['product'].get('UPC', None)]
+    # the review pages of all products are scraped concurrently instead of product after product,
+    # target shows all reviews on the product page so there are no other pages
+    reviews_per_product = await fan_out(
+        SCRAPFLY,
+        products,
+        first_page=lambda product: _reviews_config(product['product']['url']),
+        other_pages=lambda product, first: [],
+        parse=parse_reviews,
+    )
     result_combined = []
-    for product in result:
-        if product['product'].get('UPC', None):
-            print(product['product']['UPC'])   
-            product_reviews = await scrape_reviews(product)
-            if not product_reviews:
-                continue
-            product['product_reviews'] = product_reviews
-            result_combined.append(product)
-            log.info(f'scraped reviews for product {product["product"]["UPC"]}')
-            with open(output.joinpath(f"target_product_and_reviews_california_poppy_{key}.json"), "a", encoding="utf-8") as file:
-                json.dump(result_combined, file, indent=2, ensure_ascii=False)
+    for product, product_reviews in zip(products, reviews_per_product):
+        if not product_reviews:
+            continue
+        product['product_reviews'] = product_reviews
+        result_combined.append(product)
+        log.info(f'scraped reviews for product {product["product"]["UPC"]}')
+    with open(output.joinpath(f"target_product_and_reviews_california_poppy_{key}.json"), "a", encoding="utf-8") as file:
+        json.dump(result_combined, file, indent=2, ensure_ascii=False)
                 
     return result_combined
 
-async def scrape_search(
-    query: str = "",
-    max_pages: int = None,
-):
-    """scrape single target search page"""
+def _search_config(url: str) -> ScrapeConfig:
+    """search page scrape config that scrolls down to load the whole product grid"""
+    return ScrapeConfig(url, 
+                        js_scenario=[{"wait": 1000},
+                                      {"scroll": {"selector": "bottom"}},
+                                      {"wait": 1000},
+                                       {
+                                          "condition": {
+                                              "selector": "//div[@data-testid='product-description']",
+                                              "selector_state": "not_existing",
+                                              "timeout": 500,
+                                              "action": "exit_success"
+                                          }
+                                      },
+                                      {
+                                          "wait_for_selector": {
+                                              "selector": "//div[@data-testid='product-description']",
+                                              "state": "visible",
+                                              "timeout": 500
+                                          }
+                                      }
+                                      
+                                  ],
+                       render_js = True,
+                       **BASE_CONFIG)
+
+
+async def iter_search(query: str = "", max_pages: int = None) -> AsyncIterator[Dict]:
+    """scrape target search pages yielding product listings as soon as each page is parsed"""
 
     def make_search_url(page):
         url = "https://www.target.com/s?" + urlencode(
@@ -228,33 +270,10 @@ async def scrape_search(
 
     # scrape the first search page
     log.info(f"scraping the first search page with the query ({query})")
-    # todo: add js_scenario of scroll to the bottom of the page
-    first_page = await SCRAPFLY.async_scrape(
-        ScrapeConfig(make_search_url(1), 
-                      js_scenario=[{"wait": 1000},
-                                    {"scroll": {"selector": "bottom"}},
-                                    {"wait": 1000},
-                                     {
-                                        "condition": {
-                                            "selector": "//div[@data-testid='product-description']",
-                                            "selector_state": "not_existing",
-                                            "timeout": 500,
-                                            "action": "exit_success"
-                                        }
-                                    },
-                                    {
-                                        "wait_for_selector": {
-                                            "selector": "//div[@data-testid='product-description']",
-                                            "state": "visible",
-                                            "timeout": 500
-                                        }
-                                    }
-                                    
-                                ],
-                     render_js = True,
-                     **BASE_CONFIG)
-    )
+    first_page = await SCRAPFLY.async_scrape(_search_config(make_search_url(1)))
     data = parse_search(first_page)
+    for item in data:
+        yield item
     total_results = data[0]["total_results"]
 
     # find total page count to scrape
@@ -268,34 +287,45 @@ async def scrape_search(
     # then add the remaining pages to a scraping list and scrape them concurrently
     log.info(f"scraping search pagination, remaining ({total_pages - 1}) more pages")
     other_pages = [
-        ScrapeConfig(make_search_url((page-1)*24), 
-                      js_scenario=[ {"wait": 1000},
-                                    {"scroll": {"selector": "bottom"}},
-                                    {"wait": 1000},
-                                     {
-                                        "condition": {
-                                            "selector": "//div[@data-testid='product-description']",
-                                            "selector_state": "not_existing",
-                                            "timeout": 500,
-                                            "action": "exit_success"
-                                        }
-                                    },
-                                    {
-                                        "wait_for_selector": {
-                                            "selector": "//div[@data-testid='product-description']",
-                                            "state": "visible",
-                                            "timeout": 500
-                                        }
-                                    }],
-                                
-                     render_js = True,
-                     **BASE_CONFIG)
+        _search_config(make_search_url((page-1)*24))
         for page in range(2, total_pages + 1)
     ]
     async for response in SCRAPFLY.concurrent_scrape(other_pages):
-        data.extend(parse_search(response))
+        for item in parse_search(response):
+            yield item
+
+
+async def scrape_search(
+    query: str = "",
+    max_pages: int = None,
+):
+    """scrape single target search page"""
+    data = [item async for item in iter_search(query, max_pages=max_pages)]
     log.success(f"scraped {len(data)} product listings from search pages")
     return data
 
 
+async def stream_products_and_reviews(queries: List[str], max_search_pages: Optional[int] = None) -> AsyncIterator[Dict]:
+    """scrape search, product and review pages of many queries as one overlapping pipeline,
+    yielding each product with its reviews"""
+
+    async def search_listings(query: str) -> AsyncIterator[Dict]:
+        async for item in iter_search(query, max_pages=max_search_pages):
+            if item.get("url"):
+                yield item
+
+    async def scrape_product_reviews(product: Dict) -> Optional[Dict]:
+        if not product["product"].get("UPC"):
+            return None
+        product_reviews = await scrape_reviews(product)
+        if not product_reviews:
+            return None
+        return {**product, "product_reviews": product_reviews}
 
+    async for product in run_pipeline(
+        queries,
+        Stage(search_listings, name="search"),
+        Stage(scrape_product, concurrency=BASE_CONFIG.max_concurrency, name="products"),
+        Stage(scrape_product_reviews, concurrency=BASE_CONFIG.max_concurrency, name="reviews"),
+    ):
+        yield product
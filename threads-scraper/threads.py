@@ -6,27 +6,26 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 import json
-import os
-import jmespath
 
 from typing import Dict
 
 from nested_lookup import nested_lookup
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeConfig
+from scraper_runtime import get_client, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("threads")
+BASE_CONFIG = site_config("threads", {
     # Threads.net might require Anti Scraping Protection bypass feature.
     # for more: https://scrapfly.io/docs/scrape-api/anti-scraping-protection
     "asp": True,
     "country": "US",  # set country here NOTE: Threads is not available in Europe yet
-}
+})
 
 
 def parse_thread(data: Dict) -> Dict:
     """Parse Twitter tweet JSON dataset for the most important fields"""
-    result = jmespath.search(
+    result = query(
         """{
         text: post.caption.text,
         published_on: post.taken_at,
@@ -55,7 +54,7 @@ def parse_thread(data: Dict) -> Dict:
 
 def parse_profile(data: Dict) -> Dict:
     """Parse Threads profile JSON dataset for the most important fields"""
-    result = jmespath.search(
+    result = query(
         """{
         is_private: text_post_app_is_private,
         is_verified: is_verified,
@@ -5,31 +5,36 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
+import asyncio
 import datetime
 import secrets
 import json
-import jmespath
 from typing import Dict, List
 from urllib.parse import urlencode, quote
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import SessionPool, get_client, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("tiktok")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("tiktok", {
     # bypass tiktok.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
-}
+})
+# the search API only answers sessions with the cookies of a rendered search page,
+# search requests share a pool of warm sessions instead of rendering a page per search
+SESSIONS = SessionPool(SCRAPFLY, warmup=lambda session: ScrapeConfig(
+    "https://www.tiktok.com/search?q=trending", **BASE_CONFIG, render_js=True, session=session
+))
 
 def parse_post(response: ScrapeApiResponse) -> Dict:
     """parse hidden post data from HTML"""
     selector = response.selector
     data = selector.xpath("//script[@id='__UNIVERSAL_DATA_FOR_REHYDRATION__']/text()").get()
     post_data = json.loads(data)["__DEFAULT_SCOPE__"]["webapp.video-detail"]["itemInfo"]["itemStruct"]
-    parsed_post_data = jmespath.search(
+    parsed_post_data = query(
         """{
         id: id,
         desc: desc,
@@ -66,7 +71,7 @@ def parse_comments(response: ScrapeApiResponse) -> List[Dict]:
     parsed_comments = []
     # refine the comments with JMESPath
     for comment in comments_data:
-        result = jmespath.search(
+        result = query(
             """{
             text: text,
             comment_language: comment_language,
@@ -152,7 +157,7 @@ def parse_search(response: ScrapeApiResponse) -> List[Dict]:
     parsed_search = []
     for item in search_data:
         if item["type"] == 1: # get the item if it was item only
-            result = jmespath.search(
+            result = query(
                 """{
                 id: id,
                 desc: desc,
@@ -172,15 +177,6 @@ def parse_search(response: ScrapeApiResponse) -> List[Dict]:
     return parsed_search
 
 
-async def obtain_session(url: str) -> str:
-    """create a session to save the cookies and authorize the search API"""
-    session_id="tiktok_search_session"
-    await SCRAPFLY.async_scrape(ScrapeConfig(
-        url, **BASE_CONFIG, render_js=True, session=session_id
-    ))
-    return session_id
-
-
 async def scrape_search(keyword: str, max_search: int, search_count: int = 12) -> List[Dict]:
     """scrape tiktok search data from the search API"""
 
@@ -203,27 +199,25 @@ async def scrape_search(keyword: str, max_search: int, search_count: int = 12) -
         }
         return base_url + urlencode(params)
 
-    log.info("obtaining a session for the search API")
-    session_id = await obtain_session(url="https://www.tiktok.com/search?q=" + quote(keyword))
+    async def scrape_page(cursor: int) -> ScrapeApiResponse:
+        async with SESSIONS.lease() as session:
+            return await session.scrape(ScrapeConfig(
+                form_api_url(cursor), **BASE_CONFIG, headers={
+                    "content-type": "application/json",
+                }
+            ))
 
     log.info("scraping the first search batch")
-    first_page = await SCRAPFLY.async_scrape(ScrapeConfig(
-        form_api_url(cursor=0), **BASE_CONFIG, headers={
-            "content-type": "application/json",
-        }, session=session_id
-    ))
+    first_page = await scrape_page(cursor=0)
     search_data = parse_search(first_page)
 
-    # scrape the remaining comments concurrently
+    # scrape the remaining comments concurrently, each page in a warm session of the pool
     log.info(f"scraping search pagination, remaining {max_search // search_count} more pages")
-    _other_pages = [
-        ScrapeConfig(form_api_url(cursor=cursor), **BASE_CONFIG, headers={
-            "content-type": "application/json"
-        }, session=session_id
-    )
-        for cursor in range(search_count, max_search + search_count, search_count)
-    ]
-    async for response in SCRAPFLY.concurrent_scrape(_other_pages):
+    cursors = range(search_count, max_search + search_count, search_count)
+    for response in await asyncio.gather(*[scrape_page(cursor) for cursor in cursors], return_exceptions=True):
+        if isinstance(response, Exception):
+            log.error(f"failed to scrape a search page of {keyword}: {response}")
+            continue
         data = parse_search(response)
         search_data.extend(data)
 
@@ -246,7 +240,7 @@ def parse_channel(response: ScrapeApiResponse):
     # parse all the data using jmespath
     parsed_data = []
     for post in channel_data:
-        result = jmespath.search(
+        result = query(
             """{
             createTime: createTime,
             desc: desc,
@@ -7,23 +7,23 @@ $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 import json
 import math
-import os
 import random
 import string
 from typing import List, Optional, TypedDict, Dict
 from urllib.parse import urljoin
 
 from loguru import logger as log
-from scrapfly import ScrapeApiResponse, ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeApiResponse, ScrapeConfig
+from scraper_runtime import get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("tripadvisor")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("tripadvisor", {
     # Tripadvisor.com requires Anti Scraping Protection bypass feature:
     "asp": True,
     # set the proxy location to US
     "country": "US",
-}
+})
 
 
 class LocationData(TypedDict):
@@ -4,20 +4,20 @@ This is an example web scraper for trustpilot.com.
 To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
-import os
 import json
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, site_config
 from typing import Dict, List
 from loguru import logger as log
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("trustpilot")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("trustpilot", {
     # bypass trustpilot web scraping blocking
     "asp": True,
     # set the poxy location to US
     "country": "US",
-}
+})
 
 
 def parse_hidden_data(response: ScrapeApiResponse):
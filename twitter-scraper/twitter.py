@@ -6,23 +6,22 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 import json
-import os
-import jmespath
 
 from typing import Dict
 
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeConfig
+from scraper_runtime import get_client, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("twitter")
+BASE_CONFIG = site_config("twitter", {
     # X.com (Twitter) requires Anti Scraping Protection bypass feature.
     # for more: https://scrapfly.io/docs/scrape-api/anti-scraping-protection
     "asp": True,
     # X.com (Twitter) is javascript-powered web application so it requires
     # headless browsers for scraping
     "render_js": True,
-}
+})
 
 
 async def _scrape_twitter_app(url: str, _retries: int = 0, **scrape_config) -> Dict:
@@ -43,7 +42,7 @@ async def _scrape_twitter_app(url: str, _retries: int = 0, **scrape_config) -> D
 
 def parse_tweet(data: Dict) -> Dict:
     """Parse X.com (Twitter) tweet JSON dataset for the most important fields"""
-    result = jmespath.search(
+    result = query(
         """{
         created_at: legacy.created_at,
         attached_urls: legacy.entities.urls[].expanded_url,
@@ -70,7 +69,7 @@ def parse_tweet(data: Dict) -> Dict:
         data,
     )
     result["poll"] = {}
-    poll_data = jmespath.search("card.legacy.binding_values", data) or []
+    poll_data = query("card.legacy.binding_values", data) or []
     for poll_entry in poll_data:
         key, value = poll_entry["key"], poll_entry["value"]
         if "choice" in key:
@@ -83,7 +82,7 @@ def parse_tweet(data: Dict) -> Dict:
             result["poll"]["ended"] = value["boolean_value"]
         elif "duration_minutes" in key:
             result["poll"]["duration"] = value["string_value"]
-    user_data = jmespath.search("core.user_results.result", data)
+    user_data = query("core.user_results.result", data)
     if user_data:
         result["user"] = parse_profile(user_data)
     return result
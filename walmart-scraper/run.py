@@ -9,6 +9,7 @@ $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 import asyncio
 import json
 from pathlib import Path
+from scraper_runtime import Checkpoint
 import walmart
 
 output = Path(__file__).parent / "results"
@@ -21,51 +22,18 @@ async def run():
     walmart.BASE_CONFIG["country"] = "US"
 
     print("running Walmart scrape and saving results to ./results directory")
-    kw = [
-        "tincture", 
-          "drink", 
-          "tea", 
-          "supplement"
-         ]
-    # search_data = await walmart.scrape_search(
-    #     query="lemon+balm", sort="best_seller", max_pages=10)
-    # with open(output.joinpath(f"search_lemon_balm.json"), "a", encoding="utf-8") as file:
-    #     json.dump(search_data, file, indent=2, ensure_ascii=False)
-    
-    with open(output.joinpath(f"search_lemon_balm.json"), "r", encoding="utf-8") as file:
-        search_data = json.load(file) 
-    
-    # for k in kw:
-        # search_data = await walmart.scrape_search(
-        #     query="california+poppy" + "+" + k, sort="best_seller", max_pages=10
-        # )
-        # with open(output.joinpath(f"search_california_poppy_{k}_.json"), "a", encoding="utf-8") as file:
-        #     json.dump(search_data, file, indent=2, ensure_ascii=False)
-        # with open(output.joinpath(f"search_california_poppy_{k}_.json"), "r", encoding="utf-8") as file:
-        #     search_data = json.load(file) 
-            
-        # search_data = [{'usItemId': '3931738164'}]
-    product_and_reviews = await walmart.scrape_product_and_reviews(search_data, key = '')
-    
-    # with open(output.joinpath("Walmart_product_and_reviews_california_poppy.json"), "a", encoding="utf-8") as file:
-    #     json.dump(product_and_reviews, file, indent=2, ensure_ascii=False)
-
-    # products_data = await walmart.scrape_products(
-    #     urls=[
-    #         "https://www.walmart.com/ip/28931700",
-    #         ]
-    # )
-    # with open(output.joinpath("products.json"), "w", encoding="utf-8") as file:
-    #     json.dump(products_data, file, indent=2, ensure_ascii=False)
-
-
-    
-    # product_id = [search_data['usItemId'] if search_data['usItemId'] else None]
-    # product_id = 28931700
-    # product_reviews = await walmart.scrape_reviews(product_id)
-    # with open(output.joinpath("reviews_null.json"), "w", encoding="utf-8") as file:
-    #     json.dump(product_reviews, file, indent=2, ensure_ascii=False)
-    
+    # every stage (search -> products -> reviews) is checkpointed:
+    # re-running this script after a crash resumes the crawl instead of starting over
+    with Checkpoint(output.joinpath("lemon_balm.checkpoint.db")) as checkpoint:
+        product_and_reviews = await walmart.crawl(
+            "lemon+balm", checkpoint, sort="best_seller", max_search_pages=10, max_review_pages=20
+        )
+    with open(output.joinpath("Walmart_product_and_reviews_lemon_balm.json"), "w", encoding="utf-8") as file:
+        json.dump(product_and_reviews, file, indent=2, ensure_ascii=False)
+
+    # to scrape every listing of a search instead of the first 25 pages, split it into price bands:
+    # async for product in walmart.stream_products_and_reviews(["california poppy"], full_search=True):
+    #     ...
 
 
 if __name__ == "__main__":
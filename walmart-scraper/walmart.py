@@ -5,28 +5,41 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
 import math
 import re
-from typing import Dict, List, TypedDict, Optional
+from typing import AsyncIterator, Dict, List, TypedDict, Optional
 from urllib.parse import urlencode
 from loguru import logger as log
 from lxml import html
 from parsel import Selector
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import Checkpoint, Downgrade, JsonlSink, Shard, Stage, crawl_shards, get_client, parse_responses, run_pipeline, site_config, split_range
 from pathlib import Path
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("walmart")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("walmart", {
     # bypass walmart.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
     "proxy_pool": "public_residential_pool"
 
-}
+})
+
+
+def _has_page_data(response: ScrapeApiResponse) -> bool:
+    """whether a page scraped with cheaper options still has the data the parsers read"""
+    if "Robot or human" in response.content:
+        return False
+    if "/ip/" in response.context["url"]:
+        return bool(response.selector.xpath('//script[@data-seo-id="schema-org-product"]'))
+    return bool(response.selector.xpath('//script[@id="__NEXT_DATA__"]'))
+
+
+# product pages are scraped with render_js, drop it (and residential proxies) once pages come through without
+BASE_CONFIG.downgrade = Downgrade(check=_has_page_data)
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -141,21 +154,35 @@ async def scrape_products(res = None) -> List[Dict]:
                               **BASE_CONFIG,
                              ) for url in urls]
 
-    for i in range(0, len(to_scrape), 20):
-        to_scrape_slice = to_scrape[i: i+20]
-        async for response in SCRAPFLY.concurrent_scrape(to_scrape_slice):
-                prod = parse_product(response)
-                if not prod:
-                    continue
-                print(prod)
-                result.append(prod)
-                log.info(f'scraped from {response.result["config"]["url"]}')
+    # the site's adaptive concurrency limit paces the scrapes, no need to slice them by hand
+    # product pages are parsed in worker processes when parse workers are enabled
+    async for prod in parse_responses(SCRAPFLY.concurrent_scrape(to_scrape), parse_product):
+        if isinstance(prod, Exception):
+            log.error(f"failed to scrape product page: {prod}")
+            continue
+        if not prod:
+            continue
+        print(prod)
+        result.append(prod)
+        log.info(f'scraped product {prod["product"].get("sku")}')
         if len(result)%10 == 0:
             log.info('scraped product data from product pages...')
 
     return result
 
 
+async def scrape_product(item: Dict) -> Dict:
+    """scrape a single product page
+    item: product listing from scrape_search"""
+    url = f"https://www.walmart.com/ip/{item['usItemId']}"
+    response = await SCRAPFLY.async_scrape(ScrapeConfig(url, render_js=True, **BASE_CONFIG))
+    # raise on bot checks and pages without product data so checkpoints retry them instead of storing nothing
+    if not _has_page_data(response):
+        raise ValueError(f"no product data found in {url}, blocked by a bot check?")
+    log.info(f"scraped from {url}")
+    return parse_product(response)
+
+
 async def scrape_reviews(res = None, max_pages: Optional[int] = None):
     """scrape product reviews from product pages
         res: metadata of product from scrape_products"""
@@ -178,14 +205,17 @@ async def scrape_reviews(res = None, max_pages: Optional[int] = None):
         url = f"https://www.walmart.com/reviews/product/{id}?page={page}"
         other_pages.append(ScrapeConfig(url, **BASE_CONFIG))
 
-    async for result in SCRAPFLY.concurrent_scrape(other_pages):
-        page_reviews = parse_reviews(result)
+    async for page_reviews in parse_responses(SCRAPFLY.concurrent_scrape(other_pages), parse_reviews):
+        if isinstance(page_reviews, Exception):
+            log.error(f"failed to scrape review page: {page_reviews}")
+            continue
         reviews.extend(page_reviews)
     log.info(f"scraped total {len(reviews)} reviews")
     return reviews
 
 async def scrape_product_and_reviews(search_data, key = ''):
-    """scrape product and reviews concurrently"""
+    """scrape product reviews and stream each product with its reviews into a JSON lines file.
+    Products already in the output file are skipped so an interrupted run can be resumed."""
     # result = await scrape_products(search_data)
     # with open(output.joinpath(f"Walmart_products_lemon_balm.json"), "a", encoding="utf-8",) as file:
     #     json.dump(result, file, indent=2, ensure_ascii=False)
@@ -195,40 +225,43 @@ async def scrape_product_and_reviews(search_data, key = ''):
     with open(output.joinpath(f"Walmart_products_lemon_balm.json"), "r", encoding="utf-8") as file:
         result = json.load(file) 
         
-    result_combined = []
-    for product in result:
-        try:
-            product_reviews = await scrape_reviews(product, max_pages=20)
+    results_file = output.joinpath(f"Walmart_product_and_reviews_lemon_balm.jsonl")
+    with JsonlSink(results_file, fsync_every=1) as sink:
+        done = sink.keys(lambda product: product["product"]["sku"])
+        for product in result:
+            if product["product"]["sku"] in done:
+                continue
+            try:
+                product_reviews = await scrape_reviews(product, max_pages=20)
+            except Exception as e:
+                log.opt(exception=e).error(f'failed to scrape reviews for product {product["product"]["sku"]}')
+                continue
             product['product_reviews'] = product_reviews
-            result_combined.append(product)
+            sink.write(product)
             log.info(f'scraped reviews for product {product["product"]["sku"]}')
-            with open(output.joinpath(f"Walmart_product_and_reviews_lemon_balm.json"), "a", encoding="utf-8") as file:
-                json.dump(result_combined, file, indent=2, ensure_ascii=False)
-        except:
-            pass
             
-    return result_combined
-
-async def scrape_search(
-    query: str = "",
-    sort: TypedDict(
-        "SortOptions",
-        {"best_seller": str, "best_match": str, "price_low": str, "price_high": str},
-    ) = "best_match",
-    max_pages: int = None,
-):
-    """scrape single walmart search page"""
+    return results_file
+
+def search_url(query: str, page: int, sort: str, min_price: Optional[int] = None, max_price: Optional[int] = None) -> str:
+    """url of a walmart search page, optionally filtered to an inclusive price band (whole dollars)"""
+    params = {
+        "q": query,
+        "page": page,
+        "sort": sort,
+        "affinityOverride": "default",
+    }
+    if min_price is not None:
+        params["min_price"] = min_price
+    if max_price is not None:
+        params["max_price"] = max_price
+    return "https://www.walmart.com/search?" + urlencode(params)
+
+
+async def iter_search(query: str = "", sort: str = "best_match", max_pages: int = None) -> AsyncIterator[Dict]:
+    """scrape walmart search pages yielding product listings as soon as each page is parsed"""
 
     def make_search_url(page):
-        url = "https://www.walmart.com/search?" + urlencode(
-            {
-                "q": query,
-                "page": page,
-                sort: sort,
-                "affinityOverride": "default",
-            }
-        )
-        return url
+        return search_url(query, page, sort)
 
     # scrape the first search page
     log.info(f"scraping the first search page with the query ({query})")
@@ -238,7 +271,8 @@ async def scrape_search(
                      **BASE_CONFIG)
     )
     data = parse_search(first_page)
-    search_data = data["results"]
+    for item in data["results"]:
+        yield item
     total_results = data["total_results"]
 
     # find total page count to scrape
@@ -256,9 +290,124 @@ async def scrape_search(
         for page in range(2, total_pages + 1)
     ]
     async for response in SCRAPFLY.concurrent_scrape(other_pages):
-        search_data.extend(parse_search(response)["results"])
+        for item in parse_search(response)["results"]:
+            yield item
+
+
+async def scrape_search(
+    query: str = "",
+    sort: TypedDict(
+        "SortOptions",
+        {"best_seller": str, "best_match": str, "price_low": str, "price_high": str},
+    ) = "best_match",
+    max_pages: int = None,
+):
+    """scrape single walmart search page"""
+    search_data = [item async for item in iter_search(query, sort=sort, max_pages=max_pages)]
     log.success(f"scraped {len(search_data)} product listings from search pages")
     return search_data
 
 
+async def iter_full_search(
+    query: str = "", sort: str = "best_match", max_price: int = 100_000, concurrency: int = 5
+) -> AsyncIterator[Dict]:
+    """
+    scrape every product listing of a walmart search, even above the 25 page limit:
+    the search is split into price bands until each band fits into 25 pages and the bands are scraped concurrently
+    """
+
+    async def probe(band):
+        response = await SCRAPFLY.async_scrape(
+            ScrapeConfig(search_url(query, 1, sort, *band), render_js=True, **BASE_CONFIG)
+        )
+        data = parse_search(response)
+        return data["total_results"], data
+
+    async def scrape_band(shard: Shard) -> AsyncIterator[Dict]:
+        for item in shard.page["results"]:
+            yield item
+        total_pages = min(math.ceil(shard.total / 40), 25)
+        other_pages = [
+            ScrapeConfig(search_url(query, page, sort, *shard.query), **BASE_CONFIG)
+            for page in range(2, total_pages + 1)
+        ]
+        async for response in SCRAPFLY.concurrent_scrape(other_pages):
+            if isinstance(response, Exception):
+                log.error(f"failed to scrape search page: {response}")
+                continue
+            for item in parse_search(response)["results"]:
+                yield item
+
+    async for item in crawl_shards(
+        (0, max_price),
+        probe=probe,
+        # prices have cents, adjacent bands share their boundary dollar so nothing priced between them is dropped
+        split=lambda band: split_range(*band, overlap=True),
+        scrape=scrape_band,
+        cap=25 * 40,
+        # items priced on a boundary are found by both bands, tiles without an item id are never deduplicated
+        key=lambda item: item.get("usItemId"),
+        concurrency=concurrency,
+    ):
+        yield item
+
+
+async def crawl(
+    query: str,
+    checkpoint: Checkpoint,
+    sort: str = "best_seller",
+    max_search_pages: Optional[int] = None,
+    max_review_pages: Optional[int] = 20,
+) -> List[Dict]:
+    """scrape search, product and review pages of a query as a resumable pipeline.
+    The progress of every stage is stored in the checkpoint so a crashed crawl continues where it stopped."""
+    searches = await checkpoint.run_stage(
+        "search", [query], key=str, scrape=lambda query: scrape_search(query, sort=sort, max_pages=max_search_pages)
+    )
+    listings = [item for search in searches for item in search if item.get("usItemId")]
+    products = await checkpoint.run_stage(
+        "products",
+        listings,
+        key=lambda item: item["usItemId"],
+        scrape=scrape_product,
+        concurrency=BASE_CONFIG.max_concurrency,
+    )
+
+    async def scrape_product_reviews(product: Dict) -> Dict:
+        reviews = await scrape_reviews(product, max_pages=max_review_pages)
+        return {**product, "product_reviews": reviews}
+
+    return await checkpoint.run_stage(
+        "reviews", products, key=lambda product: product["product"]["sku"], scrape=scrape_product_reviews
+    )
+
 
+async def stream_products_and_reviews(
+    queries: List[str],
+    sort: str = "best_seller",
+    max_search_pages: Optional[int] = None,
+    max_review_pages: Optional[int] = 20,
+    full_search: bool = False,
+) -> AsyncIterator[Dict]:
+    """scrape search, product and review pages of many queries as one overlapping pipeline.
+    Products are scraped as soon as their search page is parsed and reviews as soon as their product is,
+    yielding each product with its reviews.
+    full_search: scrape every listing of the queries by splitting them into price bands instead of max_search_pages"""
+
+    async def search_listings(query: str) -> AsyncIterator[Dict]:
+        listings = iter_full_search(query, sort=sort) if full_search else iter_search(query, sort=sort, max_pages=max_search_pages)
+        async for item in listings:
+            if item.get("usItemId"):
+                yield item
+
+    async def scrape_product_reviews(product: Dict) -> Dict:
+        reviews = await scrape_reviews(product, max_pages=max_review_pages)
+        return {**product, "product_reviews": reviews}
+
+    async for product in run_pipeline(
+        queries,
+        Stage(search_listings, name="search"),
+        Stage(scrape_product, concurrency=BASE_CONFIG.max_concurrency, name="products"),
+        Stage(scrape_product_reviews, concurrency=BASE_CONFIG.max_concurrency, name="reviews"),
+    ):
+        yield product
@@ -5,21 +5,20 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
 from typing import Dict, List, TypedDict
-from copy import deepcopy
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import ApolloGraph, get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("wellfound")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("wellfound", {
     # bypass wellfound.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
-}
+})
 
 
 class JobData(TypedDict):
@@ -65,28 +64,10 @@ def unpack_node_references(node, graph, debug=False):
     >>> unpack_node_references({"field": {"id": "reference1", "type": "id"}}, graph={"reference1": {"foo": "bar"}})
     {'field': {'foo': 'bar'}}
     """
-    def flatten(value):
-        try:
-            if value["type"] != "id":
-                return value
-        except (KeyError, TypeError):
-            return value
-        data = deepcopy(graph[value["id"]])
-        # flatten nodes too:
-        if data.get("node"):
-            data = flatten(data["node"])
-        if debug:
-            data["__reference"] = value["id"]
-        return data
-
-    node = flatten(node)
-
-    for key, value in node.items():
-        if isinstance(value, list):
-            node[key] = [flatten(v) for v in value]
-        elif isinstance(value, dict):
-            node[key] = unpack_node_references(value, graph)
-    return node
+    if not isinstance(graph, ApolloGraph):
+        # references to edge nodes are flattened to the node they wrap
+        graph = ApolloGraph(graph, unwrap="node", mark="__reference" if debug else None)
+    return graph.resolve(node)
 
 
 def parse_company(result: ScrapeApiResponse) -> CompanyData:
@@ -102,6 +83,12 @@ def parse_company(result: ScrapeApiResponse) -> CompanyData:
     return unpack_node_references(company, graph)
 
 
+def parse_search_results(graph: Dict) -> List[CompanyData]:
+    """parse company results from a wellfound.com search page graph, nodes shared by results are unpacked once"""
+    graph = ApolloGraph(graph, unwrap="node")
+    return [unpack_node_references(graph.cache[key], graph) for key in graph if key.startswith("StartupResult")]
+
+
 async def retry_failure(url: str, _retries: int = 0):
     """retry failed requests with a maximum number of retries"""
     max_retries = 3
@@ -139,7 +126,7 @@ async def scrape_search(role: str = "", location: str = "", max_pages: int = Non
     log.info(f"scraping first page of search, {role} in {location}")
     first_page = await retry_failure(url)
     graph = extract_apollo_state(first_page)
-    companies.extend([unpack_node_references(graph[key], graph) for key in graph if key.startswith("StartupResult")])
+    companies.extend(parse_search_results(graph))
     seo_landing_key = next(key for key in graph["ROOT_QUERY"]["talent"] if "seoLandingPageJobSearchResults" in key)
     total_pages = graph["ROOT_QUERY"]["talent"][seo_landing_key]["pageCount"]
     # find total page count
@@ -151,8 +138,7 @@ async def scrape_search(role: str = "", location: str = "", max_pages: int = Non
     other_pages = [ScrapeConfig(url + f"?page={page}", **BASE_CONFIG) for page in range(2, total_pages + 1)]
     async for response in SCRAPFLY.concurrent_scrape(other_pages):
         try:
-            graph = extract_apollo_state(response)
-            companies.extend([unpack_node_references(graph[key], graph) for key in graph if key.startswith("StartupResult")])
+            companies.extend(parse_search_results(extract_apollo_state(response)))
         except Exception as e:
             log.debug(f"Error occured while crawling search: {e}")
             pass
@@ -5,21 +5,21 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
 from typing import Dict, List, Optional
 from urllib.parse import urlencode
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("yellowpages")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("yellowpages", {
     # bypass yellowpages.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
-}
+})
 
 
 def parse_search(response: ScrapeApiResponse) -> List[Dict]:
@@ -5,24 +5,27 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
 import math
 import base64
-import jmespath
-from typing import Dict, List, TypedDict
+from typing import Dict, List, Optional, TypedDict
 from urllib.parse import urlencode
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import GraphQLBatcher, get_client, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("yelp")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("yelp", {
     # bypass yelp.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
-}
+})
+
+REVIEWS_PER_PAGE = 10
+# review feed operations requested at once are sent together, the /gql/batch endpoint takes a list of them
+GRAPHQL = GraphQLBatcher(SCRAPFLY, max_batch=10, single_as_list=True)
 
 
 class Review(TypedDict):
@@ -63,13 +66,12 @@ def parse_business_id(response: ScrapeApiResponse):
     return business_id
 
 
-def parse_review_data(response: ScrapeApiResponse):
-    """parse review data from the JSON response"""
-    data = json.loads(response.scrape_result["content"])
-    reviews = data[0]["data"]["business"]["reviews"]["edges"]
+def parse_review_feed(result: Dict):
+    """parse review data of a review feed operation result"""
+    reviews = result["data"]["business"]["reviews"]["edges"]
     parsed_reviews = []
     for review in reviews:
-        result = jmespath.search(
+        parsed = query(
             """{
             encid: encid,
             text: text.{full: full, language: language},
@@ -84,11 +86,17 @@ def parse_review_data(response: ScrapeApiResponse):
             }""",
             review["node"]
         )
-        parsed_reviews.append(result)
-    total_reviews = data[0]["data"]["business"]["reviewCount"]
+        parsed_reviews.append(parsed)
+    total_reviews = result["data"]["business"]["reviewCount"]
     return {"reviews": parsed_reviews, "total_reviews": total_reviews}
 
 
+def parse_review_data(response: ScrapeApiResponse):
+    """parse review data from the JSON response"""
+    data = json.loads(response.scrape_result["content"])
+    return parse_review_feed(data[0])
+
+
 def parse_search(response: ScrapeApiResponse):
     """parse listing data from the search JSON data"""
     data = json.loads(response.scrape_result["content"])
@@ -114,51 +122,56 @@ async def scrape_pages(urls: List[str]) -> List[Dict]:
     return result
 
 
-async def request_reviews_api(url: str, start_index: int, business_id):
-    """request the graphql API for review data"""
+def review_cursor(offset: int) -> str:
+    """the graphql "after" pagination cursor of a review offset"""
     pagionation_data = {
         "version": 1,
         "type": "offset",
-        "offset": start_index
+        "offset": offset
     }
     pagionation_data = json.dumps(pagionation_data)
-    after = base64.b64encode(pagionation_data.encode('utf-8')).decode('utf-8') # decode the pagination values for the payload
-
-    payload = json.dumps([
-        {
-            "operationName": "GetBusinessReviewFeed",
-            "variables": {
-            "encBizId": f"{business_id}",
-            "reviewsPerPage": 10,
-            "selectedReviewEncId": "",
-            "hasSelectedReview": False,
-            "sortBy": "DATE_DESC",
-            "languageCode": "en",
-            "ratings": [
-                5,
-                4,
-                3,
-                2,
-                1
-            ],
-            "isSearching": False,
-            "after": after, # pagination parameter
-            "isTranslating": False,
-            "translateLanguageCode": "en",
-            "reactionsSourceFlow": "businessPageReviewSection",
-            "minConfidenceLevel": "HIGH_CONFIDENCE",
-            "highlightType": "",
-            "highlightIdentifier": "",
-            "isHighlighting": False
-            },
-            "extensions": {
-            "operationType": "query",
-            # static value
-            "documentId": "ef51f33d1b0eccc958dddbf6cde15739c48b34637a00ebe316441031d4bf7681"
-            }
+    return base64.b64encode(pagionation_data.encode('utf-8')).decode('utf-8') # decode the pagination values for the payload
+
+
+def review_feed_operation(business_id: str, start_index: int) -> Dict:
+    """graphql operation of a review page"""
+    return {
+        "operationName": "GetBusinessReviewFeed",
+        "variables": {
+        "encBizId": f"{business_id}",
+        "reviewsPerPage": REVIEWS_PER_PAGE,
+        "selectedReviewEncId": "",
+        "hasSelectedReview": False,
+        "sortBy": "DATE_DESC",
+        "languageCode": "en",
+        "ratings": [
+            5,
+            4,
+            3,
+            2,
+            1
+        ],
+        "isSearching": False,
+        "after": review_cursor(start_index), # pagination parameter
+        "isTranslating": False,
+        "translateLanguageCode": "en",
+        "reactionsSourceFlow": "businessPageReviewSection",
+        "minConfidenceLevel": "HIGH_CONFIDENCE",
+        "highlightType": "",
+        "highlightIdentifier": "",
+        "isHighlighting": False
+        },
+        "extensions": {
+        "operationType": "query",
+        # static value
+        "documentId": "ef51f33d1b0eccc958dddbf6cde15739c48b34637a00ebe316441031d4bf7681"
         }
-    ])
+    }
+
 
+def reviews_api_config(url: str, operations: Optional[List[Dict]] = None) -> ScrapeConfig:
+    """graphql API request of review pages, the batch endpoint takes a list of operations"""
+    payload = json.dumps(operations or [])
     headers = {
         'authority': 'www.yelp.com',
         'accept': '*/*',
@@ -169,28 +182,34 @@ async def request_reviews_api(url: str, start_index: int, business_id):
         'referer': url, # main business page URL 
         'x-apollo-operation-name': 'GetBusinessReviewFeed'
     }
+    return ScrapeConfig(
+        url="https://www.yelp.com/gql/batch",
+        headers=headers,
+        body=payload,
+        method="POST",
+        asp=True,
+        country="US"
+    )
+
+
+async def request_reviews_api(url: str, start_index: int, business_id):
+    """request the graphql API for review data"""
     response = await SCRAPFLY.async_scrape(
-        ScrapeConfig(
-            url="https://www.yelp.com/gql/batch",
-            headers=headers,
-            body=payload,
-            method="POST",
-            asp=True,
-            country="US"
-        )
+        reviews_api_config(url, [review_feed_operation(business_id, start_index)])
     )
     return response
 
 
 async def scrape_reviews(url: str, max_reviews: int = None) -> List[Review]:
+    """scrape yelp reviews of a business"""
     # first find business ID from business URL
     log.info("scraping the business id from the business page")
     response_business = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
     business_id = parse_business_id(response_business)
 
     log.info("scraping the first review page")
-    first_page = await request_reviews_api(url=url, business_id=business_id, start_index=1)
-    review_data = parse_review_data(first_page)
+    first_page = await GRAPHQL.execute(review_feed_operation(business_id, 1), reviews_api_config(url))
+    review_data = parse_review_feed(first_page)
     reviews = review_data["reviews"]
     total_reviews = review_data["total_reviews"]
 
@@ -199,12 +218,15 @@ async def scrape_reviews(url: str, max_reviews: int = None) -> List[Review]:
         total_reviews = max_reviews
 
     # next, scrape the remaining review pages
-    log.info(f"scraping review pagination, remaining ({total_reviews // 10}) more pages")
-
-    for offset in range(11, total_reviews, 10):
-        response = await request_reviews_api(url=url, business_id=business_id, start_index=offset)
-        new_review_data = parse_review_data(response)["reviews"]
-        reviews.extend(new_review_data)
+    # the pagination cursor is only an encoded offset, so all of them are requested at once
+    # and sent in batches of operations by GRAPHQL
+    offsets = list(range(1 + REVIEWS_PER_PAGE, total_reviews, REVIEWS_PER_PAGE))
+    log.info(f"scraping review pagination, remaining ({len(offsets)}) more pages")
+    results = await GRAPHQL.execute_many(
+        (review_feed_operation(business_id, offset), reviews_api_config(url)) for offset in offsets
+    )
+    for result in results:
+        reviews.extend(parse_review_feed(result)["reviews"])
     log.success(f"scraped {len(reviews)} reviews from review pages")
     return reviews
 
@@ -6,63 +6,101 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 import json
-import os
 import random
 import re
 from typing import List
 from urllib.parse import quote, urlencode
 
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient
+from scrapfly import ScrapeConfig
+from scraper_runtime import HiddenData, crawl_shards, get_client, hidden_data, site_config, split_box
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
-BASE_CONFIG = {
+SCRAPFLY = get_client("zillow")
+BASE_CONFIG = site_config("zillow", {
     # Zillow.com requires Anti Scraping Protection bypass feature:
     "asp": True,
     "country": "US",
-}
+})
 
 
-async def scrape_search(url: str) -> List[dict]:
-    """base search function which is used by sale and rent search functions"""
-    log.info(f"scraping search: {url}")
-    # first scrape the search HTML page and find query variables for this search
+async def _scrape_search_state(url: str) -> dict:
+    """scrape the search HTML page and find query variables for this search"""
     html_result = await SCRAPFLY.async_scrape(ScrapeConfig(url, **BASE_CONFIG))
-    script_data = json.loads(html_result.selector.xpath("//script[@id='__NEXT_DATA__']/text()").get())
-    query_data = script_data["props"]["pageProps"]["searchPageState"]["queryState"]
+    script_data = hidden_data(html_result.content, "__NEXT_DATA__")
+    return script_data["props"]["pageProps"]["searchPageState"]["queryState"]
+
+
+async def _scrape_search_api(query_data: dict) -> dict:
+    """scrape Zillow's backend API for all results of a search query, up to 500"""
     full_query = {
         "searchQueryState": query_data,
         "wants": {"cat1": ["listResults", "mapResults"], "cat2": ["total"]},
         "requestId": random.randint(2, 10),
     }
-    # then scrape Zillow's backend API for all query results:
     _backend_url = "https://www.zillow.com/async-create-search-page-state"
     api_result = await SCRAPFLY.async_scrape(
         ScrapeConfig(_backend_url, **BASE_CONFIG, headers={"content-type": "application/json"},
                       body=json.dumps(full_query), method="PUT")
     )
-    data = json.loads(api_result.content)
+    return json.loads(api_result.content)
+
+
+async def scrape_search(url: str) -> List[dict]:
+    """base search function which is used by sale and rent search functions"""
+    log.info(f"scraping search: {url}")
+    # first scrape the search HTML page and find query variables for this search
+    query_data = await _scrape_search_state(url)
+    # then scrape Zillow's backend API for all query results:
+    data = await _scrape_search_api(query_data)
     _total = data["categoryTotals"]["cat1"]["totalResultCount"]
     if _total > 500:
-        log.warning(f'more than 500 results ({_total}) for query "{url}" ')
+        log.warning(f'more than 500 results ({_total}) for query "{url}", use scrape_full_search to scrape all of them')
     return data["cat1"]["searchResults"]["mapResults"]
 
 
+async def scrape_full_search(url: str, concurrency: int = 5) -> List[dict]:
+    """
+    scrape every result of a search, even above Zillow's 500 result limit:
+    the search map area is split into quadrants until each one has at most 500 results
+    """
+    log.info(f"scraping full search: {url}")
+    query_data = await _scrape_search_state(url)
+
+    async def probe(bounds: dict):
+        data = await _scrape_search_api({**query_data, "mapBounds": bounds})
+        return data["categoryTotals"]["cat1"]["totalResultCount"], data["cat1"]["searchResults"]["mapResults"]
+
+    results = [
+        result
+        async for result in crawl_shards(
+            query_data["mapBounds"],
+            probe=probe,
+            split=split_box,
+            # the api returns every result of a shard at once
+            scrape=lambda shard: shard.page,
+            cap=500,
+            key=lambda result: result.get("zpid") or result.get("detailUrl"),
+            concurrency=concurrency,
+        )
+    ]
+    log.success(f"scraped {len(results)} search results of {url}")
+    return results
+
+
 async def scrape_properties(urls: List[str]):
     """scrape zillow property pages for property data"""
     to_scrape = [ScrapeConfig(url, **BASE_CONFIG) for url in urls]
     results = []
     async for result in SCRAPFLY.concurrent_scrape(to_scrape):
-        data = result.selector.css("script#__NEXT_DATA__::text").get()
+        hidden = HiddenData(result.content)
+        data = hidden.get("__NEXT_DATA__")
         if data:
             # Option 1: some properties are located in NEXT DATA cache
-            data = json.loads(data)
             property_data = json.loads(data["props"]["pageProps"]["componentProps"]["gdpClientCache"])
             property_data = property_data[list(property_data)[0]]['property']
         else:
             # Option 2: other times it's in Apollo cache
-            data = result.selector.css("script#hdpApolloPreloadedData::text").get()
-            data = json.loads(json.loads(data)["apiCache"])
+            data = json.loads(hidden.get("hdpApolloPreloadedData")["apiCache"])
             property_data = next(v["property"] for k, v in data.items() if "ForSale" in k)
         results.append(property_data)
     return results
@@ -5,20 +5,20 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
 import json
 from typing import Dict, List
 from loguru import logger as log
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse, ScrapflyAspError
+from scrapfly import ScrapeConfig, ScrapeApiResponse, ScrapflyAspError
+from scraper_runtime import get_client, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("zoominfo")
 
-BASE_CONFIG = {
+BASE_CONFIG = site_config("zoominfo", {
     # bypass zoominfo.com web scraping blocking
     "asp": True,
     # set the proxy country to US
     "country": "US",
-}
+})
 
 
 def parse_company(response: ScrapeApiResponse) -> List[Dict]:
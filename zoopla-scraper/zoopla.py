@@ -5,18 +5,16 @@ To run this scraper set env variable $SCRAPFLY_KEY with your scrapfly API key:
 $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
-import os
-import json
-import jmespath
 import urllib.parse
 from pathlib import Path
 from loguru import logger as log
 from typing import List, Dict, Literal, TypedDict, Optional
-from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly import ScrapeConfig, ScrapeApiResponse
+from scraper_runtime import get_client, hidden_data, query, site_config
 
-SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
+SCRAPFLY = get_client("zoopla")
 
-BASE_CONFIG = {"asp": True, "country": "GB"}
+BASE_CONFIG = site_config("zoopla", {"asp": True, "country": "GB"})
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -43,8 +41,7 @@ class PropertyResult(TypedDict):
 
 def parse_next_data(result: ScrapeApiResponse) -> Dict:
     """parse hidden data from script tags"""
-    next_data = result.selector.css("script#__NEXT_DATA__::text").get()
-    next_data_json = json.loads(next_data)["props"]["pageProps"]
+    next_data_json = hidden_data(result.content, "__NEXT_DATA__")["props"]["pageProps"]
     return next_data_json
 
 
@@ -53,7 +50,7 @@ def parse_property(response: ScrapeApiResponse) -> Optional[PropertyResult]:
     data = parse_next_data(response)
     if not data:
         return
-    result = jmespath.search(
+    result = query(
         """root.{
         id: listingId,
         title: title,